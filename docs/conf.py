@@ -26,6 +26,7 @@ import projectq
 # Also import all the modules that are not automatically imported
 import projectq.libs.math
 import projectq.libs.revkit
+import projectq.parallel
 import projectq.setups.default
 import projectq.setups.grid
 import projectq.setups.ibm
@@ -496,6 +497,10 @@ Examples are `with Compute`, followed by an automatic uncompute or `with Control
 The operations collection consists of various default gates and is a work-in-progress, as users start to work with ProjectQ.
 ''',
                        module_special_members='__init__,__or__'),
+    PackageDescription('parallel',
+                       desc='''
+Runs independent simulations, e.g., the points of a parameter sweep, in a pool of worker processes, each of which reuses its own MainEngine and Simulator.
+'''),
     PackageDescription('setups.decompositions',
                        desc='''
 The decomposition package is a collection of gate decomposition / replacement rules which can be used by, e.g., the AutoReplacer engine.
@@ -21,6 +21,11 @@ This includes:
 * a circuit drawing engine (which can be used anywhere within the compilation
   chain)
 * a simulator with emulation capabilities
+* a stabilizer simulator for Clifford circuits (on thousands of qubits)
+* a matrix-product-state simulator for circuits with low entanglement
+* a density-matrix simulator for noisy circuits on few qubits
+* a sparse simulator for states with few nonzero amplitudes (e.g., of
+  reversible circuits on many qubits)
 * a resource counter (counts gates and keeps track of the maximal width of the
   circuit)
 * an interface to the IBM Quantum Experience chip (and simulator).
@@ -29,7 +34,9 @@ This includes:
 """
 from ._printer import CommandPrinter
 from ._circuits import CircuitDrawer, CircuitDrawerMatplotlib
-from ._sim import Simulator, ClassicalSimulator
+from ._sim import (Simulator, ClassicalSimulator, CliffordSimulator,
+                   DensityMatrixSimulator, MPSSimulator,
+                   ParametrizedCircuit, SparseSimulator)
 from ._resource import ResourceCounter
 from ._ibm import IBMBackend
 from ._aqt import AQTBackend
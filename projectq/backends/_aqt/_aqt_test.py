@@ -120,6 +120,11 @@ def test_aqt_too_many_runs():
         qubit = eng.allocate_qubit()
         Rx(math.pi / 2) | qubit
         eng.flush()
+    # the engine still flushes when it is collected, therefore we remove the
+    # backend:
+    dummy = DummyEngine()
+    dummy.is_last_engine = True
+    eng.next_engine = dummy
 
 
 def test_aqt_retrieve(monkeypatch):
@@ -14,3 +14,8 @@
 
 from ._simulator import Simulator
 from ._classical_simulator import ClassicalSimulator
+from ._clifford_simulator import CliffordSimulator
+from ._mps_simulator import MPSSimulator
+from ._density_simulator import DensityMatrixSimulator
+from ._sparse_simulator import SparseSimulator
+from ._parametrized_circuit import ParametrizedCircuit
@@ -0,0 +1,167 @@
+#   Copyright 2017 ProjectQ-Framework (www.projectq.ch)
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""
+Contains the checkpoints of the Simulator and their binary file format.
+
+A checkpoint file consists of
+    * the 8-byte magic string b'PQSIMCKP',
+    * the length of the header (little-endian 64-bit integer),
+    * the header, a JSON object holding the qubit ordering, the dtype of the
+      amplitudes, the compression and the states of the random number
+      generators,
+    * zero padding up to the next multiple of 64 bytes and
+    * the 2^n amplitudes, either raw (such that they can be memory-mapped) or
+      as one zlib stream.
+"""
+
+import json
+import struct
+import zlib
+
+import numpy
+
+_MAGIC = b'PQSIMCKP'
+_VERSION = 1
+_ALIGNMENT = 64
+# number of amplitudes which are written (or compressed) at a time
+_CHUNK_SIZE = 1 << 18
+
+
+class SimulatorCheckpoint(object):
+    """
+    Snapshot of the state of a Simulator (see Simulator.checkpoint).
+
+    Attributes:
+        ordering (list[int]): Qubit IDs, where ordering[i] is at bit-location
+            i of the state vector.
+        state (numpy.ndarray): The 2^n amplitudes.
+        rng_state (str): State of the random number generator of the
+            simulator backend.
+        engine_rng_state (tuple): State of the random number generator used
+            for sampling noise channels (see random.Random.getstate).
+    """
+    def __init__(self, ordering, state, rng_state, engine_rng_state):
+        self.ordering = list(ordering)
+        self.state = state
+        self.rng_state = rng_state
+        self.engine_rng_state = engine_rng_state
+
+    @property
+    def num_qubits(self):
+        return len(self.ordering)
+
+
+def write_checkpoint(path, checkpoint, compress=False):
+    """
+    Write a checkpoint to a file, streaming the state vector in chunks.
+
+    Args:
+        path (str): Name of the file (which is overwritten).
+        checkpoint (SimulatorCheckpoint): Checkpoint to write.
+        compress (bool|int): If True (or a zlib compression level from 1 to
+            9), the amplitudes are compressed.
+    """
+    if compress is True:
+        compress = 6
+    state = checkpoint.state
+    version, internal, gauss = checkpoint.engine_rng_state
+    header = json.dumps({'version': _VERSION,
+                         'ordering': checkpoint.ordering,
+                         'dtype': state.dtype.str,
+                         'compression': 'zlib' if compress else None,
+                         'rng_state': checkpoint.rng_state,
+                         'engine_rng_state': [version, internal, gauss]})
+    header = header.encode('utf-8')
+    offset = len(_MAGIC) + 8 + len(header)
+    padding = -offset % _ALIGNMENT
+    with open(path, 'wb') as f:
+        f.write(_MAGIC)
+        f.write(struct.pack('<Q', len(header)))
+        f.write(header)
+        f.write(b'\0' * padding)
+        compressor = zlib.compressobj(compress) if compress else None
+        for start in range(0, len(state), _CHUNK_SIZE):
+            data = numpy.ascontiguousarray(state[start:start + _CHUNK_SIZE])
+            data = memoryview(data).cast('B')
+            f.write(compressor.compress(data) if compressor else data)
+        if compressor:
+            f.write(compressor.flush())
+
+
+def read_checkpoint(path, mmap=True):
+    """
+    Read a checkpoint from a file.
+
+    Args:
+        path (str): Name of the file.
+        mmap (bool): If True, the amplitudes of an uncompressed checkpoint
+            are memory-mapped (read-only) instead of read into memory.
+
+    Returns:
+        SimulatorCheckpoint
+
+    Raises:
+        ValueError: If the file is not a (complete) checkpoint.
+    """
+    with open(path, 'rb') as f:
+        if f.read(len(_MAGIC)) != _MAGIC:
+            raise ValueError("{} is not a simulator checkpoint.".format(path))
+        length, = struct.unpack('<Q', f.read(8))
+        header = json.loads(f.read(length).decode('utf-8'))
+        if header['version'] != _VERSION:
+            raise ValueError("Unsupported version {} of the simulator "
+                             "checkpoint {}.".format(header['version'], path))
+        offset = len(_MAGIC) + 8 + length
+        offset += -offset % _ALIGNMENT
+        dtype = numpy.dtype(header['dtype'])
+        size = 1 << len(header['ordering'])
+        truncated = ValueError("The simulator checkpoint {} is "
+                               "truncated.".format(path))
+        if header['compression'] is None:
+            f.seek(0, 2)
+            if f.tell() < offset + size * dtype.itemsize:
+                raise truncated
+            if mmap:
+                state = numpy.memmap(path, dtype=dtype, mode='r',
+                                     offset=offset, shape=(size,))
+            else:
+                f.seek(offset)
+                state = numpy.fromfile(f, dtype=dtype, count=size)
+        else:
+            f.seek(offset)
+            state = numpy.empty(size, dtype=dtype)
+            buff = state.view(numpy.uint8)
+            decompressor = zlib.decompressobj()
+            pos = 0
+            while not decompressor.eof:
+                chunk = f.read(_CHUNK_SIZE * dtype.itemsize)
+                if not chunk:
+                    raise truncated
+                data = decompressor.decompress(chunk, len(buff) - pos + 1)
+                while data:
+                    if pos + len(data) > len(buff):
+                        raise ValueError("The simulator checkpoint {} is "
+                                         "corrupt.".format(path))
+                    buff[pos:pos + len(data)] = numpy.frombuffer(
+                        data, dtype=numpy.uint8)
+                    pos += len(data)
+                    data = decompressor.decompress(
+                        decompressor.unconsumed_tail, len(buff) - pos + 1)
+            if pos != len(buff):
+                raise truncated
+    version, internal, gauss = header['engine_rng_state']
+    return SimulatorCheckpoint(header['ordering'], state,
+                               header['rng_state'],
+                               (version, tuple(internal), gauss))
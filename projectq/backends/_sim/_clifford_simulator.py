@@ -0,0 +1,462 @@
+#   Copyright 2017 ProjectQ-Framework (www.projectq.ch)
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""
+A stabilizer simulator for Clifford circuits (Aaronson & Gottesman, "Improved
+simulation of stabilizer circuits", Phys. Rev. A 70, 052328 (2004)), which
+scales polynomially in the number of qubits.
+"""
+
+import random
+
+import numpy
+
+from projectq.cengines import BasicEngine
+from projectq.meta import get_control_count
+from projectq.ops import (Allocate,
+                          Deallocate,
+                          FlushGate,
+                          H,
+                          Measure,
+                          S,
+                          SwapGate,
+                          XGate,
+                          YGate,
+                          ZGate)
+
+from ._qubit_mapping import QubitMappingMixin
+
+
+_POPCOUNT = numpy.array([bin(i).count('1') for i in range(256)],
+                        dtype=numpy.int64)
+
+
+def _popcount(words):
+    """
+    Return the number of set bits in each row of a 2D array of uint64 words.
+    """
+    words = numpy.ascontiguousarray(words)
+    return _POPCOUNT[words.view(numpy.uint8)].sum(axis=-1)
+
+
+def _phase_exponent(x1, z1, x2, z2):
+    """
+    Return the exponent (mod 4) of i in the product P1 * P2 of the Pauli
+    strings with bits x1, z1 and x2, z2 (Y is x = z = 1), i.e., the sum of
+    g(x1, z1, x2, z2) over all qubits in the notation of Aaronson & Gottesman.
+    The arguments are rows (or 2D arrays of rows) of packed bits.
+    """
+    plus = ((x1 & z1 & z2 & ~x2) | (x1 & ~z1 & x2 & z2) |
+            (~x1 & z1 & x2 & ~z2))
+    minus = ((x1 & z1 & x2 & ~z2) | (x1 & ~z1 & ~x2 & z2) |
+             (~x1 & z1 & x2 & z2))
+    return (_popcount(numpy.atleast_2d(plus)) -
+            _popcount(numpy.atleast_2d(minus))) % 4
+
+
+def _clifford_key(matrix):
+    """
+    Return a hashable representation of a 2x2 matrix up to a global phase.
+    """
+    matrix = numpy.asarray(matrix, dtype=complex).flatten()
+    pivot = matrix[numpy.flatnonzero(abs(matrix) > 1e-8)[0]]
+    matrix = matrix * abs(pivot) / pivot
+    return tuple((round(m.real, 6) + 0., round(m.imag, 6) + 0.)
+                 for m in matrix)
+
+
+def _single_qubit_cliffords():
+    """
+    Return a dict which maps (the keys of) all 24 single-qubit Clifford
+    gates to sequences of H and S gates implementing them.
+    """
+    generators = {'H': numpy.asarray(H.matrix), 'S': numpy.asarray(S.matrix)}
+    words = {_clifford_key(numpy.eye(2)): ()}
+    queue = [((), numpy.eye(2))]
+    while queue:
+        word, matrix = queue.pop(0)
+        for name, generator in generators.items():
+            product = generator.dot(matrix)
+            key = _clifford_key(product)
+            if key not in words:
+                words[key] = word + (name,)
+                queue.append((word + (name,), product))
+    return words
+
+
+_CLIFFORDS = _single_qubit_cliffords()
+
+
+class CliffordSimulator(QubitMappingMixin, BasicEngine):
+    """
+    Stabilizer simulator which supports Clifford circuits on thousands of
+    qubits.
+
+    The state is represented by its stabilizer tableau (n destabilizer and
+    n stabilizer generators stored as bit-packed numpy arrays), such that
+    gates cost O(n) and measurements O(n^2) operations. The supported gates
+    are all single-qubit Clifford gates (e.g., H, S, Sdag, X, Y, Z, SqrtX,
+    Rx(pi / 2) or Ph), CNOT (controlled X), CY, CZ and Swap. Other
+    multi-qubit or controlled gates are reported as unavailable, i.e., an
+    AutoReplacer decomposes them into supported gates if possible.
+
+    Example:
+        .. code-block:: python
+
+            eng = MainEngine(CliffordSimulator())
+            qureg = eng.allocate_qureg(1000)
+            H | qureg[0]
+            for i in range(999):
+                CNOT | (qureg[i], qureg[i + 1])
+            All(Measure) | qureg
+    """
+    def __init__(self, rnd_seed=None):
+        """
+        Construct the Clifford simulator.
+
+        Args:
+            rnd_seed (int): Random seed (uses random.randint(0, 4294967295)
+                by default).
+        """
+        BasicEngine.__init__(self)
+        if rnd_seed is None:
+            rnd_seed = random.randint(0, 4294967295)
+        self._rng = random.Random(rnd_seed)
+        # qubit id -> column of the tableau
+        self._positions = dict()
+        # columns of deallocated qubits (which are in |0>)
+        self._free = []
+        self._num_columns = 0
+        self._resize(64)
+
+    def _resize(self, capacity):
+        """
+        Resize the tableau to hold capacity qubits. Rows 0 .. capacity-1 are
+        the destabilizers, rows capacity .. 2*capacity-1 the stabilizers;
+        rows of unused columns are identities.
+        """
+        words = capacity // 64
+        x = numpy.zeros((2 * capacity, words), dtype=numpy.uint64)
+        z = numpy.zeros((2 * capacity, words), dtype=numpy.uint64)
+        r = numpy.zeros(2 * capacity, dtype=numpy.uint8)
+        if hasattr(self, '_x'):
+            old = self._capacity
+            old_words = old // 64
+            for rows, new_rows in [(slice(0, old), slice(0, old)),
+                                   (slice(old, 2 * old),
+                                    slice(capacity, capacity + old))]:
+                x[new_rows, :old_words] = self._x[rows]
+                z[new_rows, :old_words] = self._z[rows]
+                r[new_rows] = self._r[rows]
+        self._capacity = capacity
+        self._x, self._z, self._r = x, z, r
+
+    def _column(self, bits, pos):
+        """ Return the bits of column pos of all rows (as uint64 0/1). """
+        return (bits[:, pos // 64] >> numpy.uint64(pos % 64)) & numpy.uint64(1)
+
+    def _flip(self, bits, pos, values):
+        """ Flip the bits of column pos in all rows where values is 1. """
+        bits[:, pos // 64] ^= values << numpy.uint64(pos % 64)
+
+    def _unit_row(self, pos):
+        """ Return a row of packed bits with only bit pos set. """
+        row = numpy.zeros(self._capacity // 64, dtype=numpy.uint64)
+        row[pos // 64] = numpy.uint64(1) << numpy.uint64(pos % 64)
+        return row
+
+    def _allocate(self, qubit_id):
+        if self._free:
+            # deallocated qubits have been reset to |0>
+            self._positions[qubit_id] = self._free.pop()
+            return
+        if self._num_columns == self._capacity:
+            self._resize(2 * self._capacity)
+        pos = self._num_columns
+        self._num_columns += 1
+        # |0>: destabilizer X, stabilizer Z
+        self._x[pos] = self._unit_row(pos)
+        self._z[self._capacity + pos] = self._unit_row(pos)
+        self._positions[qubit_id] = pos
+
+    def _deallocate(self, qubit_id):
+        pos = self._positions[qubit_id]
+        if self._is_random(pos):
+            raise RuntimeError("Error: Qubit has not been measured / "
+                               "uncomputed! There is most likely a bug in "
+                               "your code.")
+        if self._deterministic_outcome(pos):
+            self._x_gate(pos)
+        del self._positions[qubit_id]
+        self._free.append(pos)
+
+    def _is_random(self, pos):
+        """ Whether measuring the qubit at column pos is random. """
+        return bool(self._column(self._x[self._capacity:], pos).any())
+
+    def _product_sign(self, rows):
+        """
+        Return the sign bit r of the product (-1)^r P of the generators in
+        rows (which have to commute), where P is the Pauli string with the
+        XOR of their bits.
+        """
+        if len(rows) == 0:
+            return 0
+        x, z = self._x[rows], self._z[rows]
+        # bits of the product of the generators before each one
+        prev_x = numpy.bitwise_xor.accumulate(x, axis=0)
+        prev_z = numpy.bitwise_xor.accumulate(z, axis=0)
+        prev_x = numpy.vstack([numpy.zeros_like(x[:1]), prev_x[:-1]])
+        prev_z = numpy.vstack([numpy.zeros_like(z[:1]), prev_z[:-1]])
+        exponent = (2 * int(self._r[rows].sum()) +
+                    int(_phase_exponent(x, z, prev_x, prev_z).sum())) % 4
+        return exponent // 2
+
+    def _deterministic_outcome(self, pos):
+        rows = numpy.flatnonzero(self._column(self._x[:self._capacity], pos))
+        return self._product_sign(rows + self._capacity)
+
+    def _measure(self, pos):
+        """ Measure the qubit at column pos in the Z basis. """
+        n = self._capacity
+        column = self._column(self._x, pos)
+        stabilizers = numpy.flatnonzero(column[n:])
+        if len(stabilizers) == 0:
+            return self._deterministic_outcome(pos)
+
+        p = n + stabilizers[0]
+        # multiply generator p into all other rows which anticommute with Z
+        rows = numpy.flatnonzero(column)
+        rows = rows[rows != p]
+        exponent = (2 * self._r[rows].astype(numpy.int64) + 2 * self._r[p] +
+                    _phase_exponent(self._x[p], self._z[p], self._x[rows],
+                                    self._z[rows])) % 4
+        self._r[rows] = exponent // 2
+        self._x[rows] ^= self._x[p]
+        self._z[rows] ^= self._z[p]
+
+        outcome = int(self._rng.random() < .5)
+        self._x[p - n] = self._x[p]
+        self._z[p - n] = self._z[p]
+        self._r[p - n] = self._r[p]
+        self._x[p] = 0
+        self._z[p] = self._unit_row(pos)
+        self._r[p] = outcome
+        return outcome
+
+    def _x_gate(self, a):
+        self._r ^= self._column(self._z, a).astype(numpy.uint8)
+
+    def _z_gate(self, a):
+        self._r ^= self._column(self._x, a).astype(numpy.uint8)
+
+    def _y_gate(self, a):
+        self._r ^= (self._column(self._x, a) ^
+                    self._column(self._z, a)).astype(numpy.uint8)
+
+    def _h_gate(self, a):
+        xa, za = self._column(self._x, a), self._column(self._z, a)
+        self._r ^= (xa & za).astype(numpy.uint8)
+        self._flip(self._x, a, xa ^ za)
+        self._flip(self._z, a, xa ^ za)
+
+    def _s_gate(self, a):
+        xa, za = self._column(self._x, a), self._column(self._z, a)
+        self._r ^= (xa & za).astype(numpy.uint8)
+        self._flip(self._z, a, xa)
+
+    def _sdag_gate(self, a):
+        xa, za = self._column(self._x, a), self._column(self._z, a)
+        self._r ^= (xa & ~za & numpy.uint64(1)).astype(numpy.uint8)
+        self._flip(self._z, a, xa)
+
+    def _cnot_gate(self, a, b):
+        xa, za = self._column(self._x, a), self._column(self._z, a)
+        xb, zb = self._column(self._x, b), self._column(self._z, b)
+        self._r ^= (xa & zb & ~(xb ^ za) & numpy.uint64(1)).astype(numpy.uint8)
+        self._flip(self._x, b, xa)
+        self._flip(self._z, a, zb)
+
+    def _cz_gate(self, a, b):
+        xa, za = self._column(self._x, a), self._column(self._z, a)
+        xb, zb = self._column(self._x, b), self._column(self._z, b)
+        self._r ^= (xa & xb & (za ^ zb)).astype(numpy.uint8)
+        self._flip(self._z, a, xb)
+        self._flip(self._z, b, xa)
+
+    def _swap_gate(self, a, b):
+        for bits in (self._x, self._z):
+            diff = self._column(bits, a) ^ self._column(bits, b)
+            self._flip(bits, a, diff)
+            self._flip(bits, b, diff)
+
+    def is_available(self, cmd):
+        """
+        Specialized implementation of is_available: The Clifford simulator
+        supports single-qubit gates, X, Y and Z with one control qubit, Swap,
+        measurement and (de-)allocation.
+
+        Single-qubit gates which are not Clifford gates (e.g., T) cannot be
+        decomposed into Clifford gates either; they are accepted such that
+        simulating them fails with a ValueError (instead of an endless
+        search for a decomposition).
+
+        Args:
+            cmd (Command): Command for which to check availability.
+
+        Returns:
+            True if the command can be simulated and False otherwise.
+        """
+        gate = cmd.gate
+        if (gate == Measure or gate == Allocate or gate == Deallocate or
+                isinstance(gate, FlushGate)):
+            return True
+        num_controls = get_control_count(cmd)
+        if isinstance(gate, (XGate, YGate, ZGate)):
+            return num_controls <= 1
+        if num_controls > 0:
+            return False
+        if isinstance(gate, SwapGate):
+            return True
+        try:
+            return len(gate.matrix) == 2
+        except AttributeError:
+            return False
+
+    def get_expectation_value(self, qubit_operator, qureg):
+        """
+        Get the expectation value of qubit_operator w.r.t. the current
+        stabilizer state of the supplied quantum register.
+
+        The expectation value of each Pauli string is +1 or -1 if it (or its
+        negative) is an element of the stabilizer group and 0 otherwise.
+
+        Args:
+            qubit_operator (projectq.ops.QubitOperator): Operator to measure.
+            qureg (list[Qubit],Qureg): Quantum bits to measure.
+
+        Returns:
+            Expectation value
+
+        Note:
+            Make sure all previous commands (especially allocations) have
+            passed through the compilation chain (call main_engine.flush() to
+            make sure).
+
+        Note:
+            If there is a mapper present in the compiler, this function
+            automatically converts from logical qubits to mapped qubits for
+            the qureg argument.
+
+        Raises:
+            Exception: If `qubit_operator` acts on more qubits than present in
+                the `qureg` argument.
+        """
+        qureg = self._convert_logical_to_mapped_qureg(qureg)
+        num_qubits = len(qureg)
+        for term, _ in qubit_operator.terms.items():
+            if not term == () and term[-1][0] >= num_qubits:
+                raise Exception("qubit_operator acts on more qubits than "
+                                "contained in the qureg.")
+        n = self._capacity
+        expectation = 0.
+        for term, coefficient in qubit_operator.terms.items():
+            x = numpy.zeros(n // 64, dtype=numpy.uint64)
+            z = numpy.zeros(n // 64, dtype=numpy.uint64)
+            for index, pauli in term:
+                pos = self._positions[qureg[index].id]
+                if pauli != 'Z':
+                    x ^= self._unit_row(pos)
+                if pauli != 'X':
+                    z ^= self._unit_row(pos)
+            # generators which anticommute with the Pauli string
+            anticommute = _popcount((self._x & z) ^ (self._z & x)) & 1
+            if anticommute[n:].any():
+                continue
+            # the Pauli string is (up to its sign) the product of the
+            # stabilizers whose destabilizers anticommute with it
+            rows = numpy.flatnonzero(anticommute[:n]) + n
+            expectation += coefficient * (1 - 2 * self._product_sign(rows))
+        return expectation
+
+    def receive(self, command_list):
+        """
+        Receive a list of commands from the previous engine and handle them
+        prior to sending them on to the next engine.
+
+        Args:
+            command_list (list<Command>): List of commands to execute on the
+                simulator.
+        """
+        for cmd in command_list:
+            self._handle(cmd)
+        if not self.is_last_engine:
+            self.send(command_list)
+
+    def _handle(self, cmd):
+        gate = cmd.gate
+        if isinstance(gate, FlushGate):
+            return
+        if gate == Measure:
+            for qr in cmd.qubits:
+                for qb in qr:
+                    log_qb = self._logical_qubit(cmd, qb)
+                    outcome = self._measure(self._positions[qb.id])
+                    self.main_engine.set_measurement_result(log_qb, outcome)
+            return
+        if gate == Allocate:
+            self._allocate(cmd.qubits[0][0].id)
+            return
+        if gate == Deallocate:
+            self._deallocate(cmd.qubits[0][0].id)
+            return
+
+        targets = [self._positions[qb.id] for qr in cmd.qubits for qb in qr]
+        controls = [self._positions[qb.id] for qb in cmd.control_qubits]
+        if isinstance(gate, SwapGate) and not controls:
+            self._swap_gate(*targets)
+            return
+        if len(targets) != 1 or len(controls) > 1:
+            raise ValueError("CliffordSimulator: Unsupported gate {}."
+                             .format(cmd))
+        a = targets[0]
+        if controls:
+            c = controls[0]
+            if isinstance(gate, XGate):
+                self._cnot_gate(c, a)
+            elif isinstance(gate, ZGate):
+                self._cz_gate(c, a)
+            elif isinstance(gate, YGate):
+                self._sdag_gate(a)
+                self._cnot_gate(c, a)
+                self._s_gate(a)
+            else:
+                raise ValueError("CliffordSimulator: Unsupported gate {}."
+                                 .format(cmd))
+        elif isinstance(gate, XGate):
+            self._x_gate(a)
+        elif isinstance(gate, YGate):
+            self._y_gate(a)
+        elif isinstance(gate, ZGate):
+            self._z_gate(a)
+        else:
+            word = _CLIFFORDS.get(_clifford_key(gate.matrix))
+            if word is None:
+                raise ValueError("CliffordSimulator: {} is not a Clifford "
+                                 "gate.".format(gate))
+            for name in word:
+                if name == 'H':
+                    self._h_gate(a)
+                else:
+                    self._s_gate(a)
@@ -0,0 +1,229 @@
+#   Copyright 2017 ProjectQ-Framework (www.projectq.ch)
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import math
+import random
+
+import pytest
+
+from projectq import MainEngine
+from projectq.cengines import AutoReplacer, DecompositionRuleSet, DummyEngine
+from projectq.meta import Control
+from projectq.ops import (All, Allocate, C, CNOT, CZ, Command, Deallocate,
+                          Entangle, H, Measure, Ph, QubitOperator, R, Rx, Ry,
+                          Rz, S, Sdag, SqrtX, Swap, T, Toffoli, X, Y, Z)
+from projectq.setups import decompositions
+from projectq.types import WeakQubitRef
+
+from ._simulator_test import mapper
+from ._simulator import Simulator
+from ._clifford_simulator import CliffordSimulator
+
+
+def test_clifford_simulator_is_available():
+    sim = CliffordSimulator()
+    eng = MainEngine(sim, [DummyEngine()])
+    qubit1 = WeakQubitRef(engine=eng, idx=1)
+    qubit2 = WeakQubitRef(engine=eng, idx=2)
+    qubit3 = WeakQubitRef(engine=eng, idx=3)
+    for gate in [H, S, Sdag, X, Y, Z, Ph(0.3), Measure, Allocate]:
+        assert sim.is_available(Command(eng, gate, ([qubit1],)))
+    assert sim.is_available(Command(eng, Swap, ([qubit1], [qubit2])))
+    for gate in [X, Y, Z]:
+        assert sim.is_available(Command(eng, gate, ([qubit1],),
+                                        controls=[qubit2]))
+        assert not sim.is_available(Command(eng, gate, ([qubit1],),
+                                            controls=[qubit2, qubit3]))
+    for gate in [H, S, Ph(0.3)]:
+        assert not sim.is_available(Command(eng, gate, ([qubit1],),
+                                            controls=[qubit2]))
+    # non-Clifford single-qubit gates have no Clifford decomposition
+    for gate in [T, Rx(0.3)]:
+        assert sim.is_available(Command(eng, gate, ([qubit1],)))
+    assert not sim.is_available(Command(eng, Entangle, ([qubit1, qubit2],)))
+
+
+def test_clifford_simulator_ghz(mapper):
+    engine_list = []
+    if mapper is not None:
+        engine_list.append(mapper)
+    sim = CliffordSimulator(rnd_seed=1)
+    eng = MainEngine(sim, engine_list)
+    qureg = eng.allocate_qureg(200)
+    H | qureg[0]
+    for i in range(199):
+        CNOT | (qureg[i], qureg[i + 1])
+    eng.flush()
+    assert sim.get_expectation_value(QubitOperator('Z0'), qureg) == 0.
+    assert sim.get_expectation_value(QubitOperator('Z0 Z199'), qureg) == 1.
+    op = QubitOperator(' '.join('X{}'.format(i) for i in range(200)))
+    assert sim.get_expectation_value(op, qureg) == 1.
+    op = QubitOperator('Y0 Y1 ' + ' '.join('X{}'.format(i)
+                                            for i in range(2, 200)))
+    assert sim.get_expectation_value(op, qureg) == -1.
+    assert sim.get_expectation_value(QubitOperator((), 0.5), qureg) == 0.5
+    with pytest.raises(Exception):
+        sim.get_expectation_value(QubitOperator('Z200'), qureg)
+    All(Measure) | qureg
+    outcomes = [int(qb) for qb in qureg]
+    assert outcomes == [outcomes[0]] * 200
+
+
+def _random_clifford_circuit(eng, qureg, rng):
+    single = [H, S, Sdag, X, Y, Z]
+    for _ in range(60):
+        choice = rng.randrange(5)
+        a, b = rng.sample(range(len(qureg)), 2)
+        if choice < 2:
+            rng.choice(single) | qureg[a]
+        elif choice == 2:
+            CNOT | (qureg[a], qureg[b])
+        elif choice == 3:
+            rng.choice([CZ, C(Y)]) | (qureg[a], qureg[b])
+        else:
+            Swap | (qureg[a], qureg[b])
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_clifford_simulator_compare_to_simulator(seed):
+    rng = random.Random(seed)
+    sim = CliffordSimulator(rnd_seed=seed)
+    eng = MainEngine(sim, [])
+    qureg = eng.allocate_qureg(5)
+    ref = Simulator()
+    ref_eng = MainEngine(ref, [])
+    ref_qureg = ref_eng.allocate_qureg(5)
+    _random_clifford_circuit(eng, qureg, random.Random(seed))
+    _random_clifford_circuit(ref_eng, ref_qureg, random.Random(seed))
+    eng.flush()
+    ref_eng.flush()
+    for _ in range(40):
+        term = ' '.join('{}{}'.format(pauli, i) for i, pauli
+                        in enumerate(rng.choice('IXYZ') for _ in range(5))
+                        if pauli != 'I')
+        op = QubitOperator(term)
+        assert (sim.get_expectation_value(op, qureg) ==
+                pytest.approx(ref.get_expectation_value(op, ref_qureg)))
+
+    # measurement outcomes agree with the probabilities of the state
+    Measure | qureg[0]
+    Measure | qureg[3]
+    eng.flush()
+    bits = [int(qureg[0]), int(qureg[3])]
+    assert ref.get_probability(bits, [ref_qureg[0], ref_qureg[3]]) > .1
+    ref.collapse_wavefunction([ref_qureg[0], ref_qureg[3]], bits)
+    All(Measure) | qureg
+    bits = [int(qb) for qb in qureg]
+    assert ref.get_probability(bits, ref_qureg) > .1
+    All(Measure) | ref_qureg
+
+
+def test_clifford_simulator_measurement_statistics():
+    sim = CliffordSimulator(rnd_seed=5)
+    eng = MainEngine(sim, [])
+    outcomes = []
+    for _ in range(200):
+        qubit = eng.allocate_qubit()
+        H | qubit
+        Measure | qubit
+        outcomes.append(int(qubit))
+        del qubit
+    assert 60 < sum(outcomes) < 140
+
+
+def test_clifford_simulator_deallocation():
+    sim = CliffordSimulator()
+    eng = MainEngine(sim, [])
+    qureg = eng.allocate_qureg(2)
+    H | qureg[0]
+    CNOT | (qureg[0], qureg[1])
+    eng.flush()
+    with pytest.raises(RuntimeError):
+        sim.receive([Command(eng, Deallocate, ([qureg[1]],))])
+    # deallocated qubits in |1> are reset for reuse
+    ancilla = eng.allocate_qubit()
+    X | ancilla
+    del ancilla
+    eng.flush()
+    assert len(sim._free) == 1
+    ancilla = eng.allocate_qubit()
+    Measure | ancilla
+    assert int(ancilla) == 0
+    All(Measure) | qureg
+
+
+def test_clifford_simulator_many_qubits():
+    # the tableau grows beyond its initial capacity of 64 qubits
+    sim = CliffordSimulator()
+    eng = MainEngine(sim, [])
+    qureg = eng.allocate_qureg(150)
+    All(X) | qureg[::3]
+    H | qureg[100]
+    for i in range(100, 149):
+        CNOT | (qureg[i], qureg[i + 1])
+    eng.flush()
+    assert sim._capacity == 256
+    All(Measure) | qureg
+    assert [int(qb) for qb in qureg[:100]] == [int(i % 3 == 0)
+                                               for i in range(100)]
+
+
+def test_clifford_simulator_decomposition():
+    sim = CliffordSimulator()
+    rule_set = DecompositionRuleSet(modules=[decompositions])
+    eng = MainEngine(sim, [AutoReplacer(rule_set)])
+    qureg = eng.allocate_qureg(3)
+    # Entangle is decomposed into H and CNOTs
+    Entangle | qureg
+    eng.flush()
+    op = QubitOperator('X0 X1 X2')
+    assert sim.get_expectation_value(op, qureg) == 1.
+    # Toffoli requires T gates
+    with pytest.raises(ValueError):
+        Toffoli | (qureg[0], qureg[1], qureg[2])
+        eng.flush()
+
+
+def test_clifford_simulator_single_qubit_cliffords():
+    sim = CliffordSimulator()
+    eng = MainEngine(sim, [])
+    qureg = eng.allocate_qureg(2)
+    ref = Simulator()
+    ref_eng = MainEngine(ref, [])
+    ref_qureg = ref_eng.allocate_qureg(2)
+    gates = [Rx(math.pi / 2), Ry(-math.pi / 2), Rz(3 * math.pi / 2), SqrtX,
+             R(math.pi / 2), Ph(0.3), Ry(math.pi), H, Sdag]
+    for e, q in [(eng, qureg), (ref_eng, ref_qureg)]:
+        for gate in gates:
+            gate | q[0]
+            CNOT | (q[0], q[1])
+            gate | q[1]
+        e.flush()
+    for term in ['X0', 'Y0 Z1', 'Z0 Z1', 'X0 Y1', 'Y1']:
+        op = QubitOperator(term)
+        assert (sim.get_expectation_value(op, qureg) ==
+                pytest.approx(ref.get_expectation_value(op, ref_qureg)))
+    with pytest.raises(ValueError):
+        T | qureg[0]
+        eng.flush()
+
+
+def test_clifford_simulator_unsupported_gate():
+    sim = CliffordSimulator()
+    eng = MainEngine(sim, [])
+    qureg = eng.allocate_qureg(2)
+    with pytest.raises(Exception):
+        with Control(eng, qureg[0]):
+            H | qureg[1]
+        eng.flush()
@@ -0,0 +1,50 @@
+// Copyright 2017 ProjectQ-Framework (www.projectq.ch)
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+// http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+// no include guard: this file is included into the namespace of the
+// kernels of each instruction set (see dispatch.hpp)
+
+#include <algorithm>
+#include <cstddef>
+
+// calls f(i) for all indices i < n which have all bits in ctrlmask set and all
+// bits in targetmask cleared, i.e., for the base indices of a controlled gate
+// kernel. Only these n / 2^(#controls + #targets) indices are enumerated (by
+// inserting the fixed bits into a compressed loop index), instead of testing
+// the control bits of all indices. Has to be called from within a parallel
+// region.
+template <class F>
+inline void for_each_controlled(std::size_t n, std::size_t ctrlmask, std::size_t targetmask, F const& f)
+{
+    std::size_t fixed = ctrlmask | targetmask;
+    unsigned positions[8 * sizeof(std::size_t)];
+    unsigned num_fixed = 0;
+    for (unsigned p = 0; p < 8 * sizeof(std::size_t); ++p)
+        if ((fixed >> p) & 1UL)
+            positions[num_fixed++] = p;
+    // the indices come in contiguous runs below the lowest fixed bit
+    std::size_t nbase = n >> num_fixed;
+    std::size_t chunk = std::min<std::size_t>(1UL << positions[0], 1024);
+    #pragma omp for schedule(static)
+    for (std::size_t b = 0; b < nbase; b += chunk){
+        std::size_t i0 = b;
+        for (unsigned k = 0; k < num_fixed; ++k){
+            unsigned p = positions[k];
+            i0 = ((i0 >> p) << (p + 1)) | (i0 & ((1UL << p) - 1));
+        }
+        i0 |= ctrlmask;
+        for (std::size_t i = i0; i < i0 + chunk; ++i)
+            f(i);
+    }
+}
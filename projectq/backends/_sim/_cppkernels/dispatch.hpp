@@ -0,0 +1,193 @@
+// Copyright 2017 ProjectQ-Framework (www.projectq.ch)
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+// http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+#ifndef DISPATCH_HPP_
+#define DISPATCH_HPP_
+
+// The gate kernels are compiled several times, once for each supported
+// instruction set, into the namespaces kernels_scalar, kernels_avx2 and
+// kernels_avx512. The rest of the extension is compiled for the baseline
+// architecture, and dispatch_kernel calls the kernels of the instruction set
+// which is selected when the extension is loaded (the best one the CPU
+// supports, unless the environment variable PROJECTQ_SIMULATOR_KERNELS names
+// another supported one).
+
+#include <algorithm>
+#include <cmath>
+#include <complex>
+#include <cstddef>
+#include <cstdlib>
+#include <functional>
+#include <stdexcept>
+#include <string>
+#include <vector>
+#include "intrin/alignedallocator.hpp"
+
+#if defined(INTRIN) && !defined(NOINTRIN) && (defined(__x86_64__) || defined(_M_X64))
+#define KERNELS_SIMD
+#endif
+
+#ifdef KERNELS_SIMD
+#if defined(_MSC_VER) && !defined(__clang__)
+#include <intrin.h>
+#endif
+#include <immintrin.h>
+
+// functions defined between KERNELS_AVX2_BEGIN (or KERNELS_AVX512_BEGIN) and
+// KERNELS_TARGET_END may use the instructions of the respective target (MSVC
+// always allows intrinsics)
+#if defined(__clang__)
+#define KERNELS_AVX2_BEGIN _Pragma("clang attribute push(__attribute__((target(\"avx2,fma\"))), apply_to = function)")
+#define KERNELS_AVX512_BEGIN _Pragma("clang attribute push(__attribute__((target(\"avx512f,avx512dq,avx512vl,avx2,fma\"))), apply_to = function)")
+#define KERNELS_TARGET_END _Pragma("clang attribute pop")
+#elif defined(__GNUC__)
+#define KERNELS_AVX2_BEGIN _Pragma("GCC push_options") _Pragma("GCC target(\"avx2,fma\")")
+#define KERNELS_AVX512_BEGIN _Pragma("GCC push_options") _Pragma("GCC target(\"avx512f,avx512dq,avx512vl,avx2,fma\")")
+#define KERNELS_TARGET_END _Pragma("GCC pop_options")
+#else
+#define KERNELS_AVX2_BEGIN
+#define KERNELS_AVX512_BEGIN
+#define KERNELS_TARGET_END
+#endif
+
+// the SIMD helpers are shared by the AVX2 and AVX-512 kernels (which may
+// inline them, as AVX-512 implies AVX2)
+KERNELS_AVX2_BEGIN
+#include "intrin/cintrin.hpp"
+KERNELS_TARGET_END
+#endif
+
+namespace kernels_scalar{
+#include "nointrin/kernels.hpp"
+}
+
+#ifdef KERNELS_SIMD
+namespace kernels_avx2{
+KERNELS_AVX2_BEGIN
+#include "intrin/kernels.hpp"
+KERNELS_TARGET_END
+}
+
+namespace kernels_avx512{
+KERNELS_AVX512_BEGIN
+#include "intrin/kernels.hpp"
+#include "intrin/kernels512.hpp"
+KERNELS_TARGET_END
+}
+#endif
+
+enum class KernelIsa { scalar, avx2, avx512 };
+
+inline char const* kernel_isa_name(KernelIsa isa){
+    switch (isa){
+        case KernelIsa::avx2: return "avx2";
+        case KernelIsa::avx512: return "avx512";
+        default: return "scalar";
+    }
+}
+
+// returns whether the kernels for isa were compiled and can be executed on
+// this CPU (including support of the operating system for the registers)
+inline bool kernel_isa_supported(KernelIsa isa){
+    if (isa == KernelIsa::scalar)
+        return true;
+#ifdef KERNELS_SIMD
+#if defined(__GNUC__)
+    __builtin_cpu_init();
+    bool const avx2 = __builtin_cpu_supports("avx2") && __builtin_cpu_supports("fma");
+    if (isa == KernelIsa::avx2)
+        return avx2;
+    return avx2 && __builtin_cpu_supports("avx512f") &&
+           __builtin_cpu_supports("avx512dq") && __builtin_cpu_supports("avx512vl");
+#elif defined(_MSC_VER)
+    int info[4];
+    __cpuid(info, 0);
+    if (info[0] < 7)
+        return false;
+    __cpuid(info, 1);
+    bool const osxsave = (info[2] >> 27) & 1, fma = (info[2] >> 12) & 1;
+    if (!osxsave)
+        return false;
+    unsigned long long const xcr0 = _xgetbv(0);
+    __cpuidex(info, 7, 0);
+    bool const avx2 = fma && ((info[1] >> 5) & 1) && (xcr0 & 0x6) == 0x6;
+    if (isa == KernelIsa::avx2)
+        return avx2;
+    return avx2 && ((info[1] >> 16) & 1) && ((info[1] >> 17) & 1) &&
+           ((unsigned(info[1]) >> 31) & 1) && (xcr0 & 0xe6) == 0xe6;
+#else
+    return false;
+#endif
+#else
+    return false;
+#endif
+}
+
+inline std::vector<std::string> supported_kernel_isas(){
+    std::vector<std::string> names;
+    for (auto isa : {KernelIsa::scalar, KernelIsa::avx2, KernelIsa::avx512})
+        if (kernel_isa_supported(isa))
+            names.push_back(kernel_isa_name(isa));
+    return names;
+}
+
+// instruction set of the kernels used by dispatch_kernel
+inline KernelIsa& selected_kernel_isa(){
+    static KernelIsa isa = []{
+        char const* requested = std::getenv("PROJECTQ_SIMULATOR_KERNELS");
+        for (auto isa : {KernelIsa::avx512, KernelIsa::avx2, KernelIsa::scalar})
+            if (kernel_isa_supported(isa) &&
+                (requested == nullptr || requested == std::string(kernel_isa_name(isa))))
+                return isa;
+        // unknown or unsupported request: use the best kernels
+        for (auto isa : {KernelIsa::avx512, KernelIsa::avx2})
+            if (kernel_isa_supported(isa))
+                return isa;
+        return KernelIsa::scalar;
+    }();
+    return isa;
+}
+
+// selects the kernels of the instruction set with the given name
+inline void select_kernel_isa(std::string const& name){
+    for (auto isa : {KernelIsa::scalar, KernelIsa::avx2, KernelIsa::avx512}){
+        if (name == kernel_isa_name(isa)){
+            if (!kernel_isa_supported(isa))
+                throw std::invalid_argument("select_kernels(): The " + name + " kernels are not supported on this machine.");
+            selected_kernel_isa() = isa;
+            return;
+        }
+    }
+    throw std::invalid_argument("select_kernels(): Unknown kernels '" + name + "' (expected 'scalar', 'avx2' or 'avx512').");
+}
+
+// applies a gate using the kernels of the selected instruction set; the
+// arguments are those of kernel(psi, id_(k-1), ..., id_0, m, ctrlmask)
+template <class V, class... Args>
+inline void dispatch_kernel(V& psi, Args const&... args){
+    switch (selected_kernel_isa()){
+#ifdef KERNELS_SIMD
+        case KernelIsa::avx512:
+            kernels_avx512::kernel_wide(psi, args...);
+            break;
+        case KernelIsa::avx2:
+            kernels_avx2::kernel(psi, args...);
+            break;
+#endif
+        default:
+            kernels_scalar::kernel(psi, args...);
+    }
+}
+
+#endif
@@ -31,6 +31,8 @@ public:
     Item(Matrix mat, IndexVector idx) : mat_(mat), idx_(idx) {}
     Matrix& get_matrix() { return mat_; }
     IndexVector& get_indices() { return idx_; }
+    Matrix const& get_matrix() const { return mat_; }
+    IndexVector const& get_indices() const { return idx_; }
 private:
     Matrix mat_;
     IndexVector idx_;
@@ -53,6 +55,21 @@ public:
         return items_.size();
     }
 
+    // true if any of the indices is a target or a control of the fused gates
+    bool overlaps(IndexVector const& index_list) const {
+        for (auto idx : index_list)
+            if (set_.count(idx) || ctrl_set_.count(idx))
+                return true;
+        return false;
+    }
+
+    // appends all gates of other (which are applied after the current ones)
+    void merge(Fusion const& other){
+        IndexVector ctrls(other.ctrl_set_.begin(), other.ctrl_set_.end());
+        for (auto const& item : other.items_)
+            insert(item.get_matrix(), item.get_indices(), ctrls);
+    }
+
     void insert(Matrix matrix, IndexVector index_list, IndexVector const& ctrl_list = {}){
         for (auto idx : index_list)
             set_.emplace(idx);
@@ -75,31 +92,34 @@ public:
 
         for (auto& item : items_){
             auto const& idx = item.get_indices();
-            IndexVector idx2mat(idx.size());
-            for (std::size_t i = 0; i < idx.size(); ++i)
-                idx2mat[i] = ((std::equal_range(index_list.begin(), index_list.end(), idx[i])).first - index_list.begin());
+            auto const& m = item.get_matrix();
+            std::size_t K = idx.size();
+            // offsets of the local (item) basis states in the big matrix
+            std::vector<std::size_t> offset(1UL<<K, 0);
+            std::size_t item_mask = 0;
+            for (std::size_t l = 0; l < K; ++l){
+                std::size_t bit = 1UL << (std::equal_range(index_list.begin(), index_list.end(), idx[l]).first - index_list.begin());
+                item_mask |= bit;
+                for (std::size_t j = 0; j < (1UL<<K); ++j)
+                    if ((j >> l)&1UL)
+                        offset[j] |= bit;
+            }
 
+            // apply the item to each column of the big matrix, one block of
+            // 2^K rows (which only differ in the item bits) at a time
+            std::vector<Complex> v(1UL<<K);
             for (std::size_t k = 0; k < (1UL<<N); ++k){ // loop over big matrix columns
-                // check if column index satisfies control-mask
-                // if not: leave it unchanged
-                std::vector<Complex> oldcol(1UL<<N);
-                for (std::size_t i = 0; i < (1UL<<N); ++i)
-                    oldcol[i] = M[i][k];
-
                 for (std::size_t i = 0; i < (1UL<<N); ++i){
-                    std::size_t local_i = 0;
-                    for (std::size_t l = 0; l < idx.size(); ++l)
-                        local_i |= ((i >> idx2mat[l])&1UL)<<l;
-
-                    Complex res = 0.;
-                    for (std::size_t j = 0; j < (1UL<<idx.size()); ++j){
-                        std::size_t locidx = i;
-                        for (std::size_t l = 0; l < idx.size(); ++l)
-                            if (((j >> l)&1UL) != ((i >> idx2mat[l])&1UL))
-                                locidx ^= (1UL << idx2mat[l]);
-                        res += oldcol[locidx] * item.get_matrix()[local_i][j];
+                    if (i & item_mask)
+                        continue;
+                    for (std::size_t j = 0; j < (1UL<<K); ++j)
+                        v[j] = M[i + offset[j]][k];
+                    for (std::size_t r = 0; r < (1UL<<K); ++r){
+                        Complex res = 0.;
+                        for (std::size_t j = 0; j < (1UL<<K); ++j)
+                            res += m[r][j] * v[j];
+                        M[i + offset[r]][k] = res;
                     }
-                    M[i][k] = res;
                 }
             }
         }
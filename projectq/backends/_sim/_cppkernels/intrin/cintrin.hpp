@@ -104,6 +104,24 @@ inline cintrin<double> operator*(double const& d, cintrin<double> const& c1){
 
 
 
+// SIMD register types used by the kernels: one register holds two complex
+// numbers (i.e., two entries of one column of the gate matrix)
+template <class T>
+struct cintrin_traits;
+
+template <>
+struct cintrin_traits<std::complex<double>>{
+    using type = __m256d;
+};
+
+template <>
+struct cintrin_traits<std::complex<float>>{
+    using type = __m128;
+};
+
+template <class V>
+using simd_type = typename cintrin_traits<typename V::value_type>::type;
+
 inline __m256d mul(__m256d const& c1, __m256d const& c2, __m256d const& c2tm){
     auto ac_bd = _mm256_mul_pd(c1, c2);
     auto multbmadmc = _mm256_mul_pd(c1, c2tm);
@@ -112,13 +130,45 @@ inline __m256d mul(__m256d const& c1, __m256d const& c2, __m256d const& c2tm){
 inline __m256d add(__m256d const& c1, __m256d const& c2){
     return _mm256_add_pd(c1, c2);
 }
-template <class U>
-inline __m256d load2(U *p){
+inline __m256d load2(std::complex<double> *p){
     auto tmp = _mm_load_pd((double const*)p);
     return _mm256_broadcast_pd(&tmp);
 }
-template <class U>
-inline __m256d load(U const*p1, U const*p2){
+inline __m256d load(std::complex<double> const*p1, std::complex<double> const*p2){
     return _mm256_loadu2_m128d((double const*)p2, (double const*)p1);
 }
+inline void store2(std::complex<double> *p1, std::complex<double> *p2, __m256d const& v){
+    _mm256_storeu2_m128d((double*)p1, (double*)p2, v);
+}
+inline __m256d swap_neg(__m256d const& m){
+    __m256d neg = _mm256_setr_pd(1.0, -1.0, 1.0, -1.0);
+    return _mm256_mul_pd(_mm256_permute_pd(m, 5), neg);
+}
+
+// single precision: the result of mul is stored as (re0, re1, im0, im1)
+// (which is compatible with add) and only reordered by store2
+inline __m128 mul(__m128 const& c1, __m128 const& c2, __m128 const& c2tm){
+    auto ac_bd = _mm_mul_ps(c1, c2);
+    auto multbmadmc = _mm_mul_ps(c1, c2tm);
+    return _mm_hsub_ps(ac_bd, multbmadmc);
+}
+inline __m128 add(__m128 const& c1, __m128 const& c2){
+    return _mm_add_ps(c1, c2);
+}
+inline __m128 load2(std::complex<float> *p){
+    return _mm_castpd_ps(_mm_load1_pd((double const*)p));
+}
+inline __m128 load(std::complex<float> const*p1, std::complex<float> const*p2){
+    auto lo = _mm_loadl_pi(_mm_setzero_ps(), (__m64 const*)p1);
+    return _mm_loadh_pi(lo, (__m64 const*)p2);
+}
+inline void store2(std::complex<float> *p1, std::complex<float> *p2, __m128 const& v){
+    auto res = _mm_shuffle_ps(v, v, _MM_SHUFFLE(3, 1, 2, 0));
+    _mm_storel_pi((__m64*)p2, res);
+    _mm_storeh_pi((__m64*)p1, res);
+}
+inline __m128 swap_neg(__m128 const& m){
+    __m128 neg = _mm_setr_ps(1.0f, -1.0f, 1.0f, -1.0f);
+    return _mm_mul_ps(_mm_shuffle_ps(m, m, _MM_SHUFFLE(2, 3, 0, 1)), neg);
+}
 #endif
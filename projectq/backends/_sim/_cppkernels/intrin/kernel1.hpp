@@ -15,12 +15,12 @@
 template <class V, class M>
 inline void kernel_core(V &psi, std::size_t I, std::size_t d0, M const& m, M const& mt)
 {
-    __m256d v[2];
+    simd_type<V> v[2];
 
     v[0] = load2(&psi[I]);
     v[1] = load2(&psi[I + d0]);
 
-    _mm256_storeu2_m128d((double*)&psi[I + d0], (double*)&psi[I], add(mul(v[0], m[0], mt[0]), mul(v[1], m[1], mt[1])));
+    store2(&psi[I + d0], &psi[I], add(mul(v[0], m[0], mt[0]), mul(v[1], m[1], mt[1])));
 
 }
 
@@ -31,13 +31,11 @@ void kernel(V &psi, unsigned id0, M const& m, std::size_t ctrlmask)
     std::size_t n = psi.size();
     std::size_t d0 = 1UL << id0;
 
-    __m256d mm[] = {load(&m[0][0], &m[1][0]), load(&m[0][1], &m[1][1])};
-    __m256d mmt[2];
+    simd_type<V> mm[] = {load(&m[0][0], &m[1][0]), load(&m[0][1], &m[1][1])};
+    simd_type<V> mmt[2];
 
-    __m256d neg = _mm256_setr_pd(1.0, -1.0, 1.0, -1.0);
     for (unsigned i = 0; i < 2; ++i){
-        auto badc = _mm256_permute_pd(mm[i], 5);
-        mmt[i] = _mm256_mul_pd(badc, neg);
+        mmt[i] = swap_neg(mm[i]);
     }
 
     std::size_t dsorted[] = {d0};
@@ -51,13 +49,9 @@ void kernel(V &psi, unsigned id0, M const& m, std::size_t ctrlmask)
         }
     }
     else{
-        #pragma omp for collapse(LOOP_COLLAPSE1) schedule(static)
-        for (std::size_t i0 = 0; i0 < n; i0 += 2 * dsorted[0]){
-            for (std::size_t i1 = 0; i1 < dsorted[0]; ++i1){
-                if (((i0 + i1)&ctrlmask) == ctrlmask)
-                    kernel_core(psi, i0 + i1, d0, mm, mmt);
-            }
-        }
+        for_each_controlled(n, ctrlmask, d0, [&](std::size_t i){
+            kernel_core(psi, i, d0, mm, mmt);
+        });
     }
 }
 
@@ -18,6 +18,7 @@
 #include <complex>
 #include <functional>
 #include <algorithm>
+#include "../controlled.hpp"
 #include "cintrin.hpp"
 #include "alignedallocator.hpp"
 
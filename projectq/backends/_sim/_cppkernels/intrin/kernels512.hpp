@@ -0,0 +1,162 @@
+// Copyright 2017 ProjectQ-Framework (www.projectq.ch)
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+// http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+// AVX-512 kernels for gates on 2 (3 in single precision) to 5 qubits
+// (included into the namespace kernels_avx512 after intrin/kernels.hpp,
+// whose kernels are used for smaller gates). One register holds a block of
+// 4 (8 in single precision) entries of a column of the gate matrix, such that
+// a k-qubit gate takes 2^(2k-1) (2^(2k-2)) fused multiply-adds per group of
+// 2^k amplitudes.
+
+template <class T>
+struct WideTraits;
+
+template <>
+struct WideTraits<double>{
+    using reg = __m512d;
+    static constexpr unsigned rows = 4;
+    static reg load(double const* p){ return _mm512_load_pd(p); }
+    static reg set1(double x){ return _mm512_set1_pd(x); }
+    static reg zero(){ return _mm512_setzero_pd(); }
+    static reg fmadd(reg a, reg b, reg c){ return _mm512_fmadd_pd(a, b, c); }
+    // (c - d, c + d) for each (real, imaginary) pair
+    static reg combine(reg c, reg d){ return _mm512_fmaddsub_pd(set1(1.), c, d); }
+    static void store(std::complex<double>* psi, std::size_t const* o, reg r){
+        _mm_storeu_pd(reinterpret_cast<double*>(psi + o[0]), _mm512_castpd512_pd128(r));
+        _mm_storeu_pd(reinterpret_cast<double*>(psi + o[1]), _mm512_extractf64x2_pd(r, 1));
+        _mm_storeu_pd(reinterpret_cast<double*>(psi + o[2]), _mm512_extractf64x2_pd(r, 2));
+        _mm_storeu_pd(reinterpret_cast<double*>(psi + o[3]), _mm512_extractf64x2_pd(r, 3));
+    }
+};
+
+template <>
+struct WideTraits<float>{
+    using reg = __m512;
+    static constexpr unsigned rows = 8;
+    static reg load(float const* p){ return _mm512_load_ps(p); }
+    static reg set1(float x){ return _mm512_set1_ps(x); }
+    static reg zero(){ return _mm512_setzero_ps(); }
+    static reg fmadd(reg a, reg b, reg c){ return _mm512_fmadd_ps(a, b, c); }
+    static reg combine(reg c, reg d){ return _mm512_fmaddsub_ps(set1(1.f), c, d); }
+    static void store(std::complex<float>* psi, std::size_t const* o, reg r){
+        store_pair(psi + o[0], psi + o[1], _mm512_castps512_ps128(r));
+        store_pair(psi + o[2], psi + o[3], _mm512_extractf32x4_ps(r, 1));
+        store_pair(psi + o[4], psi + o[5], _mm512_extractf32x4_ps(r, 2));
+        store_pair(psi + o[6], psi + o[7], _mm512_extractf32x4_ps(r, 3));
+    }
+    static void store_pair(std::complex<float>* p0, std::complex<float>* p1, __m128 r){
+        _mm_storel_pi(reinterpret_cast<__m64*>(p0), r);
+        _mm_storeh_pi(reinterpret_cast<__m64*>(p1), r);
+    }
+};
+
+// gate matrix of a k-qubit gate: entry [b][c] holds the rows of block b of
+// column c as (re, im) pairs, and the swapped pairs (im, re) are kept for
+// the imaginary part of the amplitudes
+template <unsigned K, class T>
+struct WideGate{
+    using Traits = WideTraits<T>;
+    static constexpr unsigned dim = 1u << K;
+    static constexpr unsigned blocks = dim / Traits::rows;
+    typename Traits::reg m[blocks][dim];
+    typename Traits::reg mt[blocks][dim];
+    std::size_t offsets[dim];
+
+    template <class M>
+    WideGate(M const& matrix, unsigned const* ids){
+        for (unsigned c = 0; c < dim; ++c){
+            offsets[c] = 0;
+            for (unsigned k = 0; k < K; ++k)
+                if ((c >> k) & 1)
+                    offsets[c] |= 1UL << ids[k];
+        }
+        for (unsigned b = 0; b < blocks; ++b)
+            for (unsigned c = 0; c < dim; ++c){
+                alignas(64) T col[2 * Traits::rows], swapped[2 * Traits::rows];
+                for (unsigned i = 0; i < Traits::rows; ++i){
+                    std::complex<T> const x = matrix[Traits::rows * b + i][c];
+                    col[2 * i] = swapped[2 * i + 1] = x.real();
+                    col[2 * i + 1] = swapped[2 * i] = x.imag();
+                }
+                m[b][c] = Traits::load(col);
+                mt[b][c] = Traits::load(swapped);
+            }
+    }
+};
+
+template <unsigned K, class T>
+inline void wide_kernel_core(std::complex<T>* psi, WideGate<K, T> const& g){
+    using Traits = WideTraits<T>;
+    constexpr unsigned dim = WideGate<K, T>::dim, blocks = WideGate<K, T>::blocks;
+    typename Traits::reg re[blocks], im[blocks];
+    for (unsigned b = 0; b < blocks; ++b){
+        re[b] = Traits::zero();
+        im[b] = Traits::zero();
+    }
+    // re accumulates m * Re(psi) and im accumulates swap(m) * Im(psi)
+    for (unsigned c = 0; c < dim; ++c){
+        T const* x = reinterpret_cast<T const*>(psi + g.offsets[c]);
+        auto const a = Traits::set1(x[0]), s = Traits::set1(x[1]);
+        for (unsigned b = 0; b < blocks; ++b){
+            re[b] = Traits::fmadd(g.m[b][c], a, re[b]);
+            im[b] = Traits::fmadd(g.mt[b][c], s, im[b]);
+        }
+    }
+    for (unsigned b = 0; b < blocks; ++b)
+        Traits::store(psi, g.offsets + Traits::rows * b, Traits::combine(re[b], im[b]));
+}
+
+// ids are given from low to high (i.e., ids[0] is bit 0 of the matrix index)
+template <unsigned K, class T, class A, class M>
+void wide_kernel(std::vector<std::complex<T>, A> &psi, unsigned const* ids, M const& m, std::size_t ctrlmask){
+    WideGate<K, T> const g(m, ids);
+    std::size_t targetmask = 0;
+    for (unsigned k = 0; k < K; ++k)
+        targetmask |= 1UL << ids[k];
+    std::complex<T>* data = psi.data();
+    for_each_controlled(psi.size(), ctrlmask, targetmask, [&](std::size_t i){
+        wide_kernel_core<K>(data + i, g);
+    });
+}
+
+// same arguments as kernel(psi, id_(k-1), ..., id_0, m, ctrlmask), using the
+// AVX2 kernels for gates which are too small for one register
+template <class V, class... Args>
+inline void kernel_wide(V &psi, Args const&... args){
+    kernel(psi, args...);
+}
+
+template <class A, class I, class M, class C>
+inline void kernel_wide(std::vector<std::complex<double>, A> &psi, I id1, I id0, M const& m, C ctrlmask){
+    unsigned const ids[] = {unsigned(id0), unsigned(id1)};
+    wide_kernel<2>(psi, ids, m, ctrlmask);
+}
+
+template <class T, class A, class I, class M, class C>
+inline void kernel_wide(std::vector<std::complex<T>, A> &psi, I id2, I id1, I id0, M const& m, C ctrlmask){
+    unsigned const ids[] = {unsigned(id0), unsigned(id1), unsigned(id2)};
+    wide_kernel<3>(psi, ids, m, ctrlmask);
+}
+
+template <class T, class A, class I, class M, class C>
+inline void kernel_wide(std::vector<std::complex<T>, A> &psi, I id3, I id2, I id1, I id0, M const& m, C ctrlmask){
+    unsigned const ids[] = {unsigned(id0), unsigned(id1), unsigned(id2), unsigned(id3)};
+    wide_kernel<4>(psi, ids, m, ctrlmask);
+}
+
+template <class T, class A, class I, class M, class C>
+inline void kernel_wide(std::vector<std::complex<T>, A> &psi, I id4, I id3, I id2, I id1, I id0, M const& m, C ctrlmask){
+    unsigned const ids[] = {unsigned(id0), unsigned(id1), unsigned(id2), unsigned(id3), unsigned(id4)};
+    wide_kernel<5>(psi, ids, m, ctrlmask);
+}
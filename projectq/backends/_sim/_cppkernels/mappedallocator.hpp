@@ -0,0 +1,165 @@
+// Copyright 2017 ProjectQ-Framework (www.projectq.ch)
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+// http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+#ifndef MAPPEDALLOCATOR_HPP_
+#define MAPPEDALLOCATOR_HPP_
+
+#include "intrin/alignedallocator.hpp"
+#include <string>
+#include <vector>
+#include <stdexcept>
+#include <type_traits>
+#ifndef _WIN32
+#include <sys/mman.h>
+#include <unistd.h>
+#include <cstdlib>
+#include <cerrno>
+#include <cstring>
+#endif
+
+
+// Allocator for the (possibly huge) state vector: Without a directory, it
+// allocates aligned memory. Given a directory, each allocation is backed by a
+// memory-mapped temporary file in that directory (which is unlinked right
+// away, i.e., it disappears once it is unmapped or the process terminates).
+// The operating system then pages the state vector in and out as needed, so
+// simulations exceeding the main memory are limited by the disk bandwidth.
+template <typename T, unsigned int Alignment>
+class mapped_allocator
+{
+ public:
+    typedef T* pointer;
+    typedef T const* const_pointer;
+    typedef T& reference;
+    typedef T const& const_reference;
+    typedef T value_type;
+    typedef std::size_t size_type;
+    typedef std::ptrdiff_t difference_type;
+
+    // the storage travels with the data (required for std::swap of vectors
+    // with different backing storage)
+    typedef std::true_type propagate_on_container_copy_assignment;
+    typedef std::true_type propagate_on_container_move_assignment;
+    typedef std::true_type propagate_on_container_swap;
+
+    template <typename U>
+    struct rebind
+    {
+        typedef mapped_allocator<U, Alignment> other;
+    };
+
+    mapped_allocator() noexcept {}
+    explicit mapped_allocator(std::string const& directory) : dir_(directory)
+    {
+#ifdef _WIN32
+        if (!dir_.empty())
+            throw std::runtime_error("Memory-mapped state vectors are not "
+                                     "supported on Windows.");
+#endif
+    }
+    template <typename U>
+    mapped_allocator(mapped_allocator<U, Alignment> const& other)
+    : dir_(other.directory())
+    {
+    }
+
+    std::string const& directory() const noexcept { return dir_; }
+
+    bool is_mapped() const noexcept { return !dir_.empty(); }
+
+    pointer allocate(size_type n)
+    {
+        if (!is_mapped())
+            return aligned_allocator<T, Alignment>().allocate(n);
+#ifndef _WIN32
+        std::string name = dir_ + "/projectq-state-XXXXXX";
+        std::vector<char> tmpl(name.begin(), name.end());
+        tmpl.push_back('\0');
+        int fd = mkstemp(tmpl.data());
+        if (fd < 0)
+            throw std::runtime_error("mapped_allocator: Could not create a "
+                                     "file in '" + dir_ + "': " +
+                                     std::strerror(errno));
+        unlink(tmpl.data());
+        std::size_t bytes = n * sizeof(T);
+        if (ftruncate(fd, bytes) != 0){
+            close(fd);
+            throw std::bad_alloc();
+        }
+        void* p = mmap(nullptr, bytes, PROT_READ | PROT_WRITE, MAP_SHARED,
+                       fd, 0);
+        close(fd);
+        if (p == MAP_FAILED)
+            throw std::bad_alloc();
+        return reinterpret_cast<pointer>(p);
+#else
+        throw std::bad_alloc();
+#endif
+    }
+
+    void deallocate(pointer p, size_type n) noexcept
+    {
+        if (!is_mapped())
+            return aligned_allocator<T, Alignment>().deallocate(p, n);
+#ifndef _WIN32
+        munmap(reinterpret_cast<void*>(p), n * sizeof(T));
+#endif
+    }
+
+    size_type max_size() const noexcept
+    {
+        std::allocator<T> a;
+        return a.max_size();
+    }
+
+    template <typename C, class... Args>
+    void construct(C* c, Args&&... args)
+    {
+        new ((void*)c) C(std::forward<Args>(args)...);
+    }
+
+    // value-initialization (e.g., by resize) leaves the memory untouched:
+    // the simulator initializes new amplitudes in parallel, such that each
+    // page is touched first by (and placed on the NUMA node of) the thread
+    // which works on that part of the state vector
+    template <typename C>
+    void construct(C*) noexcept
+    {
+        static_assert(std::is_trivially_copyable<C>::value,
+                      "mapped_allocator: Elements are not initialized.");
+    }
+
+    template <typename C>
+    void destroy(C* c)
+    {
+        c->~C();
+    }
+
+    template <typename U>
+    bool operator==(mapped_allocator<U, Alignment> const& other) const noexcept
+    {
+        return dir_ == other.directory();
+    }
+
+    template <typename U>
+    bool operator!=(mapped_allocator<U, Alignment> const& other) const noexcept
+    {
+        return !(*this == other);
+    }
+
+ private:
+    std::string dir_;
+};
+
+#endif
@@ -15,7 +15,7 @@
 template <class V, class M>
 inline void kernel_core(V &psi, std::size_t I, std::size_t d0, std::size_t d1, M const& m)
 {
-    std::complex<double> v[4];
+    typename V::value_type v[4];
     v[0] = psi[I];
     v[1] = psi[I + d0];
     v[2] = psi[I + d1];
@@ -49,15 +49,9 @@ void kernel(V &psi, unsigned id1, unsigned id0, M const& m, std::size_t ctrlmask
         }
     }
     else{
-        #pragma omp for collapse(LOOP_COLLAPSE2) schedule(static)
-        for (std::size_t i0 = 0; i0 < n; i0 += 2 * dsorted[0]){
-            for (std::size_t i1 = 0; i1 < dsorted[0]; i1 += 2 * dsorted[1]){
-                for (std::size_t i2 = 0; i2 < dsorted[1]; ++i2){
-                    if (((i0 + i1 + i2)&ctrlmask) == ctrlmask)
-                        kernel_core(psi, i0 + i1 + i2, d0, d1, m);
-                }
-            }
-        }
+        for_each_controlled(n, ctrlmask, d0 | d1, [&](std::size_t i){
+            kernel_core(psi, i, d0, d1, m);
+        });
     }
 }
 
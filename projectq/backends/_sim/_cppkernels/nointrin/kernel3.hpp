@@ -15,13 +15,13 @@
 template <class V, class M>
 inline void kernel_core(V &psi, std::size_t I, std::size_t d0, std::size_t d1, std::size_t d2, M const& m)
 {
-    std::complex<double> v[4];
+    typename V::value_type v[4];
     v[0] = psi[I];
     v[1] = psi[I + d0];
     v[2] = psi[I + d1];
     v[3] = psi[I + d0 + d1];
 
-    std::complex<double> tmp[8];
+    typename V::value_type tmp[8];
 
     tmp[0] = add(mul(v[0], m[0][0]), add(mul(v[1], m[0][1]), add(mul(v[2], m[0][2]), mul(v[3], m[0][3]))));
     tmp[1] = add(mul(v[0], m[1][0]), add(mul(v[1], m[1][1]), add(mul(v[2], m[1][2]), mul(v[3], m[1][3]))));
@@ -72,17 +72,9 @@ void kernel(V &psi, unsigned id2, unsigned id1, unsigned id0, M const& m, std::s
         }
     }
     else{
-        #pragma omp for collapse(LOOP_COLLAPSE3) schedule(static)
-        for (std::size_t i0 = 0; i0 < n; i0 += 2 * dsorted[0]){
-            for (std::size_t i1 = 0; i1 < dsorted[0]; i1 += 2 * dsorted[1]){
-                for (std::size_t i2 = 0; i2 < dsorted[1]; i2 += 2 * dsorted[2]){
-                    for (std::size_t i3 = 0; i3 < dsorted[2]; ++i3){
-                        if (((i0 + i1 + i2 + i3)&ctrlmask) == ctrlmask)
-                            kernel_core(psi, i0 + i1 + i2 + i3, d0, d1, d2, m);
-                    }
-                }
-            }
-        }
+        for_each_controlled(n, ctrlmask, d0 | d1 | d2, [&](std::size_t i){
+            kernel_core(psi, i, d0, d1, d2, m);
+        });
     }
 }
 
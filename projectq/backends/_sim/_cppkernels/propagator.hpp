@@ -0,0 +1,121 @@
+// Copyright 2017 ProjectQ-Framework (www.projectq.ch)
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+// http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+#ifndef PROPAGATOR_HPP_
+#define PROPAGATOR_HPP_
+
+#include <cmath>
+#include <complex>
+#include <vector>
+
+// small dense helpers for the Krylov and Chebyshev propagators of
+// emulate_time_evolution
+
+// Bessel functions of the first kind J_0(x), ..., J_kmax(x) for x >= 0
+// (computed with Miller's backward recurrence, which is stable for k > x)
+inline std::vector<double> bessel_j(double x, unsigned kmax){
+    std::vector<double> j(kmax + 1, 0.);
+    if (x == 0.){
+        j[0] = 1.;
+        return j;
+    }
+    unsigned start = kmax + unsigned(std::sqrt(160. * (kmax + 1))) + 10;
+    start += start & 1;
+    double next = 0., current = 1., sum = 0.;
+    for (unsigned k = start; k > 0; --k){
+        double const previous = 2. * k / x * current - next;
+        next = current;
+        current = previous; // J_(k-1) up to normalization
+        if (k - 1 <= kmax)
+            j[k - 1] = current;
+        if ((k - 1) % 2 == 0)
+            sum += (k - 1 == 0 ? 1. : 2.) * current;
+        if (std::abs(current) > 1.e250){
+            for (auto& v : j)
+                v *= 1.e-250;
+            next *= 1.e-250;
+            current *= 1.e-250;
+            sum *= 1.e-250;
+        }
+    }
+    // J_0 + 2 J_2 + 2 J_4 + ... = 1
+    for (auto& v : j)
+        v /= sum;
+    return j;
+}
+
+// eigen-decomposition of the real symmetric n x n matrix a (row-major) using
+// cyclic Jacobi rotations: returns the eigenvalues and stores the
+// eigenvectors in the columns of v
+inline std::vector<double> symmetric_eigen(std::vector<double> a, unsigned n,
+                                           std::vector<double>& v){
+    v.assign(n * n, 0.);
+    for (unsigned i = 0; i < n; ++i)
+        v[i * n + i] = 1.;
+    for (unsigned sweep = 0; sweep < 100; ++sweep){
+        double off = 0., total = 0.;
+        for (unsigned p = 0; p < n; ++p)
+            for (unsigned q = 0; q < n; ++q){
+                total += a[p * n + q] * a[p * n + q];
+                if (p != q)
+                    off += a[p * n + q] * a[p * n + q];
+            }
+        if (off <= 1.e-30 * total)
+            break;
+        for (unsigned p = 0; p < n; ++p)
+            for (unsigned q = p + 1; q < n; ++q){
+                double const apq = a[p * n + q];
+                if (apq == 0.)
+                    continue;
+                double const theta = (a[q * n + q] - a[p * n + p]) / (2. * apq);
+                double const t = (theta >= 0. ? 1. : -1.) / (std::abs(theta) + std::sqrt(theta * theta + 1.));
+                double const c = 1. / std::sqrt(t * t + 1.), s = t * c;
+                for (unsigned k = 0; k < n; ++k){
+                    double const akp = a[k * n + p], akq = a[k * n + q];
+                    a[k * n + p] = c * akp - s * akq;
+                    a[k * n + q] = s * akp + c * akq;
+                }
+                for (unsigned k = 0; k < n; ++k){
+                    double const apk = a[p * n + k], aqk = a[q * n + k];
+                    a[p * n + k] = c * apk - s * aqk;
+                    a[q * n + k] = s * apk + c * aqk;
+                }
+                for (unsigned k = 0; k < n; ++k){
+                    double const vkp = v[k * n + p], vkq = v[k * n + q];
+                    v[k * n + p] = c * vkp - s * vkq;
+                    v[k * n + q] = s * vkp + c * vkq;
+                }
+            }
+    }
+    std::vector<double> w(n);
+    for (unsigned i = 0; i < n; ++i)
+        w[i] = a[i * n + i];
+    return w;
+}
+
+// exp(-i time T) e_0 for the symmetric matrix T = v diag(w) v^T
+inline std::vector<std::complex<double>> expm_first_column(
+        std::vector<double> const& w, std::vector<double> const& v,
+        double time){
+    unsigned const n = w.size();
+    std::vector<std::complex<double>> y(n, 0.);
+    for (unsigned l = 0; l < n; ++l){
+        std::complex<double> const f = v[l] * std::exp(std::complex<double>(0., -time * w[l]));
+        for (unsigned j = 0; j < n; ++j)
+            y[j] += v[j * n + l] * f;
+    }
+    return y;
+}
+
+#endif
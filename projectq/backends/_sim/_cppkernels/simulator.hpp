@@ -18,93 +18,110 @@
 #include <vector>
 #include <complex>
 
-#if defined(NOINTRIN) || !defined(INTRIN)
-#include "nointrin/kernels.hpp"
-#else
-#include "intrin/kernels.hpp"
-#endif
+#include "dispatch.hpp"
 
 #include "intrin/alignedallocator.hpp"
+#include "mappedallocator.hpp"
 #include "fusion.hpp"
+#include "propagator.hpp"
 #include <map>
 #include <cassert>
 #include <algorithm>
+#include <numeric>
 #include <tuple>
 #include <random>
 #include <functional>
+#include <type_traits>
+#include <string>
+#include <sstream>
+#include <array>
+#include <limits>
+#include <chrono>
+#include <stdexcept>
+#include <memory>
+#include <cstdint>
+#if defined(_OPENMP)
+#include <omp.h>
+#endif
 
 
-class Simulator{
+// state vector simulator storing the amplitudes as std::complex<T>; gate
+// fusion and all coefficients (e.g., of QubitOperators) use double precision
+template <class T>
+class BasicSimulator{
 public:
-    using calc_type = double;
+    using calc_type = T;
     using complex_type = std::complex<calc_type>;
-    using StateVector = std::vector<complex_type, aligned_allocator<complex_type,512>>;
+    using StateVector = std::vector<complex_type, mapped_allocator<complex_type,512>>;
+    using KernelMatrix = std::vector<std::vector<complex_type, aligned_allocator<complex_type, 64>>>;
     using Map = std::map<unsigned, unsigned>;
     using RndEngine = std::mt19937;
     using Term = std::vector<std::pair<unsigned, char>>;
-    using TermsDict = std::vector<std::pair<Term, calc_type>>;
-    using ComplexTermsDict = std::vector<std::pair<Term, complex_type>>;
+    using TermsDict = std::vector<std::pair<Term, double>>;
+    using ComplexTermsDict = std::vector<std::pair<Term, std::complex<double>>>;
 
-    Simulator(unsigned seed = 1) : N_(0), vec_(1,0.), fusion_qubits_min_(4),
+    // gates executed between start_recording and stop_recording (after
+    // fusion), where the qubits are given by their positions in the
+    // recorded register
+    struct Recording{
+        enum class Kind { dense, diagonal, permutation };
+        struct Gate{
+            Kind kind;
+            KernelMatrix matrix;
+            std::vector<complex_type> diag;
+            std::vector<std::size_t> perm;
+            std::vector<std::complex<double>> phases;
+            std::vector<unsigned> ids, ctrl;
+        };
+        unsigned num_qubits;
+        std::vector<Gate> gates;
+    };
+
+    // if mmap_dir is non-empty, the state vector (and all temporary copies)
+    // are stored in memory-mapped files in that directory
+    BasicSimulator(unsigned seed = 1, std::string const& mmap_dir = "")
+    : N_(0), vec_(1, 0., mapped_allocator<complex_type,512>(mmap_dir)),
+      fusion_qubits_min_(4),
                                    fusion_qubits_max_(5), rnd_eng_(seed) {
         vec_[0]=1.; // all-zero initial state
         std::uniform_real_distribution<double> dist(0., 1.);
         rng_ = std::bind(dist, std::ref(rnd_eng_));
     }
 
+    // The state vector is only resized once it is used: newly allocated
+    // qubits (in |0>) get the next free position and their amplitudes are
+    // added when the next gate is applied, such that allocating a register
+    // grows the state vector only once. Deallocated qubits in |0> keep
+    // their position, which is reused by the next allocation (or removed
+    // in place once the state vector is used).
     void allocate_qubit(unsigned id){
         if (map_.count(id) == 0){
-            map_[id] = N_++;
-            StateVector newvec; // avoid large memory allocations
-            if( tmpBuff1_.capacity() >= (1UL << N_) )
-              std::swap(newvec, tmpBuff1_);
-            newvec.resize(1UL << N_);
-#pragma omp parallel for schedule(static)
-            for (std::size_t i = 0; i < newvec.size(); ++i)
-                newvec[i] = (i < vec_.size())?vec_[i]:0.;
-            std::swap(vec_, newvec);
-            // recycle large memory
-            std::swap(tmpBuff1_, newvec);
-            if( tmpBuff1_.capacity() < tmpBuff2_.capacity() )
-              std::swap(tmpBuff1_, tmpBuff2_);
+            if (!free_.empty()){
+                map_[id] = free_.back();
+                free_.pop_back();
+            }
+            else
+                map_[id] = N_++;
         }
         else
             throw(std::runtime_error(
                 "AllocateQubit: ID already exists. Qubit IDs should be unique."));
     }
 
-    bool get_classical_value(unsigned id, calc_type tol = 1.e-12){
-        run();
-        unsigned pos = map_[id];
-        std::size_t delta = (1UL << pos);
-
-        for (std::size_t i = 0; i < vec_.size(); i += 2*delta){
-            for (std::size_t j = 0; j < delta; ++j){
-                if (std::norm(vec_[i+j]) > tol)
-                    return false;
-                if (std::norm(vec_[i+j+delta]) > tol)
-                    return true;
-            }
-        }
-        assert(false); // this will never happen
-        return false; // suppress 'control reaches end of non-void...'
+    // reserves memory for num_qubits qubits such that allocating qubits up
+    // to that number grows the state vector in place
+    void reserve(unsigned num_qubits){
+        vec_.reserve(1UL << num_qubits);
     }
 
-    bool is_classical(unsigned id, calc_type tol = 1.e-12){
+    bool get_classical_value(unsigned id, calc_type tol = default_tolerance()){
         run();
-        unsigned pos = map_[id];
-        std::size_t delta = (1UL << pos);
-
-        short up = 0, down = 0;
-        #pragma omp parallel for schedule(static) reduction(|:up,down)
-        for (std::size_t i = 0; i < vec_.size(); i += 2*delta){
-            for (std::size_t j = 0; j < delta; ++j){
-                up = up | ((std::norm(vec_[i+j]) > tol)&1);
-                down = down | ((std::norm(vec_[i+j+delta]) > tol)&1);
-            }
-        }
+        return get_classical_value_at(map_[id], tol);
+    }
 
-        return 1 == (up^down);
+    bool is_classical(unsigned id, calc_type tol = default_tolerance()){
+        run();
+        return is_classical_at(map_[id], tol);
     }
 
     void collapse_vector(unsigned id, bool value = false, bool shrink = false){
@@ -113,18 +130,17 @@ public:
         std::size_t delta = (1UL << pos);
 
         if (!shrink){
-            #pragma omp parallel for schedule(static)
+            #pragma omp parallel for schedule(static) num_threads(team_size())
             for (std::size_t i = 0; i < vec_.size(); i += 2*delta){
                 for (std::size_t j = 0; j < delta; ++j)
                     vec_[i+j+static_cast<std::size_t>(!value)*delta] = 0.;
             }
         }
         else{
-            StateVector newvec; // avoid costly memory reallocations
-            if( tmpBuff1_.capacity() >= (1UL << (N_-1)) )
-              std::swap(tmpBuff1_, newvec);
+            // avoid costly memory reallocations
+            StateVector newvec = take_buffer(tmpBuff1_, 1UL << (N_-1));
             newvec.resize((1UL << (N_-1)));
-            #pragma omp parallel for schedule(static) if(0)
+            #pragma omp parallel for schedule(static) if(0) num_threads(team_size())
             for (std::size_t i = 0; i < vec_.size(); i += 2*delta)
                 std::copy_n(&vec_[i + static_cast<std::size_t>(value)*delta],
                             delta, &newvec[i/2]);
@@ -149,15 +165,15 @@ public:
         for (unsigned i = 0; i < ids.size(); ++i)
             positions[i] = map_[ids[i]];
 
-        calc_type P = 0.;
-        calc_type rnd = rng_();
-
         // pick entry at random with probability |entry|^2
-        std::size_t pick = 0;
-        while (P < rnd && pick < vec_.size())
-            P += std::norm(vec_[pick++]);
+        std::size_t nblocks = std::min<std::size_t>(vec_.size(), 1024);
+        std::vector<double> partial = cumulative_block_probabilities(nblocks);
+        double rnd = rng_() * partial[nblocks];
+        std::size_t b = std::lower_bound(partial.begin() + 1,
+                                         partial.begin() + nblocks, rnd)
+                        - (partial.begin() + 1);
+        std::size_t pick = scan_block(b, vec_.size() / nblocks, partial[b], rnd);
 
-        pick--;
         // determine result vector (boolean values for each qubit)
         // and create mask to detect bad entries (i.e., entries that don't agree with measurement)
         res = std::vector<bool>(ids.size());
@@ -169,20 +185,7 @@ public:
             mask |= (1UL << positions[i]);
             val |= (static_cast<std::size_t>(r&1) << positions[i]);
         }
-        // set bad entries to 0
-        calc_type N = 0.;
-        #pragma omp parallel for reduction(+:N) schedule(static)
-        for (std::size_t i = 0; i < vec_.size(); ++i){
-            if ((i & mask) != val)
-                vec_[i] = 0.;
-            else
-                N += std::norm(vec_[i]);
-        }
-        // re-normalize
-        N = 1./std::sqrt(N);
-        #pragma omp parallel for schedule(static)
-        for (std::size_t i = 0; i < vec_.size(); ++i)
-            vec_[i] *= N;
+        collapse(mask, val, probability(mask, val));
     }
 
     std::vector<bool> measure_qubits_return(std::vector<unsigned> const& ids){
@@ -191,78 +194,444 @@ public:
         return ret;
     }
 
-    void deallocate_qubit(unsigned id){
+    // draw `shots` measurement outcomes of the qubits `ids` without
+    // collapsing the wavefunction (bit i of each outcome is qubit ids[i])
+    template <class RNG>
+    std::vector<std::size_t> sample_qubits(std::vector<unsigned> const& ids,
+                                           std::size_t shots, RNG &rng){
         run();
-        assert(map_.count(id) == 1);
-        if (!is_classical(id))
-            throw(std::runtime_error("Error: Qubit has not been measured / uncomputed! There is most likely a bug in your code."));
+        if (!check_ids(ids))
+            throw(std::runtime_error("sample(): Unknown qubit id. Please make sure you have called eng.flush()."));
+
+        std::size_t nblocks = std::min<std::size_t>(vec_.size(), 1024);
+        std::size_t block = vec_.size() / nblocks;
+        std::vector<double> partial = cumulative_block_probabilities(nblocks);
+
+        std::uniform_real_distribution<double> dist(0., 1.);
+        std::vector<double> rnd(shots);
+        for (auto &r : rnd)
+            r = dist(rng) * partial[nblocks];
+        std::sort(rnd.begin(), rnd.end());
+
+        // binary search for the random numbers falling into each block and
+        // continue with a local scan within the block
+        std::vector<std::size_t> picked(shots);
+        #pragma omp parallel for schedule(dynamic) num_threads(team_size())
+        for (std::size_t b = 0; b < nblocks; ++b){
+            auto first = (b == 0) ? rnd.begin()
+                : std::upper_bound(rnd.begin(), rnd.end(), partial[b]);
+            auto last = (b + 1 == nblocks) ? rnd.end()
+                : std::upper_bound(first, rnd.end(), partial[b + 1]);
+            double P = partial[b];
+            std::size_t i = b * block;
+            for (auto r = first; r != last; ++r){
+                while (i + 1 < (b + 1) * block && P + std::norm(vec_[i]) < *r)
+                    P += std::norm(vec_[i++]);
+                picked[r - rnd.begin()] = i;
+            }
+        }
+
+        std::vector<unsigned> positions(ids.size());
+        for (unsigned i = 0; i < ids.size(); ++i)
+            positions[i] = map_[ids[i]];
+        #pragma omp parallel for schedule(static) num_threads(team_size())
+        for (std::size_t k = 0; k < shots; ++k){
+            std::size_t outcome = 0;
+            for (unsigned i = 0; i < positions.size(); ++i)
+                outcome |= ((picked[k] >> positions[i]) & 1UL) << i;
+            picked[k] = outcome;
+        }
+        // the samples were generated in sorted order
+        std::shuffle(picked.begin(), picked.end(), rng);
+        return picked;
+    }
+
+    std::vector<std::size_t> sample_qubits(std::vector<unsigned> const& ids,
+                                           std::size_t shots){
+        return sample_qubits(ids, shots, rnd_eng_);
+    }
 
-        bool value = get_classical_value(id);
-        collapse_vector(id, value, true);
+    std::vector<std::size_t> sample_qubits(std::vector<unsigned> const& ids,
+                                           std::size_t shots, unsigned seed){
+        RndEngine rng(seed);
+        return sample_qubits(ids, shots, rng);
     }
 
+    void deallocate_qubit(unsigned id){
+        // (keeps the positions of previously deallocated qubits)
+        run_gates();
+        assert(map_.count(id) == 1);
+        unsigned pos = map_[id];
+        // the amplitudes of qubits whose allocation is still pending are not
+        // part of the state vector yet (and the qubit is in |0>)
+        if ((1UL << pos) < vec_.size()){
+            if (!is_classical_at(pos))
+                throw(std::runtime_error("Error: Qubit has not been measured / uncomputed! There is most likely a bug in your code."));
+            if (get_classical_value_at(pos)){
+                collapse_vector(id, true, true);
+                return;
+            }
+        }
+        map_.erase(id);
+        free_.push_back(pos);
+    }
+
+    // Gates are collected in independent clusters (acting on disjoint sets of
+    // qubits, such that they commute). A new gate is fused with the clusters
+    // it overlaps if the result has at most fusion_qubits_max_ qubits and
+    // executing it is (according to the kernel costs) cheaper than
+    // executing the clusters and the gate separately. Otherwise, the
+    // overlapping clusters are executed and the gate starts a new cluster.
+    // Clusters are executed right away once they have fusion_qubits_min_
+    // qubits.
     template <class M>
     void apply_controlled_gate(M const& m, const std::vector<unsigned>& ids,
                                const std::vector<unsigned>& ctrl){
-        auto fused_gates = fused_gates_;
+        // pending diagonal gates on these qubits have to be applied first
+        if (diagonal_overlaps(ids) || diagonal_overlaps(ctrl))
+            run_diagonal();
+        auto const& cost = kernel_costs_;
+        Fusion fused_gates;
+        std::vector<Fusion> overlapping, others;
+        double separate_cost = cost[ids.size()];
+        for (auto& cluster : clusters_){
+            if (cluster.overlaps(ids) || cluster.overlaps(ctrl)){
+                fused_gates.merge(cluster);
+                separate_cost += cost[cluster.num_qubits()];
+                overlapping.push_back(std::move(cluster));
+            }
+            else
+                others.push_back(std::move(cluster));
+        }
+        clusters_ = std::move(others);
         fused_gates.insert(m, ids, ctrl);
 
+        if (fused_gates.num_qubits() > fusion_qubits_max_
+                || cost[fused_gates.num_qubits()] > separate_cost){
+            for (auto& cluster : overlapping)
+                run_cluster(cluster);
+            fused_gates = Fusion();
+            fused_gates.insert(m, ids, ctrl);
+        }
         if (fused_gates.num_qubits() >= fusion_qubits_min_
-                && fused_gates.num_qubits() <= fusion_qubits_max_){
-            fused_gates_ = fused_gates;
-            run();
+                || fused_gates.num_qubits() > fusion_qubits_max_)
+            run_cluster(fused_gates);
+        else
+            clusters_.push_back(std::move(fused_gates));
+    }
+
+    // Diagonal gates commute with each other. They are collected (acting on
+    // any number of qubits) and applied in a single pass over the state
+    // vector which only multiplies each amplitude by a phase. If the gate
+    // acts on qubits of pending (dense) fused gates, it is fused with them
+    // instead.
+    void apply_diagonal_gate(std::vector<std::complex<double>> const& diag,
+                             std::vector<unsigned> const& ids,
+                             std::vector<unsigned> const& ctrl){
+        std::vector<std::size_t> perm(diag.size());
+        std::iota(perm.begin(), perm.end(), 0);
+        if (clusters_overlap(ids) || clusters_overlap(ctrl)){
+            apply_controlled_gate(monomial_matrix(perm, diag), ids, ctrl);
+            return;
+        }
+        DiagonalGate gate{ids, ctrl, std::vector<complex_type>(diag.begin(), diag.end())};
+        diagonal_.push_back(std::move(gate));
+    }
+
+    // Applies the gate which maps the basis state j of the qubits ids to
+    // phases[j] times the basis state perm[j] (e.g., X, Swap or Toffoli) by
+    // moving amplitudes (instead of a matrix-vector multiplication).
+    void apply_permutation_gate(std::vector<std::size_t> const& perm,
+                                std::vector<std::complex<double>> const& phases,
+                                std::vector<unsigned> const& ids,
+                                std::vector<unsigned> const& ctrl){
+        if (clusters_overlap(ids) || clusters_overlap(ctrl)){
+            apply_controlled_gate(monomial_matrix(perm, phases), ids, ctrl);
+            return;
         }
-        else if (fused_gates.num_qubits() > fusion_qubits_max_
-                 || (fused_gates.num_qubits() - ids.size()) > fused_gates_.num_qubits()){
-            run();
-            fused_gates_.insert(m, ids, ctrl);
+        if (diagonal_overlaps(ids) || diagonal_overlaps(ctrl))
+            run_diagonal();
+        update_layout();
+        if (auto recorded = record(Recording::Kind::permutation, ids, ctrl)){
+            recorded->perm = perm;
+            recorded->phases = phases;
         }
-        else
-            fused_gates_ = fused_gates;
+
+        std::vector<std::size_t> offset(perm.size(), 0);
+        std::vector<unsigned> positions;
+        for (unsigned l = 0; l < ids.size(); ++l){
+            positions.push_back(map_[ids[l]]);
+            for (std::size_t j = 0; j < offset.size(); ++j)
+                if ((j >> l) & 1UL)
+                    offset[j] |= 1UL << map_[ids[l]];
+        }
+        for (auto c : ctrl)
+            positions.push_back(map_[c]);
+        // (control qubits may be listed more than once)
+        std::sort(positions.begin(), positions.end());
+        positions.erase(std::unique(positions.begin(), positions.end()), positions.end());
+        auto ctrlmask = get_control_mask(ctrl);
+        std::vector<complex_type> phase(phases.begin(), phases.end());
+
+        switch (perm.size()){
+            case 2: permute<2>(perm, phase, offset, positions, ctrlmask); break;
+            case 4: permute<4>(perm, phase, offset, positions, ctrlmask); break;
+            case 8: permute<8>(perm, phase, offset, positions, ctrlmask); break;
+            case 16: permute<16>(perm, phase, offset, positions, ctrlmask); break;
+            case 32: permute<32>(perm, phase, offset, positions, ctrlmask); break;
+            default:
+                throw std::invalid_argument("Gates with more than 5 qubits are not supported!");
+        }
+    }
+
+    void set_fusion_qubits(unsigned fusion_qubits_min, unsigned fusion_qubits_max){
+        if (fusion_qubits_max < 1 || fusion_qubits_max > 5 || fusion_qubits_min < 1)
+            throw std::invalid_argument("set_fusion_qubits(): The fused gates must act on 1 to 5 qubits.");
+        run();
+        fusion_qubits_min_ = fusion_qubits_min;
+        fusion_qubits_max_ = fusion_qubits_max;
+    }
+
+    // sets the number of threads of this simulator (0: the OpenMP default)
+    // and the number of qubits below which it uses a single thread (where
+    // starting the threads takes longer than the work)
+    void set_num_threads(unsigned num_threads, unsigned parallel_threshold_qubits = 14){
+        num_threads_ = num_threads;
+        parallel_threshold_qubits_ = parallel_threshold_qubits;
+    }
+
+    // number of threads used for a state vector of 2^parallel_threshold
+    // amplitudes or more
+    unsigned num_threads() const{
+#if defined(_OPENMP)
+        return num_threads_ > 0 ? num_threads_ : omp_get_max_threads();
+#else
+        return 1;
+#endif
+    }
+
+    unsigned parallel_threshold_qubits() const{
+        return parallel_threshold_qubits_;
+    }
+
+    // run times of the kernels on 1 to 5 qubits relative to the 1-qubit
+    // kernel, which decide whether gates are fused (see
+    // apply_controlled_gate)
+    std::vector<double> kernel_costs() const{
+        return std::vector<double>(kernel_costs_.begin() + 1, kernel_costs_.end());
+    }
+
+    void set_kernel_costs(std::vector<double> const& costs){
+        if (costs.size() + 1 != kernel_costs_.size())
+            throw(std::invalid_argument("set_kernel_costs(): Expected the costs of the kernels on 1 to 5 qubits."));
+        for (auto c : costs)
+            if (!(c > 0.))
+                throw(std::invalid_argument("set_kernel_costs(): The costs must be positive."));
+        std::copy(costs.begin(), costs.end(), kernel_costs_.begin() + 1);
+    }
+
+    // measures the kernel costs on this machine (with the threads of this
+    // simulator, on a state vector which exceeds the caches), uses them from
+    // now on and returns them; the measurements vary from run to run, such
+    // that the fusion decisions are no longer reproducible
+    std::vector<double> measure_kernel_costs(){
+        std::array<double, 6> t{};
+        StateVector psi(1UL << 18, complex_type(1.));
+        int const threads = team_size(psi.size());
+        for (unsigned k = 1; k < t.size(); ++k){
+            KernelMatrix m(1UL << k, typename KernelMatrix::value_type(1UL << k));
+            for (std::size_t i = 0; i < m.size(); ++i)
+                m[i][i] = 1.;
+            t[k] = std::numeric_limits<double>::max();
+            for (unsigned rep = 0; rep < 3; ++rep){
+                auto start = std::chrono::steady_clock::now();
+                switch (k){
+                    case 1:
+                        #pragma omp parallel num_threads(threads)
+                        dispatch_kernel(psi, 0, m, 0);
+                        break;
+                    case 2:
+                        #pragma omp parallel num_threads(threads)
+                        dispatch_kernel(psi, 1, 0, m, 0);
+                        break;
+                    case 3:
+                        #pragma omp parallel num_threads(threads)
+                        dispatch_kernel(psi, 2, 1, 0, m, 0);
+                        break;
+                    case 4:
+                        #pragma omp parallel num_threads(threads)
+                        dispatch_kernel(psi, 3, 2, 1, 0, m, 0);
+                        break;
+                    case 5:
+                        #pragma omp parallel num_threads(threads)
+                        dispatch_kernel(psi, 4, 3, 2, 1, 0, m, 0);
+                        break;
+                }
+                std::chrono::duration<double> dt = std::chrono::steady_clock::now() - start;
+                t[k] = std::min(t[k], dt.count());
+            }
+        }
+        std::vector<double> costs;
+        for (unsigned k = 1; k < t.size(); ++k)
+            costs.push_back(t[k] / t[1]);
+        set_kernel_costs(costs);
+        return costs;
+    }
+
+    // records the gates which are executed from now on (see Recording); the
+    // recording is invalid if a gate acts on a qubit which is not in ids
+    void start_recording(std::vector<unsigned> const& ids){
+        run();
+        recording_.reset(new Recording{static_cast<unsigned>(ids.size()), {}});
+        recording_valid_ = true;
+        recording_ids_.clear();
+        for (unsigned i = 0; i < ids.size(); ++i)
+            recording_ids_[ids[i]] = i;
+    }
+
+    // executes all pending gates and returns the recording (nullptr if it is
+    // invalid)
+    std::unique_ptr<Recording> stop_recording(){
+        if (!recording_)
+            throw(std::runtime_error("stop_recording(): No gates are being recorded."));
+        run();
+        auto recording = std::move(recording_);
+        if (!recording_valid_)
+            recording.reset();
+        return recording;
+    }
+
+    // applies the recorded gates to the qubits ids (where ids[i] takes the
+    // place of the i-th recorded qubit) without fusing them again
+    void replay(Recording const& recording, std::vector<unsigned> const& ids){
+        if (ids.size() != recording.num_qubits)
+            throw(std::invalid_argument("replay(): The recording acts on " + std::to_string(recording.num_qubits) + " qubits, got " + std::to_string(ids.size()) + "."));
+        if (!check_ids(ids))
+            throw(std::runtime_error("replay(): Unknown qubit id(s) provided. Try calling eng.flush() before invoking this function."));
+        run();
+        auto to_ids = [&](std::vector<unsigned> const& positions){
+            std::vector<unsigned> res;
+            for (auto p : positions)
+                res.push_back(ids[p]);
+            return res;
+        };
+        for (auto const& gate : recording.gates){
+            auto gate_ids = to_ids(gate.ids), gate_ctrl = to_ids(gate.ctrl);
+            switch (gate.kind){
+                case Recording::Kind::diagonal:
+                    // consecutive diagonal gates are applied in one pass
+                    diagonal_.push_back(DiagonalGate{gate_ids, gate_ctrl, gate.diag});
+                    break;
+                case Recording::Kind::permutation:
+                    run_diagonal();
+                    apply_permutation_gate(gate.perm, gate.phases, gate_ids, gate_ctrl);
+                    break;
+                default:
+                    run_diagonal();
+                    if (auto recorded = record(Recording::Kind::dense, gate_ids, gate_ctrl))
+                        recorded->matrix = gate.matrix;
+                    apply_kernel(gate.matrix, gate_ids, gate_ctrl);
+            }
+        }
+        run_diagonal();
     }
 
+    // applies the math function f to the registers quregs (if all control
+    // qubits are 1); f is evaluated once per value of the registers (and
+    // not once per amplitude) to tabulate its action, see emulate_math_table
     template <class F, class QuReg>
     void emulate_math(F const& f, QuReg quregs, const std::vector<unsigned>& ctrl,
                       bool parallelize = false){
+        unsigned num_bits = 0;
+        for (auto const& qureg : quregs)
+            num_bits += qureg.size();
+        std::vector<std::int64_t> table(1UL << num_bits);
+        std::vector<int> res(quregs.size());
+        for (std::size_t value = 0; value < table.size(); ++value){
+            unsigned offset = 0;
+            for (unsigned qr_i = 0; qr_i < quregs.size(); ++qr_i){
+                res[qr_i] = (value >> offset) & ((1UL << quregs[qr_i].size()) - 1);
+                offset += quregs[qr_i].size();
+            }
+            f(res);
+            std::size_t new_value = 0;
+            offset = 0;
+            for (unsigned qr_i = 0; qr_i < quregs.size(); ++qr_i){
+                new_value |= (static_cast<std::size_t>(res[qr_i]) & ((1UL << quregs[qr_i].size()) - 1)) << offset;
+                offset += quregs[qr_i].size();
+            }
+            table[value] = new_value;
+        }
+        emulate_math_table(table.data(), table.size(), quregs, ctrl);
+    }
+
+    // applies the math function given by its table to the registers quregs
+    // (if all control qubits are 1): the value v of the registers (where bit
+    // i of v is the i-th qubit of the concatenated registers) is mapped to
+    // table[v]. If the table is a permutation, the new state vector is
+    // gathered in parallel, otherwise the amplitudes of basis states which
+    // are mapped to the same state are added up.
+    template <class QuReg>
+    void emulate_math_table(std::int64_t const* table, std::size_t table_size,
+                            QuReg const& quregs, const std::vector<unsigned>& ctrl){
         run();
         auto ctrlmask = get_control_mask(ctrl);
+        std::vector<unsigned> locs;
+        for (auto const& qureg : quregs)
+            for (auto id : qureg)
+                locs.push_back(map_[id]);
+        if (table_size != (1UL << locs.size()))
+            throw std::invalid_argument("emulate_math_table(): The table must have 2^n entries for n qubits.");
+        std::size_t locmask = 0;
+        for (auto l : locs)
+            locmask |= 1UL << l;
+        auto extract = [&](std::size_t i){
+            std::size_t v = 0;
+            for (unsigned b = 0; b < locs.size(); ++b)
+                v |= ((i >> locs[b]) & 1UL) << b;
+            return v;
+        };
+        auto deposit = [&](std::size_t i, std::size_t v){
+            i &= ~locmask;
+            for (unsigned b = 0; b < locs.size(); ++b)
+                i |= ((v >> b) & 1UL) << locs[b];
+            return i;
+        };
 
-        for (unsigned i = 0; i < quregs.size(); ++i)
-            for (unsigned j = 0; j < quregs[i].size(); ++j)
-                quregs[i][j] = map_[quregs[i][j]];
+        // invert the table (if it is a permutation)
+        std::vector<std::int64_t> inverse(table_size, -1);
+        bool is_permutation = true;
+        for (std::size_t v = 0; v < table_size && is_permutation; ++v){
+            auto t = table[v];
+            if (t < 0 || static_cast<std::size_t>(t) >= table_size || inverse[t] >= 0)
+                is_permutation = false;
+            else
+                inverse[t] = v;
+        }
 
-        StateVector newvec; // avoid costly memory reallocations
-        if( tmpBuff1_.capacity() >= vec_.size() )
-          std::swap(newvec, tmpBuff1_);
+        // avoid costly memory reallocations
+        StateVector newvec = take_buffer(tmpBuff1_, vec_.size());
         newvec.resize(vec_.size());
-#pragma omp parallel for schedule(static)
-        for (std::size_t i = 0; i < vec_.size(); i++)
-          newvec[i] = 0;
-
-//#pragma omp parallel reduction(+:newvec[:newvec.size()]) if(parallelize) // requires OpenMP 4.5
-        {
-          std::vector<int> res(quregs.size());
-          //#pragma omp for schedule(static)
-          for (std::size_t i = 0; i < vec_.size(); ++i){
-              if ((ctrlmask&i) == ctrlmask){
-                  for (unsigned qr_i = 0; qr_i < quregs.size(); ++qr_i){
-                      res[qr_i] = 0;
-                      for (unsigned qb_i = 0; qb_i < quregs[qr_i].size(); ++qb_i)
-                          res[qr_i] |= ((i >> quregs[qr_i][qb_i])&1) << qb_i;
-                  }
-                  f(res);
-                  auto new_i = i;
-                  for (unsigned qr_i = 0; qr_i < quregs.size(); ++qr_i){
-                      for (unsigned qb_i = 0; qb_i < quregs[qr_i].size(); ++qb_i){
-                          if (!(((new_i >> quregs[qr_i][qb_i])&1) == ((res[qr_i] >> qb_i)&1)))
-                              new_i ^= (1UL << quregs[qr_i][qb_i]);
-                      }
-                  }
-                  newvec[new_i] += vec_[i];
-              }
-              else
-                  newvec[i] += vec_[i];
-          }
+        std::size_t const n = vec_.size();
+        if (is_permutation){
+            #pragma omp parallel for schedule(static) num_threads(team_size())
+            for (std::size_t i = 0; i < n; ++i){
+                if ((i & ctrlmask) == ctrlmask)
+                    newvec[i] = vec_[deposit(i, inverse[extract(i)])];
+                else
+                    newvec[i] = vec_[i];
+            }
+        }
+        else{
+            #pragma omp parallel for schedule(static) num_threads(team_size())
+            for (std::size_t i = 0; i < n; ++i)
+                newvec[i] = 0;
+            for (std::size_t i = 0; i < n; ++i){
+                if ((i & ctrlmask) == ctrlmask)
+                    newvec[deposit(i, table[extract(i)] & (table_size - 1))] += vec_[i];
+                else
+                    newvec[i] += vec_[i];
+            }
         }
         std::swap(vec_, newvec);
         std::swap(tmpBuff1_, newvec);
@@ -289,56 +658,52 @@ public:
       emulate_math([a,N](std::vector<int> &res){for(auto& x: res) x = (x * a) % N;}, quregs, ctrl, true);
     }
 
-    calc_type get_expectation_value(TermsDict const& td, std::vector<unsigned> const& ids){
+    double get_expectation_value(TermsDict const& td, std::vector<unsigned> const& ids){
         run();
-        calc_type expectation = 0.;
-
-        StateVector current_state; // avoid costly memory reallocations
-        if( tmpBuff1_.capacity() >= vec_.size() )
-          std::swap(tmpBuff1_, current_state);
-        current_state.resize(vec_.size());
-#pragma omp parallel for schedule(static)
-        for (std::size_t i = 0; i < vec_.size(); ++i)
-          current_state[i] = vec_[i];
-
+        if (!check_ids(ids))
+            throw(std::runtime_error("get_expectation_value(): Unknown qubit id. Please make sure you have called eng.flush()."));
+        // A Pauli string P maps |i> to i^#Y (-1)^|i & phase| |i ^ flip>,
+        // where flip (phase) has the bits of the qubits acted upon by X or Y
+        // (Z or Y) set. Hence <psi|P|psi> can be computed in a single
+        // read-only pass, which is shared by all terms with the same flip.
+        std::map<std::size_t, std::vector<PauliString>> groups;
         for (auto const& term : td){
-            auto const& coefficient = term.second;
-            apply_term(term.first, ids, {});
-            calc_type delta = 0.;
-            #pragma omp parallel for reduction(+:delta) schedule(static)
-            for (std::size_t i = 0; i < vec_.size(); ++i){
-                auto const a1 = std::real(current_state[i]);
-                auto const b1 = -std::imag(current_state[i]);
-                auto const a2 = std::real(vec_[i]);
-                auto const b2 = std::imag(vec_[i]);
-                delta += a1 * a2 - b1 * b2;
-                // reset vec_
-                vec_[i] = current_state[i];
+            std::size_t flip = 0;
+            PauliString p{0, 0, term.second};
+            for (auto const& local_op : term.first){
+                std::size_t const bit = 1UL << map_[ids[local_op.first]];
+                if (local_op.second != 'Z')
+                    flip ^= bit;
+                if (local_op.second != 'X')
+                    p.phase ^= bit;
+                if (local_op.second == 'Y')
+                    ++p.num_y;
             }
-            expectation += coefficient * delta;
+            groups[flip].push_back(p);
         }
-        std::swap(current_state, tmpBuff1_);
+
+        double expectation = 0.;
+        for (auto const& group : groups)
+            expectation += expectation_value(group.first, group.second);
         return expectation;
     }
 
     void apply_qubit_operator(ComplexTermsDict const& td, std::vector<unsigned> const& ids){
         run();
-        StateVector new_state, current_state; // avoid costly memory reallocations
-        if( tmpBuff1_.capacity() >= vec_.size() )
-          std::swap(tmpBuff1_, new_state);
-        if( tmpBuff2_.capacity() >= vec_.size() )
-          std::swap(tmpBuff2_, current_state);
+        // avoid costly memory reallocations
+        StateVector new_state = take_buffer(tmpBuff1_, vec_.size());
+        StateVector current_state = take_buffer(tmpBuff2_, vec_.size());
         new_state.resize(vec_.size());
         current_state.resize(vec_.size());
-#pragma omp parallel for schedule(static)
+#pragma omp parallel for schedule(static) num_threads(team_size())
         for (std::size_t i = 0; i < vec_.size(); ++i){
           new_state[i] = 0;
           current_state[i] = vec_[i];
         }
         for (auto const& term : td){
-            auto const& coefficient = term.second;
+            complex_type const coefficient(term.second);
             apply_term(term.first, ids, {});
-            #pragma omp parallel for schedule(static)
+            #pragma omp parallel for schedule(static) num_threads(team_size())
             for (std::size_t i = 0; i < vec_.size(); ++i){
                 new_state[i] += coefficient * vec_[i];
                 vec_[i] = current_state[i];
@@ -349,7 +714,7 @@ public:
         std::swap(tmpBuff2_, current_state);
     }
 
-    calc_type get_probability(std::vector<bool> const& bit_string,
+    double get_probability(std::vector<bool> const& bit_string,
                               std::vector<unsigned> const& ids){
         run();
         if (!check_ids(ids))
@@ -359,12 +724,7 @@ public:
             mask |= 1UL << map_[ids[i]];
             bit_str |= (bit_string[i]?1UL:0UL) << map_[ids[i]];
         }
-        calc_type probability = 0.;
-        #pragma omp parallel for reduction(+:probability) schedule(static)
-        for (std::size_t i = 0; i < vec_.size(); ++i)
-            if ((i & mask) == bit_str)
-                probability += std::norm(vec_[i]);
-        return probability;
+        return probability(mask, bit_str);
     }
 
     complex_type const& get_amplitude(std::vector<bool> const& bit_string,
@@ -383,64 +743,152 @@ public:
         return vec_[index];
     }
 
-    void emulate_time_evolution(TermsDict const& tdict, calc_type const& time,
-                                std::vector<unsigned> const& ids,
-                                std::vector<unsigned> const& ctrl){
+    // writes the probabilities of all 2^k outcomes of measuring the k qubits
+    // ids to probabilities (bit l of the index of an outcome is the value of
+    // ids[l]), summing them up in one pass over the state vector
+    void get_probabilities(std::vector<unsigned> const& ids, double* probabilities){
         run();
-        complex_type I(0., 1.);
-        calc_type tr = 0., op_nrm = 0.;
-        TermsDict td;
-        for (unsigned i = 0; i < tdict.size(); ++i){
-            if (tdict[i].first.size() == 0)
-                tr += tdict[i].second;
-            else{
-                td.push_back(tdict[i]);
-                op_nrm += std::abs(tdict[i].second);
+        if (!check_ids(ids))
+            throw(std::runtime_error("get_probabilities(): Unknown qubit id. Please make sure you have called eng.flush()."));
+        std::vector<unsigned> positions;
+        for (auto id : ids)
+            positions.push_back(map_[id]);
+        std::vector<unsigned> sorted(positions);
+        std::sort(sorted.begin(), sorted.end());
+        if (std::unique(sorted.begin(), sorted.end()) != sorted.end())
+            throw(std::invalid_argument("get_probabilities(): Qubit IDs should be unique."));
+        std::size_t const size = 1UL << ids.size();
+        auto local_index = [&](std::size_t i){
+            std::size_t res = 0;
+            for (unsigned l = 0; l < positions.size(); ++l)
+                res |= ((i >> positions[l]) & 1UL) << l;
+            return res;
+        };
+        complex_type const* psi = vec_.data();
+
+        if (ids.size() > max_histogram_qubits_){
+            // one histogram per thread would be too large: sum up the
+            // amplitudes of each outcome separately (the amplitudes of an
+            // outcome lie at the offsets which are 0 at all positions)
+            std::vector<std::size_t> offsets(vec_.size() >> ids.size());
+            for (std::size_t r = 0; r < offsets.size(); ++r){
+                std::size_t o = r;
+                for (auto p : sorted)
+                    o = ((o >> p) << (p + 1)) | (o & ((1UL << p) - 1));
+                offsets[r] = o;
             }
-        }
-        unsigned s = std::abs(time) * op_nrm + 1.;
-        complex_type correction = std::exp(-time * I * tr / (double)s);
-        auto output_state = vec_;
-        auto ctrlmask = get_control_mask(ctrl);
-        for (unsigned i = 0; i < s; ++i){
-            calc_type nrm_change = 1.;
-            for (unsigned k = 0; nrm_change > 1.e-12; ++k){
-                auto coeff = (-time * I) / double(s * (k + 1));
-                auto current_state = vec_;
-                auto update = StateVector(vec_.size(), 0.);
-                for (auto const& tup : td){
-                    apply_term(tup.first, ids, {});
-                    #pragma omp parallel for schedule(static)
-                    for (std::size_t j = 0; j < vec_.size(); ++j){
-                        update[j] += vec_[j] * tup.second;
-                        vec_[j] = current_state[j];
-                    }
-                }
-                nrm_change = 0.;
-                #pragma omp parallel for reduction(+:nrm_change) schedule(static)
-                for (std::size_t j = 0; j < vec_.size(); ++j){
-                    update[j] *= coeff;
-                    vec_[j] = update[j];
-                    if ((j & ctrlmask) == ctrlmask){
-                        output_state[j] += update[j];
-                        nrm_change += std::norm(update[j]);
-                    }
-                }
-                nrm_change = std::sqrt(nrm_change);
+            #pragma omp parallel for schedule(static) num_threads(team_size())
+            for (std::size_t j = 0; j < size; ++j){
+                std::size_t base = 0;
+                for (unsigned l = 0; l < positions.size(); ++l)
+                    base |= ((j >> l) & 1UL) << positions[l];
+                double P = 0.;
+                for (auto o : offsets)
+                    P += std::norm(psi[base | o]);
+                probabilities[j] = P;
             }
-            #pragma omp parallel for schedule(static)
-            for (std::size_t j = 0; j < vec_.size(); ++j){
-                if ((j & ctrlmask) == ctrlmask)
-                    output_state[j] *= correction;
-                vec_[j] = output_state[j];
+            return;
+        }
+
+        // the state vector is traversed in chunks, within which the outcome
+        // of the low bits is looked up in a table
+        std::size_t const chunk = 1UL << std::min<unsigned>(N_, 12);
+        std::vector<std::size_t> low_index(chunk);
+        for (std::size_t x = 0; x < chunk; ++x)
+            low_index[x] = local_index(x);
+        std::size_t const* low = low_index.data();
+        std::fill(probabilities, probabilities + size, 0.);
+        #pragma omp parallel num_threads(team_size())
+        {
+            std::vector<double> histogram(size, 0.);
+            #pragma omp for schedule(static)
+            for (std::size_t b = 0; b < vec_.size(); b += chunk){
+                std::size_t const high = local_index(b);
+                for (std::size_t x = 0; x < chunk; ++x)
+                    histogram[high | low[x]] += std::norm(psi[b + x]);
             }
+            #pragma omp critical
+            for (std::size_t j = 0; j < size; ++j)
+                probabilities[j] += histogram[j];
+        }
+    }
+
+    // writes the amplitudes of the basis states indices[0:count] to
+    // amplitudes, where bit l of an index is the value of ids[l] (which must
+    // be a permutation of all allocated qubits)
+    void get_amplitudes(std::size_t const* indices, std::size_t count,
+                        std::vector<unsigned> const& ids, complex_type* amplitudes){
+        run();
+        std::size_t chk = 0;
+        for (auto id : ids){
+            if (map_.count(id) == 0)
+                break;
+            chk |= 1UL << map_[id];
+        }
+        if (chk + 1 != vec_.size())
+            throw(std::runtime_error("The second argument to get_amplitudes() must be a permutation of all allocated qubits. Please make sure you have called eng.flush()."));
+        for (std::size_t i = 0; i < count; ++i)
+            if (indices[i] >= vec_.size())
+                throw(std::invalid_argument("get_amplitudes(): The bit-strings must have one bit per qubit."));
+        std::vector<unsigned> positions;
+        for (auto id : ids)
+            positions.push_back(map_[id]);
+        #pragma omp parallel for schedule(static) num_threads(team_size())
+        for (std::size_t i = 0; i < count; ++i){
+            std::size_t index = 0;
+            for (unsigned l = 0; l < positions.size(); ++l)
+                index |= ((indices[i] >> l) & 1UL) << positions[l];
+            amplitudes[i] = vec_[index];
+        }
+    }
+
+    // selects the propagator of emulate_time_evolution: "taylor" (default),
+    // "krylov" (Lanczos with adaptive time steps, keeps krylov_dim + 1
+    // additional state vectors) or "chebyshev" (expansion in Chebyshev
+    // polynomials, keeps two additional state vectors)
+    void set_time_evolution_method(std::string const& method, unsigned krylov_dim = 16){
+        if (method != "taylor" && method != "krylov" && method != "chebyshev")
+            throw(std::invalid_argument("set_time_evolution_method(): Unknown method '" + method + "'."));
+        if (krylov_dim < 1)
+            throw(std::invalid_argument("set_time_evolution_method(): krylov_dim must be positive."));
+        time_evolution_method_ = method;
+        krylov_dim_ = krylov_dim;
+        krylov_basis_.clear();
+    }
+
+    void emulate_time_evolution(TermsDict const& tdict, double const& time,
+                                std::vector<unsigned> const& ids,
+                                std::vector<unsigned> const& ctrl){
+        run();
+        Hamiltonian const& H = compile_hamiltonian(tdict, ids);
+        auto ctrlmask = get_control_mask(ctrl);
+        if (H.norm > 0. && time != 0.){
+            if (time_evolution_method_ == "krylov")
+                evolve_krylov(H, time, ctrlmask);
+            else if (time_evolution_method_ == "chebyshev")
+                evolve_chebyshev(H, time, ctrlmask);
+            else
+                evolve_taylor(H, time, ctrlmask);
         }
+        // the identity terms only contribute a (controlled) phase
+        complex_type correction(std::exp(std::complex<double>(0., -time * H.trace)));
+        #pragma omp parallel for schedule(static) num_threads(team_size())
+        for (std::size_t j = 0; j < vec_.size(); ++j)
+            if ((j & ctrlmask) == ctrlmask)
+                vec_[j] *= correction;
     }
 
     void set_wavefunction(StateVector const& wavefunction, std::vector<unsigned> const& ordering){
+        set_wavefunction(wavefunction.data(), wavefunction.size(), ordering);
+    }
+
+    // copies the size amplitudes at wavefunction directly into the state
+    // vector (which may be a memory-mapped file)
+    void set_wavefunction(complex_type const* wavefunction, std::size_t size,
+                          std::vector<unsigned> const& ordering){
         run();
         // make sure there are 2^n amplitudes for n qubits
-        assert(wavefunction.size() == (1UL << ordering.size()));
+        assert(size == (1UL << ordering.size()));
         // check that all qubits have been allocated previously
         if (map_.size() != ordering.size() || !check_ids(ordering))
             throw(std::runtime_error("set_wavefunction(): Invalid mapping provided. Please make sure all qubits have been allocated previously (call eng.flush())."));
@@ -448,11 +896,49 @@ public:
         // set mapping and wavefunction
         for (unsigned i = 0; i < ordering.size(); ++i)
             map_[ordering[i]] = i;
-        #pragma omp parallel for schedule(static)
-        for (std::size_t i = 0; i < wavefunction.size(); ++i)
+        #pragma omp parallel for schedule(static) num_threads(team_size())
+        for (std::size_t i = 0; i < size; ++i)
             vec_[i] = wavefunction[i];
     }
 
+    // replaces the qubits and the state vector by the size amplitudes at
+    // wavefunction, where qubit ordering[i] is at bit-location i (pending
+    // gates act on the discarded state and are dropped)
+    void load_state(complex_type const* wavefunction, std::size_t size,
+                    std::vector<unsigned> const& ordering){
+        assert(size == (1UL << ordering.size()));
+        clusters_.clear();
+        diagonal_.clear();
+        free_.clear();
+        map_.clear();
+        for (unsigned i = 0; i < ordering.size(); ++i)
+            map_[ordering[i]] = i;
+        if (map_.size() != ordering.size())
+            throw(std::runtime_error("load_state(): Qubit IDs should be unique."));
+        N_ = ordering.size();
+        vec_.resize(size);
+        #pragma omp parallel for schedule(static) num_threads(team_size())
+        for (std::size_t i = 0; i < size; ++i)
+            vec_[i] = wavefunction[i];
+    }
+
+    // state of the random number generator (used for measurements and
+    // sampling) in the text format of std::mt19937
+    std::string get_rng_state() const{
+        std::ostringstream out;
+        out << rnd_eng_;
+        return out.str();
+    }
+
+    void set_rng_state(std::string const& state){
+        std::istringstream in(state);
+        RndEngine eng;
+        in >> eng;
+        if (in.fail())
+            throw(std::invalid_argument("set_rng_state(): Invalid random number generator state."));
+        rnd_eng_ = eng;
+    }
+
     void collapse_wavefunction(std::vector<unsigned> const& ids, std::vector<bool> const& values){
         run();
         assert(ids.size() == values.size());
@@ -463,18 +949,202 @@ public:
             mask |= (1UL << map_[ids[i]]);
             val |= ((values[i]?1UL:0UL) << map_[ids[i]]);
         }
-        // set bad entries to 0 and compute probability of outcome to renormalize
-        calc_type N = 0.;
-        #pragma omp parallel for reduction(+:N) schedule(static)
-        for (std::size_t i = 0; i < vec_.size(); ++i){
-            if ((i & mask) == val)
-                N += std::norm(vec_[i]);
-        }
+        double N = probability(mask, val);
         if (N < 1.e-12)
             throw(std::runtime_error("collapse_wavefunction(): Invalid collapse! Probability is ~0."));
-        // re-normalize (if possible)
-        N = 1./std::sqrt(N);
-        #pragma omp parallel for schedule(static)
+        collapse(mask, val, N);
+    }
+
+    void run(){
+        update_layout();
+        run_gates();
+    }
+
+    std::tuple<Map, StateVector&> cheat(){
+        run();
+        return make_tuple(map_, std::ref(vec_));
+    }
+
+    ~BasicSimulator(){
+    }
+
+private:
+    // number of threads of the parallel regions on the current state vector
+    int team_size() const{
+        return team_size(vec_.size());
+    }
+
+    // number of threads of the parallel regions on a vector of size entries
+    int team_size(std::size_t size) const{
+        if (parallel_threshold_qubits_ >= 8 * sizeof(std::size_t) ||
+                size < (1UL << parallel_threshold_qubits_))
+            return 1;
+        return num_threads();
+    }
+
+    static constexpr calc_type default_tolerance(){
+        return std::is_same<calc_type, float>::value ? 1.e-8 : 1.e-12;
+    }
+
+    static KernelMatrix to_kernel_matrix(Fusion::Matrix const& m){
+        KernelMatrix res(m.size(), typename KernelMatrix::value_type(m.size()));
+        for (std::size_t i = 0; i < m.size(); ++i)
+            for (std::size_t j = 0; j < m.size(); ++j)
+                res[i][j] = complex_type(m[i][j]);
+        return res;
+    }
+
+    struct DiagonalGate{
+        std::vector<unsigned> ids, ctrl;
+        std::vector<complex_type> diag;
+    };
+
+    void run_gates(){
+        // pending diagonal gates and clusters act on disjoint qubits
+        run_diagonal();
+        for (auto& cluster : clusters_)
+            run_cluster(cluster);
+        clusters_.clear();
+    }
+
+    // adds the amplitudes of newly allocated qubits and removes the
+    // positions of deallocated qubits from the state vector
+    void update_layout(){
+        std::size_t size = 1UL << N_;
+        if (vec_.size() < size){
+            if (vec_.capacity() >= size){
+                // the new qubits are in |0>
+                std::size_t const old_size = vec_.size();
+                vec_.resize(size);
+                #pragma omp parallel for schedule(static) num_threads(team_size())
+                for (std::size_t i = old_size; i < size; ++i)
+                    vec_[i] = 0.;
+            }
+            else{
+                // avoid large memory allocations
+                StateVector newvec = take_buffer(tmpBuff1_, size);
+                newvec.resize(size);
+#pragma omp parallel for schedule(static) num_threads(team_size())
+                for (std::size_t i = 0; i < newvec.size(); ++i)
+                    newvec[i] = (i < vec_.size())?vec_[i]:0.;
+                std::swap(vec_, newvec);
+                // recycle large memory
+                std::swap(tmpBuff1_, newvec);
+                if( tmpBuff1_.capacity() < tmpBuff2_.capacity() )
+                  std::swap(tmpBuff1_, tmpBuff2_);
+            }
+        }
+        if (free_.empty())
+            return;
+
+        // move the amplitudes with all free qubits in |0> to the front, in
+        // contiguous runs below the lowest free position (the source of
+        // each run lies at or after its destination)
+        std::sort(free_.begin(), free_.end());
+        std::size_t const run = 1UL << free_[0];
+        std::size_t const new_size = vec_.size() >> free_.size();
+        for (std::size_t dst = run; dst < new_size; dst += run){
+            std::size_t src = dst;
+            for (auto pos : free_)
+                src = ((src >> pos) << (pos + 1)) | (src & ((1UL << pos) - 1));
+            if (src != dst)
+                std::copy_n(&vec_[src], run, &vec_[dst]);
+        }
+        vec_.resize(new_size);
+        for (auto& p : map_){
+            p.second -= std::lower_bound(free_.begin(), free_.end(), p.second)
+                        - free_.begin();
+        }
+        N_ -= free_.size();
+        free_.clear();
+    }
+
+    bool get_classical_value_at(unsigned pos, calc_type tol = default_tolerance()){
+        std::size_t delta = (1UL << pos);
+
+        for (std::size_t i = 0; i < vec_.size(); i += 2*delta){
+            for (std::size_t j = 0; j < delta; ++j){
+                if (std::norm(vec_[i+j]) > tol)
+                    return false;
+                if (std::norm(vec_[i+j+delta]) > tol)
+                    return true;
+            }
+        }
+        assert(false); // this will never happen
+        return false; // suppress 'control reaches end of non-void...'
+    }
+
+    bool is_classical_at(unsigned pos, calc_type tol = default_tolerance()){
+        std::size_t delta = (1UL << pos);
+
+        short up = 0, down = 0;
+        #pragma omp parallel for schedule(static) reduction(|:up,down) num_threads(team_size())
+        for (std::size_t i = 0; i < vec_.size(); i += 2*delta){
+            for (std::size_t j = 0; j < delta; ++j){
+                up = up | ((std::norm(vec_[i+j]) > tol)&1);
+                down = down | ((std::norm(vec_[i+j+delta]) > tol)&1);
+            }
+        }
+
+        return 1 == (up^down);
+    }
+
+    // cumulative probabilities of nblocks equally-sized blocks of the state
+    // vector, i.e., partial[b] is the probability of all entries before
+    // block b (and partial[nblocks] is the norm of the state)
+    std::vector<double> cumulative_block_probabilities(std::size_t nblocks){
+        std::size_t block = vec_.size() / nblocks;
+        std::vector<double> partial(nblocks + 1, 0.);
+        #pragma omp parallel for schedule(static) num_threads(team_size())
+        for (std::size_t b = 0; b < nblocks; ++b){
+            double P = 0.;
+            for (std::size_t i = b * block; i < (b + 1) * block; ++i)
+                P += std::norm(vec_[i]);
+            partial[b + 1] = P;
+        }
+        std::partial_sum(partial.begin(), partial.end(), partial.begin());
+        return partial;
+    }
+
+    // first entry i in block b at which the cumulative probability (starting
+    // from P at the beginning of the block) reaches rnd
+    std::size_t scan_block(std::size_t b, std::size_t block, double P,
+                           double rnd){
+        std::size_t i = b * block;
+        while (i + 1 < (b + 1) * block && P + std::norm(vec_[i]) < rnd)
+            P += std::norm(vec_[i++]);
+        return i;
+    }
+
+    // probability of the entries i with (i & mask) == val
+    double probability(std::size_t mask, std::size_t val){
+        // all entries in a run of length <= the lowest bit in mask agree
+        // on the bits in mask
+        std::size_t run = std::min<std::size_t>(mask ? (mask & (~mask + 1)) : 1,
+                                                std::min<std::size_t>(vec_.size(), 4096));
+        double P = 0.;
+        if (run == 1){
+            #pragma omp parallel for reduction(+:P) schedule(static) num_threads(team_size())
+            for (std::size_t i = 0; i < vec_.size(); ++i)
+                if ((i & mask) == val)
+                    P += std::norm(vec_[i]);
+            return P;
+        }
+        #pragma omp parallel for reduction(+:P) schedule(static) num_threads(team_size())
+        for (std::size_t i = 0; i < vec_.size(); i += run){
+            if ((i & mask) == val){
+                for (std::size_t j = i; j < i + run; ++j)
+                    P += std::norm(vec_[j]);
+            }
+        }
+        return P;
+    }
+
+    // project onto the entries i with (i & mask) == val, which have total
+    // probability P, and re-normalize in the same pass
+    void collapse(std::size_t mask, std::size_t val, double P){
+        calc_type const N = 1./std::sqrt(P);
+        #pragma omp parallel for schedule(static) num_threads(team_size())
         for (std::size_t i = 0; i < vec_.size(); ++i){
             if ((i & mask) != val)
                 vec_[i] = 0.;
@@ -483,60 +1153,649 @@ public:
         }
     }
 
-    void run(){
-        if (fused_gates_.size() < 1)
+    struct PauliString{
+        std::size_t phase;
+        unsigned num_y;
+        double coefficient;
+    };
+
+    static bool parity(std::size_t x){
+#if defined(__GNUC__) || defined(__clang__)
+        return __builtin_parityll(x);
+#else
+        for (unsigned shift = 32; shift > 0; shift >>= 1)
+            x ^= x >> shift;
+        return x & 1;
+#endif
+    }
+
+    // sum of coefficient * <psi|P|psi> over the Pauli strings P which all
+    // flip the bits in flip
+    double expectation_value(std::size_t flip,
+                             std::vector<PauliString> const& terms){
+        std::size_t const num_terms = terms.size();
+        std::vector<double> sums(num_terms, 0.);
+        if (flip == 0){
+            #pragma omp parallel num_threads(team_size())
+            {
+                std::vector<double> local(num_terms, 0.);
+                #pragma omp for schedule(static)
+                for (std::size_t i = 0; i < vec_.size(); ++i){
+                    double const p = std::norm(vec_[i]);
+                    for (std::size_t t = 0; t < num_terms; ++t)
+                        local[t] += parity(i & terms[t].phase) ? -p : p;
+                }
+                #pragma omp critical
+                for (std::size_t t = 0; t < num_terms; ++t)
+                    sums[t] += local[t];
+            }
+        }
+        else{
+            // visit each pair (i, i ^ flip) once: the contributions of i and
+            // i ^ flip add up to 2 Re(c) or 2i Im(c) with
+            // c = conj(psi[i ^ flip]) psi[i], depending on the parity of #Y
+            std::vector<bool> imag(num_terms);
+            for (std::size_t t = 0; t < num_terms; ++t)
+                imag[t] = terms[t].num_y & 1;
+            std::size_t const low = flip & (~flip + 1);
+            std::size_t const half = vec_.size() / 2;
+            #pragma omp parallel num_threads(team_size())
+            {
+                std::vector<double> local(num_terms, 0.);
+                #pragma omp for schedule(static)
+                for (std::size_t k = 0; k < half; ++k){
+                    std::size_t const i = ((k & ~(low - 1)) << 1) | (k & (low - 1));
+                    std::complex<double> const c = std::conj(std::complex<double>(vec_[i ^ flip])) * std::complex<double>(vec_[i]);
+                    for (std::size_t t = 0; t < num_terms; ++t){
+                        double const v = imag[t] ? c.imag() : c.real();
+                        local[t] += parity(i & terms[t].phase) ? -v : v;
+                    }
+                }
+                #pragma omp critical
+                for (std::size_t t = 0; t < num_terms; ++t)
+                    sums[t] += local[t];
+            }
+            for (std::size_t t = 0; t < num_terms; ++t){
+                // i^#Y * (#Y odd ? i : 1) is -1 for #Y = 1, 2 (mod 4)
+                unsigned const y = terms[t].num_y & 3;
+                sums[t] *= (y == 1 || y == 2) ? -2. : 2.;
+            }
+        }
+        double res = 0.;
+        for (std::size_t t = 0; t < num_terms; ++t)
+            res += terms[t].coefficient * sums[t];
+        return res;
+    }
+
+    // Hamiltonian of emulate_time_evolution in bit-mask form: the Pauli
+    // strings with the same flip mask are grouped (see get_expectation_value)
+    // and the sum of all strings without X and Y is tabulated in diag. The
+    // last compiled Hamiltonian is kept, such that repeated evolutions under
+    // the same Hamiltonian (and qubit layout) skip this step.
+    struct Hamiltonian{
+        TermsDict terms;
+        std::vector<unsigned> positions;
+        std::size_t size = 0;
+        double trace = 0.; // sum of the identity terms
+        double norm = 0.; // bound on the spectral radius (w/o identity terms)
+        std::vector<calc_type> diag;
+        // the strings of group g have the indices offsets[g] to
+        // offsets[g + 1] - 1 of phases and coefficients (including i^#Y)
+        std::vector<std::size_t> flips, offsets, phases;
+        std::vector<complex_type> coefficients;
+    };
+
+    Hamiltonian const& compile_hamiltonian(TermsDict const& tdict, std::vector<unsigned> const& ids){
+        std::vector<unsigned> positions(ids.size());
+        for (std::size_t i = 0; i < ids.size(); ++i)
+            positions[i] = map_[ids[i]];
+        Hamiltonian& H = hamiltonian_;
+        if (H.size == vec_.size() && H.positions == positions && H.terms == tdict)
+            return H;
+
+        H = Hamiltonian();
+        H.terms = tdict;
+        H.positions = positions;
+        H.size = vec_.size();
+        std::complex<double> const powers_of_i[] = {{1., 0.}, {0., 1.}, {-1., 0.}, {0., -1.}};
+        std::map<std::size_t, std::vector<std::pair<std::size_t, std::complex<double>>>> groups;
+        for (auto const& term : tdict){
+            if (term.first.size() == 0){
+                H.trace += term.second;
+                continue;
+            }
+            std::size_t flip = 0, phase = 0;
+            unsigned num_y = 0;
+            for (auto const& local_op : term.first){
+                std::size_t const bit = 1UL << positions[local_op.first];
+                if (local_op.second != 'Z')
+                    flip ^= bit;
+                if (local_op.second != 'X')
+                    phase ^= bit;
+                if (local_op.second == 'Y')
+                    ++num_y;
+            }
+            groups[flip].emplace_back(phase, term.second * powers_of_i[num_y & 3]);
+            H.norm += std::abs(term.second);
+        }
+        for (auto const& group : groups){
+            auto const& terms = group.second;
+            if (group.first == 0){
+                H.diag.resize(vec_.size());
+                #pragma omp parallel for schedule(static) num_threads(team_size())
+                for (std::size_t k = 0; k < H.diag.size(); ++k){
+                    double d = 0.;
+                    for (auto const& t : terms)
+                        d += parity(k & t.first) ? -t.second.real() : t.second.real();
+                    H.diag[k] = d;
+                }
+                continue;
+            }
+            H.flips.push_back(group.first);
+            H.offsets.push_back(H.phases.size());
+            for (auto const& t : terms){
+                H.phases.push_back(t.first);
+                H.coefficients.push_back(complex_type(t.second));
+            }
+        }
+        H.offsets.push_back(H.phases.size());
+        return H;
+    }
+
+    // out = alpha * H in + beta * out for the entries with all control bits
+    // set (the others are set to zero). A Pauli string maps the entry at
+    // i ^ flip to i, so each block of entries is computed in a single pass
+    // (per group, the weights of the strings are summed up first, followed
+    // by one multiply-add with the contiguous entries at i ^ flip).
+    void apply_hamiltonian(Hamiltonian const& H, StateVector const& in,
+                           StateVector& out, complex_type alpha,
+                           calc_type beta, std::size_t ctrlmask){
+        constexpr std::size_t block = 256;
+        std::size_t const num_groups = H.flips.size();
+        std::size_t const size = in.size();
+        #pragma omp parallel num_threads(team_size())
+        {
+            complex_type acc[block], weights[block];
+            #pragma omp for schedule(static)
+            for (std::size_t k0 = 0; k0 < size; k0 += block){
+                std::size_t const len = std::min(block, size - k0);
+                for (std::size_t i = 0; i < len; ++i)
+                    acc[i] = H.diag.empty() ? complex_type(0.) : H.diag[k0 + i] * in[k0 + i];
+                for (std::size_t g = 0; g < num_groups; ++g){
+                    std::size_t const flip = H.flips[g];
+                    for (std::size_t i = 0; i < len; ++i)
+                        weights[i] = 0.;
+                    for (std::size_t t = H.offsets[g]; t < H.offsets[g + 1]; ++t){
+                        std::size_t const phase = H.phases[t];
+                        complex_type const c = H.coefficients[t];
+                        for (std::size_t i = 0; i < len; ++i)
+                            weights[i] += parity(((k0 + i) ^ flip) & phase) ? -c : c;
+                    }
+                    complex_type const* src = &in[0];
+                    for (std::size_t i = 0; i < len; ++i)
+                        acc[i] += weights[i] * src[(k0 + i) ^ flip];
+                }
+                for (std::size_t i = 0; i < len; ++i){
+                    std::size_t const k = k0 + i;
+                    if ((k & ctrlmask) != ctrlmask)
+                        out[k] = 0.;
+                    else
+                        out[k] = (beta == 0.) ? alpha * acc[i] : alpha * acc[i] + beta * out[k];
+                }
+            }
+        }
+    }
+
+    // copies the entries of vec_ with all control bits set to v and sets the
+    // others to zero
+    void controlled_copy(StateVector& v, std::size_t ctrlmask){
+        v.resize(vec_.size());
+        #pragma omp parallel for schedule(static) num_threads(team_size())
+        for (std::size_t k = 0; k < vec_.size(); ++k)
+            v[k] = ((k & ctrlmask) == ctrlmask) ? vec_[k] : complex_type(0.);
+    }
+
+    double squared_norm(StateVector const& v) const{
+        double nrm = 0.;
+        #pragma omp parallel for reduction(+:nrm) schedule(static) num_threads(team_size())
+        for (std::size_t k = 0; k < v.size(); ++k)
+            nrm += std::norm(v[k]);
+        return nrm;
+    }
+
+    static constexpr double time_evolution_tolerance(){
+        return std::is_same<calc_type, float>::value ? 1.e-6 : 1.e-12;
+    }
+
+    // truncated Taylor series of exp(-i time H), split into s steps such that
+    // |time| * norm / s <= 1 (Al-Mohy and Higham, 2011)
+    void evolve_taylor(Hamiltonian const& H, double time, std::size_t ctrlmask){
+        unsigned s = std::abs(time) * H.norm + 1.;
+        StateVector current = take_buffer(tmpBuff1_, vec_.size());
+        StateVector update = take_buffer(tmpBuff2_, vec_.size());
+        update.resize(vec_.size());
+        for (unsigned i = 0; i < s; ++i){
+            controlled_copy(current, ctrlmask);
+            double nrm_change = 1.;
+            for (unsigned k = 0; nrm_change > 1.e-12; ++k){
+                complex_type coeff(std::complex<double>(0., -time / double(s * (k + 1))));
+                apply_hamiltonian(H, current, update, coeff, 0., ctrlmask);
+                std::swap(current, update);
+                nrm_change = 0.;
+                #pragma omp parallel for reduction(+:nrm_change) schedule(static) num_threads(team_size())
+                for (std::size_t j = 0; j < vec_.size(); ++j){
+                    vec_[j] += current[j];
+                    nrm_change += std::norm(current[j]);
+                }
+                nrm_change = std::sqrt(nrm_change);
+            }
+        }
+        std::swap(tmpBuff1_, current);
+        std::swap(tmpBuff2_, update);
+    }
+
+    // exp(-i time H) = J_0(x) + 2 sum_k (-i)^k J_k(x) T_k(H / norm) with
+    // x = time * norm, where the Chebyshev polynomials T_k are evaluated
+    // using T_k+1(y) = 2 y T_k(y) - T_k-1(y). The Bessel functions J_k(x)
+    // decay super-exponentially for k > |x|, i.e., roughly |x| terms are
+    // needed (instead of about 10 |x| Hamiltonian applications for Taylor).
+    void evolve_chebyshev(Hamiltonian const& H, double time, std::size_t ctrlmask){
+        double const x = std::abs(time) * H.norm;
+        auto bessel = bessel_j(x, unsigned(x + 10. * std::cbrt(x) + 20.));
+        unsigned num_terms = bessel.size();
+        while (num_terms > 1 && std::abs(bessel[num_terms - 1]) < 1.e-2 * time_evolution_tolerance())
+            --num_terms;
+        // J_k(-x) = (-1)^k J_k(x)
+        std::complex<double> const minus_i(0., time > 0. ? -1. : 1.);
+        std::complex<double> power = 1.;
+
+        StateVector previous = take_buffer(tmpBuff1_, vec_.size());
+        StateVector current = take_buffer(tmpBuff2_, vec_.size());
+        controlled_copy(previous, ctrlmask);
+        current.resize(vec_.size());
+        complex_type const a0(bessel[0]);
+        #pragma omp parallel for schedule(static) num_threads(team_size())
+        for (std::size_t j = 0; j < vec_.size(); ++j)
+            if ((j & ctrlmask) == ctrlmask)
+                vec_[j] = a0 * previous[j];
+        for (unsigned k = 1; k < num_terms; ++k){
+            if (k == 1)
+                apply_hamiltonian(H, previous, current, calc_type(1. / H.norm), 0., ctrlmask);
+            else{
+                apply_hamiltonian(H, current, previous, calc_type(2. / H.norm), -1., ctrlmask);
+                std::swap(previous, current);
+            }
+            power *= minus_i;
+            complex_type const ak(2. * bessel[k] * power);
+            #pragma omp parallel for schedule(static) num_threads(team_size())
+            for (std::size_t j = 0; j < vec_.size(); ++j)
+                vec_[j] += ak * current[j];
+        }
+        std::swap(tmpBuff1_, previous);
+        std::swap(tmpBuff2_, current);
+    }
+
+    // Lanczos propagator: exp(-i tau H) v is approximated by
+    // beta V exp(-i tau T) e_0, where the columns of V are an orthonormal
+    // basis of the Krylov space span{v, Hv, ..., H^(m-1) v} and T = V^+ H V
+    // is tridiagonal. The time step tau is chosen such that the estimated
+    // error beta * T_(m,m-1) * |[exp(-i tau T) e_0]_(m-1)| is at most
+    // beta * tolerance * tau / |time|, and adapted from step to step.
+    void evolve_krylov(Hamiltonian const& H, double time, std::size_t ctrlmask){
+        unsigned const m = krylov_dim_;
+        auto& V = krylov_basis_;
+        if (V.size() != m + 1 || !(V[0].get_allocator() == vec_.get_allocator()))
+            V.assign(m + 1, StateVector(vec_.get_allocator()));
+        for (auto& v : V)
+            v.resize(vec_.size());
+        controlled_copy(V[0], ctrlmask);
+        double const beta = std::sqrt(squared_norm(V[0]));
+        if (beta == 0.)
             return;
+        calc_type const inv_beta = 1. / beta;
+        #pragma omp parallel for schedule(static) num_threads(team_size())
+        for (std::size_t k = 0; k < vec_.size(); ++k)
+            V[0][k] *= inv_beta;
+
+        double const total = std::abs(time), sign = (time > 0.) ? 1. : -1.;
+        double const tol = time_evolution_tolerance();
+        double done = 0., tau = total;
+        bool last = false;
+        while (!last){
+            std::vector<double> alpha, offdiag;
+            unsigned dim = m;
+            bool breakdown = false;
+            for (unsigned j = 0; j < m; ++j){
+                apply_hamiltonian(H, V[j], V[j + 1], 1., 0., ctrlmask);
+                double a = 0.;
+                #pragma omp parallel for reduction(+:a) schedule(static) num_threads(team_size())
+                for (std::size_t k = 0; k < vec_.size(); ++k)
+                    a += std::real(std::conj(V[j][k]) * V[j + 1][k]);
+                calc_type const ca = a, cb = (j > 0) ? offdiag[j - 1] : 0.;
+                complex_type const* vprev = V[(j > 0) ? j - 1 : j].data();
+                double b2 = 0.;
+                #pragma omp parallel for reduction(+:b2) schedule(static) num_threads(team_size())
+                for (std::size_t k = 0; k < vec_.size(); ++k){
+                    V[j + 1][k] -= ca * V[j][k] + cb * vprev[k];
+                    b2 += std::norm(V[j + 1][k]);
+                }
+                alpha.push_back(a);
+                double const b = std::sqrt(b2);
+                if (b <= tol * H.norm){
+                    // the Krylov space is invariant under H, i.e., exact
+                    dim = j + 1;
+                    breakdown = true;
+                    break;
+                }
+                offdiag.push_back(b);
+                calc_type const inv_b = 1. / b;
+                #pragma omp parallel for schedule(static) num_threads(team_size())
+                for (std::size_t k = 0; k < vec_.size(); ++k)
+                    V[j + 1][k] *= inv_b;
+            }
+
+            std::vector<double> tridiagonal(dim * dim, 0.), eigenvectors;
+            for (unsigned i = 0; i < dim; ++i){
+                tridiagonal[i * dim + i] = alpha[i];
+                if (i + 1 < dim)
+                    tridiagonal[i * dim + i + 1] = tridiagonal[(i + 1) * dim + i] = offdiag[i];
+            }
+            auto eigenvalues = symmetric_eigen(tridiagonal, dim, eigenvectors);
+
+            double const remaining = total - done;
+            tau = std::min(tau, remaining);
+            double const exponent = 1. / std::max(dim - 1, 1U);
+            std::vector<std::complex<double>> y;
+            double err = 0., allowed = 0.;
+            for (unsigned attempt = 0; attempt < 50; ++attempt){
+                y = expm_first_column(eigenvalues, eigenvectors, sign * tau);
+                err = breakdown ? 0. : beta * offdiag[dim - 1] * std::abs(y[dim - 1]);
+                // (the error estimate is subject to round-off errors)
+                allowed = beta * std::max(tol * tau / total, 10. * std::numeric_limits<double>::epsilon());
+                if (err <= allowed)
+                    break;
+                tau *= std::max(0.1, 0.9 * std::pow(allowed / err, exponent));
+            }
+            last = (tau == remaining);
+            done += tau;
 
-        Fusion::Matrix m;
+            std::vector<complex_type> coeffs(y.begin(), y.end());
+            auto& w = V[dim];
+            #pragma omp parallel for schedule(static) num_threads(team_size())
+            for (std::size_t k = 0; k < vec_.size(); ++k){
+                complex_type s = 0.;
+                for (unsigned j = 0; j < dim; ++j)
+                    s += coeffs[j] * V[j][k];
+                w[k] = s;
+            }
+            std::swap(V[0], w);
+            // try a larger step next time if the error was small
+            tau *= (err > 0.) ? std::min(5., 0.9 * std::pow(allowed / err, exponent)) : 5.;
+        }
+        complex_type const cbeta = beta;
+        #pragma omp parallel for schedule(static) num_threads(team_size())
+        for (std::size_t k = 0; k < vec_.size(); ++k)
+            if ((k & ctrlmask) == ctrlmask)
+                vec_[k] = cbeta * V[0][k];
+    }
+
+    bool clusters_overlap(std::vector<unsigned> const& ids){
+        for (auto const& cluster : clusters_)
+            if (cluster.overlaps(ids))
+                return true;
+        return false;
+    }
+
+    bool diagonal_overlaps(std::vector<unsigned> const& ids){
+        for (auto const& gate : diagonal_)
+            for (auto id : ids)
+                if (std::count(gate.ids.begin(), gate.ids.end(), id)
+                        || std::count(gate.ctrl.begin(), gate.ctrl.end(), id))
+                    return true;
+        return false;
+    }
+
+    static Fusion::Matrix monomial_matrix(std::vector<std::size_t> const& perm,
+                                          std::vector<std::complex<double>> const& phases){
+        Fusion::Matrix m(perm.size(), Fusion::Matrix::value_type(perm.size(), 0.));
+        for (std::size_t j = 0; j < perm.size(); ++j)
+            m[perm[j]][j] = phases[j];
+        return m;
+    }
+
+    // moves the amplitude of local basis state j (at offset[j] relative to a
+    // base index, i.e., an index with all target/control positions 0 except
+    // for the controls in ctrlmask) to perm[j], multiplied by phase[j]
+    template <std::size_t Dim>
+    void permute(std::vector<std::size_t> const& perm,
+                 std::vector<complex_type> const& phase,
+                 std::vector<std::size_t> const& offset,
+                 std::vector<unsigned> const& positions, std::size_t ctrlmask){
+        std::size_t src[Dim], dst[Dim];
+        complex_type ph[Dim];
+        for (std::size_t j = 0; j < Dim; ++j){
+            src[j] = offset[j];
+            dst[j] = offset[perm[j]];
+            ph[j] = phase[j];
+        }
+        // the bases come in contiguous runs below the lowest target/control
+        // position
+        std::size_t nbase = vec_.size() >> positions.size();
+        std::size_t chunk = std::min<std::size_t>(1UL << positions[0], 1024);
+        complex_type* psi = vec_.data();
+        #pragma omp parallel for schedule(static) num_threads(team_size())
+        for (std::size_t b = 0; b < nbase; b += chunk){
+            // insert zeros at the target and control positions
+            std::size_t i0 = b;
+            for (auto p : positions)
+                i0 = ((i0 >> p) << (p + 1)) | (i0 & ((1UL << p) - 1));
+            i0 |= ctrlmask;
+            for (std::size_t i = i0; i < i0 + chunk; ++i){
+                complex_type v[Dim];
+                for (std::size_t j = 0; j < Dim; ++j)
+                    v[j] = psi[i + src[j]];
+                for (std::size_t j = 0; j < Dim; ++j)
+                    psi[i + dst[j]] = ph[j] * v[j];
+            }
+        }
+    }
+
+    // applies all pending diagonal gates in one pass over the state vector
+    void run_diagonal(){
+        if (!diagonal_.empty())
+            update_layout();
+        for (auto const& gate : diagonal_)
+            if (auto recorded = record(Recording::Kind::diagonal, gate.ids, gate.ctrl))
+                recorded->diag = gate.diag;
+        std::size_t begin = 0;
+        while (begin < diagonal_.size()){
+            // combine as many gates as possible into one table of phases
+            // which is indexed by the bits at the positions in qubits
+            std::vector<unsigned> qubits;
+            std::size_t end = begin;
+            for (; end < diagonal_.size(); ++end){
+                auto merged = qubits;
+                for (auto id : diagonal_[end].ids)
+                    merged.push_back(map_[id]);
+                for (auto id : diagonal_[end].ctrl)
+                    merged.push_back(map_[id]);
+                std::sort(merged.begin(), merged.end());
+                merged.erase(std::unique(merged.begin(), merged.end()), merged.end());
+                if (merged.size() > max_diagonal_qubits_ && end > begin)
+                    break;
+                qubits = std::move(merged);
+            }
+            apply_diagonal(begin, end, qubits);
+            begin = end;
+        }
+        diagonal_.clear();
+    }
+
+    // applies the diagonal gates diagonal_[begin:end] which act on (and are
+    // controlled by) the qubits at the given (sorted) positions
+    void apply_diagonal(std::size_t begin, std::size_t end,
+                        std::vector<unsigned> const& qubits){
+        auto local_index = [&](std::size_t i){
+            std::size_t res = 0;
+            for (unsigned l = 0; l < qubits.size(); ++l)
+                res |= ((i >> qubits[l]) & 1UL) << l;
+            return res;
+        };
+        auto table_bit = [&](unsigned id){
+            return 1UL << (std::lower_bound(qubits.begin(), qubits.end(), map_[id]) - qubits.begin());
+        };
+        std::vector<complex_type> table(1UL << qubits.size(), complex_type(1.));
+        for (std::size_t g = begin; g < end; ++g){
+            auto const& gate = diagonal_[g];
+            std::size_t ctrlmask = 0;
+            for (auto c : gate.ctrl)
+                ctrlmask |= table_bit(c);
+            std::vector<std::size_t> bits;
+            for (auto id : gate.ids)
+                bits.push_back(table_bit(id));
+            for (std::size_t t = 0; t < table.size(); ++t){
+                if ((t & ctrlmask) != ctrlmask)
+                    continue;
+                std::size_t local = 0;
+                for (unsigned l = 0; l < bits.size(); ++l)
+                    local |= static_cast<std::size_t>((t & bits[l]) != 0) << l;
+                table[t] *= gate.diag[local];
+            }
+        }
+
+        // only amplitudes whose phase differs from 1 have to be touched, i.e.,
+        // table bits which are set for all such entries (e.g., controls) can be
+        // fixed to 1
+        std::size_t fixed = ~0UL;
+        bool trivial = true;
+        for (std::size_t t = 0; t < table.size(); ++t){
+            if (table[t] != complex_type(1.)){
+                fixed &= t;
+                trivial = false;
+            }
+        }
+        if (trivial)
+            return;
+        std::vector<unsigned> fixed_positions;
+        std::size_t fixedmask = 0;
+        for (unsigned l = 0; l < qubits.size(); ++l){
+            if ((fixed >> l) & 1UL){
+                fixed_positions.push_back(qubits[l]);
+                fixedmask |= 1UL << qubits[l];
+            }
+        }
+
+        // the remaining indices come in contiguous runs (below the lowest fixed
+        // position) within which the table index is looked up
+        unsigned low_bits = std::min<unsigned>(N_, 12);
+        if (fixed_positions.size() > 0)
+            low_bits = std::min(low_bits, fixed_positions[0]);
+        std::size_t chunk = 1UL << low_bits;
+        std::vector<std::size_t> low_index(chunk);
+        for (std::size_t x = 0; x < chunk; ++x)
+            low_index[x] = local_index(x);
+        std::size_t nreduced = vec_.size() >> fixed_positions.size();
+        complex_type* psi = vec_.data();
+        complex_type const* phase = table.data();
+        std::size_t const* low = low_index.data();
+        #pragma omp parallel for schedule(static) num_threads(team_size())
+        for (std::size_t b = 0; b < nreduced; b += chunk){
+            // insert ones at the fixed positions
+            std::size_t offset = b;
+            for (auto p : fixed_positions)
+                offset = ((offset >> p) << (p + 1)) | (offset & ((1UL << p) - 1));
+            offset |= fixedmask;
+            complex_type const* high = phase + local_index(offset);
+            for (std::size_t x = 0; x < chunk; ++x)
+                psi[offset + x] *= high[low[x]];
+        }
+    }
+
+    // executes the fused gates of the cluster
+    void run_cluster(Fusion& cluster){
+        if (cluster.size() < 1)
+            return;
+        update_layout();
+
+        Fusion::Matrix fused_matrix;
         Fusion::IndexVector ids, ctrls;
 
-        fused_gates_.perform_fusion(m, ids, ctrls);
+        cluster.perform_fusion(fused_matrix, ids, ctrls);
+
+        auto m = to_kernel_matrix(fused_matrix);
+        if (auto recorded = record(Recording::Kind::dense, ids, ctrls))
+            recorded->matrix = m;
+        apply_kernel(m, ids, ctrls);
+    }
 
+    // applies the gate matrix m to the qubits ids (controlled by ctrl)
+    void apply_kernel(KernelMatrix const& m, std::vector<unsigned> ids,
+                      std::vector<unsigned> const& ctrl){
+        update_layout();
         for (auto& id : ids)
             id = map_[id];
 
-        auto ctrlmask = get_control_mask(ctrls);
+        auto ctrlmask = get_control_mask(ctrl);
 
         switch (ids.size()){
             case 1:
-                #pragma omp parallel
-                kernel(vec_, ids[0], m, ctrlmask);
+                #pragma omp parallel num_threads(team_size())
+                dispatch_kernel(vec_, ids[0], m, ctrlmask);
                 break;
             case 2:
-                #pragma omp parallel
-                kernel(vec_, ids[1], ids[0], m, ctrlmask);
+                #pragma omp parallel num_threads(team_size())
+                dispatch_kernel(vec_, ids[1], ids[0], m, ctrlmask);
                 break;
             case 3:
-                #pragma omp parallel
-                kernel(vec_, ids[2], ids[1], ids[0], m, ctrlmask);
+                #pragma omp parallel num_threads(team_size())
+                dispatch_kernel(vec_, ids[2], ids[1], ids[0], m, ctrlmask);
                 break;
             case 4:
-                #pragma omp parallel
-                kernel(vec_, ids[3], ids[2], ids[1], ids[0], m, ctrlmask);
+                #pragma omp parallel num_threads(team_size())
+                dispatch_kernel(vec_, ids[3], ids[2], ids[1], ids[0], m, ctrlmask);
                 break;
             case 5:
-                #pragma omp parallel
-                kernel(vec_, ids[4], ids[3], ids[2], ids[1], ids[0], m, ctrlmask);
+                #pragma omp parallel num_threads(team_size())
+                dispatch_kernel(vec_, ids[4], ids[3], ids[2], ids[1], ids[0], m, ctrlmask);
                 break;
             default:
                 throw std::invalid_argument("Gates with more than 5 qubits are not supported!");
         }
-
-        fused_gates_ = Fusion();
     }
 
-    std::tuple<Map, StateVector&> cheat(){
-        run();
-        return make_tuple(map_, std::ref(vec_));
+    // appends a gate to the recording and returns it (nullptr if no valid
+    // recording is active); the recording becomes invalid if the gate acts
+    // on qubits outside of the recorded register
+    typename Recording::Gate* record(typename Recording::Kind kind,
+                                     std::vector<unsigned> const& ids,
+                                     std::vector<unsigned> const& ctrl){
+        if (!recording_ || !recording_valid_)
+            return nullptr;
+        auto in_register = [&](unsigned id){ return recording_ids_.count(id) > 0; };
+        if (!std::all_of(ids.begin(), ids.end(), in_register) ||
+                !std::all_of(ctrl.begin(), ctrl.end(), in_register)){
+            recording_valid_ = false;
+            recording_->gates.clear();
+            return nullptr;
+        }
+        typename Recording::Gate gate{kind, {}, {}, {}, {}, {}, {}};
+        for (auto id : ids)
+            gate.ids.push_back(recording_ids_[id]);
+        for (auto id : ctrl)
+            gate.ctrl.push_back(recording_ids_[id]);
+        recording_->gates.push_back(std::move(gate));
+        return &recording_->gates.back();
     }
 
-    ~Simulator(){
+    // default kernel costs (index k: k-qubit kernel), such that the fusion
+    // decisions do not depend on timings (see measure_kernel_costs)
+    static constexpr std::array<double, 6> default_kernel_costs(){
+        return {{0., 1., 1.2, 1.3, 1.9, 3.}};
     }
 
-private:
     void apply_term(Term const& term, std::vector<unsigned> const& ids,
                     std::vector<unsigned> const& ctrl){
-        complex_type I(0., 1.);
+        Fusion::Complex I(0., 1.);
         Fusion::Matrix X = {{0., 1.}, {1., 0.}};
         Fusion::Matrix Y = {{0., -I}, {I, 0.}};
         Fusion::Matrix Z = {{1., 0.}, {0., -1.}};
@@ -554,6 +1813,15 @@ private:
         return ctrlmask;
     }
 
+    // returns buff if it can hold size amplitudes and uses the same kind of
+    // storage as vec_, and an empty state vector otherwise
+    StateVector take_buffer(StateVector& buff, std::size_t size){
+        StateVector res(vec_.get_allocator());
+        if (buff.capacity() >= size && buff.get_allocator() == vec_.get_allocator())
+            std::swap(res, buff);
+        return res;
+    }
+
     bool check_ids(std::vector<unsigned> const& ids){
         for (auto id : ids)
             if (!map_.count(id))
@@ -561,19 +1829,45 @@ private:
         return true;
     }
 
-    unsigned N_; // #qubits
+    unsigned N_; // #qubit positions (vec_ has 2^N_ entries once updated)
     StateVector vec_;
     Map map_;
-    Fusion fused_gates_;
+    std::vector<Fusion> clusters_;
+    std::vector<DiagonalGate> diagonal_;
+    // positions of deallocated qubits (in |0>) which are still part of vec_
+    std::vector<unsigned> free_;
+    // maximal number of qubits of the combined diagonal gates (i.e., the
+    // table of phases has at most 2^max_diagonal_qubits_ entries)
+    static constexpr unsigned max_diagonal_qubits_ = 14;
+    // maximal number of qubits for which each thread of get_probabilities
+    // keeps its own histogram of the outcomes
+    static constexpr unsigned max_histogram_qubits_ = 16;
     unsigned fusion_qubits_min_, fusion_qubits_max_;
+    unsigned num_threads_ = 0;
+    unsigned parallel_threshold_qubits_ = 14;
+    std::array<double, 6> kernel_costs_ = default_kernel_costs();
+    std::string time_evolution_method_ = "taylor";
+    unsigned krylov_dim_ = 16;
+    Hamiltonian hamiltonian_;
+    std::vector<StateVector> krylov_basis_;
     RndEngine rnd_eng_;
     std::function<double()> rng_;
+    // gates executed since start_recording (nullptr if not recording)
+    std::unique_ptr<Recording> recording_;
+    bool recording_valid_ = false;
+    // position of each recorded qubit in the recorded register
+    Map recording_ids_;
 
     // large array buffers to avoid costly reallocations
     static StateVector tmpBuff1_, tmpBuff2_;
 };
 
-Simulator::StateVector Simulator::tmpBuff1_;
-Simulator::StateVector Simulator::tmpBuff2_;
+template <class T>
+typename BasicSimulator<T>::StateVector BasicSimulator<T>::tmpBuff1_;
+template <class T>
+typename BasicSimulator<T>::StateVector BasicSimulator<T>::tmpBuff2_;
+
+using Simulator = BasicSimulator<double>;
+using SinglePrecisionSimulator = BasicSimulator<float>;
 
 #endif
@@ -30,8 +30,8 @@ using ArrayType = std::vector<c_type, aligned_allocator<c_type,64>>;
 using MatrixType = std::vector<ArrayType>;
 using QuRegs = std::vector<std::vector<unsigned>>;
 
-template <class QR>
-void emulate_math_wrapper(Simulator &sim, py::function const& pyfunc, QR const& qr, std::vector<unsigned> const& ctrls){
+template <class Sim, class QR>
+void emulate_math_wrapper(Sim &sim, py::function const& pyfunc, QR const& qr, std::vector<unsigned> const& ctrls){
     auto f = [&](std::vector<int>& x) {
         pybind11::gil_scoped_acquire acquire;
         x = std::move(pyfunc(x).cast<std::vector<int>>());
@@ -39,29 +39,148 @@ void emulate_math_wrapper(Simulator &sim, py::function const& pyfunc, QR const&
     pybind11::gil_scoped_release release;
     sim.emulate_math(f, qr, ctrls);
 }
-PYBIND11_PLUGIN(_cppsim) {
-    py::module m("_cppsim", "_cppsim");
-    py::class_<Simulator>(m, "Simulator")
+
+template <class Sim, class QR>
+void emulate_math_table_wrapper(Sim &sim, py::array_t<std::int64_t, py::array::c_style | py::array::forcecast> const& table, QR const& qr, std::vector<unsigned> const& ctrls){
+    pybind11::gil_scoped_release release;
+    sim.emulate_math_table(table.data(), table.size(), qr, ctrls);
+}
+
+// returns the qubit-to-bit-location map and a copy of the state vector
+template <class Sim>
+py::tuple cheat_wrapper(Sim &sim){
+    auto res = sim.cheat();
+    auto& vec = std::get<1>(res);
+    return py::make_tuple(std::get<0>(res), py::array_t<typename Sim::complex_type>(vec.size(), vec.data()));
+}
+
+// returns the qubit-to-bit-location map and a numpy array which aliases the
+// state vector of the simulator (no copy, also if it is memory-mapped); the
+// array is only valid until the next call which may modify or reallocate the
+// state vector (gates, allocations, measurements, emulation, ...)
+template <class Sim>
+py::tuple state_view_wrapper(py::object self){
+    auto res = self.cast<Sim&>().cheat();
+    auto& vec = std::get<1>(res);
+    auto view = py::array_t<typename Sim::complex_type>(vec.size(), vec.data(), self);
+    return py::make_tuple(std::get<0>(res), view);
+}
+
+template <class Sim>
+void set_wavefunction_wrapper(Sim &sim, py::array_t<typename Sim::complex_type, py::array::c_style | py::array::forcecast> const& wavefunction, std::vector<unsigned> const& ordering){
+    if (wavefunction.ndim() != 1 || wavefunction.size() != (1L << ordering.size()))
+        throw std::runtime_error("set_wavefunction(): The wavefunction must contain 2^n amplitudes for n qubits.");
+    sim.set_wavefunction(wavefunction.data(), wavefunction.size(), ordering);
+}
+
+template <class Sim>
+void load_state_wrapper(Sim &sim, py::array_t<typename Sim::complex_type, py::array::c_style | py::array::forcecast> const& wavefunction, std::vector<unsigned> const& ordering){
+    if (wavefunction.ndim() != 1 || wavefunction.size() != (1L << ordering.size()))
+        throw std::runtime_error("load_state(): The wavefunction must contain 2^n amplitudes for n qubits.");
+    sim.load_state(wavefunction.data(), wavefunction.size(), ordering);
+}
+
+// returns the instruction set of the gate kernels (selected when the module
+// is loaded, see dispatch.hpp) and further properties of the simulator
+template <class Sim>
+py::dict kernel_info_wrapper(Sim const& sim){
+    py::dict info;
+    info["backend"] = "c++";
+    info["kernels"] = kernel_isa_name(selected_kernel_isa());
+    info["supported_kernels"] = supported_kernel_isas();
+    info["precision"] = std::is_same<typename Sim::calc_type, float>::value ? "single" : "double";
+    info["threads"] = sim.num_threads();
+    info["parallel_threshold_qubits"] = sim.parallel_threshold_qubits();
+    info["kernel_costs"] = sim.kernel_costs();
+    return info;
+}
+
+template <class Sim>
+py::array_t<double> get_probabilities_wrapper(Sim &sim, std::vector<unsigned> const& ids){
+    py::array_t<double> probabilities(std::size_t(1) << ids.size());
+    double* data = probabilities.mutable_data();
+    pybind11::gil_scoped_release release;
+    sim.get_probabilities(ids, data);
+    return probabilities;
+}
+
+template <class Sim>
+py::array_t<typename Sim::complex_type> get_amplitudes_wrapper(Sim &sim, py::array_t<std::uint64_t, py::array::c_style | py::array::forcecast> const& indices, std::vector<unsigned> const& ids){
+    py::array_t<typename Sim::complex_type> amplitudes(indices.size());
+    auto data = amplitudes.mutable_data();
+    pybind11::gil_scoped_release release;
+    sim.get_amplitudes(reinterpret_cast<std::size_t const*>(indices.data()), indices.size(), ids, data);
+    return amplitudes;
+}
+
+// returns the recorded gates (None if the recording is invalid)
+template <class Sim>
+py::object stop_recording_wrapper(Sim &sim){
+    auto recording = sim.stop_recording();
+    if (!recording)
+        return py::none();
+    return py::cast(std::move(*recording));
+}
+
+template <class Sim>
+void bind_simulator(py::module& m, char const* name){
+    using Samples = std::vector<std::size_t>;
+    using Recording = typename Sim::Recording;
+    py::class_<Recording>(m, (std::string(name) + "Recording").c_str())
+        .def_readonly("num_qubits", &Recording::num_qubits)
+        .def("__len__", [](Recording const& recording){ return recording.gates.size(); })
+        ;
+    py::class_<Sim>(m, name)
         .def(py::init<unsigned>())
-        .def("allocate_qubit", &Simulator::allocate_qubit)
-        .def("deallocate_qubit", &Simulator::deallocate_qubit)
-        .def("get_classical_value", &Simulator::get_classical_value)
-        .def("is_classical", &Simulator::is_classical)
-        .def("measure_qubits", &Simulator::measure_qubits_return)
-        .def("apply_controlled_gate", &Simulator::apply_controlled_gate<MatrixType>)
-        .def("emulate_math", &emulate_math_wrapper<QuRegs>)
-        .def("emulate_math_addConstant", &Simulator::emulate_math_addConstant<QuRegs>)
-        .def("emulate_math_addConstantModN", &Simulator::emulate_math_addConstantModN<QuRegs>)
-        .def("emulate_math_multiplyByConstantModN", &Simulator::emulate_math_multiplyByConstantModN<QuRegs>)
-        .def("get_expectation_value", &Simulator::get_expectation_value)
-        .def("apply_qubit_operator", &Simulator::apply_qubit_operator)
-        .def("emulate_time_evolution", &Simulator::emulate_time_evolution)
-        .def("get_probability", &Simulator::get_probability)
-        .def("get_amplitude", &Simulator::get_amplitude)
-        .def("set_wavefunction", &Simulator::set_wavefunction)
-        .def("collapse_wavefunction", &Simulator::collapse_wavefunction)
-        .def("run", &Simulator::run)
-        .def("cheat", &Simulator::cheat)
+        .def(py::init<unsigned, std::string const&>())
+        .def("allocate_qubit", &Sim::allocate_qubit)
+        .def("deallocate_qubit", &Sim::deallocate_qubit)
+        .def("reserve", &Sim::reserve)
+        .def("get_classical_value", &Sim::get_classical_value)
+        .def("is_classical", &Sim::is_classical)
+        .def("measure_qubits", &Sim::measure_qubits_return)
+        .def("sample_qubits", (Samples (Sim::*)(std::vector<unsigned> const&, std::size_t)) &Sim::sample_qubits)
+        .def("sample_qubits", (Samples (Sim::*)(std::vector<unsigned> const&, std::size_t, unsigned)) &Sim::sample_qubits)
+        .def("apply_controlled_gate", &Sim::template apply_controlled_gate<MatrixType>)
+        .def("apply_diagonal_gate", &Sim::apply_diagonal_gate)
+        .def("apply_permutation_gate", &Sim::apply_permutation_gate)
+        .def("emulate_math", &emulate_math_wrapper<Sim, QuRegs>)
+        .def("emulate_math_table", &emulate_math_table_wrapper<Sim, QuRegs>)
+        .def("emulate_math_addConstant", &Sim::template emulate_math_addConstant<QuRegs>)
+        .def("emulate_math_addConstantModN", &Sim::template emulate_math_addConstantModN<QuRegs>)
+        .def("emulate_math_multiplyByConstantModN", &Sim::template emulate_math_multiplyByConstantModN<QuRegs>)
+        .def("get_expectation_value", &Sim::get_expectation_value)
+        .def("apply_qubit_operator", &Sim::apply_qubit_operator)
+        .def("emulate_time_evolution", &Sim::emulate_time_evolution)
+        .def("set_time_evolution_method", &Sim::set_time_evolution_method, py::arg("method"), py::arg("krylov_dim") = 16)
+        .def("get_probability", &Sim::get_probability)
+        .def("get_amplitude", &Sim::get_amplitude)
+        .def("get_probabilities", &get_probabilities_wrapper<Sim>)
+        .def("get_amplitudes", &get_amplitudes_wrapper<Sim>)
+        .def("set_wavefunction", &set_wavefunction_wrapper<Sim>)
+        .def("collapse_wavefunction", &Sim::collapse_wavefunction)
+        .def("load_state", &load_state_wrapper<Sim>)
+        .def("get_rng_state", &Sim::get_rng_state)
+        .def("set_rng_state", &Sim::set_rng_state)
+        .def("set_fusion_qubits", &Sim::set_fusion_qubits)
+        .def("set_num_threads", &Sim::set_num_threads, py::arg("num_threads"), py::arg("parallel_threshold_qubits") = 14)
+        .def("set_kernel_costs", &Sim::set_kernel_costs)
+        .def("measure_kernel_costs", &Sim::measure_kernel_costs)
+        .def("start_recording", &Sim::start_recording)
+        .def("stop_recording", &stop_recording_wrapper<Sim>)
+        .def("replay", &Sim::replay)
+        .def("run", &Sim::run)
+        .def("cheat", &cheat_wrapper<Sim>)
+        .def("state_view", &state_view_wrapper<Sim>)
+        .def("kernel_info", &kernel_info_wrapper<Sim>)
         ;
+}
+
+PYBIND11_PLUGIN(_cppsim) {
+    py::module m("_cppsim", "_cppsim");
+    bind_simulator<Simulator>(m, "Simulator");
+    bind_simulator<SinglePrecisionSimulator>(m, "SinglePrecisionSimulator");
+    m.def("select_kernels", &select_kernel_isa,
+          "Select the gate kernels ('scalar', 'avx2' or 'avx512') of all simulators.");
     return m.ptr();
 }
@@ -0,0 +1,363 @@
+#   Copyright 2017 ProjectQ-Framework (www.projectq.ch)
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""
+A density-matrix simulator which applies noise channels exactly.
+"""
+
+import random
+
+import numpy
+
+from projectq.cengines import BasicEngine
+from projectq.meta import get_control_count
+from projectq.ops import (Allocate,
+                          Deallocate,
+                          FlushGate,
+                          KrausChannel,
+                          Measure,
+                          ReadoutError)
+
+from ._qubit_mapping import QubitMappingMixin
+
+
+_PAULIS = {'X': numpy.array([[0, 1], [1, 0]], dtype=complex),
+           'Y': numpy.array([[0, -1j], [1j, 0]], dtype=complex),
+           'Z': numpy.array([[1, 0], [0, -1]], dtype=complex)}
+
+
+def _apply_matrix(tensor, matrix, axes):
+    """
+    Apply matrix to the given axes of tensor (axes[0] corresponds to the
+    least significant bit of the matrix indices) and return the result.
+    """
+    k = len(axes)
+    gate = numpy.asarray(matrix, dtype=complex).reshape((2,) * (2 * k))
+    # row-major reshape: the input axes of gate are ordered from the most to
+    # the least significant bit
+    inputs = [2 * k - 1 - j for j in range(k)]
+    result = numpy.tensordot(gate, tensor, axes=(inputs, list(axes)))
+    return numpy.moveaxis(result, [k - 1 - j for j in range(k)], list(axes))
+
+
+class DensityMatrixSimulator(QubitMappingMixin, BasicEngine):
+    """
+    Simulator which evolves the density matrix of the qubits, such that noise
+    channels (see, e.g., projectq.ops.DepolarizingChannel) are applied
+    exactly instead of by sampling many noisy runs.
+
+    Each noise channel is applied by a single contraction with its
+    superoperator sum_k conj(K_k) x K_k. The memory required grows as 4^n
+    for n qubits, i.e., the simulator is meant for small registers; for larger
+    ones, the Simulator samples quantum trajectories of the same channels.
+
+    Example:
+        .. code-block:: python
+
+            sim = DensityMatrixSimulator()
+            eng = MainEngine(sim)
+            qureg = eng.allocate_qureg(2)
+            H | qureg[0]
+            DepolarizingChannel(0.1) | qureg[0]
+            CNOT | (qureg[0], qureg[1])
+            eng.flush()
+            rho = sim.get_density_matrix(qureg)
+    """
+    def __init__(self, rnd_seed=None):
+        """
+        Construct the density-matrix simulator.
+
+        Args:
+            rnd_seed (int): Random seed (uses random.randint(0, 4294967295)
+                by default).
+        """
+        BasicEngine.__init__(self)
+        if rnd_seed is None:
+            rnd_seed = random.randint(0, 4294967295)
+        self._rng = random.Random(rnd_seed)
+        # probability with which the next measurement outcome of each qubit
+        # is flipped (see ReadoutError)
+        self._readout_errors = dict()
+        # qubit i has axis i (ket) and axis n + i (bra) of the tensor
+        self._ids = []
+        self._rho = numpy.ones((), dtype=complex)
+
+    def is_available(self, cmd):
+        """
+        Specialized implementation of is_available: The density-matrix
+        simulator supports (controlled) gates with a matrix on at most 5
+        qubits, noise channels, readout errors, measurement and
+        (de-)allocation.
+
+        Args:
+            cmd (Command): Command for which to check availability.
+
+        Returns:
+            True if the command can be simulated and False otherwise.
+        """
+        if (cmd.gate == Measure or cmd.gate == Allocate or
+                cmd.gate == Deallocate or isinstance(cmd.gate, FlushGate)):
+            return True
+        if isinstance(cmd.gate, (KrausChannel, ReadoutError)):
+            return get_control_count(cmd) == 0
+        try:
+            return len(cmd.gate.matrix) <= 2 ** 5
+        except AttributeError:
+            return False
+
+    def _axis(self, qubit_id):
+        try:
+            return self._ids.index(qubit_id)
+        except ValueError:
+            raise RuntimeError("DensityMatrixSimulator: Unknown qubit id {}. "
+                               "Please make sure you have called "
+                               "eng.flush().".format(qubit_id))
+
+    def _marginal(self, axes):
+        """
+        Return the probabilities of all outcomes of measuring the qubits with
+        the given axes, as a tensor with one axis per qubit.
+        """
+        n = len(self._ids)
+        diagonal = numpy.diagonal(self._rho.reshape(2 ** n, 2 ** n)).real
+        diagonal = diagonal.reshape((2,) * n)
+        others = tuple(a for a in range(n) if a not in axes)
+        return numpy.transpose(diagonal.sum(axis=others),
+                               numpy.argsort(numpy.argsort(axes)))
+
+    def _apply_unitary(self, matrix, axes, control_axes):
+        n = len(self._ids)
+        matrix = numpy.asarray(matrix, dtype=complex)
+        for offset, gate in [(0, matrix), (n, matrix.conj())]:
+            # only the part of rho where all controls are 1 changes
+            index = [slice(None)] * (2 * n)
+            for axis in control_axes:
+                index[axis + offset] = 1
+            index = tuple(index)
+            removed = sorted(axis + offset for axis in control_axes)
+            sub_axes = [axis + offset - sum(1 for r in removed
+                                            if r < axis + offset)
+                        for axis in axes]
+            self._rho[index] = _apply_matrix(self._rho[index], gate,
+                                             sub_axes)
+
+    def _apply_channel(self, channel, axis):
+        n = len(self._ids)
+        superoperator = sum(numpy.kron(k.conj(), k)
+                            for k in channel.kraus_operators)
+        self._rho = _apply_matrix(self._rho, superoperator, [axis, axis + n])
+
+    def _allocate(self, qubit_id):
+        n = len(self._ids)
+        zero = numpy.zeros((2, 2), dtype=complex)
+        zero[0, 0] = 1.
+        rho = numpy.multiply.outer(self._rho, zero)
+        self._rho = numpy.moveaxis(rho, 2 * n, n)
+        self._ids.append(qubit_id)
+
+    def _deallocate(self, qubit_id, tol=1e-10):
+        axis = self._axis(qubit_id)
+        n = len(self._ids)
+        probability = self._marginal([axis])[1]
+        if tol < probability < 1. - tol:
+            raise RuntimeError("Error: Qubit has not been measured / "
+                               "uncomputed! There is most likely a bug in "
+                               "your code.")
+        self._rho = numpy.trace(self._rho, axis1=axis, axis2=axis + n)
+        del self._ids[axis]
+
+    def _measure(self, qubit_id):
+        axis = self._axis(qubit_id)
+        n = len(self._ids)
+        probability = self._marginal([axis])[1]
+        outcome = int(self._rng.random() < probability)
+        for offset in [0, n]:
+            index = [slice(None)] * (2 * n)
+            index[axis + offset] = 1 - outcome
+            self._rho[tuple(index)] = 0.
+        self._rho /= probability if outcome else 1. - probability
+        return outcome
+
+    def get_density_matrix(self, qureg):
+        """
+        Return the (reduced) density matrix of the qubits in qureg.
+
+        Args:
+            qureg (Qureg|list[Qubit]): Quantum register determining the
+                ordering (qureg[0] corresponds to the least significant bit
+                of the row and column indices). All other qubits are traced
+                out.
+
+        Returns:
+            numpy.ndarray of shape (2 ** len(qureg), 2 ** len(qureg)).
+
+        Note:
+            Make sure all previous commands (especially allocations) have
+            passed through the compilation chain (call main_engine.flush() to
+            make sure).
+
+        Note:
+            If there is a mapper present in the compiler, this function
+            automatically converts from logical qubits to mapped qubits for
+            the qureg argument.
+        """
+        qureg = self._convert_logical_to_mapped_qureg(qureg)
+        axes = [self._axis(qb.id) for qb in qureg]
+        n = len(self._ids)
+        # trace out the other qubits, starting with the last one
+        rho = self._rho
+        remaining = list(range(n))
+        for axis in reversed(range(n)):
+            if axis not in axes:
+                m = len(remaining)
+                pos = remaining.index(axis)
+                rho = numpy.trace(rho, axis1=pos, axis2=pos + m)
+                del remaining[pos]
+        m = len(remaining)
+        order = [remaining.index(axis) for axis in reversed(axes)]
+        rho = numpy.transpose(rho, order + [pos + m for pos in order])
+        return rho.reshape(2 ** m, 2 ** m)
+
+    def get_expectation_value(self, qubit_operator, qureg):
+        """
+        Get the expectation value of qubit_operator w.r.t. the current
+        density matrix of the supplied quantum register.
+
+        Args:
+            qubit_operator (projectq.ops.QubitOperator): Operator to measure.
+            qureg (list[Qubit],Qureg): Quantum bits to measure.
+
+        Returns:
+            Expectation value
+
+        Note:
+            Make sure all previous commands (especially allocations) have
+            passed through the compilation chain (call main_engine.flush() to
+            make sure).
+
+        Note:
+            If there is a mapper present in the compiler, this function
+            automatically converts from logical qubits to mapped qubits for
+            the qureg argument.
+
+        Raises:
+            Exception: If `qubit_operator` acts on more qubits than present in
+                the `qureg` argument.
+        """
+        qureg = self._convert_logical_to_mapped_qureg(qureg)
+        num_qubits = len(qureg)
+        for term, _ in qubit_operator.terms.items():
+            if not term == () and term[-1][0] >= num_qubits:
+                raise Exception("qubit_operator acts on more qubits than "
+                                "contained in the qureg.")
+        n = len(self._ids)
+        expectation = 0.
+        for term, coefficient in qubit_operator.terms.items():
+            rho = self._rho
+            for index, action in term:
+                rho = _apply_matrix(rho, _PAULIS[action],
+                                    [self._axis(qureg[index].id)])
+            trace = numpy.trace(rho.reshape(2 ** n, 2 ** n))
+            expectation += coefficient * trace.real
+        return expectation
+
+    def get_probability(self, bit_string, qureg):
+        """
+        Return the probability of the outcome `bit_string` when measuring
+        the quantum register `qureg`.
+
+        Args:
+            bit_string (list[bool|int]|string[0|1]): Measurement outcome.
+            qureg (Qureg|list[Qubit]): Quantum register.
+
+        Returns:
+            Probability of measuring the provided bit string.
+
+        Note:
+            Make sure all previous commands (especially allocations) have
+            passed through the compilation chain (call main_engine.flush() to
+            make sure).
+
+        Note:
+            If there is a mapper present in the compiler, this function
+            automatically converts from logical qubits to mapped qubits for
+            the qureg argument.
+        """
+        qureg = self._convert_logical_to_mapped_qureg(qureg)
+        marginal = self._marginal([self._axis(qb.id) for qb in qureg])
+        return float(marginal[tuple(int(b) for b in bit_string)])
+
+    def receive(self, command_list):
+        """
+        Receive a list of commands from the previous engine and handle them
+        (simulate them classically) prior to sending them on to the next
+        engine.
+
+        Args:
+            command_list (list<Command>): List of commands to execute on the
+                simulator.
+        """
+        for cmd in command_list:
+            self._handle(cmd)
+        if not self.is_last_engine:
+            self.send(command_list)
+
+    def _handle(self, cmd):
+        """
+        Handle a command, i.e., apply it to the density matrix.
+
+        Args:
+            cmd (Command): Command to handle.
+
+        Raises:
+            Exception: If a gate on more than 5 qubits needs to be processed
+                (which should never happen due to is_available).
+        """
+        gate = cmd.gate
+        if isinstance(gate, FlushGate):
+            return
+        if gate == Measure:
+            for qr in cmd.qubits:
+                for qb in qr:
+                    log_qb = self._logical_qubit(cmd, qb)
+                    # the density matrix collapses to the true outcome
+                    outcome = self._measure(qb.id)
+                    flip = self._readout_errors.pop(qb.id, 0.)
+                    if flip and self._rng.random() < flip:
+                        outcome = 1 - outcome
+                    self.main_engine.set_measurement_result(log_qb, outcome)
+            return
+        if gate == Allocate:
+            self._allocate(cmd.qubits[0][0].id)
+            return
+        if gate == Deallocate:
+            self._deallocate(cmd.qubits[0][0].id)
+            self._readout_errors.pop(cmd.qubits[0][0].id, None)
+            return
+        if isinstance(gate, ReadoutError):
+            for qr in cmd.qubits:
+                for qb in qr:
+                    self._readout_errors[qb.id] = gate.combine(
+                        self._readout_errors.get(qb.id, 0.))
+            return
+        axes = [self._axis(qb.id) for qr in cmd.qubits for qb in qr]
+        if isinstance(gate, KrausChannel):
+            for axis in axes:
+                self._apply_channel(gate, axis)
+            return
+        if len(gate.matrix) > 2 ** 5 or 2 ** len(axes) != len(gate.matrix):
+            raise Exception("DensityMatrixSimulator: Error applying {} gate "
+                            "to {} qubits.".format(gate, len(axes)))
+        control_axes = [self._axis(qb.id) for qb in cmd.control_qubits]
+        self._apply_unitary(gate.matrix, axes, control_axes)
@@ -0,0 +1,150 @@
+#   Copyright 2017 ProjectQ-Framework (www.projectq.ch)
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import numpy
+import pytest
+
+from projectq import MainEngine
+from projectq.cengines import DummyEngine
+from projectq.meta import Control
+from projectq.ops import (All, Allocate, AmplitudeDampingChannel, CNOT,
+                          Command, Deallocate, DephasingChannel,
+                          DepolarizingChannel, H, Measure, QFT, QubitOperator,
+                          ReadoutError, Rx, Ry, Swap, Toffoli, X)
+from projectq.types import WeakQubitRef
+
+from ._simulator import Simulator
+from ._density_simulator import DensityMatrixSimulator
+
+
+def test_density_simulator_is_available():
+    sim = DensityMatrixSimulator()
+    eng = MainEngine(sim, [DummyEngine()])
+    qubit1 = WeakQubitRef(engine=eng, idx=1)
+    qubit2 = WeakQubitRef(engine=eng, idx=2)
+    for gate in [H, Rx(0.3), Measure, Allocate, DepolarizingChannel(0.1)]:
+        assert sim.is_available(Command(eng, gate, ([qubit1],)))
+    assert sim.is_available(Command(eng, H, ([qubit1],), controls=[qubit2]))
+    assert not sim.is_available(Command(eng, DephasingChannel(0.1),
+                                        ([qubit1],), controls=[qubit2]))
+    assert not sim.is_available(Command(eng, QFT, ([qubit1, qubit2],)))
+
+
+def _circuit(eng, qureg):
+    H | qureg[0]
+    Ry(0.7) | qureg[2]
+    CNOT | (qureg[0], qureg[1])
+    with Control(eng, qureg[2]):
+        Rx(1.3) | qureg[0]
+    Toffoli | (qureg[1], qureg[2], qureg[0])
+    Swap | (qureg[0], qureg[2])
+
+
+def test_density_simulator_pure_state():
+    sim = DensityMatrixSimulator()
+    eng = MainEngine(sim, [])
+    qureg = eng.allocate_qureg(3)
+    ref = Simulator()
+    ref_eng = MainEngine(ref, [])
+    ref_qureg = ref_eng.allocate_qureg(3)
+    _circuit(eng, qureg)
+    _circuit(ref_eng, ref_qureg)
+    eng.flush()
+    ref_eng.flush()
+    psi = numpy.array([ref.get_amplitude([(i >> k) & 1 for k in range(3)],
+                                         ref_qureg) for i in range(8)])
+    rho = sim.get_density_matrix(qureg)
+    assert numpy.allclose(rho, numpy.outer(psi, psi.conj()))
+    # reduced density matrix with a different ordering
+    rho = sim.get_density_matrix([qureg[2], qureg[0]])
+    psi = psi.reshape(2, 2, 2)  # axes: qubit 2, qubit 1, qubit 0
+    expected = numpy.einsum('abc,dbf->cafd', psi, psi.conj()).reshape(4, 4)
+    assert numpy.allclose(rho, expected)
+    op = QubitOperator('X0 Z2', 0.4) + QubitOperator('Y1', -1.)
+    assert (sim.get_expectation_value(op, qureg) ==
+            pytest.approx(ref.get_expectation_value(op, ref_qureg)))
+    assert (sim.get_probability('10', qureg[1:]) ==
+            pytest.approx(ref.get_probability('10', ref_qureg[1:])))
+    with pytest.raises(Exception):
+        sim.get_expectation_value(QubitOperator('Z3'), qureg)
+    All(Measure) | qureg
+    All(Measure) | ref_qureg
+
+
+def test_density_simulator_channels():
+    sim = DensityMatrixSimulator()
+    eng = MainEngine(sim, [])
+    qureg = eng.allocate_qureg(4)
+    DepolarizingChannel(0.3) | qureg[0]
+    X | qureg[1]
+    AmplitudeDampingChannel(0.25) | qureg[1]
+    H | qureg[2]
+    DephasingChannel(0.1) | qureg[2]
+    ReadoutError(0.2) | qureg[3]
+    eng.flush()
+    assert (sim.get_expectation_value(QubitOperator('Z0'), qureg) ==
+            pytest.approx(1. - 4. * 0.3 / 3.))
+    assert sim.get_probability([1], [qureg[1]]) == pytest.approx(0.75)
+    assert (sim.get_expectation_value(QubitOperator('X2'), qureg) ==
+            pytest.approx(0.8))
+    # readout errors do not act on the state
+    assert sim.get_probability([1], [qureg[3]]) == pytest.approx(0.)
+    rho = sim.get_density_matrix(qureg)
+    assert numpy.trace(rho) == pytest.approx(1.)
+    assert numpy.allclose(rho, rho.conj().T)
+    All(Measure) | qureg
+
+
+def test_density_simulator_readout_error():
+    sim = DensityMatrixSimulator(rnd_seed=4)
+    eng = MainEngine(sim, [])
+    qureg = eng.allocate_qureg(2)
+    H | qureg[0]
+    CNOT | (qureg[0], qureg[1])
+    ReadoutError(1.) | qureg[1]
+    All(Measure) | qureg
+    # the reported outcome of qureg[1] is flipped, but the state collapses
+    # to the true (correlated) outcome
+    assert int(qureg[0]) != int(qureg[1])
+    assert sim.get_probability([int(qureg[0])] * 2, qureg) == \
+        pytest.approx(1.)
+    All(Measure) | qureg
+    assert int(qureg[0]) == int(qureg[1])
+
+
+def test_density_simulator_measure_and_deallocate():
+    sim = DensityMatrixSimulator(rnd_seed=2)
+    eng = MainEngine(sim, [])
+    qureg = eng.allocate_qureg(2)
+    H | qureg[0]
+    CNOT | (qureg[0], qureg[1])
+    eng.flush()
+    with pytest.raises(RuntimeError):
+        sim.receive([Command(eng, Measure, ([WeakQubitRef(eng, 10)],))])
+    ancilla = eng.allocate_qubit()
+    X | ancilla
+    del ancilla
+    eng.flush()
+    assert sim.get_density_matrix(qureg).shape == (4, 4)
+    Measure | qureg[0]
+    assert sim.get_probability([int(qureg[0])], [qureg[1]]) == \
+        pytest.approx(1.)
+    Measure | qureg[1]
+    assert int(qureg[0]) == int(qureg[1])
+    qubit = eng.allocate_qubit()
+    H | qubit
+    eng.flush()
+    with pytest.raises(RuntimeError):
+        sim.receive([Command(eng, Deallocate, ([qubit[0]],))])
+    Measure | qubit
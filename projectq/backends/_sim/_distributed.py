@@ -0,0 +1,535 @@
+#   Copyright 2017 ProjectQ-Framework (www.projectq.ch)
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""
+Contains a state-vector simulator which distributes the state vector over
+several worker processes.
+
+The 2^n amplitudes are split into 2^g shards of 2^l = 2^(n-g) amplitudes
+each: the l lowest bit-locations are local (all amplitudes which differ in
+these bits belong to the same shard), the g highest bit-locations are global
+(they select the shard). Each worker process owns one shard and applies
+gates which only act on local qubits without any communication; controls on
+global qubits merely decide whether a worker applies the gate at all, and
+diagonal gates on global qubits reduce to phases. A gate acting on a global
+qubit is preceded by a bulk exchange which swaps the global qubit with a
+local one. Gates are queued until run() is called, which allows to choose
+the local qubits which are swapped out such that the number of exchanges is
+minimized (the qubit which is needed again furthest in the future is
+evicted).
+
+The shards live in one memory-mapped file which every process maps, i.e.,
+the exchange between two shards is a copy through shared memory. The
+simulator therefore parallelizes the gates over the processes of a single
+machine only: it does not distribute the state vector over several nodes.
+All operations other than gates run in the main process on the full state
+vector (see Simulator), so the memory needed per machine is the same as for
+the Python simulator.
+"""
+
+import math
+import mmap
+import multiprocessing
+import os
+import random
+import tempfile
+import traceback
+import weakref
+
+import numpy as _np
+
+from . import _pysim
+
+
+_PAULIS = {'X': [[0., 1.], [1., 0.]],
+           'Y': [[0., -1j], [1j, 0.]],
+           'Z': [[1., 0.], [0., -1.]]}
+
+
+class _Shard(_pysim.Simulator):
+    """
+    View of one shard of the state vector which is used by the worker
+    processes to apply gates with the kernels of the Python simulator (the
+    qubit IDs are the local bit-locations).
+    """
+    def __init__(self, state, num_qubits):
+        self._dtype = state.dtype.type
+        self._state = state
+        self._num_qubits = num_qubits
+        self._map = {pos: pos for pos in range(num_qubits)}
+
+
+def _map_buffer(path, size, dtype):
+    """
+    Map the file at path and return it as a numpy array of size entries.
+    """
+    with open(path, 'r+b') as f:
+        buff = mmap.mmap(f.fileno(), size * _np.dtype(dtype).itemsize)
+    return _np.frombuffer(buff, dtype=dtype)
+
+
+def _apply(shard, rank, num_local, op):
+    """
+    Apply a gate (see Simulator.run) to the shard of the worker with the
+    given rank.
+    """
+    kind, payload, pos, ctrlpos = op
+    global_ctrl = 0
+    for p in ctrlpos:
+        if p >= num_local:
+            global_ctrl |= 1 << (p - num_local)
+    if rank & global_ctrl != global_ctrl:
+        return
+    ctrlpos = [p for p in ctrlpos if p < num_local]
+    if kind == 'diagonal':
+        # the values of the global target qubits are fixed on this shard:
+        # keep the entries of the diagonal which agree with them
+        diag = _np.asarray(payload, dtype=shard._dtype)
+        # (from the highest bit down, such that the lower bits keep their
+        # meaning)
+        local = []
+        for i in reversed(range(len(pos))):
+            if pos[i] >= num_local:
+                bit = (rank >> (pos[i] - num_local)) & 1
+                diag = diag.reshape(-1, 2, 1 << i)[:, bit, :].ravel()
+            else:
+                local.insert(0, i)
+        if len(local) == 0:
+            mask = shard._get_control_mask(ctrlpos)
+            shard._controlled_view(shard._state, mask)[...] *= diag[0]
+        else:
+            shard.apply_diagonal_gate(diag, [pos[i] for i in local], ctrlpos)
+    elif kind == 'permutation':
+        shard.apply_permutation_gate(payload[0], payload[1], pos, ctrlpos)
+    else:
+        shard.apply_controlled_gate(payload, pos, ctrlpos)
+
+
+def _exchange(shard, partner, global_bit, local_pos, rank):
+    """
+    Swap the global qubit global_bit with the local qubit at local_pos, i.e.,
+    exchange the half of the shard where the local qubit is 1 with the half
+    of the partner shard where it is 0 (done by the rank whose global bit is
+    0).
+    """
+    if (rank >> global_bit) & 1:
+        return
+    mine = shard.reshape(-1, 2, 1 << local_pos)[:, 1, :]
+    theirs = partner.reshape(-1, 2, 1 << local_pos)[:, 0, :]
+    tmp = mine.copy()
+    mine[...] = theirs
+    theirs[...] = tmp
+
+
+def _worker(rank, conn, barrier):
+    """
+    Main loop of a worker process: executes the messages sent by
+    Simulator._send until it receives None.
+    """
+    state = None
+    while True:
+        msg = conn.recv()
+        if msg is None:
+            break
+        try:
+            if msg[0] == 'attach':
+                _, path, size, dtype = msg
+                state = None
+                state = _map_buffer(path, size, dtype)
+            else:
+                _, num_qubits, num_local, program = msg
+                size = 1 << num_local
+                # small states use fewer shards than there are workers
+                active = rank < 1 << (num_qubits - num_local)
+                if active:
+                    shard = _Shard(state[rank * size:(rank + 1) * size],
+                                   num_local)
+                for op in program:
+                    if op[0] == 'exchange':
+                        _, global_bit, local_pos = op
+                        barrier.wait()
+                        if active:
+                            partner = rank ^ (1 << global_bit)
+                            _exchange(shard._state,
+                                      state[partner * size:
+                                            (partner + 1) * size],
+                                      global_bit, local_pos, rank)
+                        barrier.wait()
+                    elif active:
+                        _apply(shard, rank, num_local, op)
+            conn.send(None)
+        except Exception:
+            barrier.abort()
+            conn.send(traceback.format_exc())
+
+
+def _shutdown(pid, workers, connections):
+    """
+    Stop the worker processes (only in the process which started them, i.e.,
+    not in forked workers of other simulators).
+    """
+    if os.getpid() != pid:
+        return
+    for conn in connections:
+        try:
+            conn.send(None)
+        except (OSError, ValueError):
+            pass
+    for process in workers:
+        process.join(timeout=5)
+        if process.is_alive():
+            process.terminate()
+
+
+class Simulator(_pysim.Simulator):
+    """
+    State-vector simulator which distributes the state vector over several
+    worker processes (see the module docstring).
+
+    All operations other than gates (measurements, expectation values,
+    emulation of math gates and time evolution, ...) are carried out by the
+    main process on the full state vector (using the implementation of the
+    Python simulator), which is mapped in the main process as well.
+
+    Note:
+        This is intra-node process parallelism only. Every process maps the
+        full state vector and the operations listed above are not sharded,
+        so the largest state vector which can be simulated is the same as
+        for the Python simulator, i.e., it is limited by the memory of one
+        machine (or by mmap_dir).
+    """
+    def __init__(self, rnd_seed, processes=None, *args, precision='double',
+                 mmap_dir=None, **kwargs):
+        """
+        Initialize the simulator and start the worker processes.
+
+        Args:
+            rnd_seed (int): Seed to initialize the random number generator.
+            processes (int): Number of worker processes, i.e., of shards
+                (must be a power of two; default: the largest power of two
+                which does not exceed the number of CPUs).
+            args: Dummy argument to allow an interface identical to the c++
+                simulator.
+            precision (str): Either 'double' (complex128 amplitudes) or
+                'single' (complex64 amplitudes).
+            mmap_dir (str): Directory of the file which stores the state
+                vector (default: /dev/shm if available, else the directory
+                for temporary files).
+            kwargs: Same as args.
+        """
+        if processes is None:
+            processes = 1 << (os.cpu_count() or 1).bit_length() - 1
+        if processes < 1 or processes & (processes - 1):
+            raise ValueError("Simulator: the number of processes must be a "
+                             "power of two, got {}.".format(processes))
+        random.seed(rnd_seed)
+        self._dtype = _pysim._DTYPES[precision]
+        self._map = dict()
+        self._num_qubits = 0
+        self._time_evolution_method = 'taylor'
+        self._krylov_dim = 16
+        self._hamiltonian = None
+        self._num_global = int(math.log2(processes))
+        if mmap_dir is None:
+            mmap_dir = ('/dev/shm' if os.path.isdir('/dev/shm')
+                        else tempfile.gettempdir())
+        self._mmap_dir = str(mmap_dir)
+        self._buffer = None
+        self._queue = []
+        #: Number of bulk exchanges of global and local qubits so far
+        self.num_exchanges = 0
+
+        context = multiprocessing.get_context()
+        barrier = context.Barrier(processes)
+        self._connections = []
+        self._workers = []
+        for rank in range(processes):
+            conn, child_conn = context.Pipe()
+            process = context.Process(target=_worker,
+                                      args=(rank, child_conn, barrier),
+                                      daemon=True)
+            process.start()
+            self._connections.append(conn)
+            self._workers.append(process)
+        self._barrier = barrier
+        self._allocate_buffer(1)
+        self._buffer[0] = 1.
+        self._finalizer = weakref.finalize(self, _shutdown, os.getpid(),
+                                           self._workers, self._connections)
+
+    @property
+    def _state(self):
+        return self._buffer[:1 << self._num_qubits]
+
+    @_state.setter
+    def _state(self, value):
+        # the state vector always lives in the shared buffer: copy new states
+        # into it (unless they already are a view of it)
+        value = _np.asarray(value)
+        if value.ctypes.data != self._buffer.ctypes.data:
+            self._buffer[:len(value)] = value
+
+    def _send(self, msg):
+        """
+        Send msg to all workers and wait until they are done.
+        """
+        for conn in self._connections:
+            conn.send(msg)
+        errors = [conn.recv() for conn in self._connections]
+        errors = [e for e in errors if e is not None]
+        if errors:
+            self._barrier.reset()
+            # report the root cause rather than the broken barriers
+            errors.sort(key=lambda e: 'BrokenBarrierError' in e)
+            raise RuntimeError("Distributed simulator: a worker process "
+                               "failed:\n" + errors[0])
+
+    def _allocate_buffer(self, size):
+        """
+        Move the state vector into a new file of size amplitudes (at least
+        one amplitude per worker).
+        """
+        size = max(size, len(self._workers))
+        fd, path = tempfile.mkstemp(prefix='projectq_', suffix='.state',
+                                    dir=self._mmap_dir)
+        try:
+            os.ftruncate(fd, size * _np.dtype(self._dtype).itemsize)
+        finally:
+            os.close(fd)
+        buff = _map_buffer(path, size, self._dtype)
+        if self._buffer is not None:
+            buff[:1 << self._num_qubits] = self._state
+        self._send(('attach', path, size, self._dtype))
+        # all processes have mapped the file: its name is no longer needed
+        os.remove(path)
+        self._buffer = buff
+
+    def _num_local(self):
+        """
+        Return the number of local bit-locations.
+
+        Gates act on at most 5 qubits, which therefore are always local
+        (small states use fewer shards).
+        """
+        return max(self._num_qubits - self._num_global,
+                   min(self._num_qubits, 5))
+
+    def reserve(self, num_qubits):
+        """
+        Reserve memory for the state vector of num_qubits qubits.
+        """
+        if (1 << num_qubits) > len(self._buffer):
+            self._allocate_buffer(1 << num_qubits)
+
+    def allocate_qubit(self, ID):
+        """
+        Allocate a qubit.
+
+        Args:
+            ID (int): ID of the qubit which is being allocated.
+        """
+        self.run()
+        size = 1 << self._num_qubits
+        if 2 * size > len(self._buffer):
+            self._allocate_buffer(2 * size)
+        self._buffer[size:2 * size] = 0.
+        self._map[ID] = self._num_qubits
+        self._num_qubits += 1
+
+    def apply_controlled_gate(self, m, ids, ctrlids):
+        """
+        Queue the k-qubit gate matrix m (see _pysim.Simulator).
+        """
+        self._record('apply_controlled_gate', (m,), ids, ctrlids)
+        self._queue.append(('matrix', _np.asarray(m, dtype=self._dtype),
+                            list(ids), list(ctrlids)))
+
+    def apply_diagonal_gate(self, diag, ids, ctrlids):
+        """
+        Queue the k-qubit diagonal gate diag (see _pysim.Simulator).
+        """
+        self._record('apply_diagonal_gate', (diag,), ids, ctrlids)
+        self._queue.append(('diagonal', list(diag), list(ids),
+                            list(ctrlids)))
+
+    def apply_permutation_gate(self, perm, phases, ids, ctrlids):
+        """
+        Queue the k-qubit permutation gate perm (see _pysim.Simulator).
+        """
+        self._record('apply_permutation_gate', (perm, phases), ids, ctrlids)
+        self._queue.append(('permutation', (list(perm), list(phases)),
+                            list(ids), list(ctrlids)))
+
+    def run(self):
+        """
+        Execute all queued gates.
+
+        Qubits which are targets of non-diagonal gates are swapped into the
+        local bit-locations first. The local qubit which is swapped out is
+        the one whose next use as such a target lies furthest in the future.
+        """
+        if not self._queue:
+            return
+        queue, self._queue = self._queue, []
+        num_local = self._num_local()
+        # targets which need to be local, per gate
+        needs = [ids if kind != 'diagonal' else [] for (kind, _, ids, _) in
+                 queue]
+        program = []
+        for i, (kind, payload, ids, ctrlids) in enumerate(queue):
+            for ID in needs[i]:
+                pos = self._map[ID]
+                if pos < num_local:
+                    continue
+                victim = self._choose_victim(needs, i, num_local)
+                program.append(('exchange', pos - num_local,
+                                self._map[victim]))
+                self._map[ID], self._map[victim] = self._map[victim], pos
+                self.num_exchanges += 1
+            program.append((kind, payload, [self._map[ID] for ID in ids],
+                            [self._map[ID] for ID in ctrlids]))
+        self._send(('run', self._num_qubits, num_local, program))
+
+    def _choose_victim(self, needs, i, num_local):
+        """
+        Return the ID of the local qubit to swap out for gate i of the queue
+        (the one which is needed as a local target again the latest).
+        """
+        current = set(needs[i])
+        candidates = {ID for ID, pos in self._map.items()
+                      if pos < num_local and ID not in current}
+        for ids in needs[i + 1:]:
+            if len(candidates) == 1:
+                break
+            remaining = candidates.difference(ids)
+            if remaining:
+                candidates = remaining
+        return min(candidates, key=lambda ID: self._map[ID])
+
+    def _apply_term(self, term, ids, ctrlids=[]):
+        """
+        Apply a QubitOperator term to the full state vector (in the main
+        process, see _pysim.Simulator._apply_term).
+        """
+        for local_op in term:
+            gate = _PAULIS[local_op[1]]
+            _pysim.Simulator.apply_controlled_gate(self, gate,
+                                                   [ids[local_op[0]]],
+                                                   ctrlids)
+
+    def kernel_info(self):
+        info = super(Simulator, self).kernel_info()
+        info['backend'] = 'distributed'
+        info['processes'] = len(self._workers)
+        return info
+
+    def cheat(self):
+        self.run()
+        return super(Simulator, self).cheat()
+
+    def load_state(self, wavefunction, ordering):
+        if (_np.ndim(wavefunction) != 1 or
+                len(wavefunction) != (1 << len(ordering))):
+            raise RuntimeError("load_state(): The wavefunction must contain "
+                               "2^n amplitudes for n qubits.")
+        if len(set(ordering)) != len(ordering):
+            raise RuntimeError("load_state(): Qubit IDs should be unique.")
+        # queued gates act on the discarded state
+        self._queue = []
+        if len(wavefunction) > len(self._buffer):
+            self._allocate_buffer(len(wavefunction))
+        self._buffer[:len(wavefunction)] = wavefunction
+        self._map = {ordering[i]: i for i in range(len(ordering))}
+        self._num_qubits = len(ordering)
+
+    def measure_qubits(self, ids):
+        self.run()
+        return super(Simulator, self).measure_qubits(ids)
+
+    def sample_qubits(self, ids, shots, seed=None):
+        self.run()
+        return super(Simulator, self).sample_qubits(ids, shots, seed)
+
+    def get_classical_value(self, ID, tol=None):
+        self.run()
+        return super(Simulator, self).get_classical_value(ID, tol)
+
+    def deallocate_qubit(self, ID):
+        self.run()
+        super(Simulator, self).deallocate_qubit(ID)
+
+    def emulate_math_table(self, table, qubit_ids, ctrlqubit_ids):
+        self.run()
+        super(Simulator, self).emulate_math_table(table, qubit_ids,
+                                                  ctrlqubit_ids)
+
+    def emulate_math_addConstant(self, a, qubit_ids, ctrlqubit_ids):
+        """
+        Emulate AddConstant(a) (same interface as the c++ simulator).
+        """
+        self.emulate_math(lambda x: [x[0] + a], qubit_ids, ctrlqubit_ids)
+
+    def emulate_math_addConstantModN(self, a, N, qubit_ids, ctrlqubit_ids):
+        """
+        Emulate AddConstantModN(a, N) (same interface as the c++ simulator).
+        """
+        self.emulate_math(lambda x: [(x[0] + a) % N],
+                          qubit_ids, ctrlqubit_ids)
+
+    def emulate_math_multiplyByConstantModN(self, a, N, qubit_ids,
+                                            ctrlqubit_ids):
+        """
+        Emulate MultiplyByConstantModN(a, N) (same interface as the c++
+        simulator).
+        """
+        self.emulate_math(lambda x: [(x[0] * a) % N],
+                          qubit_ids, ctrlqubit_ids)
+
+    def get_expectation_value(self, terms_dict, ids):
+        self.run()
+        return super(Simulator, self).get_expectation_value(terms_dict, ids)
+
+    def apply_qubit_operator(self, terms_dict, ids):
+        self.run()
+        super(Simulator, self).apply_qubit_operator(terms_dict, ids)
+
+    def get_probability(self, bit_string, ids):
+        self.run()
+        return super(Simulator, self).get_probability(bit_string, ids)
+
+    def get_probabilities(self, ids):
+        self.run()
+        return super(Simulator, self).get_probabilities(ids)
+
+    def get_amplitude(self, bit_string, ids):
+        self.run()
+        return super(Simulator, self).get_amplitude(bit_string, ids)
+
+    def get_amplitudes(self, indices, ids):
+        self.run()
+        return super(Simulator, self).get_amplitudes(indices, ids)
+
+    def emulate_time_evolution(self, terms_dict, time, ids, ctrlids):
+        self.run()
+        super(Simulator, self).emulate_time_evolution(terms_dict, time, ids,
+                                                      ctrlids)
+
+    def set_wavefunction(self, wavefunction, ordering):
+        self.run()
+        super(Simulator, self).set_wavefunction(wavefunction, ordering)
+
+    def collapse_wavefunction(self, ids, values):
+        self.run()
+        super(Simulator, self).collapse_wavefunction(ids, values)
+
@@ -0,0 +1,139 @@
+#   Copyright 2017 ProjectQ-Framework (www.projectq.ch)
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""Tests for projectq.backends._sim._distributed.py."""
+
+import random
+
+import numpy
+import pytest
+
+from projectq import MainEngine
+from projectq.ops import (All, C, CNOT, H, MatrixGate, Measure, Rx, Rz, Swap,
+                          Toffoli, X)
+from projectq.libs.math import AddConstant
+
+from projectq.backends import Simulator
+from projectq.backends._sim import _distributed
+
+
+def _run_random_circuit(sim, num_qubits=8, seed=3):
+    eng = MainEngine(sim, [])
+    qureg = eng.allocate_qureg(num_qubits)
+    rng = random.Random(seed)
+    All(H) | qureg
+    for _ in range(60):
+        i, j, k = rng.sample(range(num_qubits), 3)
+        choice = rng.randint(0, 5)
+        if choice == 0:
+            Rx(rng.uniform(0, 6)) | qureg[i]
+        elif choice == 1:
+            CNOT | (qureg[i], qureg[j])
+        elif choice == 2:
+            Toffoli | (qureg[i], qureg[j], qureg[k])
+        elif choice == 3:
+            C(Rz(rng.uniform(0, 6))) | (qureg[i], qureg[j])
+        elif choice == 4:
+            Swap | (qureg[i], qureg[j])
+        else:
+            matrix = numpy.linalg.qr(numpy.random.RandomState(
+                rng.randint(0, 100)).randn(4, 4))[0]
+            MatrixGate(matrix) | (qureg[i], qureg[j])
+    AddConstant(3) | qureg[2:5]
+    eng.flush()
+    amplitudes = [sim.get_amplitude(format(i, '08b'), qureg)
+                  for i in range(1 << num_qubits)]
+    All(Measure) | qureg
+    return numpy.array(amplitudes)
+
+
+@pytest.mark.parametrize("processes", [1, 2, 4, 8])
+@pytest.mark.parametrize("gate_fusion", [False, True])
+def test_distributed_matches_simulator(processes, gate_fusion):
+    expected = _run_random_circuit(Simulator())
+    sim = Simulator(gate_fusion=gate_fusion, processes=processes)
+    assert numpy.allclose(_run_random_circuit(sim), expected)
+    if processes == 1:
+        assert sim._simulator.num_exchanges == 0
+
+
+def test_distributed_lookahead_reduces_exchanges():
+    counts = []
+    for gate_fusion in (False, True):
+        sim = Simulator(gate_fusion=gate_fusion, processes=4)
+        _run_random_circuit(sim)
+        counts.append(sim._simulator.num_exchanges)
+    assert 0 < counts[1] < counts[0]
+
+
+def test_distributed_global_controls_and_diagonals_need_no_exchange():
+    amplitudes = []
+    for processes in (None, 4):
+        sim = Simulator(gate_fusion=True, processes=processes)
+        eng = MainEngine(sim, [])
+        qureg = eng.allocate_qureg(7)
+        # qureg[5] and qureg[6] are global (and start out in state 1)
+        wavefunction = numpy.zeros(1 << 7)
+        wavefunction[0b1100000] = 1.
+        eng.flush()
+        sim.set_wavefunction(wavefunction, qureg)
+        All(H) | qureg[:5]
+        CNOT | (qureg[6], qureg[0])
+        C(Rz(0.3), 2) | (qureg[5], qureg[6], qureg[1])
+        C(Rz(0.5)) | (qureg[2], qureg[5])
+        Rz(0.7) | qureg[5]
+        eng.flush()
+        if processes is not None:
+            assert sim._simulator.num_exchanges == 0
+        amplitudes.append(sim.cheat()[1].copy())
+        All(Measure) | qureg
+    assert numpy.allclose(amplitudes[0], amplitudes[1])
+
+
+def test_distributed_allocate_deallocate_and_reserve():
+    sim = Simulator(processes=2)
+    eng = MainEngine(sim, [])
+    sim.reserve(8)
+    qureg = eng.allocate_qureg(3)
+    X | qureg[2]
+    ancilla = eng.allocate_qureg(5)
+    H | ancilla[4]
+    H | ancilla[4]
+    CNOT | (qureg[2], ancilla[0])
+    eng.flush()
+    assert sim.get_probability('0011', [qureg[0], qureg[1], qureg[2],
+                                        ancilla[0]]) == pytest.approx(1.)
+    All(Measure) | ancilla
+    del ancilla
+    eng.flush()
+    assert len(sim.cheat()[1]) == 8
+    assert sim.get_amplitude('001', qureg) == pytest.approx(1.)
+    All(Measure) | qureg
+
+
+def test_distributed_invalid_processes():
+    with pytest.raises(ValueError):
+        Simulator(processes=3)
+
+
+def test_distributed_worker_error():
+    backend = _distributed.Simulator(1, 2)
+    backend.allocate_qubit(0)
+    backend.apply_controlled_gate([[0, 1, 0], [1, 0, 0], [0, 0, 1]], [0], [])
+    with pytest.raises(RuntimeError):
+        backend.run()
+    # the workers are still usable
+    backend.apply_controlled_gate([[0, 1], [1, 0]], [0], [])
+    backend.run()
+    assert backend.get_probability([1], [0]) == pytest.approx(1.)
@@ -0,0 +1,467 @@
+#   Copyright 2017 ProjectQ-Framework (www.projectq.ch)
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""
+A matrix-product-state (MPS) simulator for circuits with bounded
+entanglement, e.g., shallow or one-dimensional circuits on many qubits.
+"""
+
+import bisect
+import random
+
+import numpy
+
+from projectq.cengines import BasicEngine
+from projectq.meta import get_control_count
+from projectq.ops import (Allocate,
+                          Deallocate,
+                          FlushGate,
+                          Measure)
+
+from ._qubit_mapping import QubitMappingMixin
+
+
+_SWAP = numpy.array([[1, 0, 0, 0],
+                     [0, 0, 1, 0],
+                     [0, 1, 0, 0],
+                     [0, 0, 0, 1]], dtype=complex)
+
+_PAULIS = {'X': numpy.array([[0, 1], [1, 0]], dtype=complex),
+           'Y': numpy.array([[0, -1j], [1j, 0]], dtype=complex),
+           'Z': numpy.array([[1, 0], [0, -1]], dtype=complex)}
+
+
+class MPSSimulator(QubitMappingMixin, BasicEngine):
+    """
+    Simulator which represents the state as a matrix product state.
+
+    The qubits are the sites of the MPS, ordered by their (mapped) ids. Each
+    site tensor has the shape (left bond, 2, right bond), and the MPS is kept
+    in mixed-canonical form such that two-qubit gates on neighbouring sites
+    are applied by a local singular value decomposition. Singular values are
+    discarded if the bond dimension exceeds max_bond_dimension or if their
+    total weight is below truncation_threshold; the accumulated discarded
+    weight is available as truncation_error.
+
+    Gates on non-neighbouring sites are applied by swapping the sites next
+    to each other (and back). Using the simulator together with a
+    LinearMapper (see projectq.setups.linear) makes all two-qubit gates act
+    on neighbouring sites:
+
+    Example:
+        .. code-block:: python
+
+            engines = projectq.setups.linear.get_engine_list(
+                num_qubits=100, cyclic=False, one_qubit_gates="any",
+                two_qubit_gates=(CNOT, Swap))
+            sim = MPSSimulator(max_bond_dimension=64)
+            eng = MainEngine(sim, engines)
+
+    The simulator supports single-qubit gates with at most one control
+    qubit, two-qubit gates without controls (both given by their matrix),
+    measurement, and (de-)allocation. Gates on more qubits have to be
+    decomposed by an AutoReplacer.
+    """
+    def __init__(self, max_bond_dimension=None, truncation_threshold=1e-12,
+                 rnd_seed=None):
+        """
+        Construct the MPS simulator.
+
+        Args:
+            max_bond_dimension (int): Maximal bond dimension (no limit if
+                None).
+            truncation_threshold (float): Singular values are discarded if
+                their total (relative) weight is below this threshold.
+            rnd_seed (int): Random seed (uses random.randint(0, 4294967295)
+                by default).
+        """
+        BasicEngine.__init__(self)
+        if max_bond_dimension is not None and max_bond_dimension < 1:
+            raise ValueError("MPSSimulator: max_bond_dimension must be at "
+                             "least 1.")
+        if rnd_seed is None:
+            rnd_seed = random.randint(0, 4294967295)
+        self._rng = random.Random(rnd_seed)
+        self._max_bond_dimension = max_bond_dimension
+        self._truncation_threshold = truncation_threshold
+        self._truncation_error = 0.
+        # qubit ids in site order and the site tensors
+        self._ids = []
+        self._tensors = []
+        # orthogonality center: sites to its left are left-canonical, sites
+        # to its right are right-canonical
+        self._center = 0
+
+    @property
+    def truncation_error(self):
+        """
+        Accumulated weight of all discarded singular values (an estimate of
+        the infidelity of the simulated state).
+        """
+        return self._truncation_error
+
+    @property
+    def bond_dimensions(self):
+        """ List of the bond dimensions between neighbouring sites. """
+        return [tensor.shape[2] for tensor in self._tensors[:-1]]
+
+    def is_available(self, cmd):
+        """
+        Specialized implementation of is_available: The MPS simulator
+        supports gates (given by their matrix) which act on at most two
+        qubits including the control qubits, measurement and
+        (de-)allocation.
+
+        Args:
+            cmd (Command): Command for which to check availability.
+
+        Returns:
+            True if the command can be simulated and False otherwise.
+        """
+        if (cmd.gate == Measure or cmd.gate == Allocate or
+                cmd.gate == Deallocate or isinstance(cmd.gate, FlushGate)):
+            return True
+        try:
+            num_targets = len(cmd.gate.matrix).bit_length() - 1
+        except AttributeError:
+            return False
+        return num_targets + get_control_count(cmd) <= 2
+
+    def _site(self, qubit_id):
+        pos = bisect.bisect_left(self._ids, qubit_id)
+        if pos == len(self._ids) or self._ids[pos] != qubit_id:
+            raise RuntimeError("MPSSimulator: Unknown qubit id {}. Please "
+                               "make sure you have called eng.flush()."
+                               .format(qubit_id))
+        return pos
+
+    def _move_center(self, site):
+        """ Move the orthogonality center to site (by QR decompositions). """
+        tensors = self._tensors
+        while self._center < site:
+            c = self._center
+            left, _, right = tensors[c].shape
+            q, r = numpy.linalg.qr(tensors[c].reshape(left * 2, right))
+            tensors[c] = q.reshape(left, 2, q.shape[1])
+            tensors[c + 1] = numpy.tensordot(r, tensors[c + 1], axes=1)
+            self._center += 1
+        while self._center > site:
+            c = self._center
+            left, _, right = tensors[c].shape
+            q, r = numpy.linalg.qr(tensors[c].reshape(left, 2 * right).T)
+            tensors[c] = q.T.reshape(q.shape[1], 2, right)
+            tensors[c - 1] = numpy.tensordot(tensors[c - 1], r.T, axes=1)
+            self._center -= 1
+
+    def _truncate(self, s):
+        """
+        Return the number of singular values (in descending order) to keep
+        and add the weight of the discarded ones to the truncation error.
+        """
+        weights = s ** 2
+        total = weights.sum()
+        tail = numpy.cumsum(weights[::-1])[::-1]
+        keep = max(1, int(numpy.count_nonzero(
+            tail > self._truncation_threshold * total)))
+        if self._max_bond_dimension is not None:
+            keep = min(keep, self._max_bond_dimension)
+        if keep < len(s):
+            self._truncation_error += tail[keep] / total
+        return keep
+
+    def _apply_single_site(self, matrix, site):
+        self._tensors[site] = numpy.einsum('st,ltr->lsr', matrix,
+                                           self._tensors[site])
+
+    def _apply_neighbours(self, matrix, site):
+        """
+        Apply the two-qubit gate matrix to the sites site (least significant
+        qubit of matrix) and site + 1.
+        """
+        self._move_center(site)
+        left = self._tensors[site].shape[0]
+        right = self._tensors[site + 1].shape[2]
+        theta = numpy.tensordot(self._tensors[site], self._tensors[site + 1],
+                                axes=1)
+        # matrix[(o1, o0), (i1, i0)] with qubit 0 on site
+        gate = matrix.reshape(2, 2, 2, 2)
+        theta = numpy.einsum('abcd,ldcr->lbar', gate, theta)
+        u, s, v = numpy.linalg.svd(theta.reshape(left * 2, 2 * right),
+                                   full_matrices=False)
+        keep = self._truncate(s)
+        s = s[:keep] * numpy.sqrt((s ** 2).sum() / (s[:keep] ** 2).sum())
+        self._tensors[site] = u[:, :keep].reshape(left, 2, keep)
+        self._tensors[site + 1] = (s[:, None] *
+                                   v[:keep]).reshape(keep, 2, right)
+        self._center = site + 1
+
+    def _apply_two_sites(self, matrix, site0, site1):
+        """
+        Apply the two-qubit gate matrix to the sites site0 (least significant
+        qubit of matrix) and site1.
+        """
+        if site0 > site1:
+            matrix = matrix.reshape(2, 2, 2, 2).transpose(1, 0, 3, 2)
+            matrix = matrix.reshape(4, 4)
+            site0, site1 = site1, site0
+        # move site0 next to site1 and back afterwards
+        for site in range(site0, site1 - 1):
+            self._apply_neighbours(_SWAP, site)
+        self._apply_neighbours(matrix, site1 - 1)
+        for site in reversed(range(site0, site1 - 1)):
+            self._apply_neighbours(_SWAP, site)
+
+    def _probability_of_one(self, site):
+        self._move_center(site)
+        return float(numpy.linalg.norm(self._tensors[site][:, 1, :]) ** 2)
+
+    def _project(self, site, value, probability):
+        """ Project the (center) site onto value and re-normalize. """
+        tensor = self._tensors[site]
+        tensor[:, 1 - value, :] = 0.
+        tensor /= numpy.sqrt(probability)
+
+    def _allocate(self, qubit_id):
+        site = bisect.bisect_left(self._ids, qubit_id)
+        if site == 0:
+            bond = 1
+        else:
+            bond = self._tensors[site - 1].shape[2]
+        # |0> tensored with the identity on the bond is an isometry in both
+        # directions, i.e., the canonical form is preserved
+        tensor = numpy.zeros((bond, 2, bond), dtype=complex)
+        tensor[:, 0, :] = numpy.eye(bond)
+        self._ids.insert(site, qubit_id)
+        self._tensors.insert(site, tensor)
+        if site <= self._center and len(self._ids) > 1:
+            self._center += 1
+
+    def _deallocate(self, qubit_id, tol=1e-10):
+        site = self._site(qubit_id)
+        probability = self._probability_of_one(site)
+        if tol < probability < 1. - tol:
+            raise RuntimeError("Error: Qubit has not been measured / "
+                               "uncomputed! There is most likely a bug in "
+                               "your code.")
+        # the qubit is in a product state with the rest: absorb its value
+        matrix = self._tensors[site][:, int(probability > .5), :]
+        del self._ids[site]
+        del self._tensors[site]
+        if site > 0:
+            self._tensors[site - 1] = numpy.tensordot(self._tensors[site - 1],
+                                                      matrix, axes=1)
+            self._center = site - 1
+        elif self._tensors:
+            self._tensors[0] = numpy.tensordot(matrix, self._tensors[0],
+                                               axes=1)
+            self._center = 0
+        else:
+            self._center = 0
+
+    def _measure(self, qubit_id):
+        site = self._site(qubit_id)
+        probability = self._probability_of_one(site)
+        outcome = int(self._rng.random() < probability)
+        self._project(site, outcome,
+                      probability if outcome else 1. - probability)
+        return outcome
+
+    def _contract(self, operators):
+        """
+        Return <psi| prod_site operators[site] |psi> for a dict mapping sites
+        to 2x2 matrices.
+        """
+        if not operators:
+            return 1.
+        first, last = min(operators), max(operators)
+        # the sites left of the center are left-canonical and the ones to
+        # its right right-canonical: only first .. last contribute
+        self._move_center(first)
+        bond = self._tensors[first].shape[0]
+        env = numpy.eye(bond, dtype=complex)
+        for site in range(first, last + 1):
+            tensor = self._tensors[site]
+            if site in operators:
+                ket = numpy.einsum('st,ltr->lsr', operators[site], tensor)
+            else:
+                ket = tensor
+            env = numpy.einsum('asb,ac,csd->bd', tensor.conj(), env, ket)
+        return numpy.trace(env)
+
+    def get_expectation_value(self, qubit_operator, qureg):
+        """
+        Get the expectation value of qubit_operator w.r.t. the current wave
+        function represented by the supplied quantum register.
+
+        Args:
+            qubit_operator (projectq.ops.QubitOperator): Operator to measure.
+            qureg (list[Qubit],Qureg): Quantum bits to measure.
+
+        Returns:
+            Expectation value
+
+        Note:
+            Make sure all previous commands (especially allocations) have
+            passed through the compilation chain (call main_engine.flush() to
+            make sure).
+
+        Note:
+            If there is a mapper present in the compiler, this function
+            automatically converts from logical qubits to mapped qubits for
+            the qureg argument.
+
+        Raises:
+            Exception: If `qubit_operator` acts on more qubits than present in
+                the `qureg` argument.
+        """
+        qureg = self._convert_logical_to_mapped_qureg(qureg)
+        num_qubits = len(qureg)
+        for term, _ in qubit_operator.terms.items():
+            if not term == () and term[-1][0] >= num_qubits:
+                raise Exception("qubit_operator acts on more qubits than "
+                                "contained in the qureg.")
+        expectation = 0.
+        for term, coefficient in qubit_operator.terms.items():
+            operators = dict()
+            for index, action in term:
+                site = self._site(qureg[index].id)
+                operators[site] = _PAULIS[action]
+            expectation += coefficient * self._contract(operators).real
+        return expectation
+
+    def get_probability(self, bit_string, qureg):
+        """
+        Return the probability of the outcome `bit_string` when measuring
+        the quantum register `qureg`.
+
+        Args:
+            bit_string (list[bool|int]|string[0|1]): Measurement outcome.
+            qureg (Qureg|list[Qubit]): Quantum register.
+
+        Returns:
+            Probability of measuring the provided bit string.
+
+        Note:
+            Make sure all previous commands (especially allocations) have
+            passed through the compilation chain (call main_engine.flush() to
+            make sure).
+
+        Note:
+            If there is a mapper present in the compiler, this function
+            automatically converts from logical qubits to mapped qubits for
+            the qureg argument.
+        """
+        qureg = self._convert_logical_to_mapped_qureg(qureg)
+        operators = dict()
+        for bit, qubit in zip(bit_string, qureg):
+            projector = numpy.zeros((2, 2), dtype=complex)
+            projector[int(bit), int(bit)] = 1.
+            operators[self._site(qubit.id)] = projector
+        return float(self._contract(operators).real)
+
+    def get_amplitude(self, bit_string, qureg):
+        """
+        Return the probability amplitude of the supplied `bit_string`.
+        The ordering is given by the quantum register `qureg`, which must
+        contain all allocated qubits.
+
+        Args:
+            bit_string (list[bool|int]|string[0|1]): Computational basis state
+            qureg (Qureg|list[Qubit]): Quantum register determining the
+                ordering. Must contain all allocated qubits.
+
+        Returns:
+            Probability amplitude of the provided bit string.
+
+        Note:
+            Make sure all previous commands (especially allocations) have
+            passed through the compilation chain (call main_engine.flush() to
+            make sure).
+
+        Note:
+            If there is a mapper present in the compiler, this function
+            automatically converts from logical qubits to mapped qubits for
+            the qureg argument.
+        """
+        qureg = self._convert_logical_to_mapped_qureg(qureg)
+        if sorted(qb.id for qb in qureg) != self._ids:
+            raise RuntimeError("The second argument to get_amplitude() must"
+                               " be a permutation of all allocated qubits. "
+                               "Please make sure you have called "
+                               "eng.flush().")
+        bits = dict((qb.id, int(bit)) for qb, bit in zip(qureg, bit_string))
+        result = numpy.ones((1, 1), dtype=complex)
+        for qubit_id, tensor in zip(self._ids, self._tensors):
+            result = result.dot(tensor[:, bits[qubit_id], :])
+        return complex(result[0, 0])
+
+    def receive(self, command_list):
+        """
+        Receive a list of commands from the previous engine and handle them
+        (simulate them classically) prior to sending them on to the next
+        engine.
+
+        Args:
+            command_list (list<Command>): List of commands to execute on the
+                simulator.
+        """
+        for cmd in command_list:
+            self._handle(cmd)
+        if not self.is_last_engine:
+            self.send(command_list)
+
+    def _handle(self, cmd):
+        """
+        Handle a command, i.e., apply it to the matrix product state.
+
+        Args:
+            cmd (Command): Command to handle.
+
+        Raises:
+            Exception: If the gate acts on more than two qubits (which should
+                never happen due to is_available).
+        """
+        gate = cmd.gate
+        if isinstance(gate, FlushGate):
+            return
+        if gate == Measure:
+            for qr in cmd.qubits:
+                for qb in qr:
+                    log_qb = self._logical_qubit(cmd, qb)
+                    self.main_engine.set_measurement_result(
+                        log_qb, self._measure(qb.id))
+            return
+        if gate == Allocate:
+            self._allocate(cmd.qubits[0][0].id)
+            return
+        if gate == Deallocate:
+            self._deallocate(cmd.qubits[0][0].id)
+            return
+
+        gate_matrix = numpy.asarray(gate.matrix, dtype=complex)
+        # qubit 0 is the least significant one, controls come last
+        ids = ([qb.id for qr in cmd.qubits for qb in qr] +
+               [qb.id for qb in cmd.control_qubits])
+        if len(ids) > 2 or len(gate_matrix) > 4:
+            raise Exception("MPSSimulator: Error applying {} gate: gates on "
+                            "more than two qubits are not supported. Please "
+                            "add an auto-replacer engine to your list of "
+                            "compiler engines.".format(gate))
+        matrix = numpy.eye(2 ** len(ids), dtype=complex)
+        matrix[-len(gate_matrix):, -len(gate_matrix):] = gate_matrix
+        sites = [self._site(qubit_id) for qubit_id in ids]
+        if len(sites) == 1:
+            self._apply_single_site(matrix, sites[0])
+        else:
+            self._apply_two_sites(matrix, sites[0], sites[1])
@@ -0,0 +1,173 @@
+#   Copyright 2017 ProjectQ-Framework (www.projectq.ch)
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import itertools
+import random
+
+import pytest
+
+from projectq import MainEngine
+from projectq.cengines import DummyEngine
+from projectq.ops import (All, Allocate, C, CNOT, Command, CZ, H, Measure,
+                          QubitOperator, Rx, Rxx, Ry, Rz, Swap, T, Toffoli,
+                          X)
+from projectq.setups import linear
+from projectq.types import WeakQubitRef
+
+from ._simulator import Simulator
+from ._mps_simulator import MPSSimulator
+
+
+def test_mps_simulator_is_available():
+    sim = MPSSimulator()
+    eng = MainEngine(sim, [DummyEngine()])
+    qubit1 = WeakQubitRef(engine=eng, idx=1)
+    qubit2 = WeakQubitRef(engine=eng, idx=2)
+    qubit3 = WeakQubitRef(engine=eng, idx=3)
+    for gate in [H, T, Rx(0.3), Measure, Allocate]:
+        assert sim.is_available(Command(eng, gate, ([qubit1],)))
+    assert sim.is_available(Command(eng, H, ([qubit1],), controls=[qubit2]))
+    assert sim.is_available(Command(eng, Swap, ([qubit1], [qubit2])))
+    assert not sim.is_available(Command(eng, X, ([qubit1],),
+                                        controls=[qubit2, qubit3]))
+    assert not sim.is_available(Command(eng, Swap, ([qubit1], [qubit2]),
+                                        controls=[qubit3]))
+    with pytest.raises(ValueError):
+        MPSSimulator(max_bond_dimension=0)
+
+
+def _random_circuit(eng, qureg, rng):
+    for _ in range(40):
+        a, b = rng.sample(range(len(qureg)), 2)
+        choice = rng.randrange(6)
+        if choice == 0:
+            H | qureg[a]
+        elif choice == 1:
+            rng.choice([Rx, Ry, Rz])(rng.uniform(0, 6)) | qureg[a]
+        elif choice == 2:
+            CNOT | (qureg[a], qureg[b])
+        elif choice == 3:
+            C(Ry(rng.uniform(0, 6))) | (qureg[a], qureg[b])
+        elif choice == 4:
+            Rxx(rng.uniform(0, 6)) | (qureg[a], qureg[b])
+        else:
+            Swap | (qureg[a], qureg[b])
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_mps_simulator_compare_to_simulator(seed):
+    sim = MPSSimulator()
+    eng = MainEngine(sim, [])
+    qureg = eng.allocate_qureg(5)
+    ref = Simulator()
+    ref_eng = MainEngine(ref, [])
+    ref_qureg = ref_eng.allocate_qureg(5)
+    _random_circuit(eng, qureg, random.Random(seed))
+    _random_circuit(ref_eng, ref_qureg, random.Random(seed))
+    eng.flush()
+    ref_eng.flush()
+    assert sim.truncation_error == pytest.approx(0., abs=1e-10)
+    for bits in itertools.product([0, 1], repeat=5):
+        assert (sim.get_amplitude(bits, qureg) ==
+                pytest.approx(ref.get_amplitude(bits, ref_qureg)))
+    assert (sim.get_probability([1, 0], qureg[3:1:-1]) ==
+            pytest.approx(ref.get_probability([1, 0], ref_qureg[3:1:-1])))
+    op = (QubitOperator('X0 Z4', 0.5) + QubitOperator('Y2') +
+          QubitOperator('Z1 X3 Y4', -1.3) + QubitOperator((), 0.2))
+    assert (sim.get_expectation_value(op, qureg) ==
+            pytest.approx(ref.get_expectation_value(op, ref_qureg)))
+    with pytest.raises(Exception):
+        sim.get_expectation_value(QubitOperator('Z5'), qureg)
+    with pytest.raises(RuntimeError):
+        sim.get_amplitude([0] * 4, qureg[:4])
+
+    All(Measure) | qureg
+    bits = [int(qb) for qb in qureg]
+    assert ref.get_probability(bits, ref_qureg) > 1e-6
+    All(Measure) | ref_qureg
+
+
+def test_mps_simulator_truncation():
+    sim = MPSSimulator(max_bond_dimension=1)
+    eng = MainEngine(sim, [])
+    qureg = eng.allocate_qureg(2)
+    Ry(1.) | qureg[0]
+    CNOT | (qureg[0], qureg[1])
+    eng.flush()
+    assert sim.bond_dimensions == [1]
+    # the weight of the smaller Schmidt coefficient is discarded
+    assert sim.truncation_error == pytest.approx(min(.5 + .5 * 0.5403023,
+                                                     .5 - .5 * 0.5403023),
+                                                 rel=1e-6)
+    assert sim.get_probability([0, 0], qureg) == pytest.approx(1.)
+    All(Measure) | qureg
+
+
+def test_mps_simulator_linear_setup():
+    num_qubits = 60
+    sim = MPSSimulator(rnd_seed=3)
+    engines = linear.get_engine_list(num_qubits=num_qubits, cyclic=False,
+                                     one_qubit_gates="any",
+                                     two_qubit_gates=(CNOT, Swap))
+    eng = MainEngine(sim, engines)
+    qureg = eng.allocate_qureg(num_qubits)
+    H | qureg[0]
+    for i in range(num_qubits - 1):
+        CNOT | (qureg[i], qureg[i + 1])
+    CZ | (qureg[0], qureg[num_qubits - 1])
+    eng.flush()
+    assert max(sim.bond_dimensions) == 2
+    assert sim.truncation_error == 0.
+    op = QubitOperator(' '.join('X{}'.format(i) for i in range(num_qubits)))
+    # CZ maps the GHZ state to (|0...0> - |1...1>) / sqrt(2)
+    assert sim.get_expectation_value(op, qureg) == pytest.approx(-1.)
+    assert sim.get_probability([1, 1], [qureg[0], qureg[-1]]) == \
+        pytest.approx(.5)
+    All(Measure) | qureg
+    eng.flush()
+    outcomes = [int(qb) for qb in qureg]
+    assert outcomes == [outcomes[0]] * num_qubits
+
+
+def test_mps_simulator_decomposition():
+    sim = MPSSimulator()
+    eng = MainEngine(sim)
+    qureg = eng.allocate_qureg(3)
+    All(X) | qureg[:2]
+    Toffoli | (qureg[0], qureg[1], qureg[2])
+    eng.flush()
+    assert abs(sim.get_amplitude([1, 1, 1], qureg)) == pytest.approx(1.)
+    All(Measure) | qureg
+
+
+def test_mps_simulator_deallocation():
+    sim = MPSSimulator()
+    eng = MainEngine(sim, [])
+    qureg = eng.allocate_qureg(3)
+    H | qureg[0]
+    CNOT | (qureg[0], qureg[2])
+    ancilla = eng.allocate_qubit()
+    X | ancilla
+    CNOT | (ancilla, qureg[1])
+    X | ancilla
+    del ancilla
+    eng.flush()
+    assert len(sim.bond_dimensions) == 2
+    assert sim.get_probability([1], [qureg[1]]) == pytest.approx(1.)
+    assert (sim.get_amplitude([1, 1, 1], qureg) ==
+            pytest.approx(2 ** -.5))
+    with pytest.raises(RuntimeError):
+        sim.receive([Command(eng, Measure, ([WeakQubitRef(eng, 10)],))])
+    All(Measure) | qureg
+    assert int(qureg[0]) == int(qureg[2])
@@ -0,0 +1,304 @@
+#   Copyright 2017 ProjectQ-Framework (www.projectq.ch)
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""
+Contains a parametrized circuit which is compiled once and can then be
+simulated for many parameter sets (e.g., in variational algorithms).
+"""
+
+import copy
+import math
+import random
+
+import numpy
+
+from projectq.cengines import BasicEngine
+from projectq.ops import (BasicPhaseGate,
+                          BasicRotationGate,
+                          FlushGate,
+                          Measure)
+from projectq.types import WeakQubitRef
+
+from ._simulator import Simulator
+
+
+class _CommandRecorder(BasicEngine):
+    """
+    Backend which records all commands it receives instead of executing them.
+    It supports the same gates as the Simulator such that the compiler
+    produces the command sequence the Simulator would receive.
+    """
+    def __init__(self):
+        BasicEngine.__init__(self)
+        self.commands = []
+        self.recording = True
+
+    def is_available(self, cmd):
+        return Simulator.is_available(self, cmd)
+
+    def receive(self, command_list):
+        for cmd in command_list:
+            if not self.recording or isinstance(cmd.gate, FlushGate):
+                continue
+            if cmd.gate == Measure:
+                raise ValueError("ParametrizedCircuit: The circuit must not "
+                                 "contain measurements.")
+            self.commands.append(cmd)
+
+
+class ParametrizedCircuit(object):
+    """
+    A circuit which depends on a list of real parameters and which is compiled
+    only once.
+
+    The circuit is given as a function circuit(eng, qureg, parameters) which
+    applies gates to qureg (a freshly allocated quantum register of
+    num_qubits qubits). The angles of all rotation and phase gates which
+    reach the simulator (i.e., after decomposition, optimization and mapping)
+    have to be affine functions of the parameters, as is the case for all
+    decomposition rules which come with ProjectQ.
+
+    Example:
+        .. code-block:: python
+
+            def ansatz(eng, qureg, theta):
+                X | qureg[0]
+                Rx(theta[0]) | qureg[1]
+                CNOT | (qureg[1], qureg[0])
+
+            circuit = ParametrizedCircuit(ansatz, num_qubits=2,
+                                          num_parameters=1)
+            energies = circuit.expectation_values(
+                QubitOperator('Z0 Z1') + 0.5 * QubitOperator('X0'),
+                [[0.1], [0.2], [0.3]])
+
+    The compiler runs num_parameters + 2 times when the circuit is
+    constructed; afterwards, each parameter set is simulated by applying the
+    recorded gate sequence directly to the simulator.
+    """
+    def __init__(self, circuit, num_qubits, num_parameters, engine_list=None,
+                 delta=0.25):
+        """
+        Record the compiled circuit and determine how the angles of its gates
+        depend on the parameters.
+
+        Args:
+            circuit (function): Function circuit(eng, qureg, parameters)
+                which applies the circuit to the qubits in qureg.
+            num_qubits (int): Number of qubits of qureg.
+            num_parameters (int): Number of parameters.
+            engine_list (list<BasicEngine>): Compiler engines to use (a new
+                list is created for each compilation if engine_list is a
+                function without arguments). Uses the default compiler
+                engines of the MainEngine if None.
+            delta (float): Parameter offset used to determine the
+                dependence of the angles on the parameters.
+
+        Raises:
+            ValueError: If the compiled circuit contains measurements, or if
+                its structure or the dependence of its angles on the
+                parameters is not affine.
+        """
+        self._circuit = circuit
+        self._num_qubits = num_qubits
+        self._num_parameters = num_parameters
+        self._engine_list = engine_list
+
+        # generic parameter values which avoid, e.g., rotations by zero
+        # being optimized away
+        rng = random.Random(5)
+        self._base = numpy.array([rng.uniform(0.1, 1.)
+                                  for _ in range(num_parameters)])
+
+        commands, self._qubit_ids = self._record(self._base)
+        self._commands = commands
+        # angles of all gates for each parameter offset (None if the angle
+        # does not change)
+        offsets = []
+        for k in range(num_parameters):
+            params = self._base.copy()
+            params[k] += delta
+            offsets.append(self._angles(self._record(params)[0]))
+
+        # for each parametrized gate: (index, angle at base, coefficients)
+        self._parametrized = []
+        for i, cmd in enumerate(commands):
+            if all(angles[i] is None for angles in offsets):
+                continue
+            period = self._period(cmd.gate)
+            coefficients = numpy.zeros(num_parameters)
+            for k, angles in enumerate(offsets):
+                if angles[i] is not None:
+                    coefficients[k] = self._wrap(angles[i] - cmd.gate.angle,
+                                                 period) / delta
+            self._parametrized.append((i, cmd.gate.angle, coefficients))
+
+        # the angles have to be affine functions of the parameters
+        params = self._base + delta * numpy.linspace(-1., 1., num_parameters)
+        check = self._angles(self._record(params)[0])
+        parametrized = set(i for (i, _, _) in self._parametrized)
+        for i, angle in enumerate(check):
+            if angle is not None and i not in parametrized:
+                self._raise_not_affine(commands[i])
+        for (i, angle, coefficients) in self._parametrized:
+            predicted = angle + numpy.dot(coefficients, params - self._base)
+            actual = angle if check[i] is None else check[i]
+            if abs(self._wrap(actual - predicted,
+                              self._period(commands[i].gate))) > 1e-8:
+                self._raise_not_affine(commands[i])
+
+    @property
+    def num_parameters(self):
+        return self._num_parameters
+
+    def _record(self, parameters):
+        """
+        Compile the circuit for the given parameters and return the list of
+        commands reaching the backend and the (mapped) ids of the qubits.
+        """
+        from projectq.cengines import MainEngine
+        recorder = _CommandRecorder()
+        if callable(self._engine_list):
+            engine_list = self._engine_list()
+        elif self._engine_list is None:
+            engine_list = None
+        else:
+            engine_list = copy.deepcopy(self._engine_list)
+        if engine_list is None:
+            eng = MainEngine(backend=recorder)
+        else:
+            eng = MainEngine(backend=recorder, engine_list=engine_list)
+        qureg = eng.allocate_qureg(self._num_qubits)
+        self._circuit(eng, qureg, list(parameters))
+        eng.flush()
+        recorder.recording = False
+        if eng.mapper is not None:
+            mapping = eng.mapper.current_mapping
+            ids = [mapping[qb.id] for qb in qureg]
+        else:
+            ids = [qb.id for qb in qureg]
+        return recorder.commands, ids
+
+    def _angles(self, commands):
+        """
+        Check that commands is the same command sequence as the one recorded
+        at the base parameters up to the angles of the gates, and return the
+        list of angles (None for each gate whose angle did not change).
+        """
+        def ids(qubits):
+            return [[qb.id for qb in qr] for qr in qubits]
+
+        if len(commands) != len(self._commands):
+            self._raise_structure_changes()
+        angles = []
+        for cmd, other in zip(self._commands, commands):
+            if (type(cmd.gate) != type(other.gate) or
+                    ids(cmd.qubits) != ids(other.qubits) or
+                    ids([cmd.control_qubits]) !=
+                    ids([other.control_qubits])):
+                self._raise_structure_changes()
+            if isinstance(cmd.gate, (BasicRotationGate, BasicPhaseGate)):
+                changed = cmd.gate.angle != other.gate.angle
+                angles.append(other.gate.angle if changed else None)
+            elif cmd.gate != other.gate:
+                raise ValueError("ParametrizedCircuit: Only angles of "
+                                 "rotation and phase gates may depend on the "
+                                 "parameters.")
+            else:
+                angles.append(None)
+        return angles
+
+    @staticmethod
+    def _raise_structure_changes():
+        raise ValueError("ParametrizedCircuit: The structure of the compiled "
+                         "circuit depends on the parameters.")
+
+    @staticmethod
+    def _raise_not_affine(cmd):
+        raise ValueError("ParametrizedCircuit: The angle of {} is not an "
+                         "affine function of the parameters.".format(cmd))
+
+    @staticmethod
+    def _period(gate):
+        if isinstance(gate, BasicRotationGate):
+            return 4. * math.pi
+        return 2. * math.pi
+
+    @staticmethod
+    def _wrap(angle, period):
+        """ Map angle to the interval [-period / 2, period / 2). """
+        return (angle + .5 * period) % period - .5 * period
+
+    def _commands_for(self, parameters):
+        """ Return the command sequence for the given parameters. """
+        parameters = numpy.asarray(parameters, dtype=float)
+        if parameters.shape != (self._num_parameters,):
+            raise ValueError("ParametrizedCircuit: Expected {} parameters, got "
+                             "{}.".format(self._num_parameters,
+                                          parameters.shape))
+        commands = list(self._commands)
+        for (i, angle, coefficients) in self._parametrized:
+            cmd = copy.copy(commands[i])
+            cmd.gate = type(cmd.gate)(angle + numpy.dot(coefficients,
+                                                        parameters -
+                                                        self._base))
+            commands[i] = cmd
+        return commands
+
+    def simulate(self, parameters, **kwargs):
+        """
+        Simulate the circuit for one parameter set.
+
+        Args:
+            parameters (list<float>): Values of the parameters.
+            kwargs: Arguments for the Simulator (e.g., gate_fusion or
+                precision).
+
+        Returns:
+            Tuple (simulator, ids) of the Simulator which holds the final
+            state (see, e.g., Simulator.cheat) and the ids of the qubits of
+            qureg in that simulator. The simulator is not part of an engine;
+            its queries accept the qubits [WeakQubitRef(None, i) for i in
+            ids].
+        """
+        sim = Simulator(**kwargs)
+        sim.apply_commands(self._commands_for(parameters))
+        return sim, list(self._qubit_ids)
+
+    def expectation_values(self, qubit_operator, parameter_sets, **kwargs):
+        """
+        Compute the expectation value of a qubit operator for many parameter
+        sets.
+
+        Args:
+            qubit_operator (QubitOperator): Operator acting on the qubits of
+                qureg (i.e., term index i refers to qureg[i]).
+            parameter_sets (list<list<float>>): Parameter values.
+            kwargs: Arguments for the Simulator (e.g., gate_fusion or
+                precision).
+
+        Returns:
+            numpy.ndarray with one expectation value per parameter set.
+        """
+        for term in qubit_operator.terms:
+            if not all(index < self._num_qubits for index, _ in term):
+                raise ValueError("ParametrizedCircuit: The qubit operator "
+                                 "acts on more than {} qubits."
+                                 .format(self._num_qubits))
+        results = []
+        for parameters in parameter_sets:
+            sim, ids = self.simulate(parameters, **kwargs)
+            qureg = [WeakQubitRef(None, qubit_id) for qubit_id in ids]
+            results.append(sim.get_expectation_value(qubit_operator, qureg))
+        return numpy.array(results)
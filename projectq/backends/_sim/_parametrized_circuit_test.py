@@ -0,0 +1,146 @@
+#   Copyright 2017 ProjectQ-Framework (www.projectq.ch)
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""
+Tests for projectq.backends._sim._parametrized_circuit.py
+"""
+
+import math
+
+import numpy
+import pytest
+
+from projectq import MainEngine
+from projectq.backends import Simulator
+from projectq.cengines import DummyEngine
+from projectq.meta import Control
+from projectq.ops import (All, CNOT, H, Measure, QubitOperator, Rx, Ry, Rz,
+                          Ph, R, X)
+from projectq.setups import restrictedgateset
+
+from projectq.backends._sim import _parametrized_circuit
+from projectq.backends._sim._parametrized_circuit import ParametrizedCircuit
+
+
+def ansatz(eng, qureg, theta):
+    X | qureg[0]
+    Rx(theta[0]) | qureg[1]
+    Ry(2. * theta[1] - 0.3) | qureg[2]
+    CNOT | (qureg[1], qureg[0])
+    with Control(eng, qureg[0]):
+        Rz(theta[0] + theta[2]) | qureg[2]
+        R(-theta[1]) | qureg[1]
+    H | qureg[1]
+    Ph(theta[2]) | qureg[0]
+
+
+def restricted_engine_list():
+    return restrictedgateset.get_engine_list(one_qubit_gates=(Rz, Ry, H),
+                                             two_qubit_gates=(CNOT,))
+
+
+def reference(circuit, op, theta, engine_list=None):
+    if engine_list is None:
+        eng = MainEngine(Simulator())
+    else:
+        eng = MainEngine(Simulator(), engine_list=engine_list)
+    qureg = eng.allocate_qureg(3)
+    circuit(eng, qureg, theta)
+    eng.flush()
+    value = eng.backend.get_expectation_value(op, qureg)
+    All(Measure) | qureg
+    return value
+
+
+@pytest.mark.parametrize("engine_list", [None, restricted_engine_list])
+def test_parametrized_circuit_expectation_values(engine_list):
+    op = (QubitOperator('Z0 Z1', 0.5) + QubitOperator('X1 Y2', -1.2) +
+          QubitOperator('Z2') + QubitOperator('', 0.1))
+    circuit = ParametrizedCircuit(ansatz, 3, 3, engine_list=engine_list)
+    assert circuit.num_parameters == 3
+    parameter_sets = [[0., 0., 0.], [0.1, 0.2, 0.3], [2.5, -1.7, 7.1],
+                      [4. * math.pi, 1., -5.]]
+    values = circuit.expectation_values(op, parameter_sets)
+    assert values.shape == (len(parameter_sets),)
+    for theta, value in zip(parameter_sets, values):
+        ref_list = None if engine_list is None else engine_list()
+        assert value == pytest.approx(reference(ansatz, op, theta, ref_list))
+    fused = circuit.expectation_values(op, parameter_sets,
+                                       gate_fusion=True)
+    assert numpy.allclose(fused, values)
+
+
+def test_parametrized_circuit_simulate():
+    circuit = ParametrizedCircuit(ansatz, 3, 3)
+    theta = [0.4, -0.6, 1.3]
+    sim, ids = circuit.simulate(theta)
+    eng = MainEngine(Simulator())
+    qureg = eng.allocate_qureg(3)
+    ansatz(eng, qureg, theta)
+    eng.flush()
+    assert len(ids) == 3
+    state = numpy.array(sim.cheat()[1])
+    expected = numpy.array(eng.backend.cheat()[1])
+    assert numpy.allclose(state, expected)
+    All(Measure) | qureg
+    with pytest.raises(ValueError):
+        circuit.simulate([0.4, -0.6])
+
+
+def test_parametrized_circuit_invalid_operator():
+    circuit = ParametrizedCircuit(ansatz, 3, 3)
+    with pytest.raises(ValueError):
+        circuit.expectation_values(QubitOperator('Z3'), [[0., 0., 0.]])
+
+
+def test_parametrized_circuit_not_affine():
+    def circuit(eng, qureg, theta):
+        Rx(theta[0] ** 2) | qureg[0]
+
+    with pytest.raises(ValueError):
+        ParametrizedCircuit(circuit, 1, 1)
+
+
+def test_parametrized_circuit_structure_changes():
+    def circuit(eng, qureg, theta):
+        if theta[0] > 0.5:
+            X | qureg[0]
+        Rx(theta[0]) | qureg[0]
+
+    with pytest.raises(ValueError):
+        ParametrizedCircuit(circuit, 1, 1, delta=1.)
+
+    def circuit(eng, qureg, theta):
+        qb = qureg[0] if theta[0] > 0.5 else qureg[1]
+        Rx(theta[0]) | qb
+
+    with pytest.raises(ValueError):
+        ParametrizedCircuit(circuit, 2, 1, delta=1.)
+
+
+def test_parametrized_circuit_measurement():
+    def circuit(eng, qureg, theta):
+        Rx(theta[0]) | qureg[0]
+        Measure | qureg[0]
+
+    with pytest.raises(ValueError):
+        ParametrizedCircuit(circuit, 1, 1)
+
+
+def test_parametrized_circuit_recorder_is_available():
+    recorder = _parametrized_circuit._CommandRecorder()
+    eng = MainEngine(backend=recorder, engine_list=[DummyEngine()])
+    qubit = eng.allocate_qubit()
+    assert recorder.is_available(Rx(0.2).generate_command(qubit))
+    eng.flush()
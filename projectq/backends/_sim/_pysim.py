@@ -18,14 +18,19 @@ Contains a (slow) Python simulator.
 Please compile the c++ simulator for large-scale simulations.
 """
 
+import json
 import random
 import numpy as _np
 import os
+from scipy.special import jv as _jv
 
 _USE_REFCHECK = True
 if 'TRAVIS' in os.environ:
     _USE_REFCHECK = False
 
+# amplitude dtype for each supported simulator precision
+_DTYPES = {'double': _np.complex128, 'single': _np.complex64}
+
 
 class Simulator(object):
     """
@@ -35,7 +40,10 @@ class Simulator(object):
     not an option (for some reason). It has the same features but is much
     slower, so please consider building the c++ version for larger experiments.
     """
-    def __init__(self, rnd_seed, *args, **kwargs):
+    # gates recorded since start_recording (see _record)
+    _recording = None
+
+    def __init__(self, rnd_seed, *args, precision='double', **kwargs):
         """
         Initialize the simulator.
 
@@ -43,14 +51,32 @@ class Simulator(object):
             rnd_seed (int): Seed to initialize the random number generator.
             args: Dummy argument to allow an interface identical to the c++
                 simulator.
+            precision (str): Either 'double' (complex128 amplitudes) or
+                'single' (complex64 amplitudes).
             kwargs: Same as args.
         """
         random.seed(rnd_seed)
-        self._state = _np.ones(1, dtype=_np.complex128)
+        self._dtype = _DTYPES[precision]
+        self._state = _np.ones(1, dtype=self._dtype)
         self._map = dict()
         self._num_qubits = 0
+        self._time_evolution_method = 'taylor'
+        self._krylov_dim = 16
+        self._hamiltonian = None
         print("(Note: This is the (slow) Python simulator.)")
 
+    def kernel_info(self):
+        """
+        Return a dict describing the kernels which apply the gates (see
+        Simulator.kernel_info).
+        """
+        return {'backend': 'python',
+                'kernels': 'numpy',
+                'supported_kernels': ['numpy'],
+                'precision': ('single' if self._dtype == _np.complex64 else
+                              'double'),
+                'threads': 1}
+
     def cheat(self):
         """
         Return the qubit index to bit location map and the corresponding state
@@ -66,6 +92,13 @@ class Simulator(object):
         """
         return (self._map, self._state)
 
+    def state_view(self):
+        """
+        Return the qubit index to bit location map and the state vector
+        without copying it (the same as cheat, which does not copy either).
+        """
+        return self.cheat()
+
     def measure_qubits(self, ids):
         """
         Measure the qubits with IDs ids and return a list of measurement
@@ -78,34 +111,50 @@ class Simulator(object):
             List of measurement results (containing either True or False).
         """
         P = random.random()
-        val = 0.
-        i_picked = 0
-        while val < P and i_picked < len(self._state):
-            val += _np.abs(self._state[i_picked]) ** 2
-            i_picked += 1
-
-        i_picked -= 1
+        cumulative = _np.cumsum(_np.abs(self._state) ** 2)
+        i_picked = min(int(_np.searchsorted(cumulative, P)),
+                       len(self._state) - 1)
 
         pos = [self._map[ID] for ID in ids]
-        res = [False] * len(pos)
-
-        mask = 0
-        val = 0
-        for i in range(len(pos)):
-            res[i] = (((i_picked >> pos[i]) & 1) == 1)
-            mask |= (1 << pos[i])
-            val |= ((res[i] & 1) << pos[i])
-
-        nrm = 0.
-        for i in range(len(self._state)):
-            if (mask & i) != val:
-                self._state[i] = 0.
-            else:
-                nrm += _np.abs(self._state[i]) ** 2
+        res = [((i_picked >> p) & 1) == 1 for p in pos]
 
-        self._state *= 1. / _np.sqrt(nrm)
+        fixed = dict(zip(pos, res))
+        subspace = self._view(self._state, fixed)
+        nrm = _np.vdot(subspace, subspace).real
+        self._zero_complement(fixed)
+        subspace *= 1. / _np.sqrt(nrm)
         return res
 
+    def sample_qubits(self, ids, shots, seed=None):
+        """
+        Sample measurement outcomes of the qubits with IDs ids without
+        collapsing the wavefunction.
+
+        Args:
+            ids (list<int>): List of qubit IDs to sample.
+            shots (int): Number of samples to draw.
+            seed (int): Seed for the random numbers (if None, the random
+                number generator of the simulator is used).
+
+        Returns:
+            Array of `shots` integers, where bit i of each entry is the
+            outcome of the qubit with ID ids[i].
+        """
+        if not all([ID in self._map for ID in ids]):
+            raise RuntimeError("sample(): Unknown qubit id. Please make sure "
+                               "you have called eng.flush().")
+        if seed is None:
+            seed = random.getrandbits(32)
+        rng = _np.random.RandomState(seed)
+        cumulative = _np.cumsum(_np.abs(self._state) ** 2)
+        rnd = rng.random_sample(shots) * cumulative[-1]
+        picked = _np.minimum(_np.searchsorted(cumulative, rnd),
+                             len(self._state) - 1)
+        outcomes = _np.zeros(shots, dtype=_np.int64)
+        for i, ID in enumerate(ids):
+            outcomes |= ((picked >> self._map[ID]) & 1) << i
+        return outcomes
+
     def allocate_qubit(self, ID):
         """
         Allocate a qubit.
@@ -117,35 +166,33 @@ class Simulator(object):
         self._num_qubits += 1
         self._state.resize(1 << self._num_qubits, refcheck=_USE_REFCHECK)
 
-    def get_classical_value(self, ID, tol=1.e-10):
+    def get_classical_value(self, ID, tol=None):
         """
         Return the classical value of a classical bit (i.e., a qubit which has
         been measured / uncomputed).
 
         Args:
             ID (int): ID of the qubit of which to get the classical value.
-            tol (float): Tolerance for numerical errors when determining
-                whether the qubit is indeed classical.
+            tol (float): Tolerance for numerical errors (on the squared
+                magnitude of the amplitudes) when determining whether the
+                qubit is indeed classical. Defaults to 1e-12 in double and
+                1e-8 in single precision.
 
         Raises:
             RuntimeError: If the qubit is in a superposition, i.e., has not
                 been measured / uncomputed.
         """
+        if tol is None:
+            tol = 1.e-8 if self._dtype == _np.complex64 else 1.e-12
         pos = self._map[ID]
-        up = down = False
-
-        for i in range(0, len(self._state), (1 << (pos + 1))):
-            for j in range(0, (1 << pos)):
-                if _np.abs(self._state[i + j]) > tol:
-                    up = True
-                if _np.abs(self._state[i + j + (1 << pos)]) > tol:
-                    down = True
-                if up and down:
-                    raise RuntimeError("Qubit has not been measured / "
-                                       "uncomputed. Cannot access its "
-                                       "classical value and/or deallocate a "
-                                       "qubit in superposition!")
-        return down
+        up = _np.any(_np.abs(self._view(self._state, {pos: 0})) ** 2 > tol)
+        down = _np.any(_np.abs(self._view(self._state, {pos: 1})) ** 2 > tol)
+        if up and down:
+            raise RuntimeError("Qubit has not been measured / "
+                               "uncomputed. Cannot access its "
+                               "classical value and/or deallocate a "
+                               "qubit in superposition!")
+        return bool(down)
 
     def deallocate_qubit(self, ID):
         """
@@ -162,13 +209,7 @@ class Simulator(object):
 
         cv = self.get_classical_value(ID)
 
-        newstate = _np.zeros((1 << (self._num_qubits - 1)),
-                             dtype=_np.complex128)
-        k = 0
-        for i in range((1 << pos) * int(cv), len(self._state),
-                       (1 << (pos + 1))):
-            newstate[k:k + (1 << pos)] = self._state[i:i + (1 << pos)]
-            k += (1 << pos)
+        newstate = self._view(self._state, {pos: cv}).flatten()
 
         newmap = dict()
         for key, value in self._map.items():
@@ -193,6 +234,44 @@ class Simulator(object):
             mask |= (1 << ctrlpos)
         return mask
 
+    def _view(self, state, fixed):
+        """
+        Return a view of the state vector `state` (interpreted as a tensor
+        with one axis per qubit) where the qubits at the bit-locations in
+        `fixed` are restricted to the given values.
+
+        Args:
+            state (numpy.ndarray): State vector of 2^n entries.
+            fixed (dict): Dictionary mapping bit-locations to values (0/1).
+
+        Returns:
+            A view (no copy) of the corresponding entries of `state`, with one
+            axis per remaining qubit (ordered from the highest to the lowest
+            bit-location).
+        """
+        index = [slice(None)] * self._num_qubits
+        for pos, value in fixed.items():
+            index[self._num_qubits - 1 - pos] = int(value)
+        # the trailing Ellipsis ensures that a view is returned even if all
+        # qubits are fixed
+        return state.reshape([2] * self._num_qubits)[tuple(index) + (...,)]
+
+    def _controlled_view(self, state, mask):
+        """
+        Return a view of the entries of `state` where all control qubits given
+        by `mask` are 1 (see _view).
+        """
+        return self._view(state, {pos: 1 for pos in range(self._num_qubits)
+                                  if (mask >> pos) & 1})
+
+    def _zero_complement(self, fixed):
+        """
+        Set all amplitudes to zero which do not agree with the qubit values
+        in `fixed` (dictionary mapping bit-locations to values).
+        """
+        for pos, value in fixed.items():
+            self._view(self._state, {pos: 1 - int(value)})[...] = 0.
+
     def emulate_math(self, f, qubit_ids, ctrlqubit_ids):
         """
         Emulate a math function (e.g., BasicMathGate).
@@ -204,7 +283,6 @@ class Simulator(object):
                 quantum registers, which corresponds to this 'list of lists'.
             ctrlqubit_ids (list<int>): List of control qubit ids.
         """
-        mask = self._get_control_mask(ctrlqubit_ids)
         # determine qubit locations from their IDs
         qb_locs = []
         for qureg in qubit_ids:
@@ -212,26 +290,67 @@ class Simulator(object):
             for qubit_id in qureg:
                 qb_locs[-1].append(self._map[qubit_id])
 
-        newstate = _np.zeros_like(self._state)
-        for i in range(0, len(self._state)):
-            if (mask & i) == mask:
-                arg_list = [0] * len(qb_locs)
-                for qr_i in range(len(qb_locs)):
-                    for qb_i in range(len(qb_locs[qr_i])):
-                        arg_list[qr_i] |= (((i >> qb_locs[qr_i][qb_i]) & 1) <<
-                                           qb_i)
-
-                res = f(arg_list)
-                new_i = i
-                for qr_i in range(len(qb_locs)):
-                    for qb_i in range(len(qb_locs[qr_i])):
-                        if not (((new_i >> qb_locs[qr_i][qb_i]) & 1) ==
-                                ((res[qr_i] >> qb_i) & 1)):
-                            new_i ^= (1 << qb_locs[qr_i][qb_i])
-                newstate[new_i] = self._state[i]
-            else:
-                newstate[i] = self._state[i]
+        # the math function only needs to be evaluated once per value of the
+        # registers (and not once per amplitude): tabulate the action of f on
+        # the involved qubits and apply it to all indices at once
+        locs = [loc for qureg in qb_locs for loc in qureg]
+        table = _np.empty(1 << len(locs), dtype=_np.int64)
+        for value in range(len(table)):
+            arg_list = []
+            offset = 0
+            for qureg in qb_locs:
+                arg_list.append((value >> offset) & ((1 << len(qureg)) - 1))
+                offset += len(qureg)
+            res = f(arg_list)
+            new_value = 0
+            offset = 0
+            for qr_i, qureg in enumerate(qb_locs):
+                new_value |= ((res[qr_i] & ((1 << len(qureg)) - 1)) <<
+                              offset)
+                offset += len(qureg)
+            table[value] = new_value
+
+        self.emulate_math_table(table, qubit_ids, ctrlqubit_ids)
+
+    def emulate_math_table(self, table, qubit_ids, ctrlqubit_ids):
+        """
+        Emulate a math function given by its table of values.
+
+        Args:
+            table (numpy.ndarray): Integer array of 2^k entries for k qubits
+                in qubit_ids, mapping the value of the (concatenated)
+                registers to the new value (the first qubit of the first
+                register being the least significant bit).
+            qubit_ids (list<list<int>>): List of lists of qubit IDs to which
+                the gate is being applied.
+            ctrlqubit_ids (list<int>): List of control qubit ids.
+        """
+        mask = self._get_control_mask(ctrlqubit_ids)
+        locs = [self._map[qubit_id] for qureg in qubit_ids
+                for qubit_id in qureg]
+        table = _np.asarray(table, dtype=_np.int64)
+        if len(table) != 1 << len(locs):
+            raise ValueError("emulate_math_table(): The table must have 2^n "
+                             "entries for n qubits.")
+        indices = _np.arange(len(self._state), dtype=_np.int64)
+        values = _np.zeros_like(indices)
+        locs_mask = 0
+        for bit, loc in enumerate(locs):
+            values |= ((indices >> loc) & 1) << bit
+            locs_mask |= 1 << loc
+        values = table[values]
+        new_indices = indices & ~locs_mask
+        for bit, loc in enumerate(locs):
+            new_indices |= ((values >> bit) & 1) << loc
+        new_indices = _np.where((indices & mask) == mask, new_indices, indices)
 
+        newstate = _np.zeros_like(self._state)
+        if len(_np.unique(table)) == len(table):
+            newstate[new_indices] = self._state
+        else:
+            # (the amplitudes of states which are mapped to the same state
+            # add up)
+            _np.add.at(newstate, new_indices, self._state)
         self._state = newstate
 
     def get_expectation_value(self, terms_dict, ids):
@@ -245,13 +364,34 @@ class Simulator(object):
         Returns:
             Expectation value
         """
-        expectation = 0.
-        current_state = _np.copy(self._state)
+        # A Pauli string maps |i> to i^#Y (-1)^|i & phase| |i ^ flip>, so
+        # all terms with the same flip mask share the products
+        # conj(psi[i ^ flip]) * psi[i]
+        groups = dict()
         for (term, coefficient) in terms_dict:
-            self._apply_term(term, ids)
-            delta = coefficient * _np.vdot(current_state, self._state).real
-            expectation += delta
-            self._state = _np.copy(current_state)
+            flip = 0
+            phase_locs = []
+            num_y = 0
+            for (index, pauli) in term:
+                loc = self._map[ids[index]]
+                if pauli != 'Z':
+                    flip ^= 1 << loc
+                if pauli != 'X':
+                    phase_locs.append(loc)
+                num_y += pauli == 'Y'
+            groups.setdefault(flip, []).append((phase_locs, num_y,
+                                                coefficient))
+
+        indices = _np.arange(len(self._state), dtype=_np.int64)
+        expectation = 0.
+        for flip, terms in groups.items():
+            products = _np.conj(self._state[indices ^ flip]) * self._state
+            for (phase_locs, num_y, coefficient) in terms:
+                parity = _np.zeros_like(indices)
+                for loc in phase_locs:
+                    parity ^= (indices >> loc) & 1
+                value = 1j ** num_y * _np.dot(1 - 2 * parity, products)
+                expectation += coefficient * value.real
         return expectation
 
     def apply_qubit_operator(self, terms_dict, ids):
@@ -291,17 +431,46 @@ class Simulator(object):
                 raise RuntimeError("get_probability(): Unknown qubit id. "
                                    "Please make sure you have called "
                                    "eng.flush().")
-        mask = 0
-        bit_str = 0
+        subspace = self._view(self._state, {self._map[ids[i]]: bit_string[i]
+                                            for i in range(len(ids))})
+        return _np.vdot(subspace, subspace).real
+
+    def get_probabilities(self, ids):
+        """
+        Return the probabilities of all outcomes of measuring the qubits
+        given by the list of ids.
+
+        Args:
+            ids (list[int]): List of qubit ids determining the ordering.
+
+        Returns:
+            Array of the 2^len(ids) probabilities, where bit i of the index of
+            an outcome is the value of the qubit ids[i].
+
+        Raises:
+            RuntimeError if an unknown qubit id was provided.
+        """
         for i in range(len(ids)):
-            mask |= (1 << self._map[ids[i]])
-            bit_str |= (bit_string[i] << self._map[ids[i]])
-        probability = 0.
-        for i in range(len(self._state)):
-            if (i & mask) == bit_str:
-                e = self._state[i]
-                probability += e.real**2 + e.imag**2
-        return probability
+            if ids[i] not in self._map:
+                raise RuntimeError("get_probabilities(): Unknown qubit id. "
+                                   "Please make sure you have called "
+                                   "eng.flush().")
+        if len(set(ids)) != len(ids):
+            raise ValueError("get_probabilities(): Qubit IDs should be "
+                             "unique.")
+        num_qubits = len(self._map)
+        # axis k of the tensor is bit-location num_qubits - 1 - k
+        tensor = _np.abs(self._state) ** 2
+        tensor = tensor.reshape([2] * num_qubits)
+        axes = [num_qubits - 1 - self._map[i] for i in ids]
+        marginal = tensor.sum(axis=tuple(k for k in range(num_qubits)
+                                         if k not in axes))
+        # the remaining axes are in increasing order: move the one of ids[0]
+        # to the end (lowest bit)
+        remaining = sorted(axes)
+        marginal = _np.transpose(marginal, [remaining.index(k)
+                                            for k in reversed(axes)])
+        return _np.reshape(marginal, -1)
 
     def get_amplitude(self, bit_string, ids):
         """
@@ -330,15 +499,72 @@ class Simulator(object):
             index |= (bit_string[i] << self._map[ids[i]])
         return self._state[index]
 
+    def get_amplitudes(self, indices, ids):
+        """
+        Return the probability amplitudes of several computational basis
+        states. The ordering is given by the list of qubit ids.
+
+        Args:
+            indices (list[int]|numpy.ndarray): Computational basis states,
+                where bit i of an index is the value of the qubit ids[i].
+            ids (list[int]): List of qubit ids determining the
+                ordering. Must contain all allocated qubits.
+
+        Returns:
+            Array of the probability amplitudes of the basis states.
+
+        Raises:
+            RuntimeError if the second argument is not a permutation of all
+            allocated qubits.
+        """
+        if not set(ids) == set(self._map):
+            raise RuntimeError("The second argument to get_amplitudes() must"
+                               " be a permutation of all allocated qubits. "
+                               "Please make sure you have called "
+                               "eng.flush().")
+        indices = _np.asarray(indices, dtype=_np.int64).reshape(-1)
+        if _np.any(indices >> len(ids)):
+            raise ValueError("get_amplitudes(): The bit-strings must have "
+                             "one bit per qubit.")
+        index = _np.zeros(len(indices), dtype=_np.int64)
+        for i in range(len(ids)):
+            index |= ((indices >> i) & 1) << self._map[ids[i]]
+        return self._state[index]
+
+    def set_time_evolution_method(self, method, krylov_dim=16):
+        """
+        Select the propagator used by emulate_time_evolution.
+
+        Args:
+            method (str): 'taylor' (default), 'krylov' (Lanczos with
+                adaptive time steps) or 'chebyshev' (expansion in Chebyshev
+                polynomials).
+            krylov_dim (int): Dimension of the Krylov spaces (only used by
+                method='krylov').
+
+        Raises:
+            ValueError if the method is unknown or krylov_dim < 1.
+        """
+        if method not in ('taylor', 'krylov', 'chebyshev'):
+            raise ValueError("set_time_evolution_method(): Unknown method "
+                             "{!r}.".format(method))
+        if krylov_dim < 1:
+            raise ValueError("set_time_evolution_method(): krylov_dim must "
+                             "be positive.")
+        self._time_evolution_method = method
+        self._krylov_dim = krylov_dim
+
     def emulate_time_evolution(self, terms_dict, time, ids, ctrlids):
         """
         Applies exp(-i*time*H) to the wave function, i.e., evolves under
         the Hamiltonian H for a given time. The terms in the Hamiltonian
         are not required to commute.
 
-        This function computes the action of the matrix exponential using
-        ideas from Al-Mohy and Higham, 2011.
-        TODO: Implement better estimates for s.
+        The Hamiltonian is compiled into bit masks (see
+        get_expectation_value), which is skipped if the same Hamiltonian is
+        evolved under repeatedly. The action of the matrix exponential is
+        computed using the propagator selected by
+        set_time_evolution_method.
 
         Args:
             terms_dict (dict): Operator dictionary (see QubitOperator.terms)
@@ -347,39 +573,183 @@ class Simulator(object):
             ids (list): A list of qubit IDs to which to apply the evolution.
             ctrlids (list): A list of control qubit IDs.
         """
-        # Determine the (normalized) trace, which is nonzero only for identity
-        # terms:
-        tr = sum([c for (t, c) in terms_dict if len(t) == 0])
-        terms_dict = [(t, c) for (t, c) in terms_dict if len(t) > 0]
-        op_nrm = abs(time) * sum([abs(c) for (_, c) in terms_dict])
-        # rescale the operator by s:
-        s = int(op_nrm + 1.)
-        correction = _np.exp(-1j * time * tr / float(s))
-        output_state = _np.copy(self._state)
+        operator, tr, op_nrm = self._compile_hamiltonian(terms_dict, ids)
         mask = self._get_control_mask(ctrlids)
+        # the Hamiltonian does not change the control qubits, so it can be
+        # applied to the whole state with the other entries set to zero
+        vector = _np.zeros_like(self._state)
+        self._controlled_view(vector, mask)[...] = (
+            self._controlled_view(self._state, mask))
+        if op_nrm > 0. and time != 0.:
+            if self._time_evolution_method == 'krylov':
+                vector = self._evolve_krylov(operator, op_nrm, time, vector)
+            elif self._time_evolution_method == 'chebyshev':
+                vector = self._evolve_chebyshev(operator, op_nrm, time,
+                                                vector)
+            else:
+                vector = self._evolve_taylor(operator, op_nrm, time, vector)
+        self._controlled_view(self._state, mask)[...] = (
+            _np.exp(-1j * time * tr) * self._controlled_view(vector, mask))
+
+    def _compile_hamiltonian(self, terms_dict, ids):
+        """
+        Return the Hamiltonian as a list of pairs (indices, weights) such
+        that H v = sum(weights * v[indices]) (with indices None for the
+        diagonal), the sum of the identity terms and the sum of the absolute
+        values of the other coefficients. The last Hamiltonian is cached.
+        """
+        positions = tuple(self._map[qb_id] for qb_id in ids)
+        key = (tuple((tuple(t), c) for (t, c) in terms_dict), positions,
+               len(self._state))
+        if self._hamiltonian is not None and self._hamiltonian[0] == key:
+            return self._hamiltonian[1:]
+
+        tr = 0.
+        op_nrm = 0.
+        indices = _np.arange(len(self._state), dtype=_np.int64)
+        groups = dict()
+        for (term, coefficient) in terms_dict:
+            if len(term) == 0:
+                tr += coefficient
+                continue
+            op_nrm += abs(coefficient)
+            flip = 0
+            parity = _np.zeros_like(indices)
+            num_y = 0
+            for (index, pauli) in term:
+                loc = positions[index]
+                if pauli != 'Z':
+                    flip ^= 1 << loc
+                num_y += pauli == 'Y'
+            # P maps |i> to i^#Y (-1)^|i & phase| |i ^ flip>, i.e., the
+            # weight of the entry i ^ flip in (P v)[i]
+            for (index, pauli) in term:
+                if pauli != 'X':
+                    parity ^= ((indices ^ flip) >> positions[index]) & 1
+            weights = groups.setdefault(flip, _np.zeros(len(indices),
+                                                        dtype=complex))
+            weights += coefficient * 1j ** num_y * (1 - 2 * parity)
+        operator = [(None if flip == 0 else indices ^ flip,
+                     weights.astype(self._dtype))
+                    for (flip, weights) in groups.items()]
+        self._hamiltonian = (key, operator, tr, op_nrm)
+        return operator, tr, op_nrm
+
+    @staticmethod
+    def _apply_hamiltonian(operator, vector):
+        result = _np.zeros_like(vector)
+        for (indices, weights) in operator:
+            result += weights * (vector if indices is None else
+                                 vector[indices])
+        return result
+
+    def _time_evolution_tolerance(self):
+        return 1.e-6 if self._dtype == _np.complex64 else 1.e-12
+
+    def _evolve_taylor(self, operator, op_nrm, time, vector):
+        """
+        Truncated Taylor series in s steps with |time| * op_nrm / s <= 1
+        (Al-Mohy and Higham, 2011).
+        """
+        s = int(abs(time) * op_nrm + 1.)
         for i in range(s):
+            update = vector
             j = 0
             nrm_change = 1.
             while nrm_change > 1.e-12:
                 coeff = (-time * 1j) / float(s * (j + 1))
-                current_state = _np.copy(self._state)
-                update = 0j
-                for t, c in terms_dict:
-                    self._apply_term(t, ids)
-                    self._state *= c
-                    update += self._state
-                    self._state = _np.copy(current_state)
-                update *= coeff
-                self._state = update
-                for i in range(len(update)):
-                    if (i & mask) == mask:
-                        output_state[i] += update[i]
+                update = coeff * self._apply_hamiltonian(operator, update)
+                vector = vector + update
                 nrm_change = _np.linalg.norm(update)
                 j += 1
-            for i in range(len(update)):
-                if (i & mask) == mask:
-                    output_state[i] *= correction
-            self._state = _np.copy(output_state)
+        return vector
+
+    def _evolve_chebyshev(self, operator, op_nrm, time, vector):
+        """
+        exp(-i time H) = J_0(x) + 2 sum_k (-i)^k J_k(x) T_k(H / op_nrm) with
+        x = time * op_nrm and the Chebyshev polynomials T_k.
+        """
+        x = time * op_nrm
+        num_terms = int(abs(x) + 10. * abs(x) ** (1. / 3.) + 21.)
+        bessel = _jv(_np.arange(num_terms), x)
+        tol = 1.e-2 * self._time_evolution_tolerance()
+        while num_terms > 1 and abs(bessel[num_terms - 1]) < tol:
+            num_terms -= 1
+        previous = vector
+        result = bessel[0] * vector
+        current = self._apply_hamiltonian(operator, vector) / op_nrm
+        for k in range(1, num_terms):
+            if k > 1:
+                previous, current = current, (
+                    2. / op_nrm * self._apply_hamiltonian(operator, current)
+                    - previous)
+            result += 2. * (-1j) ** k * bessel[k] * current
+        return result.astype(self._dtype)
+
+    def _evolve_krylov(self, operator, op_nrm, time, vector):
+        """
+        Lanczos propagator: exp(-i tau H) v is approximated by
+        beta V exp(-i tau T) e_0, where the columns of V are an orthonormal
+        basis of the Krylov space span{v, Hv, ..., H^(m-1) v} and
+        T = V^+ H V is tridiagonal. The time step tau is chosen such that the
+        estimated error beta * T_(m,m-1) * |[exp(-i tau T) e_0]_(m-1)| is at
+        most beta * tolerance * tau / |time|, and adapted from step to step.
+        """
+        m = self._krylov_dim
+        tol = self._time_evolution_tolerance()
+        beta = _np.linalg.norm(vector)
+        if beta == 0.:
+            return vector
+        v = vector / beta
+        total = abs(time)
+        sign = 1. if time > 0 else -1.
+        done = 0.
+        tau = total
+        last = False
+        while not last:
+            basis = [v]
+            alpha = []
+            offdiag = []
+            breakdown = False
+            for j in range(m):
+                w = self._apply_hamiltonian(operator, basis[j])
+                a = _np.vdot(basis[j], w).real
+                w = w - a * basis[j]
+                if j > 0:
+                    w -= offdiag[j - 1] * basis[j - 1]
+                alpha.append(a)
+                b = _np.linalg.norm(w)
+                if b <= tol * op_nrm:
+                    # the Krylov space is invariant under H, i.e., exact
+                    breakdown = True
+                    break
+                offdiag.append(b)
+                basis.append(w / b)
+            dim = len(alpha)
+            eigenvalues, eigenvectors = _np.linalg.eigh(
+                _np.diag(alpha) + _np.diag(offdiag[:dim - 1], 1) +
+                _np.diag(offdiag[:dim - 1], -1))
+            remaining = total - done
+            tau = min(tau, remaining)
+            exponent = 1. / max(dim - 1, 1)
+            for attempt in range(50):
+                y = _np.dot(eigenvectors, _np.exp(-1j * sign * tau *
+                                                  eigenvalues) *
+                            eigenvectors[0])
+                err = 0. if breakdown else beta * offdiag[dim - 1] * abs(
+                    y[dim - 1])
+                # (the error estimate is subject to round-off errors)
+                allowed = beta * max(tol * tau / total,
+                                     10. * _np.finfo(float).eps)
+                if err <= allowed:
+                    break
+                tau *= max(0.1, 0.9 * (allowed / err) ** exponent)
+            last = tau == remaining
+            done += tau
+            v = sum(y[j] * basis[j] for j in range(dim))
+            # try a larger step next time if the error was small
+            tau *= min(5., 0.9 * (allowed / err) ** exponent) if err else 5.
+        return (beta * v).astype(self._dtype)
 
     def apply_controlled_gate(self, m, ids, ctrlids):
         """
@@ -394,6 +764,7 @@ class Simulator(object):
             ctrlids (list): A list of control qubit IDs (i.e., the gate is
                 only applied where these qubits are 1).
         """
+        self._record('apply_controlled_gate', (m,), ids, ctrlids)
         mask = self._get_control_mask(ctrlids)
         if len(m) == 2:
             pos = self._map[ids[0]]
@@ -402,6 +773,98 @@ class Simulator(object):
             pos = [self._map[ID] for ID in ids]
             self._multi_qubit_gate(m, pos, mask)
 
+    def apply_diagonal_gate(self, diag, ids, ctrlids):
+        """
+        Applies the k-qubit diagonal gate with diagonal diag to the qubits
+        with indices ids, using ctrlids as control qubits.
+
+        Args:
+            diag (list[complex]): The 2^k diagonal entries of the gate matrix.
+            ids (list): A list containing the qubit IDs to which to apply the
+                gate.
+            ctrlids (list): A list of control qubit IDs (i.e., the gate is
+                only applied where these qubits are 1).
+        """
+        self._record('apply_diagonal_gate', (diag,), ids, ctrlids)
+        mask = self._get_control_mask(ctrlids)
+        targets = self._target_view([self._map[ID] for ID in ids], mask)
+        k = len(ids)
+        targets *= _np.asarray(diag, dtype=self._dtype).reshape(
+            [2] * k + [1] * (targets.ndim - k))
+
+    def apply_permutation_gate(self, perm, phases, ids, ctrlids):
+        """
+        Applies the k-qubit gate which maps the basis state j of the qubits
+        with indices ids to phases[j] times the basis state perm[j], using
+        ctrlids as control qubits.
+
+        Args:
+            perm (list[int]): Permutation of range(2^k).
+            phases (list[complex]): Phase factors of the 2^k basis states.
+            ids (list): A list containing the qubit IDs to which to apply the
+                gate.
+            ctrlids (list): A list of control qubit IDs (i.e., the gate is
+                only applied where these qubits are 1).
+        """
+        self._record('apply_permutation_gate', (perm, phases), ids, ctrlids)
+        mask = self._get_control_mask(ctrlids)
+        targets = self._target_view([self._map[ID] for ID in ids], mask)
+        old = targets.reshape(len(perm), -1)
+        new = _np.empty_like(old)
+        new[perm] = _np.asarray(phases, dtype=self._dtype)[:, None] * old
+        targets[...] = new.reshape(targets.shape)
+
+    def start_recording(self, ids):
+        """
+        Record the gates which are applied from now on (see replay).
+
+        Args:
+            ids (list[int]): IDs of the qubits of the recorded register.
+        """
+        self._recording = ({ID: i for i, ID in enumerate(ids)}, [])
+
+    def stop_recording(self):
+        """
+        Stop recording gates.
+
+        Returns:
+            The recorded gates (or None if a gate acted on a qubit outside of
+            the recorded register).
+        """
+        if self._recording is None:
+            raise RuntimeError("stop_recording(): No gates are being "
+                               "recorded.")
+        self.run()
+        _, gates = self._recording
+        self._recording = None
+        return gates
+
+    def replay(self, recording, ids):
+        """
+        Apply recorded gates to the qubits ids, where ids[i] takes the place
+        of the i-th qubit of the recorded register.
+
+        Args:
+            recording: Gates returned by stop_recording.
+            ids (list[int]): IDs of the qubits to which to apply the gates.
+        """
+        for method, payload, pos, ctrlpos in recording:
+            getattr(self, method)(*payload, [ids[i] for i in pos],
+                                  [ids[i] for i in ctrlpos])
+
+    def _record(self, method, payload, ids, ctrlids):
+        """
+        Append a gate to the recording (if gates are being recorded).
+        """
+        if self._recording is None or self._recording[1] is None:
+            return
+        positions, gates = self._recording
+        if not all(ID in positions for ID in list(ids) + list(ctrlids)):
+            self._recording = (positions, None)
+            return
+        gates.append((method, payload, [positions[ID] for ID in ids],
+                      [positions[ID] for ID in ctrlids]))
+
     def _single_qubit_gate(self, m, pos, mask):
         """
         Applies the single qubit gate matrix m to the qubit at position `pos`
@@ -413,18 +876,19 @@ class Simulator(object):
             pos (int): Bit-position of the qubit.
             mask (int): Bit-mask where set bits indicate control qubits.
         """
-        def kernel(u, d, m):
-            return u * m[0][0] + d * m[0][1], u * m[1][0] + d * m[1][1]
-
-        for i in range(0, len(self._state), (1 << (pos + 1))):
-            for j in range(1 << pos):
-                if ((i + j) & mask) == mask:
-                    id1 = i + j
-                    id2 = id1 + (1 << pos)
-                    self._state[id1], self._state[id2] = kernel(
-                        self._state[id1],
-                        self._state[id2],
-                        m)
+        subspace = self._controlled_view(self._state, mask)
+        axis = self._num_qubits - 1 - pos
+        axis -= bin(mask >> (pos + 1)).count('1')
+        index = [slice(None)] * subspace.ndim
+        index[axis] = 0
+        up = subspace[tuple(index) + (...,)]
+        index[axis] = 1
+        down = subspace[tuple(index) + (...,)]
+        old_up = up.copy()
+        up *= m[0][0]
+        up += m[0][1] * down
+        down *= m[1][1]
+        down += m[1][0] * old_up
 
     def _multi_qubit_gate(self, m, pos, mask):
         """
@@ -437,29 +901,31 @@ class Simulator(object):
             pos (list[int]): List of bit-positions of the qubits.
             mask (int): Bit-mask where set bits indicate control qubits.
         """
-        # follows the description in https://arxiv.org/abs/1704.01127
-        inactive = [p for p in range(len(self._map)) if p not in pos]
-
-        matrix = _np.matrix(m)
-        subvec = _np.zeros(1 << len(pos), dtype=complex)
-        subvec_idx = [0] * len(subvec)
-        for c in range(1 << len(inactive)):
-            # determine base index (state of inactive qubits)
-            base = 0
-            for i in range(len(inactive)):
-                base |= ((c >> i) & 1) << inactive[i]
-            # check the control mask
-            if mask != (base & mask):
-                continue
-            # now gather all elements involved in mat-vec mul
-            for x in range(len(subvec_idx)):
-                offset = 0
-                for i in range(len(pos)):
-                    offset |= ((x >> i) & 1) << pos[i]
-                subvec_idx[x] = base | offset
-                subvec[x] = self._state[subvec_idx[x]]
-            # perform mat-vec mul
-            self._state[subvec_idx] = matrix.dot(subvec)
+        targets = self._target_view(pos, mask)
+        k = len(pos)
+        gate = _np.asarray(m, dtype=self._dtype).reshape([2] * (2 * k))
+        targets[...] = _np.tensordot(gate, targets,
+                                     axes=(list(range(k, 2 * k)),
+                                           list(range(k))))
+
+    def _target_view(self, pos, mask):
+        """
+        Returns a view of the state vector (restricted to the subspace where
+        all control qubits are 1) with one axis per qubit where the first
+        len(pos) axes correspond to the qubits at pos[-1], ..., pos[0], i.e.,
+        bit i of a k-qubit gate matrix index corresponds to the qubit at
+        pos[i].
+
+        Args:
+            pos (list[int]): List of bit-positions of the target qubits.
+            mask (int): Bit-mask where set bits indicate control qubits.
+        """
+        subspace = self._controlled_view(self._state, mask)
+        free = [p for p in reversed(range(self._num_qubits))
+                if not (mask >> p) & 1]
+        k = len(pos)
+        axes = [free.index(pos[k - 1 - i]) for i in range(k)]
+        return _np.moveaxis(subspace, axes, list(range(k)))
 
     def set_wavefunction(self, wavefunction, ordering):
         """
@@ -480,8 +946,58 @@ class Simulator(object):
                                " Please make sure all qubits have been "
                                "allocated previously (call eng.flush()).")
 
-        self._state = _np.array(wavefunction, dtype=_np.complex128)
+        # write into the existing buffer such that views of it (see cheat)
+        # stay valid
+        self._state[:] = wavefunction
+        self._map = {ordering[i]: i for i in range(len(ordering))}
+
+    def load_state(self, wavefunction, ordering):
+        """
+        Replace all qubits and the state vector.
+
+        In contrast to set_wavefunction, the qubits in ordering need not have
+        been allocated before: they replace the currently allocated qubits.
+
+        Args:
+            wavefunction (numpy.ndarray): Array of 2^n complex amplitudes.
+            ordering (list): List of the n qubit ids, where ordering[i] is
+                at bit-location i of the wavefunction.
+        """
+        if (_np.ndim(wavefunction) != 1 or
+                len(wavefunction) != (1 << len(ordering))):
+            raise RuntimeError("load_state(): The wavefunction must contain "
+                               "2^n amplitudes for n qubits.")
+        if len(set(ordering)) != len(ordering):
+            raise RuntimeError("load_state(): Qubit IDs should be unique.")
+        self._state = _np.array(wavefunction, dtype=self._dtype)
         self._map = {ordering[i]: i for i in range(len(ordering))}
+        self._num_qubits = len(ordering)
+
+    def get_rng_state(self):
+        """
+        Return the state of the random number generator (used for
+        measurements and sampling) as a string.
+        """
+        version, internal, gauss = random.getstate()
+        return json.dumps([version, internal, gauss])
+
+    def set_rng_state(self, state):
+        """
+        Restore the state of the random number generator.
+
+        Args:
+            state (str): State returned by get_rng_state.
+
+        Raises:
+            ValueError: If state is not a valid state of the random number
+                generator.
+        """
+        try:
+            version, internal, gauss = json.loads(state)
+            random.setstate((version, tuple(internal), gauss))
+        except (TypeError, ValueError):
+            raise ValueError("set_rng_state(): Invalid random number "
+                             "generator state.")
 
     def collapse_wavefunction(self, ids, values):
         """
@@ -501,25 +1017,14 @@ class Simulator(object):
             raise RuntimeError("collapse_wavefunction(): Unknown qubit id(s)"
                                " provided. Try calling eng.flush() before "
                                "invoking this function.")
-        mask = 0
-        val = 0
-        for i in range(len(ids)):
-            pos = self._map[ids[i]]
-            mask |= (1 << pos)
-            val |= (int(values[i]) << pos)
-        nrm = 0.
-        for i in range(len(self._state)):
-            if (mask & i) == val:
-                nrm += _np.abs(self._state[i]) ** 2
+        fixed = {self._map[ids[i]]: int(values[i]) for i in range(len(ids))}
+        subspace = self._view(self._state, fixed)
+        nrm = _np.vdot(subspace, subspace).real
         if nrm < 1.e-12:
             raise RuntimeError("collapse_wavefunction(): Invalid collapse! "
                                "Probability is ~0.")
-        inv_nrm = 1. / _np.sqrt(nrm)
-        for i in range(len(self._state)):
-            if (mask & i) != val:
-                self._state[i] = 0.
-            else:
-                self._state[i] *= inv_nrm
+        self._zero_complement(fixed)
+        subspace *= 1. / _np.sqrt(nrm)
 
     def run(self):
         """
@@ -527,6 +1032,36 @@ class Simulator(object):
         """
         pass
 
+    def set_fusion_qubits(self, fusion_qubits_min, fusion_qubits_max):
+        """
+        Dummy function to implement the same interface as the c++ simulator.
+        """
+        pass
+
+    def set_num_threads(self, num_threads, parallel_threshold_qubits=14):
+        """
+        Dummy function to implement the same interface as the c++ simulator.
+        """
+        pass
+
+    def set_kernel_costs(self, costs):
+        """
+        Dummy function to implement the same interface as the c++ simulator.
+        """
+        pass
+
+    def measure_kernel_costs(self):
+        """
+        Dummy function to implement the same interface as the c++ simulator.
+        """
+        pass
+
+    def reserve(self, num_qubits):
+        """
+        Dummy function to implement the same interface as the c++ simulator.
+        """
+        pass
+
     def _apply_term(self, term, ids, ctrlids=[]):
         """
         Applies a QubitOperator term to the state vector.
@@ -0,0 +1,73 @@
+#   Copyright 2017 ProjectQ-Framework (www.projectq.ch)
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""
+Contains the conversion between logical and mapped qubits which is shared by
+the simulator backends.
+"""
+
+from projectq.meta import LogicalQubitIDTag
+from projectq.types import WeakQubitRef
+
+
+class QubitMappingMixin(object):
+    """
+    Mixin for simulator backends (i.e., compiler engines) which work on the
+    mapped qubits if there is a mapper in the compiler, while the user refers
+    to the logical qubits.
+    """
+    def _convert_logical_to_mapped_qureg(self, qureg):
+        """
+        Converts a qureg from logical to mapped qubits if there is a mapper.
+
+        Args:
+            qureg (list[Qubit],Qureg): Logical quantum bits
+        """
+        if self.main_engine is None:
+            # not part of an engine (see Simulator.apply_commands): no mapper
+            return qureg
+        mapper = self.main_engine.mapper
+        if mapper is not None:
+            mapped_qureg = []
+            for qubit in qureg:
+                if qubit.id not in mapper.current_mapping:
+                    raise RuntimeError("Unknown qubit id. "
+                                       "Please make sure you have called "
+                                       "eng.flush().")
+                new_qubit = WeakQubitRef(qubit.engine,
+                                         mapper.current_mapping[qubit.id])
+                mapped_qureg.append(new_qubit)
+            return mapped_qureg
+        else:
+            return qureg
+
+    @staticmethod
+    def _logical_qubit(cmd, qubit):
+        """
+        Return the logical qubit for which the measurement result of a
+        (mapped) qubit of the measurement command cmd is stored.
+
+        Args:
+            cmd (Command): Measurement command.
+            qubit (BasicQubit): Measured qubit of cmd.
+        """
+        # Check if a mapper assigned a different logical id
+        logical_id_tag = None
+        for tag in cmd.tags:
+            if isinstance(tag, LogicalQubitIDTag):
+                logical_id_tag = tag
+        if logical_id_tag is not None:
+            return WeakQubitRef(qubit.engine,
+                                logical_id_tag.logical_qubit_id)
+        return qubit
@@ -0,0 +1,65 @@
+#   Copyright 2017 ProjectQ-Framework (www.projectq.ch)
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""
+Tests for projectq.backends._sim._qubit_mapping.py.
+"""
+
+import pytest
+
+from projectq import MainEngine
+from projectq.cengines import BasicEngine
+from projectq.meta import LogicalQubitIDTag
+from projectq.ops import All, Command, Measure
+from projectq.types import WeakQubitRef
+
+from ._simulator_test import mapper
+from ._qubit_mapping import QubitMappingMixin
+
+
+class MappedBackend(QubitMappingMixin, BasicEngine):
+    def is_available(self, cmd):
+        return True
+
+    def receive(self, command_list):
+        pass
+
+
+def test_convert_logical_to_mapped_qureg(mapper):
+    backend = MappedBackend()
+    eng = MainEngine(backend, [mapper] if mapper is not None else [])
+    qureg = eng.allocate_qureg(2)
+    eng.flush()
+    mapped = backend._convert_logical_to_mapped_qureg(qureg)
+    offset = 1 if mapper is not None else 0
+    assert [qb.id for qb in mapped] == [qb.id + offset for qb in qureg]
+    if mapper is not None:
+        with pytest.raises(RuntimeError):
+            backend._convert_logical_to_mapped_qureg([WeakQubitRef(eng, 5)])
+    All(Measure) | qureg
+
+
+def test_convert_logical_to_mapped_qureg_without_engine():
+    qureg = [WeakQubitRef(None, 3)]
+    assert MappedBackend()._convert_logical_to_mapped_qureg(qureg) is qureg
+
+
+def test_logical_qubit():
+    eng = MainEngine(MappedBackend(), [])
+    qubit = WeakQubitRef(eng, 2)
+    cmd = Command(eng, Measure, ([qubit],))
+    assert MappedBackend._logical_qubit(cmd, qubit) is qubit
+    cmd.tags = [LogicalQubitIDTag(7)]
+    logical_qubit = MappedBackend._logical_qubit(cmd, qubit)
+    assert logical_qubit.id == 7 and logical_qubit.engine is eng
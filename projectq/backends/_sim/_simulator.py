@@ -18,10 +18,15 @@ built first. If the c++ simulator is not exported to python, a (slow) python
 implementation is used as an alternative.
 """
 
+import bisect
+import itertools
 import math
 import random
+
+import numpy
+
 from projectq.cengines import BasicEngine
-from projectq.meta import get_control_count, LogicalQubitIDTag
+from projectq.meta import get_control_count
 from projectq.ops import (NOT,
                           H,
                           R,
@@ -30,22 +35,72 @@ from projectq.ops import (NOT,
                           Allocate,
                           Deallocate,
                           BasicMathGate,
+                          KrausChannel,
+                          ReadoutError,
                           TimeEvolution)
-from projectq.types import WeakQubitRef
+
+from ._checkpoint import (SimulatorCheckpoint,
+                          read_checkpoint,
+                          write_checkpoint)
+from ._distributed import Simulator as DistributedSimulatorBackend
+from ._qubit_mapping import QubitMappingMixin
+from ._state_view import StateView
 
 FALLBACK_TO_PYSIM = False
 try:
     from ._cppsim import Simulator as SimulatorBackend
+    from ._cppsim import (SinglePrecisionSimulator as
+                          SinglePrecisionSimulatorBackend)
 except ImportError:
     from ._pysim import Simulator as SimulatorBackend
     FALLBACK_TO_PYSIM = True
 
 
-class Simulator(BasicEngine):
+_PAULI_MATRICES = {'X': numpy.array([[0, 1], [1, 0]], dtype=complex),
+                   'Y': numpy.array([[0, -1j], [1j, 0]], dtype=complex),
+                   'Z': numpy.array([[1, 0], [0, -1]], dtype=complex)}
+
+
+def _math_table(vectorized_fun, qubitids):
+    """
+    Tabulate a vectorized math function (see
+    BasicMathGate.get_vectorized_math_function) for all values of the
+    registers with the given qubit IDs.
+
+    Returns:
+        numpy.ndarray mapping the value of the concatenated registers (the
+        first qubit of the first register being the least significant bit)
+        to the new value.
+    """
+    values = numpy.arange(1 << sum(len(qr) for qr in qubitids),
+                          dtype=numpy.int64)
+    args = []
+    offset = 0
+    for qr in qubitids:
+        args.append((values >> offset) & ((1 << len(qr)) - 1))
+        offset += len(qr)
+    results = vectorized_fun(args)
+    table = numpy.zeros_like(values)
+    offset = 0
+    for qr, result in zip(qubitids, results):
+        result = numpy.asarray(result, dtype=numpy.int64)
+        table |= (result & ((1 << len(qr)) - 1)) << offset
+        offset += len(qr)
+    return table
+
+
+class Simulator(QubitMappingMixin, BasicEngine):
     """
     Simulator is a compiler engine which simulates a quantum computer using
     C++-based kernels.
 
+    Noise channels (see, e.g., projectq.ops.DepolarizingChannel) are applied
+    by sampling one quantum trajectory per run, i.e., by applying one of
+    their Kraus operators at random (see DensityMatrixSimulator for exact
+    results on small registers). Readout errors (see
+    projectq.ops.ReadoutError) flip the reported outcome of the next
+    measurement of a qubit at random, without changing the state.
+
     OpenMP is enabled and the number of threads can be controlled using the
     OMP_NUM_THREADS environment variable, i.e.
 
@@ -54,17 +109,61 @@ class Simulator(BasicEngine):
         export OMP_NUM_THREADS=4 # use 4 threads
         export OMP_PROC_BIND=spread # bind threads to processors by spreading
     """
-    def __init__(self, gate_fusion=False, rnd_seed=None):
+    def __init__(self, gate_fusion=False, rnd_seed=None, precision='double',
+                 mmap_dir=None, processes=None, time_evolution='taylor',
+                 num_threads=None, parallel_threshold_qubits=14,
+                 kernel_costs=None):
         """
         Construct the C++/Python-simulator object and initialize it with a
         random seed.
 
         Args:
-            gate_fusion (bool): If True, gates are cached and only executed
-                once a certain gate-size has been reached (only has an effect
-                for the c++ simulator).
+            gate_fusion (bool|tuple): If True, gates are cached and only
+                executed once a certain gate-size has been reached (only has
+                an effect for the c++ simulator). A tuple (fusion_qubits_min,
+                fusion_qubits_max) enables gate fusion and sets the number of
+                qubits at which fused gates are executed right away
+                (default: 4) and the maximal number of qubits of a fused
+                gate (at most 5, default: 5).
             rnd_seed (int): Random seed (uses random.randint(0, 4294967295) by
                 default).
+            precision (str): Floating-point precision of the state vector,
+                either 'double' (default) or 'single'. Single precision
+                halves the memory footprint (and memory bandwidth) at the cost
+                of a relative accuracy of roughly 1e-7.
+            mmap_dir (str): If given, the state vector (and all temporary
+                copies thereof) are stored in memory-mapped files in this
+                directory, which should be on a fast local disk (only has an
+                effect for the c++ simulator). The files are deleted
+                immediately and their space is freed once the simulator is
+                destroyed.
+            processes (int): If given, the state vector is split into this
+                many shards (a power of two), each of which is held by a
+                worker process on this machine (see below). The shards are
+                stored in a memory-mapped file in mmap_dir (default:
+                /dev/shm).
+            time_evolution (str|tuple): Propagator used for TimeEvolution
+                gates, either 'taylor' (default), 'krylov' or 'chebyshev'
+                (see below). A tuple ('krylov', krylov_dim) also sets the
+                dimension of the Krylov spaces (default: 16).
+            num_threads (int): Number of OpenMP threads used by the c++
+                simulator (default: OMP_NUM_THREADS, or the number of cores).
+            parallel_threshold_qubits (int): The c++ simulator only uses
+                several threads once the state vector holds at least this
+                many qubits (default: 14), as smaller state vectors are
+                processed faster by a single thread.
+            kernel_costs (list[float]|str): Run times of the kernels on 1 to 5
+                qubits relative to the 1-qubit kernel, which decide whether
+                gates are fused (only has an effect for the c++ simulator).
+                By default, a fixed table is used such that the fusion
+                decisions are reproducible; 'measure' times the kernels on
+                this machine instead (see kernel_info()['kernel_costs']).
+
+        Example of mmap_dir: Simulations which exceed the main memory of the
+        machine become limited by the disk bandwidth instead of failing. The
+        kernels traverse the state vector sequentially, so enabling
+        gate_fusion (which reduces the number of such traversals) is
+        recommended in this case.
 
         Example of gate_fusion: Instead of applying a Hadamard gate to 5
         qubits, the simulator calculates the kronecker product of the 1-qubit
@@ -72,6 +171,45 @@ class Simulator(BasicEngine):
         operational intensity and keeps the simulator from having to iterate
         through the state vector multiple times. Depending on the system (and,
         especially, number of threads), this may or may not be beneficial.
+        Gates acting on disjoint sets of qubits are fused independently, and
+        whether fusing a gate pays off is decided using the relative run times
+        of the 1- to 5-qubit kernels (see kernel_costs).
+
+        Example of processes: With processes=4, the two highest
+        bit-locations of the state vector select the shard. Gates which act
+        on the remaining (local) qubits are applied by all workers in parallel
+        without communication, as are gates which are only controlled by or
+        diagonal in the two global qubits. A gate acting on a global qubit is
+        preceded by an exchange of shard halves which swaps the global qubit
+        with a local one. The local qubit is chosen such that few exchanges
+        are needed for the gates that follow; enabling gate_fusion lets the
+        simulator collect all gates up to the next flush (or measurement)
+        before choosing. All other operations (measurements, expectation
+        values, math gates, ...) are evaluated by the main process on the
+        full state vector. The workers only parallelize the gates within one
+        machine: the state vector is not distributed over several nodes, and
+        the memory limit is the same as without processes.
+
+        Example of time_evolution: All propagators apply the Hamiltonian in a
+        bit-mask form, which is compiled once and reused as long as the same
+        Hamiltonian is evolved under (e.g., in a sweep over times).
+        'taylor' uses a truncated Taylor series in about |t| * norm steps,
+        where norm is the sum of the absolute values of the coefficients.
+        'chebyshev' expands the propagator in Chebyshev polynomials and
+        needs roughly |t| * norm applications of the Hamiltonian in total
+        (and two additional state vectors). 'krylov' uses Lanczos
+        iterations with an adaptive time step, which converges faster if the
+        spectrum is narrow or the state is close to a few eigenstates, but
+        keeps krylov_dim + 1 additional state vectors.
+
+        Example of num_threads: Running several simulators side by side
+        (e.g., one per process of a parameter sweep) with the default number
+        of threads each oversubscribes the cores; num_threads=1 avoids this.
+        The pages of the state vector are first written by the same threads
+        (and with the same static schedule) which later apply the gates, such
+        that on multi-socket machines each page ends up on the NUMA node of
+        the thread using it. Setting OMP_PROC_BIND=close (or spread) and
+        OMP_PLACES=cores keeps the threads from migrating between nodes.
 
         Note:
             If the C++ Simulator extension was not built or cannot be found,
@@ -83,11 +221,77 @@ class Simulator(BasicEngine):
             the docs which gives futher hints on how to build the C++
             extension.
         """
+        if precision not in ('double', 'single'):
+            raise ValueError("Simulator: precision must be either 'double' "
+                             "or 'single', got {!r}.".format(precision))
+        if not isinstance(gate_fusion, bool):
+            fusion_qubits = tuple(gate_fusion)
+            if (len(fusion_qubits) != 2 or not 1 <= fusion_qubits[1] <= 5 or
+                    fusion_qubits[0] < 1):
+                raise ValueError("Simulator: gate_fusion must be a bool or a "
+                                 "tuple (fusion_qubits_min, fusion_qubits_max)"
+                                 " with 1 <= fusion_qubits_max <= 5.")
+        if num_threads is not None and (int(num_threads) != num_threads or
+                                        num_threads < 1):
+            raise ValueError("Simulator: num_threads must be a positive "
+                             "integer, got {!r}.".format(num_threads))
+        if (int(parallel_threshold_qubits) != parallel_threshold_qubits or
+                parallel_threshold_qubits < 0):
+            raise ValueError("Simulator: parallel_threshold_qubits must be a "
+                             "non-negative integer, got "
+                             "{!r}.".format(parallel_threshold_qubits))
+        # (compare with 'measure' only if it is a string: kernel_costs may
+        # be a numpy array, which would be compared element-wise)
+        measure_costs = (isinstance(kernel_costs, str) and
+                         kernel_costs == 'measure')
+        if kernel_costs is not None and not measure_costs:
+            if isinstance(kernel_costs, str):
+                kernel_costs = []
+            kernel_costs = [float(cost) for cost in kernel_costs]
+            if len(kernel_costs) != 5 or min(kernel_costs) <= 0:
+                raise ValueError("Simulator: kernel_costs must be 'measure' "
+                                 "or the 5 positive costs of the kernels on "
+                                 "1 to 5 qubits.")
         if rnd_seed is None:
             rnd_seed = random.randint(0, 4294967295)
         BasicEngine.__init__(self)
-        self._simulator = SimulatorBackend(rnd_seed)
-        self._gate_fusion = gate_fusion
+        backend_args = (rnd_seed,)
+        if mmap_dir is not None:
+            backend_args += (str(mmap_dir),)
+        if processes is not None:
+            self._simulator = DistributedSimulatorBackend(
+                rnd_seed, processes, precision=precision, mmap_dir=mmap_dir)
+        elif precision == 'double':
+            self._simulator = SimulatorBackend(*backend_args)
+        elif FALLBACK_TO_PYSIM:
+            self._simulator = SimulatorBackend(*backend_args,
+                                               precision=precision)
+        else:
+            self._simulator = SinglePrecisionSimulatorBackend(*backend_args)
+        self._gate_fusion = bool(gate_fusion)
+        # random numbers for sampling noise channels and readout errors
+        self._rng = random.Random(rnd_seed)
+        # probability with which the next measurement outcome of each qubit
+        # is flipped (see ReadoutError)
+        self._readout_errors = dict()
+        if not isinstance(gate_fusion, bool):
+            self._simulator.set_fusion_qubits(*fusion_qubits)
+        if isinstance(time_evolution, str):
+            time_evolution = (time_evolution,)
+        self._simulator.set_time_evolution_method(*time_evolution)
+        self._simulator.set_num_threads(int(num_threads or 0),
+                                        int(parallel_threshold_qubits))
+        if measure_costs:
+            self._simulator.measure_kernel_costs()
+        elif kernel_costs is not None:
+            self._simulator.set_kernel_costs(kernel_costs)
+        # recorded gates of the circuits applied by apply_cached_circuit
+        self._circuit_cache = dict()
+        # None if no circuit is being recorded (see apply_cached_circuit)
+        self._recording_valid = None
+        # incremented whenever the state vector may change, which invalidates
+        # the views returned by get_state_view
+        self._state_version = 0
 
     def is_available(self, cmd):
         """
@@ -108,6 +312,8 @@ class Simulator(BasicEngine):
                 isinstance(cmd.gate, BasicMathGate) or
                 isinstance(cmd.gate, TimeEvolution)):
             return True
+        if isinstance(cmd.gate, (KrausChannel, ReadoutError)):
+            return get_control_count(cmd) == 0
         try:
             m = cmd.gate.matrix
             # Allow up to 5-qubit gates
@@ -117,28 +323,6 @@ class Simulator(BasicEngine):
         except:
             return False
 
-    def _convert_logical_to_mapped_qureg(self, qureg):
-        """
-        Converts a qureg from logical to mapped qubits if there is a mapper.
-
-        Args:
-            qureg (list[Qubit],Qureg): Logical quantum bits
-        """
-        mapper = self.main_engine.mapper
-        if mapper is not None:
-            mapped_qureg = []
-            for qubit in qureg:
-                if qubit.id not in mapper.current_mapping:
-                    raise RuntimeError("Unknown qubit id. "
-                                       "Please make sure you have called "
-                                       "eng.flush().")
-                new_qubit = WeakQubitRef(qubit.engine,
-                                         mapper.current_mapping[qubit.id])
-                mapped_qureg.append(new_qubit)
-            return mapped_qureg
-        else:
-            return qureg
-
     def get_expectation_value(self, qubit_operator, qureg):
         """
         Get the expectation value of qubit_operator w.r.t. the current wave
@@ -213,6 +397,7 @@ class Simulator(BasicEngine):
                                 "contained in the qureg.")
         operator = [(list(term), coeff) for (term, coeff)
                     in qubit_operator.terms.items()]
+        self._state_version += 1
         return self._simulator.apply_qubit_operator(operator,
                                                     [qb.id for qb in qureg])
 
@@ -243,6 +428,78 @@ class Simulator(BasicEngine):
         return self._simulator.get_probability(bit_string,
                                                [qb.id for qb in qureg])
 
+    def get_probabilities(self, qureg):
+        """
+        Return the probabilities of all outcomes of measuring the quantum
+        register `qureg`.
+
+        This is equivalent to calling get_probability for each of the 2^n
+        outcomes, but requires only one pass over the state vector.
+
+        Args:
+            qureg (Qureg|list[Qubit]): Quantum register.
+
+        Returns:
+            probabilities (numpy.ndarray): The 2^n probabilities, where bit i
+            of the index of an outcome is the value of qureg[i].
+
+        Note:
+            Make sure all previous commands (especially allocations) have
+            passed through the compilation chain (call main_engine.flush() to
+            make sure).
+
+        Note:
+            If there is a mapper present in the compiler, this function
+            automatically converts from logical qubits to mapped qubits for
+            the qureg argument.
+        """
+        qureg = self._convert_logical_to_mapped_qureg(qureg)
+        return numpy.asarray(self._simulator.get_probabilities(
+            [qb.id for qb in qureg]))
+
+    def sample(self, qureg, shots, seed=None):
+        """
+        Sample measurement outcomes of the quantum register `qureg` without
+        collapsing (or otherwise modifying) the wavefunction.
+
+        This is equivalent to re-running the circuit `shots` times and
+        measuring `qureg` at the end, but requires only one pass over the
+        state vector.
+
+        Args:
+            qureg (Qureg|list[Qubit]): Quantum register to sample.
+            shots (int): Number of samples to draw.
+            seed (int): Random seed for the samples (uses the random number
+                generator of the simulator by default).
+
+        Returns:
+            counts (dict): Dictionary mapping bit-strings to the number of
+            times they were sampled. The left-most bit in the bit-string
+            corresponds to the first qubit in `qureg`.
+
+        Note:
+            Make sure all previous commands (especially allocations) have
+            passed through the compilation chain (call main_engine.flush() to
+            make sure).
+
+        Note:
+            If there is a mapper present in the compiler, this function
+            automatically converts from logical qubits to mapped qubits for
+            the qureg argument.
+        """
+        qureg = self._convert_logical_to_mapped_qureg(qureg)
+        ids = [qb.id for qb in qureg]
+        if seed is None:
+            samples = self._simulator.sample_qubits(ids, shots)
+        else:
+            samples = self._simulator.sample_qubits(ids, shots, seed)
+        counts = dict()
+        for value, count in zip(*numpy.unique(samples, return_counts=True)):
+            bit_string = ''.join('1' if (value >> i) & 1 else '0'
+                                 for i in range(len(ids)))
+            counts[bit_string] = int(count)
+        return counts
+
     def get_amplitude(self, bit_string, qureg):
         """
         Return the probability amplitude of the supplied `bit_string`.
@@ -272,6 +529,51 @@ class Simulator(BasicEngine):
         return self._simulator.get_amplitude(bit_string,
                                              [qb.id for qb in qureg])
 
+    def get_amplitudes(self, bit_strings, qureg):
+        """
+        Return the probability amplitudes of the supplied `bit_strings`.
+        The ordering is given by the quantum register `qureg`, which must
+        contain all allocated qubits.
+
+        Args:
+            bit_strings (list[list[bool|int]|string[0|1]]|numpy.ndarray):
+                Computational basis states (one per row of a 2D array).
+            qureg (Qureg|list[Qubit]): Quantum register determining the
+                ordering. Must contain all allocated qubits.
+
+        Returns:
+            amplitudes (numpy.ndarray): Probability amplitudes of the provided
+            bit strings.
+
+        Raises:
+            ValueError: If a bit string does not have one bit per qubit.
+
+        Note:
+            Make sure all previous commands (especially allocations) have
+            passed through the compilation chain (call main_engine.flush() to
+            make sure).
+
+        Note:
+            If there is a mapper present in the compiler, this function
+            automatically converts from logical qubits to mapped qubits for
+            the qureg argument.
+        """
+        qureg = self._convert_logical_to_mapped_qureg(qureg)
+        if isinstance(bit_strings, numpy.ndarray) and bit_strings.ndim == 2:
+            bits = bit_strings.astype(numpy.int64)
+        else:
+            bits = numpy.array([[int(b) for b in bit_string]
+                                for bit_string in bit_strings],
+                               dtype=numpy.int64)
+        if bits.size == 0:
+            bits = bits.reshape(0, len(qureg))
+        if bits.ndim != 2 or bits.shape[1] != len(qureg):
+            raise ValueError("get_amplitudes(): Each bit string must have "
+                             "one bit per qubit in the qureg.")
+        indices = bits.dot(1 << numpy.arange(len(qureg), dtype=numpy.int64))
+        return numpy.asarray(self._simulator.get_amplitudes(
+            indices, [qb.id for qb in qureg]))
+
     def set_wavefunction(self, wavefunction, qureg):
         """
         Set the wavefunction and the qubit ordering of the simulator.
@@ -280,8 +582,11 @@ class Simulator(BasicEngine):
         the wavefunction).
 
         Args:
-            wavefunction (list[complex]): Array of complex amplitudes
-                describing the wavefunction (must be normalized).
+            wavefunction (list[complex]|numpy.ndarray): Array of complex
+                amplitudes describing the wavefunction (must be normalized).
+                A contiguous numpy array of the simulator's dtype (complex128,
+                or complex64 for precision='single') is copied directly into
+                the state vector without any intermediate conversion.
             qureg (Qureg|list[Qubit]): Quantum register determining the
                 ordering. Must contain all allocated qubits.
 
@@ -296,6 +601,7 @@ class Simulator(BasicEngine):
             the qureg argument.
         """
         qureg = self._convert_logical_to_mapped_qureg(qureg)
+        self._state_version += 1
         self._simulator.set_wavefunction(wavefunction,
                                          [qb.id for qb in qureg])
 
@@ -322,6 +628,7 @@ class Simulator(BasicEngine):
             the qureg argument.
         """
         qureg = self._convert_logical_to_mapped_qureg(qureg)
+        self._state_version += 1
         return self._simulator.collapse_wavefunction([qb.id for qb in qureg],
                                                      [bool(int(v)) for v in
                                                       values])
@@ -336,7 +643,8 @@ class Simulator(BasicEngine):
         Returns:
             A tuple where the first entry is a dictionary mapping qubit
             indices to bit-locations and the second entry is the corresponding
-            state vector.
+            state vector (a numpy array; use get_state_view to access the
+            state vector without copying it).
 
         Note:
             Make sure all previous commands have passed through the
@@ -349,6 +657,298 @@ class Simulator(BasicEngine):
         """
         return self._simulator.cheat()
 
+    def get_state_view(self):
+        """
+        Return a read-only view of the state vector.
+
+        In contrast to cheat(), no qubit mapping is returned and the view
+        cannot be used to modify the wavefunction. No data is copied, which
+        makes this the cheapest way to post-process the full wavefunction
+        (e.g., after each step of a variational algorithm).
+
+        Returns:
+            StateView which shares its memory with the simulator. It is only
+            valid until the next operation which may change the state vector
+            (gates, allocations, measurements, set_wavefunction, ...);
+            afterwards, accessing it raises a RuntimeError (call
+            get_state_view again to obtain the new state).
+
+        Note:
+            Make sure all previous commands have passed through the
+            compilation chain (call main_engine.flush() to make sure).
+        """
+        return StateView(self, self._simulator.state_view()[1])
+
+    def reserve(self, num_qubits):
+        """
+        Reserve memory for the state vector of num_qubits qubits.
+
+        The state vector grows with every allocated qubit. Reserving the
+        memory in advance allows it to grow in place (without copying the
+        wavefunction) as long as at most num_qubits qubits are allocated.
+
+        Args:
+            num_qubits (int): Maximal number of qubits which will be
+                allocated at the same time.
+
+        Example:
+            .. code-block:: python
+
+                sim = Simulator()
+                eng = MainEngine(sim)
+                sim.reserve(24)
+                qureg = eng.allocate_qureg(24)
+        """
+        self._state_version += 1
+        self._simulator.reserve(num_qubits)
+
+    def apply_commands(self, command_list):
+        """
+        Apply commands which have already been compiled for this simulator,
+        without sending them through the compiler engines, and run all
+        queued gates.
+
+        This allows to replay a recorded command sequence (see, e.g.,
+        ParametrizedCircuit) on a simulator which need not be part of an
+        engine. The qubit IDs of the commands are the IDs of the simulated
+        (mapped) qubits.
+
+        Args:
+            command_list (list<Command>): Commands to apply (all of them must
+                be supported by the simulator, see is_available, and qubits
+                must be allocated before they are used).
+        """
+        for cmd in command_list:
+            if not cmd.gate == FlushGate():
+                self._handle(cmd)
+        self._simulator.run()
+
+    def apply_cached_circuit(self, fingerprint, circuit, qureg):
+        """
+        Apply the gates of circuit(qureg), replaying them from the circuit
+        cache if a circuit with the same fingerprint has been applied before.
+
+        The first time, circuit(qureg) is called and the gates which the
+        simulator executes (after compilation and gate fusion) are recorded.
+        Subsequent calls with the same fingerprint apply the recorded gates
+        to qureg directly, without calling circuit and without sending the
+        gates through the compiler engines again.
+
+        Args:
+            fingerprint (hashable): Key which identifies the circuit,
+                including all parameters which change its gates (e.g.,
+                ('qaoa', p, gamma, beta)).
+            circuit (callable): Function which applies the gates to the
+                qureg it receives as its only argument.
+            qureg (Qureg|list[Qubit]): Qubits to which to apply the circuit
+                (allocated before the call).
+
+        Returns:
+            True if the gates were replayed and False if circuit was called.
+
+        Raises:
+            ValueError: If the cached circuit acts on a different number of
+                qubits.
+
+        Note:
+            Only circuits which consist of gates given by their matrices and
+            which act on the qubits of qureg (also as controls) are cached;
+            e.g., measurements, (de-)allocations of ancilla qubits, math
+            gates, time evolution and noise channels are not replayed, i.e.,
+            such circuits are called every time. The circuit is also called
+            every time if there is a mapper present in the compiler. Circuits
+            whose rotation angles change from call to call are better
+            served by ParametrizedCircuit.
+
+        Example:
+            .. code-block:: python
+
+                def qft(qureg):
+                    for i in range(len(qureg)):
+                        H | qureg[i]
+                        for j in range(i + 1, len(qureg)):
+                            C(R(math.pi / 2 ** (j - i))) | (qureg[j],
+                                                            qureg[i])
+
+                for run in range(1000):
+                    qureg = eng.allocate_qureg(8)
+                    sim.apply_cached_circuit(('qft', 8), qft, qureg)
+                    All(Measure) | qureg
+        """
+        eng = self.main_engine
+        if eng.mapper is not None:
+            circuit(qureg)
+            return False
+        ids = [qb.id for qb in qureg]
+        eng.flush()
+        recording = self._circuit_cache.get(fingerprint)
+        if recording is not None:
+            num_qubits, gates = recording
+            if num_qubits != len(ids):
+                raise ValueError("apply_cached_circuit(): The circuit {!r} "
+                                 "acts on {} qubits, got {}.".format(
+                                     fingerprint, num_qubits, len(ids)))
+            self._state_version += 1
+            self._simulator.replay(gates, ids)
+            return True
+        self._simulator.start_recording(ids)
+        self._recording_valid = True
+        try:
+            circuit(qureg)
+            eng.flush()
+        finally:
+            gates = self._simulator.stop_recording()
+            valid, self._recording_valid = self._recording_valid, None
+        if valid and gates is not None:
+            self._circuit_cache[fingerprint] = (len(ids), gates)
+        return False
+
+    def clear_circuit_cache(self):
+        """
+        Remove all circuits recorded by apply_cached_circuit.
+        """
+        self._circuit_cache = dict()
+
+    def kernel_info(self):
+        """
+        Return a description of the kernels which apply the gates.
+
+        The C++ simulator contains kernels for several instruction sets and
+        uses the best ones the CPU supports ('avx512', 'avx2' or 'scalar').
+        Other supported kernels can be selected by setting the environment
+        variable PROJECTQ_SIMULATOR_KERNELS (e.g., to 'avx2') before
+        projectq is imported.
+
+        Returns:
+            A dict with the entries 'backend' ('c++', 'python' or
+            'distributed'), 'kernels' (the kernels in use),
+            'supported_kernels' (all kernels which can be used on this
+            machine), 'precision' and 'threads' (the number of OpenMP
+            threads, see num_threads). The C++ simulator also reports the
+            'parallel_threshold_qubits' and the 'kernel_costs' (see
+            __init__) and the distributed simulator the number of worker
+            'processes'.
+
+        Example:
+            .. code-block:: python
+
+                >>> Simulator().kernel_info()
+                {'backend': 'c++', 'kernels': 'avx2',
+                 'supported_kernels': ['scalar', 'avx2'],
+                 'precision': 'double', 'threads': 8,
+                 'parallel_threshold_qubits': 14,
+                 'kernel_costs': [1.0, 1.2, 1.3, 1.9, 3.0]}
+        """
+        return self._simulator.kernel_info()
+
+    def checkpoint(self):
+        """
+        Return an in-memory copy of the state of the simulator.
+
+        The checkpoint holds a copy of the state vector, the qubit ordering
+        and the states of the random number generators. Pending (fused)
+        gates are executed first. Loading the checkpoint (see
+        load_checkpoint) restores the simulator to this point, which allows
+        to prepare a state once and branch many experiments from it.
+
+        Returns:
+            SimulatorCheckpoint
+
+        Example:
+            .. code-block:: python
+
+                sim = Simulator()
+                eng = MainEngine(sim)
+                qureg = eng.allocate_qureg(20)
+                prepare_state(qureg)
+                eng.flush()
+                prepared = sim.checkpoint()
+                for angle in angles:
+                    sim.load_checkpoint(prepared)
+                    All(Rx(angle)) | qureg
+                    eng.flush()
+                    results.append(sim.get_expectation_value(op, qureg))
+
+        Note:
+            Make sure all previous commands have passed through the
+            compilation chain (call main_engine.flush() to make sure).
+        """
+        return self._checkpoint(copy=True)
+
+    def save_checkpoint(self, path, compress=False):
+        """
+        Save the state of the simulator to a file.
+
+        The state vector is streamed to the file in chunks (without copying
+        it in memory), together with the qubit ordering and the states of
+        the random number generators. Pending (fused) gates are executed
+        first.
+
+        Args:
+            path (str): Name of the file (which is overwritten).
+            compress (bool|int): If True (or a zlib compression level from 1
+                to 9), the state vector is compressed. Compressed
+                checkpoints cannot be memory-mapped when they are loaded.
+
+        Note:
+            Make sure all previous commands have passed through the
+            compilation chain (call main_engine.flush() to make sure).
+        """
+        write_checkpoint(path, self._checkpoint(copy=False), compress)
+
+    def _checkpoint(self, copy):
+        """
+        Return a SimulatorCheckpoint whose state vector is a copy (or a view)
+        of the one of the simulator.
+        """
+        qubit_map, state = self._simulator.state_view()
+        if copy:
+            state = numpy.array(state, copy=True)
+        return SimulatorCheckpoint(sorted(qubit_map, key=qubit_map.get),
+                                   state, self._simulator.get_rng_state(),
+                                   self._rng.getstate())
+
+    def load_checkpoint(self, checkpoint, mmap=True):
+        """
+        Restore the state of the simulator from a checkpoint.
+
+        All qubits and the state vector of the simulator are replaced by the
+        ones of the checkpoint. The main engine must have allocated the same
+        qubits (with the same IDs) as the engine which saved the checkpoint,
+        e.g., by loading it into the same engine or by repeating the
+        allocations in a new one.
+
+        Args:
+            checkpoint (str|SimulatorCheckpoint): Name of a file written by
+                save_checkpoint or a checkpoint returned by checkpoint().
+            mmap (bool): If True (default), the state vector of an
+                uncompressed checkpoint file is memory-mapped instead of
+                read into memory before it is copied into the simulator.
+
+        Raises:
+            ValueError: If the file is not a (complete) checkpoint.
+
+        Note:
+            The states of the random number generators are only restored if
+            the checkpoint was written by the same kind of simulator backend
+            (i.e., C++ or Python), such that measurements yield the same
+            results as after saving the checkpoint.
+
+        Note:
+            Make sure all previous commands have passed through the
+            compilation chain (call main_engine.flush() to make sure).
+        """
+        if not isinstance(checkpoint, SimulatorCheckpoint):
+            checkpoint = read_checkpoint(checkpoint, mmap)
+        self._state_version += 1
+        self._simulator.load_state(checkpoint.state, checkpoint.ordering)
+        try:
+            self._simulator.set_rng_state(checkpoint.rng_state)
+        except ValueError:
+            # written by a backend with a different random number generator
+            pass
+        self._rng.setstate(checkpoint.engine_rng_state)
+
     def _handle(self, cmd):
         """
         Handle all commands, i.e., call the member functions of the C++-
@@ -362,6 +962,13 @@ class Simulator(BasicEngine):
             Exception: If a non-single-qubit gate needs to be processed
                 (which should never happen due to is_available).
         """
+        self._state_version += 1
+        if self._recording_valid and (
+                cmd.gate in (Measure, Allocate, Deallocate) or
+                isinstance(cmd.gate, (BasicMathGate, TimeEvolution,
+                                      KrausChannel, ReadoutError))):
+            # only gates given by their matrices are recorded
+            self._recording_valid = False
         if cmd.gate == Measure:
             assert(get_control_count(cmd) == 0)
             ids = [qb.id for qr in cmd.qubits for qb in qr]
@@ -369,15 +976,12 @@ class Simulator(BasicEngine):
             i = 0
             for qr in cmd.qubits:
                 for qb in qr:
-                    # Check if a mapper assigned a different logical id
-                    logical_id_tag = None
-                    for tag in cmd.tags:
-                        if isinstance(tag, LogicalQubitIDTag):
-                            logical_id_tag = tag
-                    if logical_id_tag is not None:
-                        qb = WeakQubitRef(qb.engine,
-                                          logical_id_tag.logical_qubit_id)
-                    self.main_engine.set_measurement_result(qb, out[i])
+                    # the state keeps the true outcome
+                    flip = self._readout_errors.pop(qb.id, 0.)
+                    if flip and self._rng.random() < flip:
+                        out[i] = not out[i]
+                    self.main_engine.set_measurement_result(
+                        self._logical_qubit(cmd, qb), out[i])
                     i += 1
         elif cmd.gate == Allocate:
             ID = cmd.qubits[0][0].id
@@ -385,6 +989,7 @@ class Simulator(BasicEngine):
         elif cmd.gate == Deallocate:
             ID = cmd.qubits[0][0].id
             self._simulator.deallocate_qubit(ID)
+            self._readout_errors.pop(ID, None)
         elif isinstance(cmd.gate, BasicMathGate):
             # improve performance by using C++ code for some commomn gates
             from projectq.libs.math import (AddConstant,
@@ -395,25 +1000,35 @@ class Simulator(BasicEngine):
                 qubitids.append([])
                 for qb in qr:
                     qubitids[-1].append(qb.id)
+            ctrlids = [qb.id for qb in cmd.control_qubits]
+            vectorized_fun = cmd.gate.get_vectorized_math_function(
+                cmd.qubits)
             if FALLBACK_TO_PYSIM:
-                math_fun = cmd.gate.get_math_function(cmd.qubits)
-                self._simulator.emulate_math(math_fun, qubitids,
-                                             [qb.id for qb in cmd.control_qubits])
+                if vectorized_fun is not None:
+                    self._simulator.emulate_math_table(
+                        _math_table(vectorized_fun, qubitids), qubitids,
+                        ctrlids)
+                else:
+                    math_fun = cmd.gate.get_math_function(cmd.qubits)
+                    self._simulator.emulate_math(math_fun, qubitids, ctrlids)
             else:
                 # individual code for different standard gates to make it faster!
                 if isinstance(cmd.gate, AddConstant):
                     self._simulator.emulate_math_addConstant(cmd.gate.a, qubitids,
-                                                             [qb.id for qb in cmd.control_qubits])
+                                                             ctrlids)
                 elif isinstance(cmd.gate, AddConstantModN):
                     self._simulator.emulate_math_addConstantModN(cmd.gate.a, cmd.gate.N, qubitids,
-                                                                 [qb.id for qb in cmd.control_qubits])
+                                                                 ctrlids)
                 elif isinstance(cmd.gate, MultiplyByConstantModN):
                     self._simulator.emulate_math_multiplyByConstantModN(cmd.gate.a, cmd.gate.N, qubitids,
-                                                                        [qb.id for qb in cmd.control_qubits])
+                                                                        ctrlids)
+                elif vectorized_fun is not None:
+                    self._simulator.emulate_math_table(
+                        _math_table(vectorized_fun, qubitids), qubitids,
+                        ctrlids)
                 else:
                     math_fun = cmd.gate.get_math_function(cmd.qubits)
-                    self._simulator.emulate_math(math_fun, qubitids,
-                                                 [qb.id for qb in cmd.control_qubits])
+                    self._simulator.emulate_math(math_fun, qubitids, ctrlids)
         elif isinstance(cmd.gate, TimeEvolution):
             op = [(list(term), coeff) for (term, coeff)
                   in cmd.gate.hamiltonian.terms.items()]
@@ -421,6 +1036,15 @@ class Simulator(BasicEngine):
             qubitids = [qb.id for qb in cmd.qubits[0]]
             ctrlids = [qb.id for qb in cmd.control_qubits]
             self._simulator.emulate_time_evolution(op, t, qubitids, ctrlids)
+        elif isinstance(cmd.gate, KrausChannel):
+            for qr in cmd.qubits:
+                for qb in qr:
+                    self._apply_channel(cmd.gate, qb.id)
+        elif isinstance(cmd.gate, ReadoutError):
+            for qr in cmd.qubits:
+                for qb in qr:
+                    self._readout_errors[qb.id] = cmd.gate.combine(
+                        self._readout_errors.get(qb.id, 0.))
         elif len(cmd.gate.matrix) <= 2 ** 5:
             matrix = cmd.gate.matrix
             ids = [qb.id for qr in cmd.qubits for qb in qr]
@@ -430,17 +1054,76 @@ class Simulator(BasicEngine):
                                     str(cmd.gate),
                                     int(math.log(len(cmd.gate.matrix), 2)),
                                     len(ids)))
-            self._simulator.apply_controlled_gate(matrix.tolist(),
-                                                  ids,
-                                                  [qb.id for qb in
-                                                   cmd.control_qubits])
-            if not self._gate_fusion:
-                self._simulator.run()
+            ctrlids = [qb.id for qb in cmd.control_qubits]
+            self._apply_matrix(numpy.asarray(matrix), ids, ctrlids)
         else:
             raise Exception("This simulator only supports controlled k-qubit"
                             " gates with k < 6!\nPlease add an auto-replacer"
                             " engine to your list of compiler engines.")
 
+    def _apply_matrix(self, matrix, ids, ctrlids):
+        """
+        Apply a (controlled) gate given by its matrix, using the diagonal and
+        permutation kernels where possible.
+        """
+        nonzero = matrix != 0
+        if not nonzero[~numpy.eye(len(matrix), dtype=bool)].any():
+            # diagonal gate (e.g., Rz, R, Ph, S, T, Z, CZ)
+            self._simulator.apply_diagonal_gate(
+                numpy.diagonal(matrix).tolist(), ids, ctrlids)
+        elif ((nonzero.sum(axis=0) == 1).all() and
+              (nonzero.sum(axis=1) == 1).all()):
+            # permutation gate, possibly with phases (e.g., X, Y, Swap)
+            perm = nonzero.argmax(axis=0)
+            phases = matrix[perm, numpy.arange(len(matrix))]
+            self._simulator.apply_permutation_gate(perm.tolist(),
+                                                   phases.tolist(),
+                                                   ids, ctrlids)
+        else:
+            self._simulator.apply_controlled_gate(matrix.tolist(), ids,
+                                                  ctrlids)
+        if not self._gate_fusion:
+            self._simulator.run()
+
+    def _choose(self, weights):
+        """
+        Return an index i with probability weights[i] / sum(weights).
+        """
+        cumulative = list(itertools.accumulate(weights))
+        index = bisect.bisect_right(cumulative,
+                                    self._rng.random() * cumulative[-1])
+        return min(index, len(weights) - 1)
+
+    def _apply_channel(self, channel, qubit_id):
+        """
+        Apply a noise channel to a qubit by applying one of its Kraus
+        operators, chosen at random (i.e., sample a quantum trajectory).
+
+        Pauli channels choose the Pauli operator independently of the state;
+        for other channels, the probability of each Kraus operator is
+        computed from the reduced density matrix of the qubit.
+        """
+        paulis = channel.pauli_probabilities()
+        if paulis is not None:
+            names = sorted(paulis)
+            pauli = names[self._choose([paulis[n] for n in names])]
+            if pauli != 'I':
+                self._apply_matrix(_PAULI_MATRICES[pauli], [qubit_id], [])
+            return
+        self._simulator.run()
+        rho = numpy.eye(2, dtype=complex)
+        for pauli in 'XYZ':
+            value = self._simulator.get_expectation_value(
+                [([(0, pauli)], 1.)], [qubit_id])
+            rho = rho + value * _PAULI_MATRICES[pauli]
+        rho /= 2.
+        kraus_operators = channel.kraus_operators
+        probabilities = [max(numpy.trace(k.conj().T.dot(k).dot(rho)).real, 0.)
+                         for k in kraus_operators]
+        k = self._choose(probabilities)
+        self._apply_matrix(kraus_operators[k] / math.sqrt(probabilities[k]),
+                           [qubit_id], [])
+
     def receive(self, command_list):
         """
         Receive a list of commands from the previous engine and handle them
@@ -18,6 +18,7 @@ and the C++ simulator as backends.
 """
 
 import copy
+import itertools
 import math
 import numpy
 import pytest
@@ -29,10 +30,13 @@ import scipy.sparse.linalg
 from projectq import MainEngine
 from projectq.cengines import (BasicEngine, BasicMapperEngine, DummyEngine,
                                LocalOptimizer, NotYetMeasuredError)
-from projectq.ops import (All, Allocate, BasicGate, BasicMathGate, CNOT,
-                          Command, H, MatrixGate, Measure, QubitOperator,
-                          Rx, Ry, Rz, S, TimeEvolution, Toffoli, X, Y, Z)
-from projectq.meta import Control, Dagger, LogicalQubitIDTag
+from projectq.ops import (All, Allocate, AmplitudeDampingChannel, BasicGate,
+                          BasicMathGate, C, CNOT, CZ, Command,
+                          DepolarizingChannel, H, MatrixGate, Measure, Ph,
+                          QubitOperator, R, ReadoutError, Rx, Ry, Rz, S,
+                          Swap, T, TimeEvolution, Toffoli, X, Y, Z)
+from projectq.meta import (Compute, Control, Dagger, LogicalQubitIDTag,
+                           Uncompute)
 from projectq.types import WeakQubitRef
 
 from projectq.backends import Simulator
@@ -44,7 +48,7 @@ def test_is_cpp_simulator_present():
 
 
 def get_available_simulators():
-    result = ["py_simulator"]
+    result = ["py_simulator", "distributed_simulator"]
     try:
         import projectq.backends._sim._cppsim as _
         result.append("cpp_simulator")
@@ -66,6 +70,11 @@ def sim(request):
         sim = Simulator()
         sim._simulator = PySim(1)
         return sim
+    if request.param == "distributed_simulator":
+        from projectq.backends._sim._distributed import Simulator as DistSim
+        sim = Simulator(gate_fusion=True)
+        sim._simulator = DistSim(1, 4)
+        return sim
 
 
 @pytest.fixture(params=["mapper", "no_mapper"])
@@ -235,6 +244,57 @@ def test_simulator_emulation(sim):
     All(Measure) | (qubit1 + qubit2 + qubit3)
 
 
+class VectorizedGate(BasicMathGate):
+    def __init__(self):
+        def multiply(a, b, c):
+            return (a, b, c + a * b)
+
+        def vectorized_multiply(a, b, c):
+            assert isinstance(c, numpy.ndarray)
+            return (a, b, c + a * b)
+
+        BasicMathGate.__init__(self, multiply, vectorized_multiply)
+
+
+def test_simulator_emulation_vectorized(sim):
+    eng = MainEngine(sim, [])
+    a = eng.allocate_qureg(2)
+    b = eng.allocate_qureg(2)
+    c = eng.allocate_qureg(3)
+    ctrl = eng.allocate_qubit()
+    X | a[1]
+    H | b[0]
+    X | b[1]
+    with Control(eng, ctrl):
+        VectorizedGate() | (a, b, c)
+    eng.flush()
+    assert sim.get_probability('000', c) == pytest.approx(1.)
+    X | ctrl
+    with Control(eng, ctrl):
+        VectorizedGate() | (a, b, c)
+    eng.flush()
+    # a = 2, b = 2 or 3: c = 4 or 6 (mod 8)
+    assert sim.get_probability('001', c) == pytest.approx(.5)
+    assert sim.get_probability('011', c) == pytest.approx(.5)
+    All(Measure) | a + b + c + ctrl
+
+
+def test_simulator_emulate_math_table(sim):
+    eng = MainEngine(sim, [])
+    qureg = eng.allocate_qureg(2)
+    All(H) | qureg
+    eng.flush()
+    ids = [[qb.id for qb in qureg]]
+    # not a permutation: the amplitudes of 0 and 1 add up
+    sim._simulator.emulate_math_table(numpy.array([1, 1, 2, 3]), ids, [])
+    assert sim.get_amplitude('10', qureg) == pytest.approx(1.)
+    assert sim.get_amplitude('00', qureg) == pytest.approx(0.)
+    with pytest.raises(ValueError):
+        sim._simulator.emulate_math_table(numpy.array([0, 1]), ids, [])
+    sim.set_wavefunction([1, 0, 0, 0], qureg)
+    All(Measure) | qureg
+
+
 def test_simulator_kqubit_gate(sim):
     m1 = Rx(0.3).matrix
     m2 = Rx(0.8).matrix
@@ -273,6 +333,116 @@ def test_simulator_kqubit_gate(sim):
         LargerGate() | (qureg + qubit)
 
 
+def _ancilla_program(eng, data, use_ancillas):
+    H | data[0]
+    Rx(0.3) | data[1]
+    CNOT | (data[0], data[2])
+    for i in range(4):
+        if use_ancillas:
+            ancillas = eng.allocate_qureg(2)
+            CNOT | (data[0], ancillas[0])
+            X | ancillas[1]
+            with Control(eng, ancillas[0]):
+                Ry(0.2 + i) | data[1]
+            CNOT | (data[0], ancillas[0])
+            Measure | ancillas[1]
+            if i % 2:
+                eng.flush()
+            del ancillas
+        else:
+            with Control(eng, data[0]):
+                Ry(0.2 + i) | data[1]
+        # unused qubits are deallocated right away
+        eng.allocate_qureg(3)
+        Rz(0.1 * i) | data[2]
+
+
+def test_simulator_allocate_deallocate_reuse(sim):
+    sim.reserve(8)
+    eng = MainEngine(sim, [])
+    data = eng.allocate_qureg(3)
+    _ancilla_program(eng, data, True)
+    eng.flush()
+    assert len(sim.cheat()[1]) == 8
+
+    ref = Simulator()
+    ref_eng = MainEngine(ref, [])
+    ref_data = ref_eng.allocate_qureg(3)
+    _ancilla_program(ref_eng, ref_data, False)
+    ref_eng.flush()
+    for i in range(8):
+        bits = [(i >> k) & 1 for k in range(3)]
+        assert (sim.get_amplitude(bits, data) ==
+                pytest.approx(ref.get_amplitude(bits, ref_data)))
+    All(Measure) | data
+    All(Measure) | ref_data
+
+
+def test_simulator_noise_trajectories(sim):
+    eng = MainEngine(sim, [])
+    qubit = eng.allocate_qubit()
+    assert sim.is_available(Command(eng, DepolarizingChannel(0.1), (qubit,)))
+    ancilla = eng.allocate_qubit()
+    assert not sim.is_available(Command(eng, DepolarizingChannel(0.1),
+                                        (qubit,), controls=ancilla))
+    del ancilla
+    del qubit
+    damped = 0
+    depolarized = 0
+    for _ in range(400):
+        qureg = eng.allocate_qureg(2)
+        X | qureg[0]
+        AmplitudeDampingChannel(0.25) | qureg[0]
+        DepolarizingChannel(0.3) | qureg[1]
+        All(Measure) | qureg
+        damped += int(qureg[0])
+        depolarized += int(qureg[1])
+        if int(qureg[0]):
+            X | qureg[0]
+        if int(qureg[1]):
+            X | qureg[1]
+        del qureg
+    # P(1) = 1 - gamma and 2 p / 3, respectively
+    assert 250 < damped < 350
+    assert 40 < depolarized < 120
+
+
+def test_simulator_readout_error(sim):
+    eng = MainEngine(sim, [])
+    qureg = eng.allocate_qureg(2)
+    assert sim.is_available(Command(eng, ReadoutError(0.1), (qureg[:1],)))
+    assert not sim.is_available(Command(eng, ReadoutError(0.1), (qureg[:1],),
+                                        controls=qureg[1:]))
+    X | qureg[0]
+    ReadoutError(1.) | qureg[0]
+    ReadoutError(1.) | qureg[1]
+    ReadoutError(1.) | qureg[1]
+    eng.flush()
+    # the state is not changed by the readout errors...
+    assert sim.get_probability('10', qureg) == pytest.approx(1.)
+    All(Measure) | qureg
+    # ... only the reported outcomes (the two errors on qureg[1] cancel)
+    assert [int(qb) for qb in qureg] == [0, 0]
+    assert sim.get_probability('10', qureg) == pytest.approx(1.)
+    # the errors only affect the next measurement
+    All(Measure) | qureg
+    assert [int(qb) for qb in qureg] == [1, 0]
+    X | qureg[0]
+    flipped = 0
+    for _ in range(400):
+        ReadoutError(0.3) | qureg[0]
+        Measure | qureg[0]
+        flipped += int(qureg[0])
+        assert sim.get_probability('0', qureg[:1]) == pytest.approx(1.)
+    assert 80 < flipped < 160
+    # pending readout errors are discarded when a qubit is deallocated
+    ReadoutError(1.) | qureg[1]
+    del qureg
+    qubit = eng.allocate_qubit()
+    Measure | qubit
+    assert int(qubit) == 0
+
+
 def test_simulator_kqubit_exception(sim):
     m1 = Rx(0.3).matrix
     m2 = Rx(0.8).matrix
@@ -293,6 +463,35 @@ def test_simulator_kqubit_exception(sim):
         H | qureg
 
 
+def test_simulator_controlled_kqubit_gate(sim):
+    rng = numpy.random.RandomState(42)
+    m = numpy.linalg.qr(rng.randn(4, 4) + 1j * rng.randn(4, 4))[0]
+
+    class TwoQubitGate(BasicGate):
+        @property
+        def matrix(self):
+            return m
+
+    eng = MainEngine(sim, [])
+    qureg = eng.allocate_qureg(5)
+    All(H) | qureg
+    Ry(0.3) | qureg[1]
+    eng.flush()
+    state = numpy.array(sim.cheat()[1])
+    with Control(eng, qureg[1]):
+        TwoQubitGate() | (qureg[3], qureg[0])
+    eng.flush()
+
+    # reference: bit i of the matrix index corresponds to the i-th qubit
+    expected = state.copy()
+    for idx in range(len(state)):
+        if (idx >> 1) & 1 and not (idx >> 3) & 1 and not idx & 1:
+            sub = [idx, idx | 8, idx | 1, idx | 9]
+            expected[sub] = m.dot(state[sub])
+    assert numpy.allclose(sim.cheat()[1], expected)
+    All(Measure) | qureg
+
+
 def test_simulator_probability(sim, mapper):
     engine_list = [LocalOptimizer()]
     if mapper is not None:
@@ -325,6 +524,782 @@ def test_simulator_probability(sim, mapper):
     All(Measure) | qubits
 
 
+def test_simulator_get_probabilities(sim, mapper):
+    engine_list = [LocalOptimizer()]
+    if mapper is not None:
+        engine_list.append(mapper)
+    eng = MainEngine(sim, engine_list=engine_list)
+    qubits = eng.allocate_qureg(5)
+    for i, qb in enumerate(qubits):
+        Ry(0.3 + 0.4 * i) | qb
+    CNOT | (qubits[0], qubits[3])
+    Rx(0.7) | qubits[4]
+    eng.flush()
+    for qureg in (qubits, qubits[::-1], qubits[3:0:-2], [qubits[2]], []):
+        probabilities = sim.get_probabilities(qureg)
+        assert len(probabilities) == 1 << len(qureg)
+        expected = [sim.get_probability([(i >> k) & 1
+                                         for k in range(len(qureg))], qureg)
+                    for i in range(1 << len(qureg))]
+        assert numpy.allclose(probabilities, expected)
+    extra_qubit = eng.allocate_qubit()
+    with pytest.raises(RuntimeError):
+        sim.get_probabilities(extra_qubit)
+    del extra_qubit
+    with pytest.raises(ValueError):
+        sim.get_probabilities([qubits[0], qubits[0]])
+    All(Measure) | qubits
+
+
+def test_simulator_get_amplitudes(sim, mapper):
+    engine_list = [LocalOptimizer()]
+    if mapper is not None:
+        engine_list.append(mapper)
+    eng = MainEngine(sim, engine_list=engine_list)
+    qubits = eng.allocate_qureg(4)
+    for i, qb in enumerate(qubits):
+        Ry(0.3 + 0.4 * i) | qb
+        Rz(0.2 * i) | qb
+    CNOT | (qubits[1], qubits[2])
+    eng.flush()
+    bit_strings = ['0000', '1011', [1, 1, 0, 1], (0, 0, 0, 1), '1111']
+    for qureg in (qubits, qubits[::-1], [qubits[2], qubits[0], qubits[3],
+                                         qubits[1]]):
+        amplitudes = sim.get_amplitudes(bit_strings, qureg)
+        expected = [sim.get_amplitude(b, qureg) for b in bit_strings]
+        assert numpy.allclose(amplitudes, expected)
+    bits = numpy.array([[(i >> k) & 1 for k in range(4)] for i in range(16)])
+    amplitudes = sim.get_amplitudes(bits, qubits)
+    assert numpy.allclose(numpy.abs(amplitudes) ** 2,
+                          sim.get_probabilities(qubits))
+    assert len(sim.get_amplitudes([], qubits)) == 0
+    with pytest.raises(ValueError):
+        sim.get_amplitudes(['010'], qubits)
+    with pytest.raises(RuntimeError):
+        sim.get_amplitudes(['010'], qubits[:3])
+    All(Measure) | qubits
+
+
+def test_simulator_get_probabilities_many_qubits(sim):
+    eng = MainEngine(sim, [])
+    qubits = eng.allocate_qureg(17)
+    All(H) | qubits
+    for i, qb in enumerate(qubits):
+        Rz(0.1 * i) | qb
+        Ry(0.05 * i) | qb
+    CNOT | (qubits[0], qubits[16])
+    eng.flush()
+    qureg = qubits[::-1]
+    bits = (numpy.arange(1 << 17)[:, None] >> numpy.arange(17)) & 1
+    expected = numpy.abs(sim.get_amplitudes(bits, qureg)) ** 2
+    assert numpy.allclose(sim.get_probabilities(qureg), expected)
+    marginal = expected.reshape(2, -1).sum(axis=0)
+    assert numpy.allclose(sim.get_probabilities(qureg[:16]), marginal)
+    All(Measure) | qubits
+
+
+def test_simulator_sample(sim, mapper):
+    engine_list = [LocalOptimizer()]
+    if mapper is not None:
+        engine_list.append(mapper)
+    eng = MainEngine(sim, engine_list=engine_list)
+    qubits = eng.allocate_qureg(3)
+    Ry(2 * math.acos(math.sqrt(0.3))) | qubits[0]
+    CNOT | (qubits[0], qubits[2])
+    eng.flush()
+    state = copy.deepcopy(sim.cheat()[1])
+
+    counts = sim.sample(qubits, 10000, seed=42)
+    assert sum(counts.values()) == 10000
+    assert set(counts) == {'000', '101'}
+    assert counts['101'] == pytest.approx(7000, abs=300)
+    assert sim.sample(qubits, 10000, seed=42) == counts
+    assert sim.sample([qubits[2]], 100)['1'] > 0
+    # the wavefunction is left untouched
+    assert numpy.allclose(sim.cheat()[1], state)
+
+    extra_qubit = eng.allocate_qubit()
+    with pytest.raises(RuntimeError):
+        sim.sample(extra_qubit, 10)
+    del extra_qubit
+    All(Measure) | qubits
+
+
+@pytest.fixture(params=get_available_simulators())
+def make_sim(request, monkeypatch):
+    """
+    Returns a function which constructs a Simulator with the given precision
+    through its constructor (the py_simulator is selected as if the C++
+    simulator was not available).
+    """
+    if request.param == "py_simulator":
+        from projectq.backends._sim import _simulator
+        from projectq.backends._sim._pysim import Simulator as PySim
+        monkeypatch.setattr(_simulator, 'FALLBACK_TO_PYSIM', True)
+        monkeypatch.setattr(_simulator, 'SimulatorBackend', PySim)
+
+    def make(precision):
+        if request.param == "py_simulator":
+            return Simulator(precision=precision)
+        if request.param == "distributed_simulator":
+            return Simulator(gate_fusion=True, precision=precision,
+                             processes=2)
+        return Simulator(gate_fusion=True, precision=precision)
+    return make
+
+
+def test_simulator_single_precision(make_sim):
+    results = []
+    for precision in ('double', 'single'):
+        sim = make_sim(precision)
+        eng = MainEngine(sim, [])
+        qubits = eng.allocate_qureg(6)
+        rng = random.Random(17)
+        All(H) | qubits
+        for _ in range(30):
+            i, j = rng.sample(range(6), 2)
+            Rx(rng.uniform(0, 6)) | qubits[i]
+            Rz(rng.uniform(0, 6)) | qubits[j]
+            CNOT | (qubits[i], qubits[j])
+        with Control(eng, qubits[0]):
+            TimeEvolution(0.7, QubitOperator('X1 Z2') +
+                          0.3 * QubitOperator('Y3')) | qubits
+        eng.flush()
+        op = QubitOperator('Z0 X4') + 0.5 * QubitOperator('Y1')
+        results.append((numpy.array(sim.cheat()[1]),
+                        sim.get_expectation_value(op, qubits),
+                        sim.get_probability('101', qubits[:3])))
+        All(Measure) | qubits
+    (state, expectation, prob), (state32, expectation32, prob32) = results
+    assert numpy.allclose(state32, state, atol=1e-5)
+    assert expectation32 == pytest.approx(expectation, abs=1e-5)
+    assert prob32 == pytest.approx(prob, abs=1e-5)
+
+
+def test_simulator_single_precision_dtype(make_sim):
+    sim = make_sim('single')
+    assert sim.kernel_info()['precision'] == 'single'
+    eng = MainEngine(sim, [])
+    qubits = eng.allocate_qureg(3)
+    H | qubits[0]
+    CNOT | (qubits[0], qubits[1])
+    eng.flush()
+    assert sim.cheat()[1].dtype == numpy.complex64
+    sim.set_wavefunction([1, 0, 0, 0, 0, 0, 0, 0], qubits)
+    assert sim.cheat()[1].dtype == numpy.complex64
+    All(Measure) | qubits
+
+
+def test_simulator_single_precision_uncompute(make_sim):
+    sim = make_sim('single')
+    eng = MainEngine(sim, [])
+    qureg = eng.allocate_qureg(7)
+    rng = random.Random(3)
+    for qb in qureg:
+        Ry(rng.uniform(0, 6)) | qb
+    for _ in range(5):
+        ancilla = eng.allocate_qubit()
+        with Compute(eng):
+            H | ancilla
+            for qb in qureg:
+                C(Rz(rng.uniform(0, 6))) | (qb, ancilla)
+                Rx(rng.uniform(0, 6)) | ancilla
+        CNOT | (ancilla, qureg[0])
+        CNOT | (ancilla, qureg[0])
+        Uncompute(eng)
+        # the rounding errors of the uncomputation are below the tolerance
+        # of single precision, such that the ancilla is deallocated
+        del ancilla
+        eng.flush()
+        assert len(sim.cheat()[1]) == 1 << 7
+    All(Measure) | qureg
+
+
+def test_simulator_invalid_precision():
+    with pytest.raises(ValueError):
+        Simulator(precision='half')
+
+
+def test_simulator_mmap(tmpdir):
+    if "cpp_simulator" not in get_available_simulators():
+        pytest.skip("No C++ simulator")
+    states = []
+    for mmap_dir in (None, str(tmpdir)):
+        sim = Simulator(gate_fusion=True, rnd_seed=5, mmap_dir=mmap_dir)
+        eng = MainEngine(sim, [])
+        qubits = eng.allocate_qureg(5)
+        All(H) | qubits
+        for i in range(4):
+            CNOT | (qubits[i], qubits[i + 1])
+            Ry(0.3 * i) | qubits[i]
+        with Control(eng, qubits[0]):
+            TimeEvolution(0.4, QubitOperator('X1 Y2')) | qubits
+        eng.flush()
+        states.append(numpy.array(sim.cheat()[1]))
+        Measure | qubits[0]
+        del qubits[0]
+        eng.flush()
+        states.append(numpy.array(sim.cheat()[1]))
+        All(Measure) | qubits
+    assert numpy.allclose(states[0], states[2])
+    assert numpy.allclose(states[1], states[3])
+    # the backing files are unlinked right away
+    assert tmpdir.listdir() == []
+
+
+def test_simulator_mmap_invalid_directory(tmpdir):
+    if "cpp_simulator" not in get_available_simulators():
+        pytest.skip("No C++ simulator")
+    with pytest.raises(RuntimeError):
+        Simulator(mmap_dir=str(tmpdir.join("does-not-exist")))
+
+
+def test_simulator_kernel_info(sim):
+    info = sim.kernel_info()
+    assert info['backend'] in ('c++', 'python', 'distributed')
+    assert info['kernels'] in info['supported_kernels']
+    assert info['precision'] == 'double'
+    assert info['threads'] >= 1
+
+
+@pytest.mark.parametrize("precision", ['double', 'single'])
+def test_simulator_kernels_agree(precision):
+    if "cpp_simulator" not in get_available_simulators():
+        pytest.skip("No C++ simulator")
+    from projectq.backends._sim import _cppsim
+    info = Simulator().kernel_info()
+    assert 'scalar' in info['supported_kernels']
+    rng = numpy.random.RandomState(5)
+    gates = []
+    for k in [1, 2, 3, 4, 5, 3, 5, 2]:
+        matrix, _ = numpy.linalg.qr(rng.randn(2 ** k, 2 ** k) +
+                                    1j * rng.randn(2 ** k, 2 ** k))
+        qubits = list(rng.permutation(8))
+        gates.append((matrix, qubits[:k], qubits[k:k + rng.randint(3)]))
+    states = []
+    try:
+        for kernels in info['supported_kernels']:
+            _cppsim.select_kernels(kernels)
+            sim = Simulator(precision=precision)
+            assert sim.kernel_info()['kernels'] == kernels
+            eng = MainEngine(sim, [])
+            qureg = eng.allocate_qureg(8)
+            All(H) | qureg
+            for matrix, targets, controls in gates:
+                with Control(eng, [qureg[i] for i in controls]):
+                    MatrixGate(matrix) | [qureg[i] for i in targets]
+            eng.flush()
+            states.append(numpy.array(sim.cheat()[1]))
+            All(Measure) | qureg
+    finally:
+        _cppsim.select_kernels(info['kernels'])
+    for state in states[1:]:
+        assert numpy.allclose(state, states[0], atol=1e-5)
+    with pytest.raises(ValueError):
+        _cppsim.select_kernels('sse')
+
+
+
+@pytest.mark.parametrize("num_threads", [None, 1, 2])
+def test_simulator_num_threads(num_threads):
+    states = []
+    for threshold in [14, 0, 3]:
+        sim = Simulator(rnd_seed=3, num_threads=num_threads,
+                        parallel_threshold_qubits=threshold)
+        info = sim.kernel_info()
+        if info['backend'] == 'c++':
+            assert info['parallel_threshold_qubits'] == threshold
+            if num_threads is not None:
+                assert info['threads'] == num_threads
+        eng = MainEngine(sim, [])
+        qureg = eng.allocate_qureg(6)
+        All(H) | qureg
+        CNOT | (qureg[0], qureg[5])
+        Rx(0.3) | qureg[2]
+        Toffoli | (qureg[1], qureg[3], qureg[2])
+        TimeEvolution(0.4, QubitOperator('X0 Z3')) | qureg
+        Measure | qureg[4]
+        eng.flush()
+        states.append(numpy.array(sim.cheat()[1]))
+        All(Measure) | qureg
+    for state in states[1:]:
+        assert numpy.allclose(state, states[0])
+    with pytest.raises(ValueError):
+        Simulator(num_threads=0)
+    with pytest.raises(ValueError):
+        Simulator(num_threads=1.5)
+    with pytest.raises(ValueError):
+        Simulator(parallel_threshold_qubits=-1)
+
+
+def test_simulator_kernel_costs():
+    states = []
+    for kernel_costs in [None, [1, 1, 1, 1, 1], [1, 50, 50, 50, 50],
+                         numpy.array([1., 2., 2., 2., 2.]), 'measure']:
+        sim = Simulator(gate_fusion=True, rnd_seed=3, num_threads=1,
+                        kernel_costs=kernel_costs)
+        info = sim.kernel_info()
+        if info['backend'] == 'c++':
+            costs = info['kernel_costs']
+            assert len(costs) == 5 and costs[0] == pytest.approx(1.)
+            if kernel_costs is None:
+                # the default table does not depend on timings
+                assert Simulator().kernel_info()['kernel_costs'] == costs
+            elif not isinstance(kernel_costs, str):
+                assert costs == pytest.approx(kernel_costs)
+        eng = MainEngine(sim, [])
+        qureg = eng.allocate_qureg(6)
+        All(H) | qureg
+        for i in range(5):
+            CNOT | (qureg[i], qureg[i + 1])
+            Rx(0.3 * i) | qureg[i]
+        Toffoli | (qureg[1], qureg[3], qureg[2])
+        eng.flush()
+        states.append(numpy.array(sim.cheat()[1]))
+        All(Measure) | qureg
+    for state in states[1:]:
+        assert numpy.allclose(state, states[0])
+    for kernel_costs in ['fast', [1, 2, 3], [1, 1, 0, 1, 1]]:
+        with pytest.raises(ValueError):
+            Simulator(kernel_costs=kernel_costs)
+
+
+def _cached_test_circuit(qureg):
+    H | qureg[0]
+    C(R(0.3)) | (qureg[1], qureg[0])
+    CNOT | (qureg[0], qureg[2])
+    Rx(0.4) | qureg[1]
+    Toffoli | (qureg[2], qureg[1], qureg[0])
+    MatrixGate([[0.6, 0.8j], [0.8j, 0.6]]) | qureg[2]
+    with Control(qureg[1].engine, qureg[1]):
+        Ry(1.1) | qureg[2]
+        Swap | (qureg[0], qureg[2])
+    T | qureg[0]
+
+
+def _check_cached_circuit(sim, gate_fusion):
+    eng = MainEngine(sim, [])
+    ref = Simulator(gate_fusion=gate_fusion)
+    ref_eng = MainEngine(ref, [])
+    for replayed in [False, True, True]:
+        qureg = eng.allocate_qureg(3)
+        ref_qureg = ref_eng.allocate_qureg(3)
+        # replay on qubits with other ids (and in another order)
+        if replayed:
+            qureg = qureg[::-1]
+            ref_qureg = ref_qureg[::-1]
+        H | qureg[1]
+        H | ref_qureg[1]
+        assert (sim.apply_cached_circuit('circuit', _cached_test_circuit,
+                                         qureg) == replayed)
+        _cached_test_circuit(ref_qureg)
+        H | qureg[2]
+        H | ref_qureg[2]
+        eng.flush()
+        ref_eng.flush()
+        amplitudes, expected = [], []
+        for bits in itertools.product([0, 1], repeat=3):
+            amplitudes.append(sim.get_amplitude(bits, qureg))
+            expected.append(ref.get_amplitude(bits, ref_qureg))
+        # (up to the global phase left by the measurements)
+        assert abs(numpy.vdot(amplitudes, expected)) == pytest.approx(1.)
+        All(Measure) | qureg
+        All(Measure) | ref_qureg
+        del qureg, ref_qureg
+        eng.flush()
+        ref_eng.flush()
+
+
+def test_simulator_apply_cached_circuit(sim):
+    _check_cached_circuit(sim, gate_fusion=True)
+
+
+@pytest.mark.parametrize("gate_fusion", [False, True, (2, 3)])
+def test_simulator_apply_cached_circuit_gate_fusion(gate_fusion):
+    _check_cached_circuit(Simulator(gate_fusion=gate_fusion), gate_fusion)
+
+
+def test_simulator_apply_cached_circuit_not_cached(sim):
+    eng = MainEngine(sim, [])
+    qureg = eng.allocate_qureg(2)
+
+    def measured(qureg):
+        H | qureg[0]
+        Measure | qureg[0]
+
+    def ancilla(qureg):
+        qubit = eng.allocate_qubit()
+        CNOT | (qureg[0], qubit)
+        CNOT | (qureg[0], qubit)
+
+    for circuit in [measured, ancilla]:
+        for _ in range(2):
+            assert not sim.apply_cached_circuit(circuit.__name__, circuit,
+                                                qureg)
+    assert not sim.apply_cached_circuit('X', lambda q: X | q[1], qureg)
+    assert sim.apply_cached_circuit('X', lambda q: X | q[1], qureg)
+    assert int(sim.get_probability('01', qureg) + .5) == 1 - int(qureg[0])
+    with pytest.raises(ValueError):
+        sim.apply_cached_circuit('X', lambda q: X | q[1], qureg[:1])
+    sim.clear_circuit_cache()
+    assert not sim.apply_cached_circuit('X', lambda q: X | q[1], qureg)
+    All(Measure) | qureg
+
+
+def test_simulator_apply_commands(sim):
+    backend = DummyEngine(save_commands=True)
+    eng = MainEngine(backend, [])
+    qureg = eng.allocate_qureg(2)
+    H | qureg[0]
+    CNOT | (qureg[0], qureg[1])
+    Ry(0.3) | qureg[1]
+    eng.flush()
+    sim.apply_commands(backend.received_commands)
+    ref_eng = MainEngine(Simulator(), [])
+    ref_qureg = ref_eng.allocate_qureg(2)
+    H | ref_qureg[0]
+    CNOT | (ref_qureg[0], ref_qureg[1])
+    Ry(0.3) | ref_qureg[1]
+    ref_eng.flush()
+    assert numpy.allclose(sim.cheat()[1], ref_eng.backend.cheat()[1])
+    # the simulator is not part of an engine
+    qubits = [WeakQubitRef(None, qb.id) for qb in qureg]
+    assert sim.get_expectation_value(QubitOperator('Z0 Z1'), qubits) == \
+        pytest.approx(ref_eng.backend.get_expectation_value(
+            QubitOperator('Z0 Z1'), ref_qureg))
+    All(Measure) | ref_qureg
+
+
+def test_simulator_apply_cached_circuit_mapper(mapper):
+    sim = Simulator()
+    eng = MainEngine(sim, [mapper] if mapper is not None else [])
+    qureg = eng.allocate_qureg(2)
+    for _ in range(2):
+        cached = sim.apply_cached_circuit('CNOT', lambda q: CNOT | (q[0],
+                                                                    q[1]),
+                                          qureg)
+        assert cached == (mapper is None and _ > 0)
+    All(Measure) | qureg
+
+@pytest.mark.parametrize("use_mmap", [False, True])
+def test_simulator_cheat_copies_state(use_mmap, tmpdir):
+    if "cpp_simulator" not in get_available_simulators():
+        pytest.skip("No C++ simulator")
+    from projectq.libs.math import AddConstant
+    sim = Simulator(mmap_dir=str(tmpdir) if use_mmap else None)
+    eng = MainEngine(sim, [])
+    qubits = eng.allocate_qureg(3)
+    eng.flush()
+    state = sim.cheat()[1]
+    assert isinstance(state, numpy.ndarray)
+    # the state vector is reallocated by the allocations and the emulation
+    # of the math gate
+    qubits += eng.allocate_qureg(8)
+    AddConstant(3) | qubits[:3]
+    eng.flush()
+    assert state[0] == pytest.approx(1.)
+    state[0] = 0
+    assert sim.get_probability('110', qubits[:3]) == pytest.approx(1.)
+    All(Measure) | qubits
+
+
+def test_simulator_get_state_view(sim):
+    eng = MainEngine(sim, [])
+    qubits = eng.allocate_qureg(3)
+    eng.flush()
+    view = sim.get_state_view()
+    assert len(view) == 8 and view.shape == (8,)
+    assert numpy.shares_memory(numpy.asarray(view),
+                               sim._simulator.state_view()[1])
+    with pytest.raises(TypeError):
+        view[0] = 0
+    with pytest.raises(ValueError):
+        numpy.asarray(view)[0] = 0
+    assert view[0] == pytest.approx(1.)
+    # slices are copies
+    part = view[:2]
+    H | qubits[1]
+    eng.flush()
+    assert not view.valid
+    with pytest.raises(RuntimeError):
+        view[0]
+    with pytest.raises(RuntimeError):
+        numpy.abs(view)
+    assert part[0] == pytest.approx(1.)
+    view = sim.get_state_view()
+    assert view[0] == pytest.approx(1. / math.sqrt(2))
+    assert view[2] == pytest.approx(1. / math.sqrt(2))
+    # queries do not change the state vector
+    sim.get_probability('0', [qubits[1]])
+    sim.sample(qubits, 10)
+    eng.flush()
+    assert numpy.allclose(numpy.abs(view) ** 2, [.5, 0, .5, 0, 0, 0, 0, 0])
+    state = view.copy()
+
+    wavefunction = numpy.zeros(8, dtype=view.dtype)
+    wavefunction[5] = 1.
+    sim.set_wavefunction(wavefunction, qubits)
+    assert not view.valid
+    assert state[2] == pytest.approx(1. / math.sqrt(2))
+    assert sim.get_state_view()[5] == pytest.approx(1.)
+    # lists and arrays of other dtypes are converted
+    sim.set_wavefunction([0, 1, 0, 0, 0, 0, 0, 0], qubits)
+    assert sim.get_state_view()[1] == pytest.approx(1.)
+    sim.set_wavefunction(numpy.eye(8)[6], qubits)
+    assert sim.get_state_view()[6] == pytest.approx(1.)
+    All(Measure) | qubits
+    with pytest.raises(RuntimeError):
+        len(view)
+
+
+def _prepare_checkpoint_state(eng, qureg):
+    All(H) | qureg
+    for i in range(len(qureg) - 1):
+        CNOT | (qureg[i], qureg[i + 1])
+        Ry(0.4 * i + 0.1) | qureg[i]
+    Rz(0.7) | qureg[-1]
+    eng.flush()
+
+
+@pytest.mark.parametrize("compress", [False, True, 1])
+def test_simulator_checkpoint_file(sim, tmpdir, compress):
+    eng = MainEngine(sim, [])
+    qureg = eng.allocate_qureg(5)
+    _prepare_checkpoint_state(eng, qureg)
+    qubit_map, state = sim.cheat()
+    qubit_map, state = dict(qubit_map), numpy.array(state)
+    path = str(tmpdir.join("state.ckpt"))
+    sim.save_checkpoint(path, compress=compress)
+    All(Measure) | qureg
+    bits = [int(qb) for qb in qureg]
+    X | qureg[0]
+    eng.flush()
+    sim.load_checkpoint(path)
+    assert sim.cheat()[0] == qubit_map
+    assert numpy.allclose(sim.cheat()[1], state)
+    # the random number generator is restored as well
+    All(Measure) | qureg
+    assert [int(qb) for qb in qureg] == bits
+
+
+@pytest.mark.parametrize("precision", ['double', 'single'])
+@pytest.mark.parametrize("mmap", [False, True])
+def test_simulator_checkpoint_into_new_simulator(sim, tmpdir, precision,
+                                                 mmap):
+    eng = MainEngine(sim, [])
+    qureg = eng.allocate_qureg(4)
+    _prepare_checkpoint_state(eng, qureg)
+    sim.save_checkpoint(str(tmpdir.join("state.ckpt")))
+    # a new engine which allocates the same qubits (and maybe more)
+    new_sim = Simulator(precision=precision)
+    new_eng = MainEngine(new_sim, [])
+    new_qureg = new_eng.allocate_qureg(5)
+    new_eng.flush()
+    new_sim.load_checkpoint(str(tmpdir.join("state.ckpt")), mmap=mmap)
+    for i in range(16):
+        bits = [(i >> j) & 1 for j in range(4)]
+        assert new_sim.get_amplitude(bits, new_qureg[:4]) == pytest.approx(
+            sim.get_amplitude(bits, qureg), abs=1e-6)
+    H | new_qureg[0]
+    new_eng.flush()
+    assert sim.get_probability('1', qureg[3:]) == pytest.approx(
+        new_sim.get_probability('1', new_qureg[3:4]), abs=1e-6)
+    All(Measure) | qureg
+    All(Measure) | new_qureg[:4]
+
+
+def test_simulator_checkpoint_in_memory(sim):
+    eng = MainEngine(sim, [])
+    qureg = eng.allocate_qureg(3)
+    H | qureg[0]
+    CNOT | (qureg[0], qureg[2])
+    eng.flush()
+    prepared = sim.checkpoint()
+    state = numpy.array(prepared.state)
+    assert prepared.num_qubits == 3
+    for angle in [0.3, 1.2, -2.]:
+        sim.load_checkpoint(prepared)
+        Ry(angle) | qureg[0]
+        eng.flush()
+        assert sim.get_expectation_value(QubitOperator('X0 X2'),
+                                         qureg) == pytest.approx(
+                                             math.cos(angle))
+        All(Measure) | qureg
+    # the checkpoint holds a copy of the state vector
+    assert numpy.allclose(prepared.state, state)
+
+
+def test_simulator_checkpoint_invalid_file(tmpdir):
+    path = tmpdir.join("invalid.ckpt")
+    path.write("not a checkpoint")
+    sim = Simulator()
+    eng = MainEngine(sim, [])
+    qureg = eng.allocate_qureg(10)
+    All(H) | qureg
+    eng.flush()
+    with pytest.raises(ValueError):
+        sim.load_checkpoint(str(path))
+    for compress in (False, True):
+        sim.save_checkpoint(str(path), compress=compress)
+        data = path.read_binary()
+        path.write_binary(data[:-100])
+        with pytest.raises(ValueError):
+            sim.load_checkpoint(str(path))
+    All(Measure) | qureg
+
+
+@pytest.mark.parametrize("gate_fusion", [(1, 1), (2, 3), (4, 5), (5, 5),
+                                         (6, 5)])
+def test_simulator_fusion_clusters(gate_fusion):
+    states = []
+    for fusion in (False, gate_fusion):
+        sim = Simulator(gate_fusion=fusion)
+        eng = MainEngine(sim, [])
+        qubits = eng.allocate_qureg(7)
+        rng = random.Random(42)
+        All(H) | qubits
+        for _ in range(40):
+            i, j, k = rng.sample(range(7), 3)
+            choice = rng.randint(0, 3)
+            if choice == 0:
+                Rx(rng.uniform(0, 6)) | qubits[i]
+            elif choice == 1:
+                CNOT | (qubits[i], qubits[j])
+            elif choice == 2:
+                Toffoli | (qubits[i], qubits[j], qubits[k])
+            else:
+                with Control(eng, qubits[i]):
+                    Ry(rng.uniform(0, 6)) | qubits[j]
+                    Rz(rng.uniform(0, 6)) | qubits[k]
+        eng.flush()
+        states.append(numpy.array(sim.cheat()[1]))
+        All(Measure) | qubits
+    assert numpy.allclose(states[0], states[1])
+
+
+@pytest.mark.parametrize("num_targets", [1, 2, 3, 4, 5])
+@pytest.mark.parametrize("num_controls", [1, 2, 4])
+def test_simulator_multi_controlled_gates(sim, num_targets, num_controls):
+    rng = numpy.random.RandomState(num_targets + 7 * num_controls)
+    n = 10
+    eng = MainEngine(sim, [])
+    qubits = eng.allocate_qureg(n)
+    All(H) | qubits
+    state = numpy.full(1 << n, 1. / math.sqrt(1 << n), dtype=complex)
+    for _ in range(3):
+        order = rng.permutation(n)
+        targets = [int(i) for i in order[:num_targets]]
+        controls = [int(i) for i in
+                    order[num_targets:num_targets + num_controls]]
+        matrix = numpy.linalg.qr(rng.randn(1 << num_targets,
+                                           1 << num_targets) +
+                                 1j * rng.randn(1 << num_targets,
+                                                1 << num_targets))[0]
+        C(MatrixGate(matrix), num_controls) | ([qubits[i] for i in controls],
+                                               [qubits[i] for i in targets])
+        # reference: apply the matrix to the control=1 subspace (with the
+        # qubit qubits[i] at bit-location i)
+        tensor = state.reshape([2] * n)
+        index = [slice(None)] * n
+        for c in controls:
+            index[n - 1 - c] = 1
+        sub = tensor[tuple(index)]
+        free = [i for i in reversed(range(n)) if i not in controls]
+        axes = [free.index(targets[num_targets - 1 - j])
+                for j in range(num_targets)]
+        sub = numpy.moveaxis(sub, axes, list(range(num_targets)))
+        gate = matrix.reshape([2] * (2 * num_targets))
+        sub[...] = numpy.tensordot(gate, sub,
+                                   axes=(list(range(num_targets,
+                                                    2 * num_targets)),
+                                         list(range(num_targets))))
+    eng.flush()
+    qubit_map, result = sim.cheat()
+    indices = numpy.arange(1 << n)
+    reordered = numpy.zeros_like(indices)
+    for i, qb in enumerate(qubits):
+        reordered |= ((indices >> qubit_map[qb.id]) & 1) << i
+    expected = numpy.empty_like(state)
+    expected[indices] = state[reordered]
+    assert numpy.allclose(result, expected)
+    All(Measure) | qubits
+
+
+@pytest.mark.parametrize("gate_fusion", [(1, 6), (0, 5), (1, 0), (1, 2, 3)])
+def test_simulator_fusion_invalid(gate_fusion):
+    with pytest.raises(ValueError):
+        Simulator(gate_fusion=gate_fusion)
+
+
+class DenseGateBackend(object):
+    """
+    Wraps a simulator backend and applies diagonal and permutation gates as
+    dense matrices.
+    """
+    def __init__(self, backend):
+        self._backend = backend
+
+    def __getattr__(self, name):
+        return getattr(self._backend, name)
+
+    def apply_diagonal_gate(self, diag, ids, ctrlids):
+        self._backend.apply_controlled_gate(numpy.diag(diag).tolist(), ids,
+                                            ctrlids)
+
+    def apply_permutation_gate(self, perm, phases, ids, ctrlids):
+        m = numpy.zeros((len(perm), len(perm)), dtype=complex)
+        m[perm, range(len(perm))] = phases
+        self._backend.apply_controlled_gate(m.tolist(), ids, ctrlids)
+
+
+@pytest.mark.parametrize("gate_fusion", [False, True])
+def test_simulator_diagonal_and_permutation_gates(sim, gate_fusion):
+    sim._gate_fusion = gate_fusion
+    ref = Simulator(gate_fusion=gate_fusion)
+    ref._simulator = DenseGateBackend(type(sim._simulator)(1))
+    states = []
+    for simulator in (sim, ref):
+        eng = MainEngine(simulator, [])
+        qubits = eng.allocate_qureg(5)
+        rng = random.Random(7)
+        for _ in range(60):
+            i, j, k = rng.sample(range(5), 3)
+            choice = rng.randint(0, 9)
+            if choice == 0:
+                Rz(rng.uniform(0, 6)) | qubits[i]
+            elif choice == 1:
+                R(rng.uniform(0, 6)) | qubits[i]
+            elif choice == 2:
+                (S if rng.random() < .5 else T) | qubits[i]
+            elif choice == 3:
+                with Control(eng, qubits[j]):
+                    Ph(rng.uniform(0, 6)) | qubits[i]
+            elif choice == 4:
+                CZ | (qubits[i], qubits[j])
+            elif choice == 5:
+                (X if rng.random() < .5 else Y) | qubits[i]
+            elif choice == 6:
+                Swap | (qubits[i], qubits[j])
+            elif choice == 7:
+                with Control(eng, qubits[k]):
+                    Swap | (qubits[i], qubits[j])
+            elif choice == 8:
+                Toffoli | (qubits[i], qubits[j], qubits[k])
+            else:
+                H | qubits[i]
+                Rx(rng.uniform(0, 6)) | qubits[j]
+        # control qubits may be listed more than once
+        eng.flush()
+        simulator._simulator.apply_permutation_gate(
+            [1, 0], [1, 1j], [qubits[0].id], [qubits[1].id, qubits[1].id])
+        simulator._simulator.apply_diagonal_gate(
+            [1, -1], [qubits[2].id], [qubits[3].id, qubits[3].id])
+        eng.flush()
+        states.append(numpy.array(simulator.cheat()[1]))
+        All(Measure) | qubits
+    assert numpy.allclose(states[0], states[1])
+
+
 def test_simulator_amplitude(sim, mapper):
     engine_list = [LocalOptimizer()]
     if mapper is not None:
@@ -409,6 +1384,42 @@ def test_simulator_expectation(sim, mapper):
     assert .4 == pytest.approx(expectation)
 
 
+def test_simulator_expectation_pauli_strings(sim):
+    eng = MainEngine(sim, [])
+    qureg = eng.allocate_qureg(4)
+    eng.flush()
+    rng = numpy.random.RandomState(3)
+    state = rng.randn(16) + 1j * rng.randn(16)
+    state /= numpy.linalg.norm(state)
+    sim.set_wavefunction(state, qureg)
+    paulis = {'I': numpy.eye(2), 'X': numpy.array([[0, 1], [1, 0]]),
+              'Y': numpy.array([[0, -1j], [1j, 0]]),
+              'Z': numpy.diag([1, -1])}
+    # many terms share the same flip mask (e.g., X0 Z1, Y0 and X0 Y2 Z3)
+    op = QubitOperator()
+    for _ in range(60):
+        term = ' '.join('{}{}'.format(pauli, i) for i, pauli
+                        in enumerate(rng.choice(list('IXYZ'), 4))
+                        if pauli != 'I')
+        op += QubitOperator(term, rng.randn())
+    # the operator refers to the qubits in a permuted order
+    order = [2, 0, 3, 1]
+    expected = 0.
+    for term, coefficient in op.terms.items():
+        local = ['I'] * 4
+        for index, pauli in term:
+            local[order[index]] = pauli
+        matrix = numpy.array([[1.]])
+        for pauli in local:
+            matrix = numpy.kron(paulis[pauli], matrix)
+        expected += coefficient * numpy.vdot(state, matrix.dot(state)).real
+    expectation = sim.get_expectation_value(op, [qureg[i] for i in order])
+    assert expectation == pytest.approx(expected)
+    # the state is left unchanged
+    assert numpy.allclose(sim.cheat()[1], state)
+    All(Measure) | qureg
+
+
 def test_simulator_expectation_exception(sim):
     eng = MainEngine(sim, [])
     qureg = eng.allocate_qureg(3)
@@ -462,9 +1473,11 @@ def test_simulator_applyqubitoperator(sim, mapper):
     assert sim.get_amplitude('000', qureg) == pytest.approx(0.)
 
 
-def test_simulator_time_evolution(sim):
+@pytest.mark.parametrize("method", ["taylor", "krylov", "chebyshev"])
+@pytest.mark.parametrize("time_to_evolve", [1.1, -2.3])
+def test_simulator_time_evolution(sim, method, time_to_evolve):
     N = 8  # number of qubits
-    time_to_evolve = 1.1  # time to evolve for
+    sim._simulator.set_time_evolution_method(method, 6)
     eng = MainEngine(sim, [])
     qureg = eng.allocate_qureg(N)
     # initialize in random wavefunction by applying some gates:
@@ -479,6 +1492,7 @@ def test_simulator_time_evolution(sim):
     op += 1.1 * Qop(())
     op += -1.4 * Qop("Y0 Z1 X3 Y5")
     op += -1.1 * Qop("Y1 X2 X3 Y4")
+    op += 0.7 * Qop("Z2 Z6") - 0.2 * Qop("Z7")
     ctrl_qubit = eng.allocate_qubit()
     H | ctrl_qubit
     with Control(eng, ctrl_qubit):
@@ -503,14 +1517,25 @@ def test_simulator_time_evolution(sim):
     for t, c in op.terms.items():
         matrix = [id_sp] * N
         for idx, gate in t:
-            matrix[qbit_to_bit_map[qureg[idx].id]] = gates[ord(gate) -
-                                                           ord('X')]
+            matrix[qubit_to_bit_map[qureg[idx].id]] = gates[ord(gate) -
+                                                            ord('X')]
         matrix.reverse()
         res_matrix += build_matrix(matrix) * c
     res_matrix *= -1j * time_to_evolve
 
     init_wavefunction = numpy.array(init_wavefunction, copy=False)
     final_wavefunction = numpy.array(final_wavefunction, copy=False)
+    # bring the final wavefunction into the initial ordering (with the
+    # control qubit last), in case the simulator has moved the qubits
+    target_map = dict(qubit_to_bit_map)
+    target_map[ctrl_qubit[0].id] = N
+    indices = numpy.arange(len(final_wavefunction))
+    target_indices = numpy.zeros_like(indices)
+    for qb_id, pos in qbit_to_bit_map.items():
+        target_indices |= ((indices >> pos) & 1) << target_map[qb_id]
+    reordered = numpy.empty_like(final_wavefunction)
+    reordered[target_indices] = final_wavefunction
+    final_wavefunction = reordered
     res = scipy.sparse.linalg.expm_multiply(res_matrix, init_wavefunction)
 
     half = int(len(final_wavefunction) / 2)
@@ -521,6 +1546,54 @@ def test_simulator_time_evolution(sim):
                           init_wavefunction)
 
 
+@pytest.mark.parametrize("method", ["taylor", "krylov", "chebyshev"])
+def test_simulator_time_evolution_repeated(sim, method):
+    # the compiled Hamiltonian is reused, also after the qubit layout changed
+    sim._simulator.set_time_evolution_method(method)
+    eng = MainEngine(sim, [])
+    qureg = eng.allocate_qureg(5)
+    for qb in qureg:
+        Rx(random.random()) | qb
+        Ry(random.random()) | qb
+    eng.flush()
+    bit_strings = [format(i, '05b') for i in range(32)]
+    initial = [sim.get_amplitude(b, qureg) for b in bit_strings]
+    op = (0.4 * QubitOperator("X0 X1") + 0.3 * QubitOperator("Y1 Y2") -
+          0.8 * QubitOperator("Z0 Z4") + 0.5 * QubitOperator("X3") +
+          1.3 * QubitOperator(()))
+    for _ in range(2):
+        TimeEvolution(0.3, op) | qureg
+    ancilla = eng.allocate_qubit()
+    X | ancilla
+    for _ in range(2):
+        TimeEvolution(0.3, op) | qureg
+    TimeEvolution(-1.2, op) | qureg
+    eng.flush()
+    final = [sim.get_amplitude(b + '1', qureg + ancilla) for b in bit_strings]
+    assert numpy.allclose(final, initial)
+    All(Measure) | qureg + ancilla
+
+
+def test_simulator_time_evolution_method_argument():
+    sim = Simulator(time_evolution=('krylov', 4))
+    eng = MainEngine(sim, [])
+    qureg = eng.allocate_qureg(3)
+    All(H) | qureg
+    TimeEvolution(math.pi / 4, QubitOperator("X0 X1") +
+                  QubitOperator("X2")) | qureg
+    eng.flush()
+    # H|0> is an eigenstate of X with eigenvalue 1
+    assert abs(sim.get_amplitude('000', qureg)) == pytest.approx(
+        1. / math.sqrt(8))
+    assert numpy.angle(sim.get_amplitude('000', qureg)) == pytest.approx(
+        -math.pi / 2)
+    All(Measure) | qureg
+    with pytest.raises(ValueError):
+        Simulator(time_evolution='euler')
+    with pytest.raises(ValueError):
+        Simulator(time_evolution=('krylov', 0))
+
+
 def test_simulator_set_wavefunction(sim, mapper):
     engine_list = [LocalOptimizer()]
     if mapper is not None:
@@ -550,6 +1623,33 @@ def test_simulator_set_wavefunction_always_complex(sim):
     assert eng.backend.get_amplitude('1', qubit) == pytest.approx(1j)
 
 
+def test_simulator_measure_large_state(sim):
+    # the state vector spans many blocks of the sampler
+    eng = MainEngine(sim, [])
+    qureg = eng.allocate_qureg(12)
+    eng.flush()
+    for index in [0, 1234, 2 ** 12 - 1]:
+        state = numpy.zeros(2 ** 12, dtype=complex)
+        state[index] = 1j
+        sim.set_wavefunction(state, qureg)
+        All(Measure) | qureg
+        assert [int(qb) for qb in qureg] == [(index >> i) & 1
+                                             for i in range(12)]
+    # equal superposition of two states: the outcome of the first
+    # measurement determines the others and the state is re-normalized
+    state = numpy.zeros(2 ** 12, dtype=complex)
+    state[5] = state[2 ** 12 - 6] = 2 ** -.5
+    sim.set_wavefunction(state, qureg)
+    Measure | qureg[11]
+    eng.flush()
+    index = 5 if int(qureg[11]) == 0 else 2 ** 12 - 6
+    assert sim.get_probability([(index >> i) & 1 for i in range(12)],
+                               qureg) == pytest.approx(1.)
+    assert abs(sim.cheat()[1][index]) == pytest.approx(1.)
+    All(Measure) | qureg
+    assert [int(qb) for qb in qureg] == [(index >> i) & 1 for i in range(12)]
+
+
 def test_simulator_collapse_wavefunction(sim, mapper):
     engine_list = [LocalOptimizer()]
     if mapper is not None:
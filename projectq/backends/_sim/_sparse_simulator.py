@@ -0,0 +1,475 @@
+#   Copyright 2017 ProjectQ-Framework (www.projectq.ch)
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""
+A sparse state-vector simulator for states with few nonzero amplitudes, e.g.,
+of reversible (oracle and arithmetic) circuits on many qubits.
+"""
+
+import random
+
+import numpy
+
+from projectq.cengines import BasicEngine
+from projectq.ops import (Allocate,
+                          BasicMathGate,
+                          Deallocate,
+                          FlushGate,
+                          Measure)
+
+from ._qubit_mapping import QubitMappingMixin
+from ._simulator import Simulator
+
+
+class SparseSimulator(QubitMappingMixin, BasicEngine):
+    """
+    Simulator which stores only the nonzero amplitudes of the state, in a
+    dictionary mapping basis states (integers with one bit per qubit) to
+    amplitudes.
+
+    Gates which map basis states to basis states (X, CNOT, Toffoli, Swap,
+    math gates, ...) rewrite the keys, diagonal gates (Z, T, Rz, ...) only
+    change the amplitudes, and all other gates split each basis state into
+    (at most) 2^k basis states for a gate on k qubits. Amplitudes with an
+    absolute value below tolerance are dropped. Hence, the cost of a gate
+    is proportional to the number of nonzero amplitudes (the support) and
+    independent of the number of qubits, e.g., reversible circuits from
+    projectq.libs.math or projectq.libs.revkit on hundreds of qubits can be
+    verified as long as they are applied to few basis states:
+
+    Example:
+        .. code-block:: python
+
+            sim = SparseSimulator()
+            eng = MainEngine(sim)
+            x = eng.allocate_qureg(64)
+            H | x[0]
+            AddConstant(2 ** 62 + 5) | x
+            eng.flush()
+            print(sim.support)  # 2
+
+    Once the support exceeds max_support, the state is handed over to a
+    (dense) Simulator, which then handles all further commands, provided
+    that at most max_dense_qubits qubits are allocated (otherwise, the
+    simulation remains sparse).
+
+    The simulator supports gates (given by their matrix) on at most 5
+    qubits with arbitrary controls, math gates, measurement and
+    (de-)allocation.
+    """
+    def __init__(self, max_support=1 << 16, max_dense_qubits=24,
+                 tolerance=1e-12, rnd_seed=None):
+        """
+        Construct the sparse simulator.
+
+        Args:
+            max_support (int): Number of nonzero amplitudes above which the
+                simulator switches to a dense Simulator.
+            max_dense_qubits (int): Maximal number of qubits for which the
+                simulator switches to a dense Simulator.
+            tolerance (float): Amplitudes whose absolute value is below this
+                threshold are dropped.
+            rnd_seed (int): Random seed (uses random.randint(0, 4294967295)
+                by default).
+        """
+        BasicEngine.__init__(self)
+        if max_support < 1:
+            raise ValueError("SparseSimulator: max_support must be at least "
+                             "1.")
+        if rnd_seed is None:
+            rnd_seed = random.randint(0, 4294967295)
+        self._rng = random.Random(rnd_seed)
+        self._max_support = max_support
+        self._max_dense_qubits = max_dense_qubits
+        self._tolerance = tolerance
+        # qubit id -> bit position in the keys of _state
+        self._map = dict()
+        self._free = []
+        self._state = {0: 1. + 0j}
+        # the dense simulator which takes over once the support is too large
+        self._dense = None
+
+    @property
+    def support(self):
+        """
+        Number of nonzero amplitudes of the state (None after switching to
+        the dense simulator).
+        """
+        return None if self._dense is not None else len(self._state)
+
+    @property
+    def dense_simulator(self):
+        """
+        The dense Simulator which has taken over the simulation (None while
+        the simulation is sparse).
+        """
+        return self._dense
+
+    def is_available(self, cmd):
+        """
+        Specialized implementation of is_available: The sparse simulator
+        supports all arbitrarily-controlled gates which provide a gate-matrix
+        (via gate.matrix) and act on 5 or less qubits (not counting the
+        control qubits), math gates, measurement and (de-)allocation.
+
+        Args:
+            cmd (Command): Command for which to check availability.
+
+        Returns:
+            True if the command can be simulated and False otherwise.
+        """
+        if (cmd.gate == Measure or cmd.gate == Allocate or
+                cmd.gate == Deallocate or isinstance(cmd.gate, FlushGate) or
+                isinstance(cmd.gate, BasicMathGate)):
+            return True
+        try:
+            return len(cmd.gate.matrix) <= 2 ** 5
+        except AttributeError:
+            return False
+
+    def _position(self, qubit_id):
+        if qubit_id not in self._map:
+            raise RuntimeError("SparseSimulator: Unknown qubit id {}. Please "
+                               "make sure you have called eng.flush()."
+                               .format(qubit_id))
+        return self._map[qubit_id]
+
+    @staticmethod
+    def _extract(key, positions):
+        """ Return the bits of key at positions as an integer. """
+        value = 0
+        for bit, pos in enumerate(positions):
+            value |= ((key >> pos) & 1) << bit
+        return value
+
+    @staticmethod
+    def _deposit(value, positions):
+        """ Return the bits of value spread out onto positions. """
+        key = 0
+        for bit, pos in enumerate(positions):
+            key |= ((value >> bit) & 1) << pos
+        return key
+
+    def _allocate(self, qubit_id):
+        if self._free:
+            self._map[qubit_id] = self._free.pop()
+        else:
+            self._map[qubit_id] = len(self._map)
+
+    def _probability_of_one(self, pos):
+        return sum(abs(amplitude) ** 2 for (key, amplitude)
+                   in self._state.items() if (key >> pos) & 1)
+
+    def _project(self, pos, value, probability):
+        """ Project onto the states with the bit at pos equal to value. """
+        norm = numpy.sqrt(probability)
+        self._state = {key: amplitude / norm for (key, amplitude)
+                       in self._state.items() if (key >> pos) & 1 == value}
+
+    def _deallocate(self, qubit_id, tol=1e-10):
+        pos = self._position(qubit_id)
+        probability = self._probability_of_one(pos)
+        if tol < probability < 1. - tol:
+            raise RuntimeError("Error: Qubit has not been measured / "
+                               "uncomputed! There is most likely a bug in "
+                               "your code.")
+        # the position is reused by the next allocated qubit (in |0>)
+        value = int(probability > .5)
+        self._state = {key & ~(1 << pos): amplitude for (key, amplitude)
+                       in self._state.items() if (key >> pos) & 1 == value}
+        del self._map[qubit_id]
+        self._free.append(pos)
+
+    def _measure(self, qubit_id):
+        pos = self._position(qubit_id)
+        probability = self._probability_of_one(pos)
+        outcome = int(self._rng.random() < probability)
+        self._project(pos, outcome,
+                      probability if outcome else 1. - probability)
+        return outcome
+
+    def _apply_matrix(self, matrix, positions, ctrlmask):
+        """
+        Apply the gate matrix to the qubits at positions (the first one being
+        the least significant qubit of matrix) if all bits in ctrlmask are
+        set.
+        """
+        deposit = [self._deposit(value, positions)
+                   for value in range(len(matrix))]
+        targetmask = deposit[-1]
+        nonzero = numpy.abs(matrix) > self._tolerance
+        state = self._state
+        if (nonzero.sum(axis=0) == 1).all():
+            # maps basis states to basis states (with a phase)
+            perm = numpy.argmax(nonzero, axis=0).tolist()
+            phases = matrix[perm, range(len(matrix))].tolist()
+            if perm == list(range(len(matrix))):
+                for key in state:
+                    if key & ctrlmask == ctrlmask:
+                        state[key] *= phases[self._extract(key, positions)]
+                return
+            new_state = dict()
+            for (key, amplitude) in state.items():
+                if key & ctrlmask == ctrlmask:
+                    value = self._extract(key, positions)
+                    key = (key & ~targetmask) | deposit[perm[value]]
+                    amplitude *= phases[value]
+                new_state[key] = amplitude
+            self._state = new_state
+            return
+
+        # split each basis state: collect the amplitudes of the 2^k basis
+        # states which only differ in the target qubits
+        groups = dict()
+        new_state = dict()
+        for (key, amplitude) in state.items():
+            if key & ctrlmask == ctrlmask:
+                base = key & ~targetmask
+                if base not in groups:
+                    groups[base] = numpy.zeros(len(matrix), dtype=complex)
+                groups[base][self._extract(key, positions)] = amplitude
+            else:
+                new_state[key] = amplitude
+        for (base, amplitudes) in groups.items():
+            for (value, amplitude) in enumerate(matrix.dot(amplitudes)):
+                if abs(amplitude) > self._tolerance:
+                    new_state[base | deposit[value]] = complex(amplitude)
+        self._state = new_state
+
+    def _apply_math(self, gate, qubits, ctrlmask):
+        math_fun = gate.get_math_function(qubits)
+        positions = [[self._position(qb.id) for qb in qr] for qr in qubits]
+        targetmask = sum(1 << pos for qr in positions for pos in qr)
+        new_state = dict()
+        for (key, amplitude) in self._state.items():
+            if key & ctrlmask == ctrlmask:
+                values = math_fun([self._extract(key, qr)
+                                   for qr in positions])
+                key &= ~targetmask
+                for (value, qr) in zip(values, positions):
+                    key |= self._deposit(value, qr)
+            # (the amplitudes of states which are mapped to the same state
+            # add up)
+            new_state[key] = new_state.get(key, 0.) + amplitude
+        self._state = new_state
+
+    def _switch_to_dense(self):
+        """
+        Hand the state over to a dense Simulator, which handles all further
+        commands.
+        """
+        ids = sorted(self._map, key=self._map.get)
+        positions = [self._map[qubit_id] for qubit_id in ids]
+        wavefunction = numpy.zeros(1 << len(ids), dtype=complex)
+        for (key, amplitude) in self._state.items():
+            wavefunction[self._extract(key, positions)] = amplitude
+        dense = Simulator(rnd_seed=self._rng.randint(0, 4294967295))
+        dense.main_engine = self.main_engine
+        dense.is_last_engine = True
+        for qubit_id in ids:
+            dense._simulator.allocate_qubit(qubit_id)
+        dense._simulator.set_wavefunction(wavefunction, ids)
+        self._dense = dense
+        self._state = None
+        self._map = None
+
+    def get_expectation_value(self, qubit_operator, qureg):
+        """
+        Get the expectation value of qubit_operator w.r.t. the current wave
+        function represented by the supplied quantum register.
+
+        Args:
+            qubit_operator (projectq.ops.QubitOperator): Operator to measure.
+            qureg (list[Qubit],Qureg): Quantum bits to measure.
+
+        Returns:
+            Expectation value
+
+        Note:
+            Make sure all previous commands (especially allocations) have
+            passed through the compilation chain (call main_engine.flush() to
+            make sure).
+
+        Note:
+            If there is a mapper present in the compiler, this function
+            automatically converts from logical qubits to mapped qubits for
+            the qureg argument.
+
+        Raises:
+            Exception: If `qubit_operator` acts on more qubits than present in
+                the `qureg` argument.
+        """
+        if self._dense is not None:
+            return self._dense.get_expectation_value(qubit_operator, qureg)
+        qureg = self._convert_logical_to_mapped_qureg(qureg)
+        num_qubits = len(qureg)
+        for term, _ in qubit_operator.terms.items():
+            if not term == () and term[-1][0] >= num_qubits:
+                raise Exception("qubit_operator acts on more qubits than "
+                                "contained in the qureg.")
+        expectation = 0.
+        for term, coefficient in qubit_operator.terms.items():
+            # P maps |k> to i^#Y (-1)^|k & phase| |k ^ flip>
+            flip = phase = num_y = 0
+            for index, action in term:
+                bit = 1 << self._position(qureg[index].id)
+                if action != 'Z':
+                    flip ^= bit
+                if action != 'X':
+                    phase ^= bit
+                num_y += action == 'Y'
+            value = 0j
+            for (key, amplitude) in self._state.items():
+                other = self._state.get(key ^ flip)
+                if other is not None:
+                    sign = -1 if bin(key & phase).count('1') & 1 else 1
+                    value += sign * other.conjugate() * amplitude
+            expectation += coefficient * (1j ** num_y * value).real
+        return expectation
+
+    def get_probability(self, bit_string, qureg):
+        """
+        Return the probability of the outcome `bit_string` when measuring
+        the quantum register `qureg`.
+
+        Args:
+            bit_string (list[bool|int]|string[0|1]): Measurement outcome.
+            qureg (Qureg|list[Qubit]): Quantum register.
+
+        Returns:
+            Probability of measuring the provided bit string.
+
+        Note:
+            Make sure all previous commands (especially allocations) have
+            passed through the compilation chain (call main_engine.flush() to
+            make sure).
+
+        Note:
+            If there is a mapper present in the compiler, this function
+            automatically converts from logical qubits to mapped qubits for
+            the qureg argument.
+        """
+        if self._dense is not None:
+            return self._dense.get_probability(bit_string, qureg)
+        qureg = self._convert_logical_to_mapped_qureg(qureg)
+        mask = value = 0
+        for bit, qubit in zip(bit_string, qureg):
+            pos = self._position(qubit.id)
+            mask |= 1 << pos
+            value |= int(bit) << pos
+        return sum(abs(amplitude) ** 2 for (key, amplitude)
+                   in self._state.items() if key & mask == value)
+
+    def get_amplitude(self, bit_string, qureg):
+        """
+        Return the probability amplitude of the supplied `bit_string`.
+        The ordering is given by the quantum register `qureg`, which must
+        contain all allocated qubits.
+
+        Args:
+            bit_string (list[bool|int]|string[0|1]): Computational basis state
+            qureg (Qureg|list[Qubit]): Quantum register determining the
+                ordering. Must contain all allocated qubits.
+
+        Returns:
+            Probability amplitude of the provided bit string.
+
+        Note:
+            Make sure all previous commands (especially allocations) have
+            passed through the compilation chain (call main_engine.flush() to
+            make sure).
+
+        Note:
+            If there is a mapper present in the compiler, this function
+            automatically converts from logical qubits to mapped qubits for
+            the qureg argument.
+        """
+        if self._dense is not None:
+            return self._dense.get_amplitude(bit_string, qureg)
+        qureg = self._convert_logical_to_mapped_qureg(qureg)
+        if sorted(qb.id for qb in qureg) != sorted(self._map):
+            raise RuntimeError("The second argument to get_amplitude() must"
+                               " be a permutation of all allocated qubits. "
+                               "Please make sure you have called "
+                               "eng.flush().")
+        key = 0
+        for bit, qubit in zip(bit_string, qureg):
+            key |= int(bit) << self._map[qubit.id]
+        return self._state.get(key, 0j)
+
+    def receive(self, command_list):
+        """
+        Receive a list of commands from the previous engine and handle them
+        (simulate them classically) prior to sending them on to the next
+        engine.
+
+        Args:
+            command_list (list<Command>): List of commands to execute on the
+                simulator.
+        """
+        for cmd in command_list:
+            if self._dense is not None:
+                self._dense.receive([cmd])
+                continue
+            self._handle(cmd)
+            if (len(self._state) > self._max_support and
+                    len(self._map) <= self._max_dense_qubits):
+                self._switch_to_dense()
+        if not self.is_last_engine:
+            self.send(command_list)
+
+    def _handle(self, cmd):
+        """
+        Handle a command, i.e., apply it to the sparse state.
+
+        Args:
+            cmd (Command): Command to handle.
+
+        Raises:
+            Exception: If the gate acts on more than 5 qubits (not counting
+                the control qubits), which should never happen due to
+                is_available.
+        """
+        gate = cmd.gate
+        if isinstance(gate, FlushGate):
+            return
+        if gate == Measure:
+            for qr in cmd.qubits:
+                for qb in qr:
+                    log_qb = self._logical_qubit(cmd, qb)
+                    self.main_engine.set_measurement_result(
+                        log_qb, self._measure(qb.id))
+            return
+        if gate == Allocate:
+            self._allocate(cmd.qubits[0][0].id)
+            return
+        if gate == Deallocate:
+            self._deallocate(cmd.qubits[0][0].id)
+            return
+
+        ctrlmask = 0
+        for qb in cmd.control_qubits:
+            ctrlmask |= 1 << self._position(qb.id)
+        if isinstance(gate, BasicMathGate):
+            self._apply_math(gate, cmd.qubits, ctrlmask)
+            return
+        matrix = numpy.asarray(gate.matrix, dtype=complex)
+        positions = [self._position(qb.id) for qr in cmd.qubits for qb in qr]
+        if len(matrix) > 2 ** 5 or len(matrix) != 2 ** len(positions):
+            raise Exception("SparseSimulator: Error applying {} gate: only "
+                            "gates on at most 5 qubits (with a matching "
+                            "matrix) are supported. Please add an "
+                            "auto-replacer engine to your list of compiler "
+                            "engines.".format(gate))
+        self._apply_matrix(matrix, positions, ctrlmask)
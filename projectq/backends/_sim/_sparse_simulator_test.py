@@ -0,0 +1,187 @@
+#   Copyright 2017 ProjectQ-Framework (www.projectq.ch)
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import itertools
+import random
+
+import pytest
+
+from projectq import MainEngine
+from projectq.cengines import DummyEngine
+from projectq.libs.math import AddConstant, AddQuantum, MultiplyQuantum
+from projectq.ops import (All, Allocate, C, CNOT, Command, Deallocate, H,
+                          MatrixGate, Measure, QubitOperator, Rx, Ry, Rz, S,
+                          Swap, T, Toffoli, X)
+from projectq.types import WeakQubitRef
+
+from ._simulator import Simulator
+from ._sparse_simulator import SparseSimulator
+
+
+def test_sparse_simulator_is_available():
+    sim = SparseSimulator()
+    eng = MainEngine(sim, [DummyEngine()])
+    qubits = [WeakQubitRef(engine=eng, idx=i) for i in range(7)]
+    for gate in [H, T, Rx(0.3), Measure, Allocate, AddConstant(3)]:
+        assert sim.is_available(Command(eng, gate, ([qubits[0]],)))
+    assert sim.is_available(Command(eng, X, ([qubits[0]],),
+                                    controls=qubits[1:]))
+    assert not sim.is_available(Command(eng, MatrixGate([[1] * 64] * 64),
+                                        ([qubits[0]],)))
+    assert not sim.is_available(Command(eng, QubitOperator('X0'),
+                                        ([qubits[0]],)))
+    with pytest.raises(ValueError):
+        SparseSimulator(max_support=0)
+
+
+def _random_circuit(eng, qureg, rng):
+    for _ in range(40):
+        a, b, c = rng.sample(range(len(qureg)), 3)
+        choice = rng.randrange(7)
+        if choice == 0:
+            H | qureg[a]
+        elif choice == 1:
+            rng.choice([Rx, Ry, Rz])(rng.uniform(0, 6)) | qureg[a]
+        elif choice == 2:
+            CNOT | (qureg[a], qureg[b])
+        elif choice == 3:
+            C(Ry(rng.uniform(0, 6))) | (qureg[a], qureg[b])
+        elif choice == 4:
+            Toffoli | (qureg[a], qureg[b], qureg[c])
+        elif choice == 5:
+            C(S) | (qureg[a], qureg[b])
+        else:
+            Swap | (qureg[a], qureg[b])
+    AddQuantum | (qureg[0:2], qureg[2:5])
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_sparse_simulator_compare_to_simulator(seed):
+    sim = SparseSimulator()
+    eng = MainEngine(sim, [])
+    qureg = eng.allocate_qureg(5)
+    ref = Simulator()
+    ref_eng = MainEngine(ref, [])
+    ref_qureg = ref_eng.allocate_qureg(5)
+    _random_circuit(eng, qureg, random.Random(seed))
+    _random_circuit(ref_eng, ref_qureg, random.Random(seed))
+    eng.flush()
+    ref_eng.flush()
+    assert sim.dense_simulator is None
+    for bits in itertools.product([0, 1], repeat=5):
+        assert (sim.get_amplitude(bits, qureg) ==
+                pytest.approx(ref.get_amplitude(bits, ref_qureg)))
+    assert (sim.get_probability([1, 0], qureg[3:1:-1]) ==
+            pytest.approx(ref.get_probability([1, 0], ref_qureg[3:1:-1])))
+    op = (QubitOperator('X0 Z4', 0.5) + QubitOperator('Y2') +
+          QubitOperator('Z1 X3 Y4', -1.3) + QubitOperator((), 0.2))
+    assert (sim.get_expectation_value(op, qureg) ==
+            pytest.approx(ref.get_expectation_value(op, ref_qureg)))
+    with pytest.raises(Exception):
+        sim.get_expectation_value(QubitOperator('Z5'), qureg)
+    with pytest.raises(RuntimeError):
+        sim.get_amplitude([0] * 4, qureg[:4])
+
+    All(Measure) | qureg
+    bits = [int(qb) for qb in qureg]
+    assert ref.get_probability(bits, ref_qureg) > 1e-6
+    All(Measure) | ref_qureg
+
+
+def test_sparse_simulator_reversible_circuit_on_many_qubits():
+    sim = SparseSimulator(rnd_seed=1)
+    eng = MainEngine(sim, [])
+    a = eng.allocate_qureg(40)
+    b = eng.allocate_qureg(40)
+    c = eng.allocate_qureg(80)
+    H | a[0]
+    H | b[39]
+    AddConstant((1 << 39) + 12345) | a
+    AddConstant(987654321) | b
+    MultiplyQuantum | (a, b, c)
+    eng.flush()
+    assert sim.support == 4
+    assert sim.dense_simulator is None
+    All(Measure) | a + b + c
+    x = sum(int(qb) << i for i, qb in enumerate(a))
+    y = sum(int(qb) << i for i, qb in enumerate(b))
+    z = sum(int(qb) << i for i, qb in enumerate(c))
+    assert x in ((1 << 39) + 12345, (1 << 39) + 12346)
+    assert y in (987654321, 987654321 + (1 << 39))
+    assert z == x * y
+    # all measured qubits can be deallocated
+    del a, b, c
+    eng.flush()
+    assert sim.support == 1
+
+
+def test_sparse_simulator_falls_back_to_dense():
+    sim = SparseSimulator(max_support=8, rnd_seed=2)
+    eng = MainEngine(sim, [])
+    qureg = eng.allocate_qureg(6)
+    ancilla = eng.allocate_qubit()
+    X | ancilla
+    All(H) | qureg[:3]
+    eng.flush()
+    assert sim.support == 8
+    H | qureg[3]
+    CNOT | (qureg[3], qureg[4])
+    eng.flush()
+    assert sim.support is None
+    assert isinstance(sim.dense_simulator, Simulator)
+    assert sim.get_probability([1, 1, 1], [qureg[3], qureg[4],
+                                           ancilla[0]]) == pytest.approx(.5)
+    assert sim.get_amplitude('0001101', qureg + ancilla) == pytest.approx(
+        .25)
+    assert sim.get_expectation_value(QubitOperator('X0'), qureg) == (
+        pytest.approx(1.))
+    Measure | ancilla
+    del ancilla
+    All(Measure) | qureg
+    assert int(qureg[3]) == int(qureg[4])
+
+
+def test_sparse_simulator_stays_sparse_on_many_qubits():
+    sim = SparseSimulator(max_support=4, max_dense_qubits=8)
+    eng = MainEngine(sim, [])
+    qureg = eng.allocate_qureg(9)
+    All(H) | qureg[:3]
+    All(H) | qureg[:3]
+    eng.flush()
+    assert sim.dense_simulator is None
+    # the amplitudes of H H |0> = |0> cancel (and are dropped)
+    assert sim.support == 1
+    All(Measure) | qureg
+
+
+def test_sparse_simulator_deallocate_and_reuse():
+    sim = SparseSimulator()
+    eng = MainEngine(sim, [])
+    qubit = eng.allocate_qubit()
+    ancilla = eng.allocate_qubit()
+    H | ancilla
+    eng.flush()
+    with pytest.raises(RuntimeError):
+        sim.receive([Command(eng, Deallocate, ([ancilla[0]],))])
+    H | ancilla
+    X | ancilla
+    CNOT | (ancilla, qubit)
+    X | ancilla
+    del ancilla
+    new_qubit = eng.allocate_qubit()
+    eng.flush()
+    assert sim.get_amplitude('10', qubit + new_qubit) == pytest.approx(1.)
+    with pytest.raises(RuntimeError):
+        sim.get_probability('1', [WeakQubitRef(eng, 100)])
+    All(Measure) | qubit + new_qubit
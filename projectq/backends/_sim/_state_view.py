@@ -0,0 +1,88 @@
+#   Copyright 2017 ProjectQ-Framework (www.projectq.ch)
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""
+Contains the read-only view of the state vector of the Simulator.
+"""
+
+import numpy
+
+
+class StateView(object):
+    """
+    Read-only view of the state vector of a Simulator (see
+    Simulator.get_state_view).
+
+    The view shares its memory with the simulator. It is only valid until the
+    next operation which may modify or reallocate the state vector (gates,
+    allocations, measurements, apply_qubit_operator, set_wavefunction, ...);
+    afterwards, every access raises a RuntimeError and get_state_view has to
+    be called again. Queries such as get_probability or sample do not
+    invalidate the view.
+
+    The view supports len(), indexing (which returns copies) and conversion
+    to a numpy array, e.g., numpy.abs(view) ** 2. Arrays obtained by
+    numpy.asarray(view) share the memory as well and must not be used once
+    the view is no longer valid.
+    """
+    def __init__(self, simulator, array):
+        self._simulator = simulator
+        self._version = simulator._state_version
+        self._array = array.view()
+        self._array.flags.writeable = False
+
+    @property
+    def valid(self):
+        """
+        Whether the state vector has not changed since the view was created.
+        """
+        return self._simulator._state_version == self._version
+
+    @property
+    def dtype(self):
+        return self._array.dtype
+
+    @property
+    def shape(self):
+        return self._array.shape
+
+    def _get(self):
+        if not self.valid:
+            raise RuntimeError("The state view is no longer valid (the state "
+                               "vector has changed since get_state_view() "
+                               "was called). Call get_state_view() again.")
+        return self._array
+
+    def __len__(self):
+        return len(self._get())
+
+    def __getitem__(self, key):
+        item = self._get()[key]
+        if isinstance(item, numpy.ndarray):
+            item = item.copy()
+        return item
+
+    def __array__(self, dtype=None, copy=None):
+        array = self._get()
+        if dtype is not None and numpy.dtype(dtype) != array.dtype:
+            return array.astype(dtype)
+        if copy:
+            return array.copy()
+        return array
+
+    def copy(self):
+        """
+        Return a copy of the state vector (which remains valid).
+        """
+        return self._get().copy()
@@ -277,15 +277,20 @@ class MainEngine(BasicEngine):
             if self.verbose:
                 raise
             else:
-                exc_type, exc_value, exc_traceback = sys.exc_info()
-                # try:
+                exc_type, exc_value = sys.exc_info()[:2]
                 last_line = traceback.format_exc().splitlines()
                 compact_exception = exc_type(str(exc_value) +
                                              '\n raised in:\n' +
                                              repr(last_line[-3]) +
                                              "\n" + repr(last_line[-2]))
                 compact_exception.__cause__ = None
-                raise compact_exception  # use verbose=True for more info
+                try:
+                    raise compact_exception  # use verbose=True for more info
+                finally:
+                    # the tracebacks refer to this frame: break the cycles so
+                    # that the engine and its qubits are not kept alive until
+                    # the next garbage collection
+                    del exc_value, compact_exception
 
     def flush(self, deallocate_qubits=False):
         """
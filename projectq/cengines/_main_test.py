@@ -13,6 +13,7 @@
 #   limitations under the License.
 
 """Tests for projectq.cengines._main.py."""
+import gc
 import sys
 import weakref
 
@@ -181,3 +182,24 @@ def test_exceptions_are_forwarded():
                             verbose=True)
     with pytest.raises(TypeError):
         eng2.allocate_qubit()
+
+
+def test_exceptions_do_not_keep_qubits_alive():
+    class ErrorEngine(DummyEngine):
+        def receive(self, command_list):
+            if command_list[0].gate == H:
+                raise TypeError
+            DummyEngine.receive(self, command_list)
+    backend = ErrorEngine(save_commands=True)
+    eng = _main.MainEngine(backend=backend, engine_list=[])
+    qubit = eng.allocate_qubit()
+    # the qubit has to be deallocated right away, not only by the next
+    # garbage collection
+    gc.disable()
+    try:
+        with pytest.raises(TypeError):
+            H | qubit
+        del qubit
+        assert backend.received_commands[-1].gate == DeallocateQubitGate()
+    finally:
+        gc.enable()
@@ -50,21 +50,15 @@ def histogram(backend, qureg):
         print("The resulting histogram may look bad and/or take too long.")
         print("Consider calling histogram() with a sublist of the qubits.")
 
-    if hasattr(backend, 'get_probabilities'):
-        probabilities = backend.get_probabilities(qureg)
-    elif isinstance(backend, Simulator):
-        outcome = [0] * len(qubit_list)
-        n_outcomes = (1 << len(qubit_list))
+    if isinstance(backend, Simulator):
         probabilities = {}
-        for i in range(n_outcomes):
-            for pos in range(len(qubit_list)):
-                if (1 << pos) & i:
-                    outcome[pos] = 1
-                else:
-                    outcome[pos] = 0
-            probabilities[''.join([str(bit) for bit in outcome
-                                   ])] = backend.get_probability(
-                                       outcome, qubit_list)
+        for i, probability in enumerate(
+                backend.get_probabilities(qubit_list)):
+            outcome = ''.join(str((i >> pos) & 1)
+                              for pos in range(len(qubit_list)))
+            probabilities[outcome] = float(probability)
+    elif hasattr(backend, 'get_probabilities'):
+        probabilities = backend.get_probabilities(qureg)
     else:
         raise RuntimeError('Unable to retrieve probabilities from backend')
 
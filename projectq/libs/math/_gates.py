@@ -13,6 +13,8 @@
 #   limitations under the License.
 """Math gates for ProjectQ"""
 
+import numpy
+
 from projectq.ops import BasicMathGate
 
 
@@ -41,7 +43,10 @@ class AddConstant(BasicMathGate):
         It also initializes its base class, BasicMathGate, with the
         corresponding function, so it can be emulated efficiently.
         """
-        BasicMathGate.__init__(self, lambda x: ((x + a), ))
+        def add(x):
+            return (x + a, )
+
+        BasicMathGate.__init__(self, add, add)
         self.a = a
 
     def get_inverse(self):
@@ -114,7 +119,10 @@ class AddConstantModN(BasicMathGate):
         It also initializes its base class, BasicMathGate, with the
         corresponding function, so it can be emulated efficiently.
         """
-        BasicMathGate.__init__(self, lambda x: ((x + a) % N, ))
+        def add_mod_n(x):
+            return ((x + a) % N, )
+
+        BasicMathGate.__init__(self, add_mod_n, add_mod_n)
         self.a = a
         self.N = N
 
@@ -204,7 +212,10 @@ class MultiplyByConstantModN(BasicMathGate):
         It also initializes its base class, BasicMathGate, with the
         corresponding function, so it can be emulated efficiently.
         """
-        BasicMathGate.__init__(self, lambda x: ((a * x) % N, ))
+        def multiply_mod_n(x):
+            return ((a * x) % N, )
+
+        BasicMathGate.__init__(self, multiply_mod_n, multiply_mod_n)
         self.a = a
         self.N = N
 
@@ -269,6 +280,20 @@ class AddQuantumGate(BasicMathGate):
 
         return math_fun
 
+    def get_vectorized_math_function(self, qubits):
+        n = len(qubits[0])
+
+        def math_fun(a):
+            a[1] = a[0] + a[1]
+            overflow = a[1] >= 2**n
+            a[1] = a[1] % (2**n)
+            if len(a) == 3:
+                # Flip the last bit of the carry register
+                a[2] = a[2] ^ overflow
+            return (a)
+
+        return math_fun
+
     def get_inverse(self):
         """
         Return the inverse gate (subtraction of the same number a modulo the
@@ -304,6 +329,17 @@ class _InverseAddQuantumGate(BasicMathGate):
 
         return math_fun
 
+    def get_vectorized_math_function(self, qubits):
+        def math_fun(a):
+            if len(a) == 3:
+                # Flip the last bit of the carry register
+                a[2] = a[2] ^ 1
+
+            a[1] = a[1] - a[0]
+            return (a)
+
+        return math_fun
+
 
 class SubtractQuantumGate(BasicMathGate):
     """
@@ -329,7 +365,7 @@ class SubtractQuantumGate(BasicMathGate):
         def subtract(a, b):
             return (a, b - a)
 
-        BasicMathGate.__init__(self, subtract)
+        BasicMathGate.__init__(self, subtract, subtract)
 
     def __str__(self):
         return "SubtractQuantum"
@@ -385,7 +421,10 @@ class ComparatorQuantumGate(BasicMathGate):
                     c = 0
             return (a, b, c)
 
-        BasicMathGate.__init__(self, compare)
+        def vectorized_compare(a, b, c):
+            return (a, b, numpy.where(b < a, numpy.where(c == 0, 1, 0), c))
+
+        BasicMathGate.__init__(self, compare, vectorized_compare)
 
     def __str__(self):
         return "Comparator"
@@ -448,7 +487,15 @@ class DivideQuantumGate(BasicMathGate):
                 quotient = remainder + dividend // divisor
                 return ((dividend - (quotient * divisor)), quotient, divisor)
 
-        BasicMathGate.__init__(self, division)
+        def vectorized_division(dividend, remainder, divisor):
+            unchanged = (divisor == 0) | (divisor > dividend)
+            quotient = remainder + dividend // numpy.maximum(divisor, 1)
+            return (numpy.where(unchanged, remainder,
+                                dividend - quotient * divisor),
+                    numpy.where(unchanged, dividend, quotient),
+                    divisor)
+
+        BasicMathGate.__init__(self, division, vectorized_division)
 
     def get_inverse(self):
         return _InverseDivideQuantumGate()
@@ -483,7 +530,15 @@ class _InverseDivideQuantumGate(BasicMathGate):
             remainder = 0
             return (dividend, remainder, divisor)
 
-        BasicMathGate.__init__(self, inverse_division)
+        def vectorized_inverse_division(remainder, quotient, divisor):
+            unchanged = divisor == 0
+            return (numpy.where(unchanged, quotient,
+                                remainder + quotient * divisor),
+                    numpy.where(unchanged, remainder, 0),
+                    divisor)
+
+        BasicMathGate.__init__(self, inverse_division,
+                               vectorized_inverse_division)
 
     def __str__(self):
         return "_InverseDivideQuantum"
@@ -514,7 +569,7 @@ class MultiplyQuantumGate(BasicMathGate):
         def multiply(a, b, c):
             return (a, b, c + a * b)
 
-        BasicMathGate.__init__(self, multiply)
+        BasicMathGate.__init__(self, multiply, multiply)
 
     def __str__(self):
         return "MultiplyQuantum"
@@ -544,7 +599,8 @@ class _InverseMultiplyQuantumGate(BasicMathGate):
         def inverse_multiplication(a, b, c):
             return (a, b, c - a * b)
 
-        BasicMathGate.__init__(self, inverse_multiplication)
+        BasicMathGate.__init__(self, inverse_multiplication,
+                               inverse_multiplication)
 
     def __str__(self):
         return "_InverseMultiplyQuantum"
@@ -13,6 +13,11 @@
 #   limitations under the License.
 """Tests for projectq.libs.math._gates.py."""
 
+import itertools
+
+import numpy
+import pytest
+
 from projectq.libs.math import (AddConstant, AddConstantModN,
                                 MultiplyByConstantModN, SubConstant,
                                 SubConstantModN, AddQuantum, SubtractQuantum,
@@ -20,7 +25,9 @@ from projectq.libs.math import (AddConstant, AddConstantModN,
                                 MultiplyQuantum)
 
 from ._gates import (AddQuantumGate, SubtractQuantumGate, MultiplyQuantumGate,
-                     DivideQuantumGate, ComparatorQuantumGate)
+                     DivideQuantumGate, ComparatorQuantumGate,
+                     _InverseAddQuantumGate, _InverseDivideQuantumGate,
+                     _InverseMultiplyQuantumGate)
 
 
 def test_addconstant():
@@ -95,3 +102,32 @@ def test_hash_function_implemented():
     assert hash(ComparatorQuantum) == hash(str(ComparatorQuantum))
     assert hash(DivideQuantum) == hash(str(DivideQuantum))
     assert hash(MultiplyQuantum) == hash(str(MultiplyQuantum))
+
+
+@pytest.mark.parametrize("gate, sizes", [
+    (AddConstant(3), [3]),
+    (AddConstantModN(3, 5), [3]),
+    (MultiplyByConstantModN(3, 5), [3]),
+    (AddQuantum, [2, 2]),
+    (AddQuantum, [2, 2, 1]),
+    (_InverseAddQuantumGate(), [2, 2]),
+    (_InverseAddQuantumGate(), [2, 2, 1]),
+    (SubtractQuantum, [2, 2]),
+    (ComparatorQuantum, [2, 2, 1]),
+    (DivideQuantum, [2, 2, 2]),
+    (_InverseDivideQuantumGate(), [2, 2, 2]),
+    (MultiplyQuantum, [2, 2, 5]),
+    (_InverseMultiplyQuantumGate(), [2, 2, 5])])
+def test_vectorized_math_functions(gate, sizes):
+    qubits = tuple([None] * size for size in sizes)
+    values = list(itertools.product(*[range(1 << size) for size in sizes]))
+    vectorized_fun = gate.get_vectorized_math_function(qubits)
+    results = vectorized_fun([numpy.array(column, dtype=numpy.int64)
+                              for column in zip(*values)])
+    math_fun = gate.get_math_function(qubits)
+    for j, value in enumerate(values):
+        expected = math_fun(list(value))
+        for size, result, expected_value in zip(sizes, results, expected):
+            mask = (1 << size) - 1
+            assert (numpy.broadcast_to(result, (len(values),))[j] & mask ==
+                    expected_value & mask)
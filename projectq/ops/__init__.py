@@ -40,3 +40,9 @@ from ._uniformly_controlled_rotation import (UniformlyControlledRy,
 from ._state_prep import StatePreparation
 from ._qpegate import QPE
 from ._qaagate import QAA
+from ._noise import (KrausChannel,
+                     DepolarizingChannel,
+                     DephasingChannel,
+                     BitFlipChannel,
+                     ReadoutError,
+                     AmplitudeDampingChannel)
@@ -639,8 +639,21 @@ class BasicMathGate(BasicGate):
 
         def multiply(a,b,c)
             return (a,b,c+a*b)
+
+    Simulators evaluate this function once for every value of the registers.
+    Gates may additionally provide a vectorized version of it, which takes
+    one NumPy integer array per register (holding many values of that
+    register) and returns the outputs as arrays, such that all values can be
+    evaluated in a single call. For multiply, this is again
+
+    .. code-block:: python
+
+        def multiply(a,b,c)
+            return (a,b,c+a*b)
+
+    since the arithmetic operators act element-wise on NumPy arrays.
     """
-    def __init__(self, math_fun):
+    def __init__(self, math_fun, vectorized_math_fun=None):
         """
         Initialize a BasicMathGate by providing the mathematical function that
         it implements.
@@ -650,6 +663,9 @@ class BasicMathGate(BasicGate):
                 input, as the gate takes registers. For each of these values,
                 it then returns the output (i.e., it returns a list/tuple of
                 output values).
+            vectorized_math_fun (function): Optional version of math_fun
+                which takes (and returns) numpy.int64 arrays instead of int
+                values (see get_vectorized_math_function).
 
         Example:
             .. code-block:: python
@@ -686,6 +702,14 @@ class BasicMathGate(BasicGate):
 
         self._math_function = math_function
 
+        if vectorized_math_fun is None:
+            self._vectorized_math_function = None
+        else:
+            def vectorized_math_function(x):
+                return list(vectorized_math_fun(*x))
+
+            self._vectorized_math_function = vectorized_math_function
+
     def __str__(self):
         return "MATH"
 
@@ -703,3 +727,26 @@ class BasicMathGate(BasicGate):
             gate. (See BasicMathGate.__init__ for an example).
         """
         return self._math_function
+
+    def get_vectorized_math_function(self, qubits):
+        """
+        Return the vectorized math function which corresponds to the action of
+        this math gate, given the input to the gate (a tuple of quantum
+        registers), or None if the gate does not provide one.
+
+        The function takes a list with one numpy.int64 array per register
+        (all of the same length, entry j of each array forming the j-th
+        input) and returns the list of output arrays. Simulators use it to
+        evaluate the gate for all values of the registers at once (instead
+        of calling the function returned by get_math_function once per
+        value).
+
+        Args:
+            qubits (tuple<Qureg>): Qubits to which the math gate is being
+                applied.
+
+        Returns:
+            math_fun (function): Vectorized Python function describing the
+            action of this gate, or None.
+        """
+        return self._vectorized_math_function
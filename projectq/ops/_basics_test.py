@@ -309,6 +309,19 @@ def test_basic_math_gate():
     # Test a=2, b=3, and c=5 should give a=2, b=3, c=11
     math_fun = gate.get_math_function(("qreg1", "qreg2", "qreg3"))
     assert math_fun([2, 3, 5]) == [2, 3, 11]
+    assert gate.get_vectorized_math_function(("qreg1", "qreg2",
+                                              "qreg3")) is None
+
+
+def test_basic_math_gate_vectorized():
+    def my_math_function(a, b, c):
+        return (a, b, c + a * b)
+
+    gate = _basics.BasicMathGate(my_math_function, my_math_function)
+    math_fun = gate.get_vectorized_math_function(("qreg1", "qreg2", "qreg3"))
+    result = math_fun([np.array([2, 1]), np.array([3, 4]), np.array([5, 0])])
+    assert len(result) == 3
+    assert list(result[2]) == [11, 4]
 
 
 def test_matrix_gate():
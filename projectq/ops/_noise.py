@@ -0,0 +1,158 @@
+#   Copyright 2017 ProjectQ-Framework (www.projectq.ch)
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""
+Contains single-qubit noise channels, i.e., (non-unitary) gates given by
+Kraus operators K_k which map a density matrix rho to
+sum_k K_k rho K_k^dagger.
+
+Noise channels have no matrix; they are supported by the
+DensityMatrixSimulator (exactly) and by the Simulator (which samples one
+quantum trajectory per run). The module also contains the ReadoutError,
+which does not act on the state but flips the reported outcome of the next
+measurement.
+
+Example:
+    .. code-block:: python
+
+        H | qubit
+        DepolarizingChannel(0.01) | qubit
+        ReadoutError(0.02) | qubit
+        Measure | qubit
+"""
+
+import math
+
+import numpy
+
+from ._basics import BasicGate
+
+
+_PAULI_MATRICES = {'I': numpy.eye(2, dtype=complex),
+                   'X': numpy.array([[0, 1], [1, 0]], dtype=complex),
+                   'Y': numpy.array([[0, -1j], [1j, 0]], dtype=complex),
+                   'Z': numpy.array([[1, 0], [0, -1]], dtype=complex)}
+
+
+class _ErrorGate(BasicGate):
+    """
+    Base class of the single-qubit errors which depend on one probability.
+    """
+    def __init__(self, probability):
+        """
+        Initialize an error gate.
+
+        Args:
+            probability (float): Error probability (between 0 and 1).
+        """
+        BasicGate.__init__(self)
+        if not 0. <= probability <= 1.:
+            raise ValueError("{}: The probability must be between 0 and 1, "
+                             "got {}.".format(self.__class__.__name__,
+                                              probability))
+        self.probability = probability
+
+    def __str__(self):
+        return "{}({})".format(self.__class__.__name__, self.probability)
+
+    def __eq__(self, other):
+        if isinstance(other, self.__class__):
+            return self.probability == other.probability
+        return False
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __hash__(self):
+        return hash(str(self))
+
+
+class KrausChannel(_ErrorGate):
+    """
+    Base class of single-qubit noise channels which depend on one
+    probability.
+
+    Derived classes implement kraus_operators and, if the channel applies
+    Pauli operators at random, pauli_probabilities.
+    """
+    @property
+    def kraus_operators(self):
+        """ List of the Kraus operators (2x2 numpy arrays). """
+        paulis = self.pauli_probabilities()
+        return [math.sqrt(p) * _PAULI_MATRICES[pauli]
+                for pauli, p in sorted(paulis.items())]
+
+    def pauli_probabilities(self):
+        """
+        Return a dict which maps 'I', 'X', 'Y' and 'Z' to the probability with
+        which the channel applies the corresponding Pauli operator, or None if
+        the channel is not a mixture of Pauli operators.
+        """
+        return None
+
+
+class DepolarizingChannel(KrausChannel):
+    """
+    Depolarizing channel: applies X, Y or Z with probability p / 3 each.
+    """
+    def pauli_probabilities(self):
+        p = self.probability
+        return {'I': 1. - p, 'X': p / 3., 'Y': p / 3., 'Z': p / 3.}
+
+
+class DephasingChannel(KrausChannel):
+    """
+    Dephasing (phase flip) channel: applies Z with probability p.
+    """
+    def pauli_probabilities(self):
+        return {'I': 1. - self.probability, 'Z': self.probability}
+
+
+class BitFlipChannel(KrausChannel):
+    """
+    Bit flip channel: applies X with probability p.
+    """
+    def pauli_probabilities(self):
+        return {'I': 1. - self.probability, 'X': self.probability}
+
+
+class ReadoutError(_ErrorGate):
+    """
+    Readout error: flips the reported outcome of the next measurement of the
+    qubit with probability p.
+
+    The state is not changed, i.e., after the measurement the qubit is in the
+    basis state of the true outcome (also if the reported one is flipped).
+    Several readout errors before the same measurement combine. The error is
+    supported by the Simulator and the DensityMatrixSimulator.
+    """
+    def combine(self, probability):
+        """
+        Return the probability that the outcome is flipped by this error and
+        an error with the given flip probability.
+        """
+        p = self.probability
+        return p + probability - 2. * p * probability
+
+
+class AmplitudeDampingChannel(KrausChannel):
+    """
+    Amplitude damping channel: decays |1> to |0> with probability gamma.
+    """
+    @property
+    def kraus_operators(self):
+        gamma = self.probability
+        return [numpy.array([[1, 0], [0, math.sqrt(1. - gamma)]],
+                            dtype=complex),
+                numpy.array([[0, math.sqrt(gamma)], [0, 0]], dtype=complex)]
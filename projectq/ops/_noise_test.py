@@ -0,0 +1,73 @@
+#   Copyright 2017 ProjectQ-Framework (www.projectq.ch)
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""Tests for projectq.ops._noise."""
+
+import numpy
+import pytest
+
+from projectq.ops import _noise, NotInvertible, X
+
+
+@pytest.mark.parametrize("channel", [_noise.DepolarizingChannel,
+                                     _noise.DephasingChannel,
+                                     _noise.BitFlipChannel,
+                                     _noise.AmplitudeDampingChannel])
+@pytest.mark.parametrize("probability", [0., 0.1, 1.])
+def test_kraus_operators_complete(channel, probability):
+    gate = channel(probability)
+    total = sum(k.conj().T.dot(k) for k in gate.kraus_operators)
+    assert numpy.allclose(total, numpy.eye(2))
+    paulis = gate.pauli_probabilities()
+    if paulis is not None:
+        assert sum(paulis.values()) == pytest.approx(1.)
+
+
+def test_invalid_probability():
+    with pytest.raises(ValueError):
+        _noise.DepolarizingChannel(1.5)
+    with pytest.raises(ValueError):
+        _noise.AmplitudeDampingChannel(-0.1)
+
+
+def test_equality_and_hash():
+    gate1 = _noise.DephasingChannel(0.1)
+    gate2 = _noise.DephasingChannel(0.1)
+    gate3 = _noise.DephasingChannel(0.2)
+    assert gate1 == gate2
+    assert hash(gate1) == hash(gate2)
+    assert gate1 != gate3
+    assert gate1 != _noise.BitFlipChannel(0.1)
+    assert gate1 != X
+
+
+def test_str_and_inverse():
+    gate = _noise.AmplitudeDampingChannel(0.25)
+    assert str(gate) == "AmplitudeDampingChannel(0.25)"
+    assert gate.pauli_probabilities() is None
+    with pytest.raises(NotInvertible):
+        gate.get_inverse()
+
+
+def test_readout_error():
+    gate = _noise.ReadoutError(0.1)
+    assert not isinstance(gate, _noise.KrausChannel)
+    assert str(gate) == "ReadoutError(0.1)"
+    assert gate == _noise.ReadoutError(0.1)
+    assert gate != _noise.BitFlipChannel(0.1)
+    assert gate.combine(0.) == pytest.approx(0.1)
+    assert gate.combine(0.2) == pytest.approx(0.1 * 0.8 + 0.9 * 0.2)
+    assert _noise.ReadoutError(1.).combine(1.) == pytest.approx(0.)
+    with pytest.raises(ValueError):
+        _noise.ReadoutError(1.1)
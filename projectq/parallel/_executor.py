@@ -0,0 +1,344 @@
+#   Copyright 2017 ProjectQ-Framework (www.projectq.ch)
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""
+Contains an executor which runs independent simulations (e.g., the points of
+a parameter sweep) in a pool of worker processes.
+
+Each worker process owns one MainEngine with a Simulator backend, which is
+built once and reused for all the simulations the worker runs. The workers
+receive the parameters of one simulation at a time (whenever they are idle)
+and send back the requested quantities, such that the results arrive in the
+order in which the simulations complete.
+"""
+
+import multiprocessing
+import multiprocessing.connection
+import os
+import traceback
+import weakref
+
+from projectq.backends import Simulator
+from projectq.cengines import MainEngine
+from projectq.ops import All, Measure, QubitOperator
+
+
+class ParallelResult(object):
+    """
+    Result of one simulation run by a ParallelExecutor.
+
+    Attributes:
+        index (int): Position of the parameters in the list of parameter sets.
+        parameters: The parameters of the simulation.
+        value: Second entry of the tuple (qureg, value) returned by the
+            circuit function (None if it only returned the qureg).
+        expectation (float|list[float]): Expectation value(s) of the
+            requested QubitOperator(s).
+        probabilities (numpy.ndarray): Probabilities of the 2^n outcomes of
+            measuring the qureg, where bit i of the index of an outcome is the
+            value of qureg[i].
+        counts (dict): Sampled measurement outcomes (see Simulator.sample).
+    """
+    def __init__(self, index, parameters, value=None, expectation=None,
+                 probabilities=None, counts=None):
+        self.index = index
+        self.parameters = parameters
+        self.value = value
+        self.expectation = expectation
+        self.probabilities = probabilities
+        self.counts = counts
+
+    def __repr__(self):
+        return "ParallelResult(index={}, parameters={!r})".format(
+            self.index, self.parameters)
+
+
+def _call_circuit(circuit, eng, parameters):
+    """
+    Call circuit(eng, ...) with the given parameter set (a tuple holds the
+    positional arguments, a dict the keyword arguments and anything else is
+    the only argument).
+    """
+    if isinstance(parameters, tuple):
+        return circuit(eng, *parameters)
+    if isinstance(parameters, dict):
+        return circuit(eng, **parameters)
+    return circuit(eng, parameters)
+
+
+def _run(eng, circuit, index, parameters, spec):
+    """
+    Run one simulation on eng and release its qubits afterwards.
+    """
+    expectation, probabilities, shots, seed = spec
+    output = _call_circuit(circuit, eng, parameters)
+    value = None
+    if isinstance(output, tuple):
+        output, value = output
+    qureg = list(output) if output is not None else []
+    del output
+    eng.flush()
+    sim = eng.backend
+    result = ParallelResult(index, parameters, value)
+    if expectation is not None:
+        if isinstance(expectation, QubitOperator):
+            result.expectation = sim.get_expectation_value(expectation, qureg)
+        else:
+            result.expectation = [sim.get_expectation_value(op, qureg)
+                                  for op in expectation]
+    if probabilities:
+        result.probabilities = sim.get_probabilities(qureg)
+    if shots:
+        result.counts = sim.sample(qureg, shots,
+                                   None if seed is None else seed + index)
+    # the pipeline is reused: return it to the empty state
+    All(Measure) | qureg
+    del qureg
+    eng.flush()
+    return result
+
+
+def _worker(conn, circuit, cores, simulator_kwargs, engine_list):
+    """
+    Main loop of a worker process: runs the simulations sent by
+    ParallelExecutor.map until it receives None.
+    """
+    if cores is not None and hasattr(os, 'sched_setaffinity'):
+        try:
+            os.sched_setaffinity(0, cores)
+        except OSError:
+            pass
+    eng = None
+    while True:
+        task = conn.recv()
+        if task is None:
+            break
+        index, parameters, spec = task
+        try:
+            if eng is None:
+                engines = engine_list() if engine_list is not None else None
+                eng = MainEngine(Simulator(**simulator_kwargs), engines)
+            conn.send((index, None, _run(eng, circuit, index, parameters,
+                                         spec)))
+        except Exception:
+            # the state of the pipeline is unknown: build a new one
+            eng = None
+            conn.send((index, traceback.format_exc(), None))
+
+
+def _shutdown(pid, workers, connections):
+    """
+    Stop the worker processes (only in the process which started them).
+    """
+    if os.getpid() != pid:
+        return
+    for conn in connections:
+        try:
+            conn.send(None)
+        except (OSError, ValueError):
+            pass
+    for process in workers:
+        process.join(timeout=5)
+        if process.is_alive():
+            process.terminate()
+
+
+class ParallelExecutor(object):
+    """
+    Pool of worker processes which run independent simulations, each with
+    its own MainEngine and Simulator.
+
+    The circuit function is called as circuit(eng, ...) with the engine of a
+    worker and one parameter set (see map). It allocates the qubits, applies
+    the gates and returns the qureg to evaluate, or a tuple (qureg, value)
+    whose (picklable) value is passed back as well. Afterwards, the worker
+    measures the qureg and deallocates it, such that the engine is empty
+    again; all other qubits the circuit allocated must be measured or
+    uncomputed before it returns.
+
+    Example:
+        .. code-block:: python
+
+            def circuit(eng, theta):
+                qureg = eng.allocate_qureg(2)
+                Rx(theta) | qureg[0]
+                CNOT | (qureg[0], qureg[1])
+                return qureg
+
+            with ParallelExecutor(circuit) as executor:
+                for result in executor.map(numpy.linspace(0, 3, 100),
+                                           expectation=QubitOperator('Z1')):
+                    print(result.parameters, result.expectation)
+    """
+    def __init__(self, circuit, processes=None, threads_per_process=1,
+                 engine_list=None, simulator_kwargs=None, seed=None,
+                 pin=True):
+        """
+        Start the worker processes.
+
+        Args:
+            circuit (callable): Function which builds the circuit (see
+                above). It is sent to the worker processes and thus must be
+                picklable if processes are spawned rather than forked.
+            processes (int): Number of worker processes (default: the number
+                of available cores divided by threads_per_process).
+            threads_per_process (int): Number of OpenMP threads of the
+                Simulator of each worker (and number of cores it is pinned
+                to).
+            engine_list (callable): Function without arguments which returns
+                the engine list of the MainEngine of a worker (default: the
+                default engine list of the MainEngine).
+            simulator_kwargs (dict): Further arguments of the Simulator of
+                each worker (e.g., gate_fusion or precision).
+            seed (int): If given, worker r seeds its Simulator with seed + r
+                and simulation i samples its counts with seed + i (such that
+                the counts do not depend on which worker ran a simulation).
+            pin (bool): If True (and supported by the operating system), each
+                worker is restricted to its own threads_per_process cores.
+
+        Raises:
+            ValueError: If processes or threads_per_process is less than 1.
+        """
+        if hasattr(os, 'sched_getaffinity'):
+            cores = sorted(os.sched_getaffinity(0))
+        else:
+            cores = list(range(os.cpu_count() or 1))
+        if processes is None:
+            processes = max(1, len(cores) // threads_per_process)
+        if processes < 1 or threads_per_process < 1:
+            raise ValueError("ParallelExecutor: processes and "
+                             "threads_per_process must be positive.")
+        self._seed = seed
+        self._busy = False
+        context = multiprocessing.get_context()
+        self._connections = []
+        self._workers = []
+        for rank in range(processes):
+            kwargs = {'num_threads': threads_per_process}
+            if seed is not None:
+                kwargs['rnd_seed'] = seed + rank
+            kwargs.update(simulator_kwargs or {})
+            worker_cores = None
+            if pin:
+                worker_cores = sorted(
+                    set(cores[(rank * threads_per_process + i) % len(cores)]
+                        for i in range(threads_per_process)))
+            conn, child_conn = context.Pipe()
+            process = context.Process(target=_worker,
+                                      args=(child_conn, circuit, worker_cores,
+                                            kwargs, engine_list),
+                                      daemon=True)
+            process.start()
+            self._connections.append(conn)
+            self._workers.append(process)
+        self._finalizer = weakref.finalize(self, _shutdown, os.getpid(),
+                                           self._workers, self._connections)
+
+    @property
+    def processes(self):
+        """
+        Number of worker processes.
+        """
+        return len(self._workers)
+
+    def map(self, parameter_sets, expectation=None, probabilities=False,
+            shots=None, ordered=False):
+        """
+        Run one simulation per parameter set and yield the results as they
+        become available.
+
+        Args:
+            parameter_sets (iterable): Parameters of the simulations. A tuple
+                holds the positional arguments of the circuit function (after
+                the engine), a dict its keyword arguments and any other
+                object is passed as the only argument.
+            expectation (QubitOperator|list[QubitOperator]): Operator(s)
+                whose expectation value(s) w.r.t. the returned qureg are
+                calculated.
+            probabilities (bool): If True, the probabilities of all outcomes
+                of measuring the returned qureg are calculated.
+            shots (int): If given, this many measurement outcomes of the
+                returned qureg are sampled (without re-running the circuit).
+            ordered (bool): If True, the results are yielded in the order of
+                the parameter sets (rather than in the order in which they
+                are completed).
+
+        Yields:
+            ParallelResult: The result of each simulation.
+
+        Raises:
+            RuntimeError: If a simulation fails (the error of the worker is
+                included in the message) or a worker process terminates.
+        """
+        if self._busy:
+            raise RuntimeError("ParallelExecutor.map(): The results of the "
+                               "previous call have not been consumed yet.")
+        if not self._finalizer.alive:
+            raise RuntimeError("ParallelExecutor.map(): The executor has "
+                               "been closed.")
+        spec = (expectation, probabilities, shots, self._seed)
+        tasks = enumerate(parameter_sets)
+        busy = set()
+        waiting = dict()
+        next_index = 0
+
+        def submit(conn):
+            task = next(tasks, None)
+            if task is not None:
+                conn.send(task + (spec,))
+                busy.add(conn)
+
+        self._busy = True
+        try:
+            for conn in self._connections:
+                submit(conn)
+            while busy:
+                for conn in multiprocessing.connection.wait(list(busy)):
+                    busy.discard(conn)
+                    try:
+                        index, error, result = conn.recv()
+                    except EOFError:
+                        raise RuntimeError("ParallelExecutor: a worker "
+                                           "process terminated.")
+                    if error is not None:
+                        raise RuntimeError("ParallelExecutor: simulation {} "
+                                           "failed:\n{}".format(index, error))
+                    submit(conn)
+                    if not ordered:
+                        yield result
+                        continue
+                    waiting[index] = result
+                    while next_index in waiting:
+                        yield waiting.pop(next_index)
+                        next_index += 1
+        finally:
+            # discard the results of the simulations which are still running
+            for conn in busy:
+                try:
+                    conn.recv()
+                except EOFError:
+                    pass
+            self._busy = False
+
+    def close(self):
+        """
+        Stop the worker processes.
+        """
+        self._finalizer()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
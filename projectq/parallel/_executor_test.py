@@ -0,0 +1,143 @@
+#   Copyright 2017 ProjectQ-Framework (www.projectq.ch)
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""Tests for projectq.parallel._executor.py."""
+
+import math
+import os
+
+import numpy
+import pytest
+
+from projectq import MainEngine
+from projectq.backends import Simulator
+from projectq.ops import All, CNOT, H, Measure, QubitOperator, Rx, Ry
+
+from projectq.parallel import _executor
+from projectq.parallel._executor import ParallelExecutor
+
+
+def _rotation(eng, theta):
+    qureg = eng.allocate_qureg(2)
+    Rx(theta) | qureg[0]
+    CNOT | (qureg[0], qureg[1])
+    return qureg
+
+
+def _entangled(eng, angles, swap=False):
+    qureg = eng.allocate_qureg(len(angles))
+    for qb, angle in zip(qureg, angles):
+        Ry(angle) | qb
+    CNOT | (qureg[0], qureg[-1])
+    ancilla = eng.allocate_qubit()
+    H | ancilla
+    Measure | ancilla
+    if swap:
+        qureg = qureg[::-1]
+    return qureg, (os.getpid(), id(eng))
+
+
+def _failing(eng, fail):
+    qubit = eng.allocate_qubit()
+    H | qubit
+    if fail:
+        raise ValueError("failing circuit")
+    return qubit
+
+
+def test_parallel_executor_expectation():
+    thetas = numpy.linspace(0, 3, 7)
+    with ParallelExecutor(_rotation, processes=2) as executor:
+        assert executor.processes == 2
+        results = list(executor.map(thetas, expectation=QubitOperator('Z1')))
+        assert sorted(r.index for r in results) == list(range(len(thetas)))
+        for result in results:
+            assert result.parameters == thetas[result.index]
+            assert result.expectation == pytest.approx(
+                math.cos(result.parameters))
+            assert result.value is None
+        ops = [QubitOperator('Z0'), QubitOperator('Z0 Z1')]
+        results = list(executor.map(thetas, expectation=ops, ordered=True))
+        assert [r.index for r in results] == list(range(len(thetas)))
+        for theta, result in zip(thetas, results):
+            assert result.expectation == pytest.approx(
+                [math.cos(theta), 1.])
+    with pytest.raises(RuntimeError):
+        list(executor.map(thetas))
+
+
+@pytest.mark.parametrize("swap", [False, True])
+def test_parallel_executor_probabilities_and_counts(swap):
+    parameter_sets = [((0.3, 1.2, 2.), swap), {'angles': (1., 0.1, 0.5),
+                                               'swap': swap}]
+    with ParallelExecutor(_entangled, processes=2, seed=7,
+                          simulator_kwargs={'gate_fusion': True}) as ex:
+        results = list(ex.map(parameter_sets, probabilities=True,
+                              shots=1000, ordered=True))
+    with ParallelExecutor(_entangled, processes=1, seed=7) as ex:
+        repeated = list(ex.map(parameter_sets, shots=1000, ordered=True))
+    for result, other in zip(results, repeated):
+        assert result.counts == other.counts
+        assert sum(result.counts.values()) == 1000
+        assert other.probabilities is None
+    for angles, result in zip([(0.3, 1.2, 2.), (1., 0.1, 0.5)], results):
+        eng = MainEngine(Simulator(), [])
+        qureg, _ = _entangled(eng, angles, swap)
+        eng.flush()
+        expected = [eng.backend.get_probability(
+                    [(i >> k) & 1 for k in range(3)], qureg)
+                    for i in range(8)]
+        assert numpy.allclose(result.probabilities, expected)
+        for bits, count in result.counts.items():
+            index = int(bits[::-1], 2)
+            assert count / 1000. == pytest.approx(expected[index], abs=0.1)
+        All(Measure) | qureg
+
+
+def test_parallel_executor_reuses_engines():
+    with ParallelExecutor(_entangled, processes=1) as executor:
+        results = list(executor.map([((0.1, 0.2),)] * 5))
+    assert len(set(result.value for result in results)) == 1
+    assert results[0].value[0] != os.getpid()
+
+
+def test_parallel_executor_failure():
+    executor = ParallelExecutor(_failing, processes=2)
+    with pytest.raises(RuntimeError) as excinfo:
+        list(executor.map([False, True, False]))
+    assert "failing circuit" in str(excinfo.value)
+    # the workers are still usable
+    results = executor.map([False] * 4)
+    next(results)
+    with pytest.raises(RuntimeError):
+        next(executor.map([False]))
+    results.close()
+    assert len(list(executor.map([False] * 4))) == 4
+    executor.close()
+    with pytest.raises(ValueError):
+        ParallelExecutor(_failing, processes=0)
+
+
+def test_parallel_executor_pins_workers(monkeypatch):
+    pinned = []
+    monkeypatch.setattr(os, 'sched_setaffinity',
+                        lambda pid, cores: pinned.append(cores),
+                        raising=False)
+
+    class Conn(object):
+        def recv(self):
+            return None
+
+    _executor._worker(Conn(), _rotation, [2, 3], {}, None)
+    assert pinned == [[2, 3]]
@@ -339,22 +339,29 @@ class BuildExt(build_ext):
         important_msgs('WARNING: compiler does not support OpenMP!')
 
     def _configure_intrinsics(self):
-        for flag in [
-                '-march=native', '-mavx2', '/arch:AVX2', '/arch:CORE-AVX2',
-                '/arch:AVX'
-        ]:
-            if compiler_test(
-                    self.compiler,
-                    flagname=flag,
-                    link=False,
-                    include='#include <immintrin.h>',
-                    body='__m256d neg = _mm256_set1_pd(1.0); (void)neg;'):
-
-                if sys.platform == 'win32':
-                    self.opts.extend(('/DINTRIN', flag))
-                else:
-                    self.opts.extend(('-DINTRIN', flag))
-                break
+        # The gate kernels are compiled for several instruction sets (scalar,
+        # AVX2 and AVX-512, using target attributes instead of -march) and
+        # the extension selects the best ones the CPU supports at run time.
+        # Hence, the build does not depend on the CPU of the build machine.
+        if self.compiler.compiler_type == 'msvc':
+            include = '#include <immintrin.h>'
+            body = '__m512d a = _mm512_set1_pd(1.0); (void)a;'
+        else:
+            include = ('#include <immintrin.h>\n'
+                       '__attribute__((target("avx512f,avx512dq,avx512vl,'
+                       'avx2,fma"))) void test_avx512() {\n'
+                       '__m512d a = _mm512_set1_pd(1.0); (void)a; }')
+            body = ('__builtin_cpu_init(); '
+                    'if (__builtin_cpu_supports("avx512f")) test_avx512();')
+        if compiler_test(self.compiler, link=True, include=include,
+                         body=body):
+            if sys.platform == 'win32':
+                self.opts.append('/DINTRIN')
+            else:
+                self.opts.append('-DINTRIN')
+        else:
+            important_msgs('WARNING: compiler does not support run-time '
+                           'selection of SIMD kernels, using scalar kernels!')
 
         for flag in ['-ffast-math', '-fast', '/fast', '/fp:precise']:
             if compiler_test(self.compiler, flagname=flag):